@@ -0,0 +1,145 @@
+"""
+Test the admin alert bus and parallel admin delivery
+"""
+
+import asyncio
+import time
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from traffic_share.bot.delivery import TelegramSender, send_to_admins
+from traffic_share.server.admin_alerts import AdminAlertBus
+from traffic_share.server.config import settings
+from traffic_share.server.database import Base
+from traffic_share.server.services import package_allocator
+from traffic_share.server.services.package_allocator import PackageAllocator
+
+
+@pytest.fixture
+def memory_backend(monkeypatch):
+    monkeypatch.setattr(settings, "ADMIN_ALERTS_ENABLED", True)
+    monkeypatch.setattr(settings, "ADMIN_ALERT_BACKEND", "memory")
+    monkeypatch.setattr(settings, "ADMIN_ALERT_KEY_INTERVAL", 600)
+
+
+class FakeRedis:
+    """SET NX EX on a dict (expiry ignored)"""
+
+    def __init__(self, fail=False):
+        self.keys = {}
+        self.fail = fail
+
+    def set(self, key, value, nx=False, ex=None):
+        if self.fail:
+            raise ConnectionError("down")
+        if nx and key in self.keys:
+            return None
+        self.keys[key] = value
+        return True
+
+
+def test_events_are_merged_and_rate_limited(memory_backend):
+    """Test repeats of a key become one line and a key is reported once per window"""
+    bus = AdminAlertBus()
+    for i in range(3):
+        bus.emit("payout_failed", f"Payout failed for user {i}: timeout")
+    bus.emit("stale_sessions", "150 sessions went stale")
+
+    digest = bus.take_digest(now=1000.0)
+    assert "• payout_failed (x3): Payout failed for user 2: timeout" in digest
+    assert "• stale_sessions: 150 sessions went stale" in digest
+    assert bus.take_digest(now=1001.0) is None
+
+    # Within the window the repeats are held and counted
+    bus.emit("payout_failed", "Payout failed for user 7: timeout")
+    bus.emit("payout_failed", "Payout failed for user 8: timeout")
+    assert bus.take_digest(now=1300.0) is None
+    assert "payout_failed (x2)" in bus.take_digest(now=1600.0)
+
+
+def test_pending_keys_are_capped(memory_backend, monkeypatch):
+    """Test events of keys over the cap are counted, not stored"""
+    monkeypatch.setattr(settings, "ADMIN_ALERT_MAX_KEYS", 2)
+    bus = AdminAlertBus()
+    for region in ("UZ", "KZ", "RU", "US"):
+        bus.emit(f"allocation_exhausted:{region}", f"No packages in {region}")
+
+    digest = bus.take_digest(now=0.0)
+    assert "allocation_exhausted:UZ" in digest and "allocation_exhausted:KZ" in digest
+    assert "2 more events not shown" in digest
+
+
+def test_redis_window_is_shared(monkeypatch):
+    """Test two processes report a key once per window, falling back to local windows"""
+    monkeypatch.setattr(settings, "ADMIN_ALERTS_ENABLED", True)
+    monkeypatch.setattr(settings, "ADMIN_ALERT_BACKEND", "redis")
+    redis = FakeRedis()
+    first = AdminAlertBus(client_factory=lambda: redis)
+    second = AdminAlertBus(client_factory=lambda: redis)
+
+    first.emit("payout_webhook_error", "bad signature")
+    second.emit("payout_webhook_error", "bad signature")
+    assert "payout_webhook_error" in first.take_digest(now=0.0)
+    assert second.take_digest(now=0.0) is None
+
+    redis.fail = True
+    second.emit("stale_sessions", "120 sessions went stale")
+    assert "stale_sessions" in second.take_digest(now=0.0)
+
+
+def test_flush_sends_digest(memory_backend):
+    """Test flush hands one digest to the sender and nothing when idle"""
+    sent = []
+
+    async def send(text):
+        sent.append(text)
+        return 1
+
+    bus = AdminAlertBus(send=send)
+    bus.emit("payout_failed", "Payout failed for user 1: timeout")
+
+    assert asyncio.run(bus.flush()) is True
+    assert asyncio.run(bus.flush()) is False
+    assert len(sent) == 1 and sent[0].startswith("🔔 *Admin Alert*")
+
+
+def test_send_to_admins_in_parallel(monkeypatch):
+    """Test every admin and the channel are sent to at once, failures isolated"""
+    monkeypatch.setattr(settings, "TELEGRAM_ADMIN_IDS", "101,102,103")
+    monkeypatch.setattr(settings, "TELEGRAM_ADMIN_CHANNEL", "@traffic_ops")
+
+    class SlowBot:
+        sent = []
+
+        async def send_message(self, chat_id, text, parse_mode=None):
+            await asyncio.sleep(0.1)
+            if chat_id == 102:
+                raise RuntimeError("chat not reachable")
+            self.sent.append(chat_id)
+
+    sender = TelegramSender(bot_factory=SlowBot, rate=1000, chat_interval=0)
+    started = time.monotonic()
+    reached = asyncio.run(send_to_admins("alert", sender=sender))
+
+    assert reached == 3
+    assert sorted(map(str, SlowBot.sent)) == ["101", "103", "@traffic_ops"]
+    assert time.monotonic() - started < 0.3
+
+
+def test_allocation_exhaustion_emits_alert(tmp_path, memory_backend, monkeypatch):
+    """Test a pull finding no packages raises an alert for its region"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'alerts.db'}")
+    Base.metadata.create_all(bind=engine)
+    bus = AdminAlertBus()
+    monkeypatch.setattr(package_allocator, "admin_alerts", bus)
+
+    db = sessionmaker(bind=engine)()
+    try:
+        assert PackageAllocator(db).allocate(1, 10, region="UZ").packages == []
+    finally:
+        db.close()
+        engine.dispose()
+
+    assert "allocation_exhausted:UZ" in bus.take_digest(now=0.0)
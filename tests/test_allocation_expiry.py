@@ -0,0 +1,104 @@
+"""
+Test the allocation expiry index and reaper
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from traffic_share.server.allocation_expiry import AllocationReaper, MemoryExpiryIndex
+from traffic_share.server.config import settings
+from traffic_share.server.database import Base
+from traffic_share.server.models import Buyer, Package, PackageStatus, User
+from traffic_share.server.services.package_allocator import PackageAllocator
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'expiry.db'}")
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(bind=engine)
+    engine.dispose()
+
+
+@pytest.fixture
+def reaper(session_factory, monkeypatch):
+    """Reaper on a memory index"""
+    monkeypatch.setattr(settings, "ALLOCATION_EXPIRY_ENABLED", True)
+    return AllocationReaper(
+        index=MemoryExpiryIndex(), session_factory=session_factory, batch_size=10
+    )
+
+
+def test_memory_index_pops_due_ids():
+    """Test due ids are popped once and a later deadline supersedes an earlier one"""
+    index = MemoryExpiryIndex()
+    start = datetime(2024, 1, 1, 12)
+    asyncio.run(index.add([
+        (1, start), (2, start + timedelta(seconds=1)), (3, start + timedelta(seconds=5))
+    ]))
+    asyncio.run(index.add([(2, start + timedelta(seconds=10))]))
+
+    assert index.pop_due(start + timedelta(seconds=2), 10) == [1]
+    assert index.pop_due(start + timedelta(seconds=2), 10) == []
+    assert index.pop_due(start + timedelta(seconds=10), 1) == [3]
+    assert index.pop_due(start + timedelta(seconds=10), 10) == [2]
+    assert index.size() == 0
+
+
+def test_reaper_releases_expired_allocations(session_factory, reaper):
+    """Test unconfirmed allocations are released at their deadline, confirmed ones kept"""
+    db = session_factory()
+    user = User(telegram_id=980000001)
+    buyer = Buyer(name="expiry-buyer", email="expiry@example.com", api_key="expiry-key")
+    db.add_all([user, buyer])
+    db.commit()
+    packages = [
+        Package(package_uuid=f"expiry-{i}", user_id=user.id, ip=f"10.9.0.{i}", region="UZ")
+        for i in range(3)
+    ]
+    db.add_all(packages)
+    db.commit()
+
+    allocated, deadlines = PackageAllocator(db).allocate(buyer.id, 10)
+    db.commit()
+    asyncio.run(reaper.track(deadlines))
+    assert len(allocated) == 3
+    assert reaper.index.size() == 3
+
+    # The buyer confirms one package before the deadline
+    packages[0].status = PackageStatus.IN_PROGRESS.value
+    db.commit()
+
+    assert reaper.reap_once() == (0, [])
+
+    deadline = datetime.utcnow() + timedelta(seconds=settings.PACKAGE_ALLOCATION_TTL + 1)
+    popped, released = reaper.reap_once(deadline)
+    assert popped == 3
+    assert released == [(packages[1].id, "UZ"), (packages[2].id, "UZ")]
+
+    db.expire_all()
+    assert [p.status for p in packages] == [
+        PackageStatus.IN_PROGRESS.value, PackageStatus.AVAILABLE.value, PackageStatus.AVAILABLE.value
+    ]
+    assert packages[1].assigned_buyer_id is None and packages[1].expires_at is None
+    assert reaper.index.size() == 0
+
+
+def test_track_backs_off_after_index_error(reaper):
+    """Test a failing index is skipped for a while instead of slowing allocations"""
+    class BrokenIndex:
+        calls = 0
+
+        async def add(self, entries):
+            BrokenIndex.calls += 1
+            raise ConnectionError("down")
+
+    reaper._index = BrokenIndex()
+    asyncio.run(reaper.track([(1, datetime.utcnow())]))
+    asyncio.run(reaper.track([(2, datetime.utcnow())]))
+
+    assert BrokenIndex.calls == 1
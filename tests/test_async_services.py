@@ -0,0 +1,157 @@
+"""
+Test the async service wrappers and get_async_db against an aiosqlite engine
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from traffic_share.server import database
+from traffic_share.server.config import settings
+from traffic_share.server.database import Base, get_async_db
+from traffic_share.server.models import (
+    Buyer, Device, Package, PackageStatus, Payment, PaymentStatus, TrafficSession, User
+)
+from traffic_share.server.schemas import RegisterRequest
+from traffic_share.server.services import auth_service
+from traffic_share.server.services.auth_service import AsyncAuthService
+from traffic_share.server.services.buyer_service import AsyncBuyerService
+from traffic_share.server.services.payment_service import AsyncPaymentService
+from traffic_share.server.services.traffic_service import AsyncTrafficService
+from traffic_share.server.services.user_service import AsyncUserService
+
+
+@pytest.fixture
+def async_env(tmp_path, monkeypatch):
+    """File database written through the sync engine and read through aiosqlite"""
+    path = tmp_path / "async.db"
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    session_factory = async_sessionmaker(bind=async_engine, expire_on_commit=False)
+    monkeypatch.setattr(database, "AsyncSessionLocal", session_factory)
+    monkeypatch.setattr(settings, "REPORT_COUNTERS_ENABLED", False)
+
+    yield db, session_factory
+
+    db.close()
+    engine.dispose()
+    asyncio.run(async_engine.dispose())
+
+
+def test_get_async_db_yields_session(async_env):
+    """Test the dependency hands out a working AsyncSession"""
+    db, _ = async_env
+    db.add(User(telegram_id=930000001))
+    db.commit()
+
+    async def run():
+        sessions = get_async_db()
+        session = await sessions.__anext__()
+        try:
+            user = await session.run_sync(
+                lambda sync: sync.query(User).filter_by(telegram_id=930000001).one()
+            )
+            return user.telegram_id
+        finally:
+            await sessions.aclose()
+
+    assert asyncio.run(run()) == 930000001
+
+
+def test_async_services_round_trip(async_env):
+    """Test the auth, user, buyer and traffic services reach their sync logic"""
+    db, session_factory = async_env
+    buyer = Buyer(name="async buyer", email="async@buyer.test", api_key="async-buyer-key")
+    db.add(buyer)
+    db.commit()
+    db.add(Package(
+        package_uuid="async-package", status=PackageStatus.ALLOCATED.value,
+        assigned_buyer_id=buyer.id, expires_at=datetime.utcnow() - timedelta(minutes=1)
+    ))
+    db.commit()
+
+    async def run():
+        async with session_factory() as session:
+            user = await AsyncAuthService(session).register_user(
+                RegisterRequest(telegram_id=930000002, username="async")
+            )
+            profile = await AsyncUserService(session).get_user_profile(user.id)
+            released = await AsyncBuyerService(session).cleanup_stale_allocations()
+            history, next_cursor = await AsyncTrafficService(session).get_session_history(user.id)
+            return user.id, profile, released, history, next_cursor
+
+    user_id, profile, released, history, next_cursor = asyncio.run(run())
+
+    # Written through aiosqlite, visible to the sync engine
+    assert db.get(User, user_id).username == "async"
+    assert profile.telegram_id == 930000002
+    assert released == 1
+    assert db.query(Package).one().status == PackageStatus.AVAILABLE.value
+    assert history == [] and next_cursor is None
+
+
+def test_async_webhook_and_history(async_env):
+    """Test payout webhooks and session history on rows written through the sync engine"""
+    db, session_factory = async_env
+    user = User(telegram_id=930000003)
+    db.add(user)
+    db.commit()
+    device = Device(user_id=user.id, device_id="async-device")
+    db.add(device)
+    db.commit()
+    traffic_session = TrafficSession(
+        user_id=user.id, device_id=device.id, session_uuid="async-session", total_bytes=1024
+    )
+    db.add_all([
+        Payment(
+            user_id=user.id, amount=7.5, payment_method="cryptomus",
+            status=PaymentStatus.PENDING
+        ),
+        traffic_session,
+    ])
+    db.commit()
+    payment_id = db.query(Payment.id).filter_by(user_id=user.id).scalar()
+
+    async def run():
+        async with session_factory() as session:
+            payments = AsyncPaymentService(session)
+            found = await payments.handle_webhook(
+                {"order_id": f"payout_{payment_id}_1", "status": "check"}
+            )
+            missing = await payments.handle_webhook(
+                {"order_id": f"payout_{payment_id + 1}_1", "status": "check"}
+            )
+            history, _ = await AsyncTrafficService(session).get_session_history(user.id)
+            return found, missing, history
+
+    found, missing, history = asyncio.run(run())
+    assert found is True and missing is False
+    assert [(s.id, s.bytes_total) for s in history] == [(traffic_session.id, 1024)]
+
+
+def test_async_register_records_counter_after_commit(async_env, monkeypatch):
+    """Test only a created user is counted, from the async wrapper"""
+    _, session_factory = async_env
+    recorded = []
+
+    class Counters:
+        async def record_new_user(self):
+            recorded.append("new_user")
+
+    monkeypatch.setattr(auth_service, "report_counters", Counters())
+
+    async def run():
+        async with session_factory() as session:
+            service = AsyncAuthService(session)
+            await service.register_user(RegisterRequest(telegram_id=930000004))
+            await service.register_user(RegisterRequest(telegram_id=930000004, username="again"))
+
+    asyncio.run(run())
+    assert recorded == ["new_user"]
@@ -0,0 +1,128 @@
+"""
+Test chunked admin broadcasts
+"""
+
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from traffic_share.core.exceptions import ValidationError
+from traffic_share.server import broadcast_runner as runner_module
+from traffic_share.server.broadcast_runner import BroadcastRunner
+from traffic_share.server.config import settings
+from traffic_share.server.database import Base
+from traffic_share.server.models import (
+    BroadcastJob, BroadcastJobStatus, Notification, TrafficSession, User
+)
+from traffic_share.server.services.notification_service import NotificationService
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    """File database shared by the test and runner threads"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'broadcasts.db'}")
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(bind=engine)
+    engine.dispose()
+
+
+def create_users(db, count: int, **fields):
+    users = [User(telegram_id=960000000 + i, **fields) for i in range(count)]
+    db.add_all(users)
+    db.commit()
+    return users
+
+
+def test_broadcast_chunks_resume_after_last_user(session_factory):
+    """Test each chunk continues after the last committed user"""
+    db = session_factory()
+    users = create_users(db, 5)
+    users[4].is_active = False
+    db.commit()
+
+    service = NotificationService(db)
+    job = service.create_broadcast_job("admin", "Hello", "Body", "all")
+    assert job.total == 4
+
+    assert service.run_broadcast_chunk(job.id, chunk_size=3) is True
+    db.refresh(job)
+    assert job.status == BroadcastJobStatus.RUNNING
+    assert (job.processed, job.last_user_id) == (3, users[2].id)
+
+    # A fresh service (e.g. after a restart) picks up where the job stopped
+    service = NotificationService(session_factory())
+    while service.run_broadcast_chunk(job.id, chunk_size=3):
+        pass
+
+    response = service.get_broadcast_job(job.id)
+    assert response.status == "completed"
+    assert (response.processed, response.progress) == (4, 1.0)
+
+    notifications = db.query(Notification).order_by(Notification.user_id).all()
+    assert [n.user_id for n in notifications] == [u.id for u in users[:4]]
+    assert {(n.title, n.notification_type) for n in notifications} == {("Hello", "admin")}
+
+
+def test_broadcast_targets(session_factory):
+    """Test verified, region and user_id targets"""
+    db = session_factory()
+    users = create_users(db, 3)
+    users[0].is_verified = True
+    db.add(TrafficSession(
+        user_id=users[1].id, device_id=1, session_uuid="broadcast-session", region="KZ"
+    ))
+    db.commit()
+
+    service = NotificationService(db)
+    assert service.broadcast_notification("admin", "T", "M", "verified") == 1
+    assert service.broadcast_notification("admin", "T", "M", "region:kz") == 1
+    assert service.broadcast_notification("admin", "T", "M", f"user_id:{users[2].id}") == 1
+
+    with pytest.raises(ValidationError):
+        service.create_broadcast_job("admin", "T", "M", "region:")
+    with pytest.raises(ValidationError):
+        service.create_broadcast_job("admin", "T", "M", "everyone")
+
+
+def test_cancelled_broadcast_stops(session_factory):
+    """Test a cancelled job runs no further chunks"""
+    db = session_factory()
+    create_users(db, 4)
+
+    service = NotificationService(db)
+    job = service.create_broadcast_job("admin", "T", "M")
+    service.run_broadcast_chunk(job.id, chunk_size=2)
+    service.cancel_broadcast_job(job.id)
+
+    assert service.run_broadcast_chunk(job.id, chunk_size=2) is False
+    assert db.query(Notification).count() == 2
+
+
+def test_runner_completes_and_resumes_jobs(session_factory, monkeypatch):
+    """Test queued jobs are resumed at start and run to completion"""
+    monkeypatch.setattr(runner_module, "SessionLocal", session_factory)
+    monkeypatch.setattr(settings, "BROADCAST_CHUNK_SIZE", 2)
+    monkeypatch.setattr(settings, "BROADCAST_CHUNK_DELAY", 0)
+
+    db = session_factory()
+    create_users(db, 5)
+    job = NotificationService(db).create_broadcast_job("admin", "T", "M")
+
+    async def run():
+        runner = BroadcastRunner()
+        await runner.start()
+        for _ in range(200):
+            await asyncio.sleep(0.01)
+            if not runner._tasks:
+                break
+        await runner.stop()
+
+    asyncio.run(run())
+
+    db.expire_all()
+    finished = db.get(BroadcastJob, job.id)
+    assert finished.status == BroadcastJobStatus.COMPLETED
+    assert finished.processed == 5
+    assert db.query(Notification).count() == 5
@@ -0,0 +1,209 @@
+"""
+Test daily report snapshots and intraday counters
+"""
+
+import asyncio
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pytest
+import redis
+
+from traffic_share.server import daily_reports
+from traffic_share.server.config import settings
+from traffic_share.server.daily_reports import (
+    IntradayCounters, day_start, get_reports, snapshot_day, today_report
+)
+from traffic_share.server.models import (
+    DailyReport, Payment, PaymentStatus, User, UserTrafficRollup
+)
+from traffic_share.server.rollups import PERIOD_DAY
+from traffic_share.server.tasks import report_task
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+            return self
+        return call
+
+    def execute(self):
+        return [getattr(self.redis, name)(*args, **kwargs) for name, args, kwargs in self.calls]
+
+
+class FakeAsyncPipeline(FakePipeline):
+    async def execute(self):
+        return super().execute()
+
+
+class FakeAsyncRedis:
+    def __init__(self, redis):
+        self.redis = redis
+
+    def pipeline(self, transaction=True):
+        return FakeAsyncPipeline(self.redis)
+
+
+class FakeRedis:
+    def __init__(self):
+        self.hashes = {}
+        self.sets = {}
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def hincrby(self, key, field, amount):
+        values = self.hashes.setdefault(key, {})
+        values[field] = str(int(values.get(field, 0)) + amount)
+
+    def hincrbyfloat(self, key, field, amount):
+        values = self.hashes.setdefault(key, {})
+        values[field] = str(float(values.get(field, 0)) + amount)
+
+    def hset(self, key, mapping):
+        self.hashes.setdefault(key, {}).update({k: str(v) for k, v in mapping.items()})
+
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    def pfadd(self, key, *values):
+        self.sets.setdefault(key, set()).update(values)
+
+    def pfcount(self, key):
+        return len(self.sets.get(key, ()))
+
+    def expire(self, key, seconds):
+        pass
+
+
+@pytest.fixture
+def counters(monkeypatch):
+    fake = FakeRedis()
+    counters = IntradayCounters(
+        client_factory=lambda: fake, async_client_factory=lambda: FakeAsyncRedis(fake)
+    )
+    monkeypatch.setattr(daily_reports, "report_counters", counters)
+    monkeypatch.setattr(settings, "REPORT_COUNTERS_ENABLED", True)
+    return counters
+
+
+def add_day_activity(test_db, day: datetime, first_telegram_id: int):
+    """Two users created on day, one login, traffic and a completed payout"""
+    users = [
+        User(telegram_id=first_telegram_id + i, created_at=day + timedelta(hours=i + 1))
+        for i in range(2)
+    ]
+    users[0].last_login_at = day + timedelta(hours=5)
+    test_db.add_all(users)
+    test_db.commit()
+
+    test_db.add_all([
+        UserTrafficRollup(
+            user_id=users[0].id, period=PERIOD_DAY, bucket_start=day,
+            bytes_total=3 * 1024 ** 3, earnings=1.5
+        ),
+        Payment(
+            user_id=users[0].id, amount=4.0, payment_method="cryptomus",
+            status=PaymentStatus.COMPLETED, completed_at=day + timedelta(hours=6)
+        ),
+    ])
+    test_db.commit()
+    return users
+
+
+def test_counters_need_seeding(counters):
+    """Test counters only count as complete once seeded"""
+    today = day_start()
+    asyncio.run(counters.record_new_user())
+    asyncio.run(counters.record_login(1))
+    assert counters.read(today) is None
+
+    counters.seed(today, new_users=5, total_payouts=10.0, login_user_ids=[1, 2])
+    asyncio.run(counters.record_new_user())
+    asyncio.run(counters.record_login(3))
+    asyncio.run(counters.record_payout(2.5))
+
+    assert counters.read(today) == {
+        "new_users": 6, "total_payouts": 12.5, "active_users": 3
+    }
+
+
+def test_counter_writes_pause_after_redis_error(monkeypatch):
+    """Test a Redis error stops counter writes for the backoff window"""
+    monkeypatch.setattr(settings, "REPORT_COUNTERS_ENABLED", True)
+    calls = []
+
+    def broken_client():
+        calls.append(1)
+        raise redis.ConnectionError("down")
+
+    counters = IntradayCounters(async_client_factory=broken_client)
+    asyncio.run(counters.record_new_user())
+    asyncio.run(counters.record_login(1))
+    assert len(calls) == 1
+
+    counters._paused_until = 0.0
+    asyncio.run(counters.record_login(1))
+    assert len(calls) == 2
+
+
+def test_snapshot_and_lookup(test_db, counters):
+    """Test a closed day is computed once and then read from the table"""
+    day = datetime(2021, 3, 1)
+    add_day_activity(test_db, day, 950000001)
+
+    values = snapshot_day(test_db, day)
+    assert values["new_users"] == 2
+    assert values["active_users"] == 1
+    assert values["traffic_bytes"] == 3 * 1024 ** 3
+    assert values["total_earnings"] == 1.5
+    assert values["total_payouts"] == 4.0
+
+    # Later reads are lookups, not aggregates
+    stored = test_db.get(DailyReport, day)
+    stored.new_users = 42
+    test_db.commit()
+
+    reports = get_reports(test_db, day - timedelta(days=1), day)
+    assert [r["report_date"] for r in reports] == [day - timedelta(days=1), day]
+    assert reports[1]["new_users"] == 42
+    assert test_db.get(DailyReport, day - timedelta(days=1)) is not None
+
+
+def test_today_report_from_counters(test_db, counters):
+    """Test today seeds counters once and then follows increments"""
+    today = day_start()
+    first = today_report(test_db)
+
+    asyncio.run(counters.record_new_user())
+    asyncio.run(counters.record_payout(1.25))
+    second = today_report(test_db)
+
+    assert second["report_date"] == today
+    assert second["new_users"] == first["new_users"] + 1
+    assert second["total_payouts"] == first["total_payouts"] + 1.25
+    assert get_reports(test_db, today + timedelta(days=1), today + timedelta(days=2)) == []
+
+
+def test_report_task_snapshots_missing_days(test_db, counters, monkeypatch):
+    """Test the task fills only closed days that have no snapshot"""
+    @contextmanager
+    def db_context():
+        yield test_db
+
+    monkeypatch.setattr(report_task, "get_db_context", db_context)
+    monkeypatch.setattr(settings, "REPORT_BACKFILL_DAYS", 3)
+    now = datetime(2022, 6, 10, 0, 10)
+
+    stored = report_task.snapshot_closed_days(now)
+    assert stored == [datetime(2022, 6, 7), datetime(2022, 6, 8), datetime(2022, 6, 9)]
+    assert report_task.snapshot_closed_days(now) == []
+
+    # The live session count only describes the day that just closed
+    assert test_db.get(DailyReport, datetime(2022, 6, 8)).active_sessions is None
+    assert test_db.get(DailyReport, datetime(2022, 6, 9)).active_sessions is not None
@@ -0,0 +1,90 @@
+"""
+Test shared HTTP client registry
+"""
+
+import asyncio
+import httpx
+import pytest
+
+from traffic_share.server.http_clients import HTTPClientRegistry, UpstreamConfig
+
+
+def make_registry(handler, retries: int = 2) -> HTTPClientRegistry:
+    return HTTPClientRegistry({
+        "test": lambda: UpstreamConfig(
+            base_url="http://upstream",
+            retries=retries,
+            backoff=0,
+            transport=httpx.MockTransport(handler)
+        )
+    })
+
+
+def test_idempotent_request_retried_on_503():
+    """Test GET is retried on 503 and the client is reused"""
+    calls = []
+
+    def handler(request):
+        calls.append(request.method)
+        return httpx.Response(503 if len(calls) < 3 else 200, json={"ok": True})
+
+    registry = make_registry(handler)
+
+    async def scenario():
+        client = registry.get("test")
+        response = await registry.request("test", "GET", "/ping")
+        same_client = registry.get("test") is client
+        await registry.stop()
+        return response, same_client
+
+    response, same_client = asyncio.run(scenario())
+
+    assert response.status_code == 200
+    assert calls == ["GET", "GET", "GET"]
+    assert same_client
+
+
+def test_post_not_retried_after_send():
+    """Test POST is not repeated once the server answered"""
+    calls = []
+
+    def handler(request):
+        calls.append(request.method)
+        return httpx.Response(503)
+
+    registry = make_registry(handler)
+
+    async def scenario():
+        response = await registry.request("test", "POST", "/payout", json={})
+        await registry.stop()
+        return response
+
+    assert asyncio.run(scenario()).status_code == 503
+    assert calls == ["POST"]
+
+
+def test_connect_error_retried_for_post():
+    """Test connection failures are retried for any method, then raised"""
+    calls = []
+
+    def handler(request):
+        calls.append(request.method)
+        raise httpx.ConnectError("refused", request=request)
+
+    registry = make_registry(handler, retries=1)
+
+    async def scenario():
+        try:
+            await registry.request("test", "POST", "/payout")
+        finally:
+            await registry.stop()
+
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(scenario())
+    assert calls == ["POST", "POST"]
+
+
+def test_unknown_upstream():
+    """Test unknown upstream names are rejected"""
+    with pytest.raises(KeyError):
+        make_registry(lambda request: httpx.Response(200)).get("missing")
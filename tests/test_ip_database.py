@@ -0,0 +1,82 @@
+"""
+Test offline IP database
+"""
+
+import asyncio
+import os
+
+from traffic_share.core.ip_database import IPDatabase, IPRangeSet
+from traffic_share.core.region_check import RegionChecker
+
+
+CSV = """network,country_code,asn,as_org,is_hosting
+1.0.0.0/24,AU,13335,Cloudflare,0
+8.8.8.0/24,US,15169,Google LLC,0
+81.2.69.0/24,GB,20712,Andrews & Arnold,0
+2001:db8::/32,DE,64500,Example IPv6,0
+5.6.7.0/24,NL,64501,Some Hosting BV,1
+"""
+
+
+def write_db(tmp_path, content=CSV):
+    path = tmp_path / "ranges.csv"
+    path.write_text(content)
+    return path
+
+
+def test_range_set_merges_and_matches():
+    """Test overlapping ranges are merged and both families match"""
+    ranges = IPRangeSet(["10.0.0.0/8", "10.1.0.0/16", "192.168.1.10-192.168.1.20", "2001:db8::/64"])
+
+    assert len(ranges) == 3
+    assert ranges.contains("10.200.0.1")
+    assert ranges.contains("192.168.1.15")
+    assert not ranges.contains("192.168.1.21")
+    assert ranges.contains("2001:db8::1")
+    assert not ranges.contains("not-an-ip")
+
+
+def test_lookup_ipv4_and_ipv6(tmp_path):
+    """Test country and ASN lookups"""
+    db = IPDatabase(str(write_db(tmp_path)))
+    db.load()
+
+    record = db.lookup("8.8.8.8")
+    assert record.country_code == "US"
+    assert record.asn == 15169
+
+    assert db.lookup("2001:db8::42").country_code == "DE"
+    assert db.lookup("9.9.9.9") is None
+    assert db.is_hosting("5.6.7.8")
+    assert not db.is_hosting("8.8.8.8")
+
+
+def test_hot_reload(tmp_path):
+    """Test changed files are reloaded"""
+    path = write_db(tmp_path)
+    db = IPDatabase(str(path))
+    db.load()
+    assert not db.reload_if_changed()
+
+    path.write_text("start_ip,end_ip,country_code\n8.8.8.0,8.8.8.255,CA\n")
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+
+    assert db.reload_if_changed()
+    assert db.lookup("8.8.8.8").country_code == "CA"
+    assert db.lookup("1.0.0.1") is None
+
+
+def test_region_checker_uses_database(tmp_path):
+    """Test region checks are answered offline"""
+    db = IPDatabase(str(write_db(tmp_path)))
+    db.load()
+    checker = RegionChecker(ip_api_enabled=False, ip_database=db)
+
+    info = asyncio.run(checker.get_ip_info("8.8.8.8"))
+    assert info["country_code"] == "US"
+    assert info["source"] == "database"
+    assert not info["is_vpn"]
+
+    assert asyncio.run(checker.get_ip_info("5.6.7.8"))["is_vpn"]
+    assert checker.is_in_range("10.1.2.3", checker.VPN_IP_RANGES)
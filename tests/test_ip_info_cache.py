@@ -0,0 +1,68 @@
+"""
+Test IP info cache
+"""
+
+import asyncio
+
+from traffic_share.server.geoip import IPInfoCache, CachedRegionChecker
+
+
+def test_single_flight_and_memory_hits():
+    """Test concurrent lookups share one load and later ones hit memory"""
+    calls = []
+
+    async def loader(ip):
+        calls.append(ip)
+        await asyncio.sleep(0.01)
+        return {"ip": ip, "country_code": "US", "source": "ip-api"}
+
+    cache = IPInfoCache(max_size=100, ttl=60, negative_ttl=1, use_redis=False)
+
+    async def scenario():
+        first = await asyncio.gather(*(cache.get("8.8.8.8", loader) for _ in range(5)))
+        again = await cache.get("8.8.8.8", loader)
+        return first, again
+
+    first, again = asyncio.run(scenario())
+
+    assert calls == ["8.8.8.8"]
+    assert all(info["country_code"] == "US" for info in first)
+    assert again["country_code"] == "US"
+    assert cache.stats["miss"] == 1
+    assert cache.stats["coalesced"] == 4
+    assert cache.stats["memory_hit"] == 1
+
+
+def test_negative_answers_expire_quickly():
+    """Test fallback answers use the short TTL"""
+    calls = []
+
+    async def loader(ip):
+        calls.append(ip)
+        return {"ip": ip, "country_code": "US", "source": "fallback"}
+
+    cache = IPInfoCache(max_size=100, ttl=60, negative_ttl=0.01, use_redis=False)
+
+    async def scenario():
+        await cache.get("1.2.3.4", loader)
+        await asyncio.sleep(0.02)
+        await cache.get("1.2.3.4", loader)
+
+    asyncio.run(scenario())
+    assert calls == ["1.2.3.4", "1.2.3.4"]
+
+
+def test_cached_region_checker():
+    """Test validate_region goes through the cache"""
+    checker = CachedRegionChecker(
+        cache=IPInfoCache(max_size=100, ttl=60, negative_ttl=1, use_redis=False),
+        ip_api_enabled=False
+    )
+
+    async def scenario():
+        await checker.validate_region("8.8.8.8")
+        await checker.validate_region("8.8.8.8")
+
+    asyncio.run(scenario())
+    assert checker.cache.stats["miss"] == 1
+    assert checker.cache.stats["memory_hit"] == 1
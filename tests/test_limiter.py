@@ -0,0 +1,61 @@
+"""
+Test rate limiting
+"""
+
+import asyncio
+import pytest
+from traffic_share.server.limiter import LocalTokenBucket, RateLimiter
+
+
+def test_parse_rate_string():
+    """Test rate string parsing"""
+    limiter = RateLimiter()
+
+    assert limiter.parse_rate_string("10/minute") == (10, 60)
+    assert limiter.parse_rate_string("5/second") == (5, 1)
+    assert limiter.parse_rate_string("invalid") == (60, 60)
+
+
+def test_local_bucket_limits_and_refills():
+    """Test local token bucket allows a burst then refills over time"""
+    bucket = LocalTokenBucket()
+
+    for _ in range(3):
+        limited, _ = bucket.consume("ip:1.2.3.4", 3, 60, now=0.0)
+        assert not limited
+
+    limited, info = bucket.consume("ip:1.2.3.4", 3, 60, now=0.0)
+    assert limited
+    assert info["reset_in"] == 20
+
+    # One token every 20 seconds
+    limited, _ = bucket.consume("ip:1.2.3.4", 3, 60, now=20.0)
+    assert not limited
+
+
+def test_local_bucket_evicts_old_keys():
+    """Test local bucket stays bounded"""
+    bucket = LocalTokenBucket(max_keys=2)
+
+    bucket.consume("a", 1, 60, now=0.0)
+    bucket.consume("b", 1, 60, now=0.0)
+    bucket.consume("c", 1, 60, now=0.0)
+
+    limited, _ = bucket.consume("a", 1, 60, now=0.0)
+    assert not limited
+
+
+def test_limiter_falls_back_without_redis():
+    """Test limiter uses the local bucket when Redis is not connected"""
+    limiter = RateLimiter()
+
+    results = [
+        asyncio.run(limiter.is_rate_limited("user:1", 2, 60))[0]
+        for _ in range(3)
+    ]
+
+    assert results == [False, False, True]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
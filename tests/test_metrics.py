@@ -0,0 +1,57 @@
+"""
+Test Prometheus metrics
+"""
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from traffic_share.server.metrics import (
+    RequestRate, REQUEST_LATENCY, observe_request, render_latest
+)
+
+
+def test_request_rate_window():
+    """Test requests older than the window are not counted"""
+    rate = RequestRate(window_seconds=60)
+
+    for _ in range(3):
+        rate.mark(now=1000)
+    rate.mark(now=1030)
+    assert rate.per_minute(now=1030) == 4
+
+    # Slot of second 1000 is reused at 1060
+    rate.mark(now=1060)
+    assert rate.per_minute(now=1060) == 2
+    assert rate.per_minute(now=1200) == 0
+
+
+def test_observe_request_uses_route_label():
+    """Test latency is labelled by route template"""
+    observe_request("GET", "/api/test/{item_id}", 200, 0.01)
+    observe_request("GET", None, 404, 0.001)
+
+    samples = {
+        (s.labels.get("route"), s.labels.get("status")): s.value
+        for metric in REQUEST_LATENCY.collect()
+        for s in metric.samples
+        if s.name.endswith("_count")
+    }
+    assert samples[("/api/test/{item_id}", "200")] >= 1
+    assert samples[("unmatched", "404")] >= 1
+
+
+def test_metrics_endpoint():
+    """Test metrics are served in Prometheus text format"""
+    from traffic_share.server.routes import system_routes
+
+    app = FastAPI()
+    app.include_router(system_routes.router, prefix="/api")
+    client = TestClient(app)
+
+    response = client.get("/api/system/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "traffic_share_http_request_duration_seconds" in response.text
+
+    body, _ = render_latest()
+    assert b"traffic_share_rate_limit_check_seconds" in body
@@ -0,0 +1,189 @@
+"""
+Test the Telegram notification delivery queue and sender
+"""
+
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from telegram.error import BadRequest, Forbidden, RetryAfter, TimedOut
+
+from traffic_share.bot.delivery import TelegramSender
+from traffic_share.server.config import settings
+from traffic_share.server.database import Base
+from traffic_share.server.models import Notification, NotificationDeliveryStatus, User
+from traffic_share.server.services.notification_service import (
+    DeliveryResult, NotificationService, PendingDelivery
+)
+from traffic_share.server.tasks.notify_task import deliver_pending_notifications
+
+
+SENT = NotificationDeliveryStatus.SENT
+PENDING = NotificationDeliveryStatus.PENDING
+FAILED = NotificationDeliveryStatus.FAILED
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'delivery.db'}")
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(bind=engine)
+    engine.dispose()
+
+
+class FakeBot:
+    """Records sends; errors maps chat id -> exceptions raised in turn"""
+
+    def __init__(self, errors=None):
+        self.errors = errors or {}
+        self.sent = []
+
+    async def send_message(self, chat_id, text, parse_mode=None):
+        await asyncio.sleep(0)
+        if self.errors.get(chat_id):
+            raise self.errors[chat_id].pop(0)
+        self.sent.append((chat_id, text, parse_mode, time.monotonic()))
+
+
+def create_notifications(db, count: int):
+    users = [User(telegram_id=990000000 + i) for i in range(count)]
+    db.add_all(users)
+    db.commit()
+    notifications = [
+        Notification(user_id=user.id, title="Hello", message=f"Message {i}",
+                     notification_type="info")
+        for i, user in enumerate(users)
+    ]
+    # System notification without a user is never delivered
+    notifications.append(Notification(title="System", message="-", notification_type="system"))
+    db.add_all(notifications)
+    db.commit()
+    return users, notifications
+
+
+def test_claim_and_record_deliveries(session_factory):
+    """Test claimed rows are not claimed again and outcomes are stored in bulk"""
+    db = session_factory()
+    users, notifications = create_notifications(db, 3)
+    service = NotificationService(db)
+    now = datetime.utcnow()
+
+    first = service.claim_deliveries(batch_size=2, now=now)
+    assert [d.chat_id for d in first] == [990000000, 990000001]
+    assert first[0].attempts == 1
+    second = service.claim_deliveries(batch_size=2, now=now)
+    assert [d.id for d in second] == [notifications[2].id]
+    assert service.claim_deliveries(now=now) == []
+
+    retry_at = now + timedelta(seconds=30)
+    service.record_deliveries([
+        DeliveryResult(first[0].id, SENT),
+        DeliveryResult(first[1].id, PENDING, "TimedOut", retry_at),
+        DeliveryResult(second[0].id, FAILED, "Forbidden: bot was blocked by the user"),
+    ])
+
+    db.expire_all()
+    rows = [db.get(Notification, n.id) for n in notifications]
+    assert [r.delivery_status for r in rows] == ["sent", "pending", "failed", "pending"]
+    assert rows[0].sent_via_bot is True and rows[0].delivered_at is not None
+    assert rows[1].next_attempt_at == retry_at and rows[1].delivery_error == "TimedOut"
+
+    # Due again after the retry time
+    assert service.claim_deliveries(now=now) == []
+    retried = service.claim_deliveries(now=retry_at)
+    assert [(d.id, d.attempts) for d in retried] == [(notifications[1].id, 2)]
+
+    # Never recorded (worker stopped): back in the queue after the claim timeout
+    expired = retry_at + timedelta(seconds=settings.NOTIFY_CLAIM_TIMEOUT)
+    assert service.release_stale_deliveries(retry_at) == 0
+    assert service.release_stale_deliveries(expired) == 1
+    assert [d.id for d in service.claim_deliveries(now=expired)] == [notifications[1].id]
+
+
+def test_sender_classifies_errors(monkeypatch):
+    """Test flood control, permanent and transient errors"""
+    monkeypatch.setattr(settings, "NOTIFY_MAX_ATTEMPTS", 2)
+    bot = FakeBot({
+        2: [RetryAfter(1)],
+        3: [Forbidden("Forbidden: bot was blocked by the user")],
+        4: [TimedOut()],
+        5: [TimedOut()],
+        6: [BadRequest("Can't parse entities: can't find end of the entity")],
+    })
+    sender = TelegramSender(bot_factory=lambda: bot, rate=1000, chat_interval=0)
+    sender.pause = lambda seconds: None
+
+    deliveries = [
+        PendingDelivery(chat, chat, "T", "m", 2 if chat == 5 else 1, datetime.utcnow())
+        for chat in (1, 2, 3, 4, 5, 6)
+    ]
+    deliveries.append(PendingDelivery(7, None, "T", "m", 1, datetime.utcnow()))
+    results = asyncio.run(sender.send_many(deliveries))
+
+    assert [r.status for r in results] == [SENT, PENDING, FAILED, PENDING, FAILED, SENT, FAILED]
+    assert results[1].retry_at is not None and "Flood control" in results[1].error
+    assert results[3].retry_at >= datetime.utcnow() + timedelta(seconds=settings.NOTIFY_RETRY_BACKOFF - 5)
+    # Unparseable Markdown is sent as plain text
+    assert [(chat, parse_mode) for chat, _, parse_mode, _ in bot.sent] == [
+        (1, "Markdown"), (6, None)
+    ]
+
+
+def test_sender_throttles_per_chat_and_globally():
+    """Test messages to one chat are spaced and the global rate is kept"""
+    bot = FakeBot()
+    sender = TelegramSender(bot_factory=lambda: bot, rate=100, chat_interval=0.05, concurrency=4)
+
+    async def run():
+        await asyncio.gather(*(
+            sender.send_text(chat, "hi") for chat in (1, 1, 1, 2, 3, 4, 5, 6)
+        ))
+
+    asyncio.run(run())
+
+    same_chat = [sent_at for chat, _, _, sent_at in bot.sent if chat == 1]
+    assert all(b - a >= 0.045 for a, b in zip(same_chat, same_chat[1:]))
+    times = sorted(sent_at for *_, sent_at in bot.sent)
+    assert times[-1] - times[0] >= 7 * 0.01 * 0.9
+
+
+def test_retry_after_pauses_all_sends():
+    """Test flood control holds other chats until it has passed"""
+    bot = FakeBot({1: [RetryAfter(1)]})
+    sender = TelegramSender(bot_factory=lambda: bot, rate=1000, chat_interval=0)
+    sender.pause = lambda seconds, pause=sender.pause: pause(0.1)
+
+    async def run():
+        started = time.monotonic()
+        results = await sender.send_many([
+            PendingDelivery(1, 1, "T", "m", 1, datetime.utcnow()),
+        ])
+        await sender.send_text(2, "hi")
+        return started, results
+
+    started, results = asyncio.run(run())
+    assert results[0].status == PENDING
+    assert bot.sent[0][3] - started >= 0.09
+
+
+def test_deliver_pending_notifications(session_factory, monkeypatch):
+    """Test the notify task drains the queue in batches"""
+    monkeypatch.setattr(settings, "NOTIFY_BATCH_SIZE", 2)
+    db = session_factory()
+    users, notifications = create_notifications(db, 5)
+    bot = FakeBot({990000003: [Forbidden("Forbidden: user is deactivated")]})
+    sender = TelegramSender(bot_factory=lambda: bot, rate=1000, chat_interval=0)
+
+    delivered = asyncio.run(
+        deliver_pending_notifications(session_factory=session_factory, sender=sender)
+    )
+
+    assert delivered == 4
+    assert sorted(chat for chat, *_ in bot.sent) == [990000000, 990000001, 990000002, 990000004]
+    db.expire_all()
+    assert [n.delivery_status for n in notifications] == [
+        "sent", "sent", "sent", "failed", "sent", "pending"
+    ]
@@ -0,0 +1,75 @@
+"""
+Test set-based package allocation
+"""
+
+import pytest
+from traffic_share.server.models import User, Buyer, Package, PackageAllocation
+from traffic_share.server.services.package_allocator import PackageAllocator
+
+
+def create_packages(test_db, telegram_id: int, ips: list, region: str = "UZ"):
+    """Create user, buyer and one available package per IP"""
+    user = User(telegram_id=telegram_id)
+    buyer = Buyer(
+        name=f"allocator-buyer-{telegram_id}",
+        email=f"buyer-{telegram_id}@example.com",
+        api_key=f"allocator-key-{telegram_id}"
+    )
+    test_db.add_all([user, buyer])
+    test_db.commit()
+
+    packages = [
+        Package(
+            package_uuid=f"alloc-{telegram_id}-{i}",
+            user_id=user.id,
+            ip=ip,
+            size_bytes=1000,
+            region=region
+        )
+        for i, ip in enumerate(ips)
+    ]
+    test_db.add_all(packages)
+    test_db.commit()
+    return buyer, packages
+
+
+def test_allocate_one_package_per_user_ip(test_db):
+    """Test duplicate user + IP pairs are allocated once per buyer"""
+    buyer, packages = create_packages(
+        test_db, 910000001, ["10.0.0.1", "10.0.0.1", "10.0.0.2"]
+    )
+    allocator = PackageAllocator(test_db)
+
+    allocated, deadlines = allocator.allocate(buyer.id, 10, candidate_ids=[p.id for p in packages])
+    test_db.commit()
+
+    assert sorted(p.ip for p in allocated) == ["10.0.0.1", "10.0.0.2"]
+    assert test_db.query(PackageAllocation).filter_by(buyer_id=buyer.id).count() == 2
+
+    # Buyer still holds 10.0.0.1 - the remaining duplicate is not handed out
+    again = allocator.allocate(buyer.id, 10, candidate_ids=[p.id for p in packages])
+    assert again.packages == [] and again.deadlines == []
+
+
+def test_allocate_respects_max_count_and_region(test_db):
+    """Test max_count and region filter"""
+    buyer, packages = create_packages(
+        test_db, 910000002, ["10.1.0.1", "10.1.0.2", "10.1.0.3"], region="KZ"
+    )
+    allocator = PackageAllocator(test_db)
+    ids = [p.id for p in packages]
+
+    assert allocator.allocate(buyer.id, 5, region="US", candidate_ids=ids).packages == []
+
+    allocated = allocator.allocate(buyer.id, 2, region="KZ", candidate_ids=ids).packages
+    test_db.commit()
+
+    assert len(allocated) == 2
+    statuses = {
+        p.status for p in test_db.query(Package).filter(Package.id.in_(ids))
+    }
+    assert statuses == {"allocated", "available"}
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
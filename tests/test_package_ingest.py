@@ -0,0 +1,176 @@
+"""
+Test chunked bulk package ingestion
+"""
+
+import json
+import sqlite3
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from traffic_share.server.database import Base
+from traffic_share.core.exceptions import ValidationError
+from traffic_share.server.models import User, Package, PackageStatus
+from traffic_share.server.services.admin_service import AdminService
+from traffic_share.server.services.package_ingest import (
+    PackageIngestor, detect_format, normalize, FORMAT_CSV, FORMAT_NDJSON,
+    SQLITE_MAX_VARIABLES
+)
+
+
+def create_user(test_db, telegram_id: int) -> User:
+    user = User(telegram_id=telegram_id)
+    test_db.add(user)
+    test_db.commit()
+    return user
+
+
+def ndjson(rows: list) -> list:
+    return [json.dumps(row) + "\n" for row in rows]
+
+
+def test_normalize_validates_rows():
+    """Test row validation reasons"""
+    row = normalize({"uuid": " p-1 ", "user_id": "7", "ip": "10.0.0.1", "size_bytes": "5", "region": "uz"})
+    assert row["package_uuid"] == "p-1"
+    assert row["user_id"] == 7
+    assert row["region"] == "UZ"
+
+    for record, reason in [
+        ({"user_id": 1, "ip": "10.0.0.1"}, "missing uuid"),
+        ({"uuid": "x", "user_id": "a", "ip": "10.0.0.1"}, "invalid user_id"),
+        ({"uuid": "x", "user_id": 1, "ip": "10.0.0.999"}, "invalid ip"),
+        ({"uuid": "x", "user_id": 1, "ip": "10.0.0.1", "size_bytes": -1}, "invalid size"),
+    ]:
+        with pytest.raises(ValueError, match=reason):
+            normalize(record)
+
+
+def test_detect_format():
+    """Test format from parameter or file name"""
+    assert detect_format("packages.csv") == FORMAT_CSV
+    assert detect_format("packages.jsonl") == FORMAT_NDJSON
+    assert detect_format("packages.csv", "ndjson") == FORMAT_NDJSON
+    with pytest.raises(ValidationError):
+        detect_format("packages.xml", "xml")
+
+
+def test_ingest_ndjson_reports_row_errors(test_db):
+    """Test valid rows are loaded and bad rows reported by line"""
+    user = create_user(test_db, 935000001)
+    lines = ndjson([
+        {"uuid": "ingest-1", "user_id": user.id, "ip": "10.2.0.1", "size_bytes": 100},
+        {"uuid": "ingest-2", "user_id": user.id, "ip": "not-an-ip", "size_bytes": 100},
+        {"uuid": "ingest-3", "user_id": 999999999, "ip": "10.2.0.3", "size_bytes": 100},
+        {"uuid": "ingest-1", "user_id": user.id, "ip": "10.2.0.4", "size_bytes": 100},
+    ]) + ["{broken\n", "\n", json.dumps(
+        {"uuid": "ingest-5", "user_id": user.id, "ip": "10.2.0.5", "size_bytes": 100}
+    )]
+
+    report = PackageIngestor(test_db).ingest_lines(lines, FORMAT_NDJSON)
+
+    assert report.received == 6
+    assert report.inserted == 2
+    assert report.failed == 4
+    errors = {e["line"]: e["error"] for e in report.errors}
+    assert errors.pop(5).startswith("invalid JSON")
+    assert errors == {
+        2: "invalid ip",
+        3: "user not found",
+        4: "duplicate uuid in input",
+    }
+
+    packages = test_db.query(Package).filter(
+        Package.package_uuid.in_(["ingest-1", "ingest-5"])
+    ).all()
+    assert len(packages) == 2
+    assert all(p.status == PackageStatus.AVAILABLE.value for p in packages)
+
+
+def test_ingest_csv_conflict_skip_and_update(test_db):
+    """Test existing uuids are skipped, or updated only while available"""
+    user = create_user(test_db, 935000002)
+    header = "package_uuid,user_id,ip,size_bytes,region\n"
+
+    first = PackageIngestor(test_db).ingest_lines([
+        header,
+        f"csv-1,{user.id},10.3.0.1,100,UZ\n",
+        f"csv-2,{user.id},10.3.0.2,100,UZ\n",
+    ], FORMAT_CSV)
+    assert first.inserted == 2
+
+    allocated = test_db.query(Package).filter_by(package_uuid="csv-2").one()
+    allocated.status = PackageStatus.ALLOCATED.value
+    test_db.commit()
+
+    rows = [
+        header,
+        f"csv-1,{user.id},10.3.0.11,200,KZ\n",
+        f"csv-2,{user.id},10.3.0.12,200,KZ\n",
+        f"csv-3,{user.id},10.3.0.13,200,KZ\n",
+    ]
+
+    skipped = PackageIngestor(test_db).ingest_lines(rows, FORMAT_CSV)
+    assert (skipped.inserted, skipped.updated, skipped.skipped) == (1, 0, 2)
+
+    updated = PackageIngestor(test_db, on_conflict="update").ingest_lines(rows, FORMAT_CSV)
+    assert (updated.inserted, updated.updated, updated.skipped) == (0, 2, 1)
+
+    test_db.expire_all()
+    by_uuid = {
+        p.package_uuid: p
+        for p in test_db.query(Package).filter(Package.package_uuid.like("csv-%"))
+    }
+    assert by_uuid["csv-1"].ip == "10.3.0.11"
+    assert by_uuid["csv-1"].region == "KZ"
+    assert by_uuid["csv-3"].size_bytes == 200
+    # Allocated packages are never rewritten
+    assert by_uuid["csv-2"].ip == "10.3.0.2"
+
+
+def test_ingest_stays_below_sqlite_variable_limit(tmp_path):
+    """Test large chunks load on SQLite builds limited to 999 bound parameters"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'ingest.db'}")
+
+    @event.listens_for(engine, "connect")
+    def limit_variables(dbapi_connection, _):
+        dbapi_connection.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, SQLITE_MAX_VARIABLES)
+
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    try:
+        user = create_user(db, 935000004)
+        rows = [
+            {"uuid": f"limit-{i}", "user_id": user.id, "ip": f"10.5.{i // 250}.{i % 250}"}
+            for i in range(1500)
+        ]
+
+        first = PackageIngestor(db).ingest_lines(ndjson(rows), FORMAT_NDJSON)
+        again = PackageIngestor(db, on_conflict="update").ingest_lines(ndjson(rows), FORMAT_NDJSON)
+    finally:
+        db.close()
+        engine.dispose()
+
+    assert first.inserted == 1500 and not first.errors
+    assert (again.inserted, again.updated) == (0, 1500)
+
+
+def test_bulk_create_packages_uses_ingestor(test_db):
+    """Test the JSON bulk endpoint keeps its (created, errors) contract"""
+    user = create_user(test_db, 935000003)
+
+    created, errors = AdminService(test_db).bulk_create_packages([
+        {"uuid": "bulk-1", "user_id": user.id, "ip": "10.4.0.1", "size_bytes": 100},
+        {"uuid": "bulk-2", "user_id": 999999998, "ip": "10.4.0.2", "size_bytes": 100},
+    ])
+    assert created == 1
+    assert errors == ["Row 2: user not found"]
+
+    # Existing uuids are conflicts, skipped by default
+    created, errors = AdminService(test_db).bulk_create_packages([
+        {"uuid": "bulk-1", "user_id": user.id, "ip": "10.4.0.3", "size_bytes": 100},
+    ])
+
+    assert (created, errors) == (0, [])
+    assert test_db.query(Package).filter_by(package_uuid="bulk-1").count() == 1
@@ -0,0 +1,49 @@
+"""
+Test package pool ready queues
+"""
+
+import asyncio
+import pytest
+from traffic_share.server.models import Package
+from traffic_share.server.package_pool import MemoryReadyQueues, PackagePool, NO_REGION
+
+
+def test_memory_queues_pop_lowest_ids():
+    """Test ids are unique per shard and popped in id order"""
+    queues = MemoryReadyQueues()
+
+    async def scenario():
+        await queues.add("UZ", [5, 3, 9, 3])
+        await queues.add("KZ", [1])
+        first = await queues.pop(["UZ"], 2)
+        rest = await queues.pop(["UZ", "KZ"], 10)
+        return first, rest, await queues.sizes()
+
+    first, rest, sizes = asyncio.run(scenario())
+
+    assert first == [3, 5]
+    assert rest == [9, 1]
+    assert sizes == {"UZ": 0, "KZ": 0}
+
+
+def test_pool_refill_by_region(test_db):
+    """Test refill queues available packages under their region"""
+    test_db.add_all([
+        Package(package_uuid="pool-1", region="TJ"),
+        Package(package_uuid="pool-2", region="TJ", status="allocated"),
+        Package(package_uuid="pool-3")
+    ])
+    test_db.commit()
+
+    pool = PackagePool(queues=MemoryReadyQueues(), target_size=100)
+    by_shard = pool.load_available(test_db)
+
+    tj_ids = [
+        p.id for p in test_db.query(Package).filter(Package.package_uuid == "pool-1")
+    ]
+    assert by_shard["TJ"] == tj_ids
+    assert NO_REGION in by_shard
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,74 @@
+"""
+Test keyset pagination helpers
+"""
+
+import pytest
+from datetime import datetime, timedelta
+from traffic_share.core.exceptions import ValidationError
+from traffic_share.server.models import AuditLog, User
+from traffic_share.server.services.admin_service import AdminService
+from traffic_share.server.utils import encode_cursor, decode_cursor, keyset_paginate
+
+
+def test_cursor_round_trip():
+    """Test cursor encodes and decodes position"""
+    position = (datetime(2024, 5, 1, 10, 30, 0), 42)
+
+    assert decode_cursor(encode_cursor(position)) == position
+
+
+def test_invalid_cursor_rejected():
+    """Test malformed cursors raise ValidationError"""
+    with pytest.raises(ValidationError):
+        decode_cursor("not-a-cursor")
+
+    with pytest.raises(ValidationError):
+        decode_cursor(encode_cursor(["1; DROP TABLE users"]))
+
+
+def test_keyset_paginate_walks_all_rows(test_db):
+    """Test pages follow each other without gaps or repeats"""
+    created = datetime(2024, 1, 1)
+    # Two rows share a timestamp, id breaks the tie
+    for i, offset in enumerate([0, 1, 1, 2, 3]):
+        test_db.add(AuditLog(
+            action="keyset_test",
+            entity_id=i,
+            created_at=created + timedelta(minutes=offset)
+        ))
+    test_db.commit()
+
+    query = test_db.query(AuditLog).filter(AuditLog.action == "keyset_test")
+    seen = []
+    cursor = None
+    while True:
+        page, cursor = keyset_paginate(
+            query, [AuditLog.created_at, AuditLog.id], cursor, page_size=2
+        )
+        seen.extend(log.entity_id for log in page)
+        if not cursor:
+            break
+
+    assert seen == [4, 3, 2, 1, 0]
+
+
+def test_user_list_page_matches_cursor(test_db):
+    """Test the deprecated page number returns the page the cursor reaches"""
+    created = datetime(1999, 1, 1)
+    test_db.add_all([
+        User(telegram_id=970000000 + i, created_at=created + timedelta(minutes=i))
+        for i in range(4)
+    ])
+    test_db.commit()
+
+    service = AdminService(test_db)
+    _, _, cursor = service.get_all_users(page_size=1, exact_total=True)
+    by_cursor, _, _ = service.get_all_users(page_size=1, cursor=cursor, exact_total=True)
+    by_page, total, next_cursor = service.get_all_users(page_size=1, exact_total=True, page=2)
+
+    assert [u.id for u in by_page] == [u.id for u in by_cursor]
+    assert total >= 4 and next_cursor is None
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,32 @@
+"""
+Test partition maintenance helpers
+"""
+
+import pytest
+from datetime import datetime
+from traffic_share.server.tasks.partition_task import (
+    interval_start, next_boundary, partition_name
+)
+
+
+def test_daily_boundaries():
+    """Test day partitions start at midnight"""
+    moment = datetime(2025, 3, 15, 17, 30)
+
+    assert interval_start(moment, "day") == datetime(2025, 3, 15)
+    assert next_boundary(moment, "day") == datetime(2025, 3, 16)
+    assert partition_name("traffic_logs", datetime(2025, 3, 15)) == "traffic_logs_p20250315"
+
+
+def test_weekly_boundaries():
+    """Test week partitions start on Monday"""
+    moment = datetime(2025, 3, 15, 17, 30)  # Saturday
+
+    assert interval_start(moment, "week") == datetime(2025, 3, 10)
+    assert next_boundary(moment, "week") == datetime(2025, 3, 17)
+    # A day-aligned start in the middle of a week ends at the next Monday
+    assert next_boundary(datetime(2025, 3, 12), "week") == datetime(2025, 3, 17)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
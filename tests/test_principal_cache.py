@@ -0,0 +1,104 @@
+"""
+Test authenticated principal cache
+"""
+
+import asyncio
+import time
+import pytest
+from datetime import datetime, timedelta
+from traffic_share.server.models import BuyerToken
+from traffic_share.server import principal_cache as principal_cache_module
+from traffic_share.server.principal_cache import TTLCache, PrincipalCache, TokenUsageRecorder
+
+
+class FakeBuyer:
+    def __init__(self, buyer_id: int):
+        self.id = buyer_id
+
+
+def test_ttl_cache_expiry_and_lru():
+    """Test entries expire and least recently used are evicted"""
+    cache = TTLCache(max_size=2, ttl=60)
+
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+    cache.set("d", 4, ttl=0.01)
+    time.sleep(0.02)
+    assert cache.get("d") is None
+
+
+def test_apply_invalidation():
+    """Test invalidation messages drop matching entries"""
+    cache = PrincipalCache(max_size=100, ttl=60)
+
+    expires = datetime.utcnow() + timedelta(days=1)
+    token_a = BuyerToken(buyer_id=1, token_hash="hash-a", expires_at=expires)
+    token_b = BuyerToken(buyer_id=1, token_hash="hash-b", expires_at=expires)
+    token_c = BuyerToken(buyer_id=2, token_hash="hash-c", expires_at=expires)
+    for token in (token_a, token_b, token_c):
+        cache.set_buyer(FakeBuyer(token.buyer_id), token)
+
+    cache.apply_invalidation("token:hash-c")
+    assert cache.get_buyer("hash-c") is None
+    assert cache.get_buyer("hash-a") is not None
+
+    cache.apply_invalidation("buyer:1")
+    assert cache.get_buyer("hash-a") is None
+    assert cache.get_buyer("hash-b") is None
+
+
+def test_invalidate_token_publishes_through_async_client(monkeypatch):
+    """Test revocations drop the local entry and are published without blocking"""
+    published = []
+
+    class FakeAsyncRedis:
+        async def publish(self, channel, message):
+            published.append((channel, message))
+
+    monkeypatch.setattr(principal_cache_module, "get_async_redis", lambda: FakeAsyncRedis())
+    cache = PrincipalCache(max_size=100, ttl=60)
+    token = BuyerToken(
+        buyer_id=1, token_hash="hash-r", expires_at=datetime.utcnow() + timedelta(days=1)
+    )
+    cache.set_buyer(FakeBuyer(1), token)
+
+    asyncio.run(cache.invalidate_token("hash-r"))
+
+    assert cache.get_buyer("hash-r") is None
+    assert published == [(principal_cache_module.INVALIDATION_CHANNEL, "token:hash-r")]
+
+
+def test_expired_token_not_cached():
+    """Test tokens are never cached past their expiry"""
+    cache = PrincipalCache(max_size=100, ttl=60)
+    token = BuyerToken(
+        buyer_id=1,
+        token_hash="hash-old",
+        expires_at=datetime.utcnow() - timedelta(seconds=1)
+    )
+
+    cache.set_buyer(FakeBuyer(1), token)
+    assert cache.get_buyer("hash-old") is None
+
+
+def test_token_usage_keeps_latest():
+    """Test repeated touches keep only the latest timestamp"""
+    recorder = TokenUsageRecorder(flush_interval=60)
+    first = datetime(2024, 1, 1, 12, 0, 0)
+    second = first + timedelta(seconds=5)
+
+    recorder.touch(7, first)
+    recorder.touch(7, second)
+
+    assert recorder._last_used == {7: second}
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
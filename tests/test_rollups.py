@@ -0,0 +1,51 @@
+"""
+Test per-user traffic rollups
+"""
+
+import pytest
+from datetime import datetime
+from traffic_share.server.models import User, UserTrafficRollup
+from traffic_share.server.rollups import apply_rollups, bucket_starts, read_summary, TOTAL_BUCKET
+
+
+def test_bucket_starts():
+    """Test a moment maps to hour, day, month and total buckets"""
+    buckets = dict(bucket_starts(datetime(2024, 3, 15, 13, 45, 10)))
+
+    assert buckets["hour"] == datetime(2024, 3, 15, 13)
+    assert buckets["day"] == datetime(2024, 3, 15)
+    assert buckets["month"] == datetime(2024, 3, 1)
+    assert buckets["total"] == TOTAL_BUCKET
+
+
+def test_rollups_accumulate_and_summarize(test_db):
+    """Test deltas are upserted and read back as a summary"""
+    user = User(telegram_id=920000001)
+    test_db.add(user)
+    test_db.commit()
+
+    now = datetime(2024, 3, 15, 13, 0, 0)
+    apply_rollups(test_db, [
+        (user.id, now, 1000, 0.0),
+        (user.id, now, 500, 0.5),
+        (user.id, datetime(2024, 3, 10, 8, 0, 0), 200, 0.1),
+        (user.id, datetime(2024, 2, 1, 8, 0, 0), 100, 0.0)
+    ])
+    test_db.commit()
+
+    hour_rows = test_db.query(UserTrafficRollup).filter_by(
+        user_id=user.id, period="hour"
+    ).count()
+    assert hour_rows == 3
+
+    stats = read_summary(test_db, user.id, now=now)
+
+    assert stats["daily_bytes"] == 1500
+    assert stats["weekly_bytes"] == 1700
+    assert stats["monthly_bytes"] == 1700
+    assert stats["total_bytes"] == 1800
+    assert stats["total_earnings"] == pytest.approx(0.6)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
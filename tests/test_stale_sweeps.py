@@ -0,0 +1,188 @@
+"""
+Test batched stale session and stale allocation sweeps
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from traffic_share.core.exceptions import SessionError
+from traffic_share.server.config import settings
+from traffic_share.server.database import Base
+from traffic_share.server.models import (
+    Buyer, Device, Package, PackageStatus, TrafficSession, TrafficSessionStatus,
+    User, UserTrafficRollup
+)
+from traffic_share.server.schemas import TrafficStopRequest
+from traffic_share.server.services.buyer_service import BuyerService
+from traffic_share.server.services.traffic_service import TrafficService
+from traffic_share.server.utils import calculate_earnings
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    """File database shared by concurrent sweeps"""
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'sweeps.db'}",
+        connect_args={"timeout": 30}
+    )
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(bind=engine)
+    engine.dispose()
+
+
+GB = 1024 ** 3
+
+
+def create_sessions(db, stale: int, fresh: int):
+    """Stale and fresh active sessions over two users"""
+    users = [User(telegram_id=970000000 + i) for i in range(2)]
+    db.add_all(users)
+    db.commit()
+    device = Device(user_id=users[0].id, device_id="sweep-device")
+    db.add(device)
+    db.commit()
+
+    now = datetime.utcnow()
+    last_seen = now - timedelta(seconds=settings.STALE_SESSION_TIMEOUT + 60)
+    sessions = []
+    for i in range(stale + fresh):
+        sessions.append(TrafficSession(
+            user_id=users[i % 2].id,
+            device_id=device.id,
+            session_uuid=f"sweep-{i}",
+            total_bytes=GB,
+            updated_at=last_seen if i < stale else now
+        ))
+    db.add_all(sessions)
+    db.commit()
+    return users, sessions, last_seen
+
+
+def test_stale_sessions_settled_in_batches(session_factory):
+    """Test stale sessions are closed and paid once, in bounded batches"""
+    db = session_factory()
+    users, sessions, last_seen = create_sessions(db, stale=5, fresh=1)
+
+    assert TrafficService(db).settle_stale_sessions(batch_size=2, max_batches=2) == 4
+    assert TrafficService(db).settle_stale_sessions(batch_size=2) == 1
+    assert TrafficService(db).settle_stale_sessions(batch_size=2) == 0
+
+    db.expire_all()
+    per_session = calculate_earnings(GB, settings.PRICE_PER_GB)
+    closed = [s for s in sessions if s.status == TrafficSessionStatus.FAILED]
+    assert len(closed) == 5
+    assert all(s.earnings == per_session and s.ended_at == last_seen for s in closed)
+    assert sessions[5].status == TrafficSessionStatus.ACTIVE
+
+    # Sessions alternate between the two users: 3 and 2 stale sessions
+    assert [u.balance for u in users] == [3 * per_session, 2 * per_session]
+    assert [u.total_earned for u in users] == [3 * per_session, 2 * per_session]
+
+    rollup_earnings = sum(
+        earnings for (earnings,) in db.query(UserTrafficRollup.earnings).filter(
+            UserTrafficRollup.user_id.in_([u.id for u in users]),
+            UserTrafficRollup.period == "day"
+        )
+    )
+    assert rollup_earnings == pytest.approx(5 * per_session)
+
+
+def test_concurrent_session_sweeps_pay_once(session_factory):
+    """Test sweeps running at the same time never settle a session twice"""
+    db = session_factory()
+    users, _, _ = create_sessions(db, stale=20, fresh=0)
+
+    def sweep():
+        sweep_db = session_factory()
+        try:
+            return TrafficService(sweep_db).settle_stale_sessions(batch_size=3)
+        finally:
+            sweep_db.close()
+
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        closed = sum(pool.map(lambda _: sweep(), range(3)))
+
+    assert closed == 20
+    db.expire_all()
+    per_session = calculate_earnings(GB, settings.PRICE_PER_GB)
+    assert sum(u.balance for u in users) == pytest.approx(20 * per_session)
+
+
+def test_stale_allocations_released_in_batches(session_factory):
+    """Test only expired allocations are released"""
+    db = session_factory()
+    buyer = Buyer(name="sweep-buyer", email="sweep@example.com", api_key="sweep-key")
+    db.add(buyer)
+    db.commit()
+
+    now = datetime.utcnow()
+    ttl = timedelta(seconds=settings.PACKAGE_ALLOCATION_TTL)
+    expired = now - ttl - timedelta(seconds=60)
+    packages = [
+        Package(
+            package_uuid=f"sweep-package-{i}",
+            status=PackageStatus.ALLOCATED.value,
+            assigned_buyer_id=buyer.id,
+            allocated_at=expired if i < 5 else now,
+            expires_at=(expired if i < 5 else now) + ttl
+        )
+        for i in range(6)
+    ]
+    db.add_all(packages)
+    db.commit()
+
+    assert BuyerService(db).cleanup_stale_allocations(batch_size=2) == 5
+
+    db.expire_all()
+    assert [p.status for p in packages] == [PackageStatus.AVAILABLE.value] * 5 + [
+        PackageStatus.ALLOCATED.value
+    ]
+    assert all(p.assigned_buyer_id is None and p.allocated_at is None for p in packages[:5])
+    assert packages[5].assigned_buyer_id == buyer.id
+
+
+def test_stop_after_sweep_is_not_paid_twice(session_factory):
+    """Test a late stop only credits what the sweep did not pay"""
+    db = session_factory()
+    users, sessions, _ = create_sessions(db, stale=1, fresh=0)
+    per_gb = calculate_earnings(GB, settings.PRICE_PER_GB)
+
+    assert TrafficService(db).settle_stale_sessions() == 1
+    db.expire_all()
+    assert users[0].balance == pytest.approx(per_gb)
+
+    # Same counters as the sweep settled: nothing more to pay
+    response = TrafficService(db).stop_session(users[0].id, TrafficStopRequest(
+        session_id="sweep-0", final_bytes_tx=GB, final_bytes_rx=0
+    ))
+    db.expire_all()
+    assert response.earnings == pytest.approx(per_gb)
+    assert users[0].balance == pytest.approx(per_gb)
+    assert sessions[0].status == TrafficSessionStatus.COMPLETED
+
+    # Stopping again is rejected
+    with pytest.raises(SessionError):
+        TrafficService(db).stop_session(users[0].id, TrafficStopRequest(
+            session_id="sweep-0", final_bytes_tx=2 * GB, final_bytes_rx=0
+        ))
+
+
+def test_stop_after_sweep_credits_the_difference(session_factory):
+    """Test final counters above the settled total are paid once"""
+    db = session_factory()
+    users, sessions, _ = create_sessions(db, stale=1, fresh=0)
+    per_gb = calculate_earnings(GB, settings.PRICE_PER_GB)
+
+    TrafficService(db).settle_stale_sessions()
+    TrafficService(db).stop_session(users[0].id, TrafficStopRequest(
+        session_id="sweep-0", final_bytes_tx=GB, final_bytes_rx=GB
+    ))
+
+    db.expire_all()
+    assert sessions[0].earnings == pytest.approx(2 * per_gb)
+    assert users[0].balance == pytest.approx(2 * per_gb)
+    assert users[0].total_earned == pytest.approx(2 * per_gb)
@@ -0,0 +1,135 @@
+"""
+Test streaming statistics export
+"""
+
+import csv
+import gzip
+import io
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+from traffic_share.core.exceptions import ValidationError
+from traffic_share.server.models import Payment, PaymentStatus, User
+from traffic_share.server.services import stats_export
+from traffic_share.server.services.stats_export import (
+    ExportState, StatsExporter, open_export, FORMAT_CSV_GZIP
+)
+
+
+def create_users(test_db, first_telegram_id: int, count: int, created_at: datetime):
+    users = [
+        User(
+            telegram_id=first_telegram_id + i, username=f"export-{i}",
+            created_at=created_at, updated_at=created_at
+        )
+        for i in range(count)
+    ]
+    test_db.add_all(users)
+    test_db.commit()
+    return users
+
+
+def read_csv(data: bytes) -> list:
+    return list(csv.DictReader(io.StringIO(data.decode("utf-8"))))
+
+
+def test_export_streams_csv_in_batches(test_db):
+    """Test every batch is emitted as soon as it is fetched"""
+    created_at = datetime(2031, 1, 10)
+    users = create_users(test_db, 940000001, 5, created_at)
+
+    exporter = StatsExporter(test_db, chunk_size=2)
+    chunks = list(exporter.iter_bytes(
+        "users", start=created_at, end=created_at + timedelta(days=1)
+    ))
+
+    # Three batches of at most two rows
+    assert len(chunks) == 3
+    rows = read_csv(b"".join(chunks))
+    assert [int(row["id"]) for row in rows] == [user.id for user in users]
+    assert rows[0]["username"] == "export-0"
+    assert rows[0]["created_at"] == created_at.isoformat()
+    assert exporter.rows_exported == 5
+
+
+def test_export_gzip_csv(test_db):
+    """Test gzip CSV output decompresses to the plain CSV"""
+    created_at = datetime(2031, 2, 10)
+    create_users(test_db, 940000101, 3, created_at)
+    window = {"start": created_at, "end": created_at + timedelta(days=1)}
+
+    plain = b"".join(StatsExporter(test_db).iter_bytes("users", **window))
+    compressed = b"".join(StatsExporter(test_db, chunk_size=1).iter_bytes(
+        "users", FORMAT_CSV_GZIP, **window
+    ))
+
+    assert gzip.decompress(compressed) == plain
+
+
+def test_export_rejects_unknown_dataset_and_format():
+    """Test dataset and format are validated before streaming"""
+    with pytest.raises(ValidationError):
+        open_export("secrets")
+    with pytest.raises(ValidationError):
+        open_export("users", "xlsx")
+
+
+def test_incremental_export_advances_watermark(test_db_engine, test_db, tmp_path, monkeypatch):
+    """Test incremental exports only return rows since the last one"""
+    monkeypatch.setattr(stats_export, "SessionLocal", sessionmaker(bind=test_db_engine))
+    state = ExportState(str(tmp_path / "state" / "export.json"))
+
+    now = datetime.utcnow()
+    create_users(test_db, 940000201, 1, now - timedelta(days=2))
+    create_users(test_db, 940000301, 1, now - timedelta(minutes=1))
+    state.set("users", now - timedelta(days=1))
+
+    stream, watermark = open_export("users", incremental=True, state=state)
+    assert watermark >= now
+    # Stored only once the stream has been consumed
+    assert state.get("users") < watermark
+
+    telegram_ids = {int(row["telegram_id"]) for row in read_csv(b"".join(stream))}
+    assert 940000301 in telegram_ids
+    assert 940000201 not in telegram_ids
+    assert state.get("users") == watermark
+
+    stream, _ = open_export("users", incremental=True, state=state)
+    assert read_csv(b"".join(stream)) == []
+
+
+def test_incremental_export_includes_changed_rows(test_db_engine, test_db, tmp_path, monkeypatch):
+    """Test rows updated after an incremental export are exported again"""
+    monkeypatch.setattr(stats_export, "SessionLocal", sessionmaker(bind=test_db_engine))
+    state = ExportState(str(tmp_path / "state" / "export.json"))
+
+    now = datetime.utcnow()
+    user, = create_users(test_db, 940000401, 1, now - timedelta(days=3))
+    payment = Payment(
+        user_id=user.id, amount=5.0, payment_method="usdt", status=PaymentStatus.PENDING,
+        created_at=now - timedelta(days=3), updated_at=now - timedelta(days=3)
+    )
+    test_db.add(payment)
+    test_db.commit()
+    state.set("users", now - timedelta(days=1))
+    state.set("payments", now - timedelta(days=1))
+
+    stream, _ = open_export("users", incremental=True, state=state)
+    assert "940000401" not in {row["telegram_id"] for row in read_csv(b"".join(stream))}
+    stream, _ = open_export("payments", incremental=True, state=state)
+    assert str(payment.id) not in {row["id"] for row in read_csv(b"".join(stream))}
+
+    # Balance change and payout completion after the last export
+    user.balance = 12.5
+    payment.status = PaymentStatus.COMPLETED
+    test_db.commit()
+
+    stream, _ = open_export("users", incremental=True, state=state)
+    rows = read_csv(b"".join(stream))
+    assert [(int(row["telegram_id"]), float(row["balance"])) for row in rows] == [(940000401, 12.5)]
+
+    stream, _ = open_export("payments", incremental=True, state=state)
+    rows = read_csv(b"".join(stream))
+    assert [int(row["id"]) for row in rows] == [payment.id]
+    assert "completed" in rows[0]["status"].lower()
@@ -0,0 +1,55 @@
+"""
+Test statistics collection
+"""
+
+import asyncio
+import pytest
+from contextlib import contextmanager
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from traffic_share.server.database import Base
+from traffic_share.server.models import SystemMetric, User
+from traffic_share.server.tasks import stats_task
+
+
+def test_stats_collection_writes_all_metrics(tmp_path, monkeypatch):
+    """Test collectors run and metrics are written in one batch"""
+    # File database - collectors use their own connections in worker threads
+    engine = create_engine(f"sqlite:///{tmp_path / 'stats.db'}")
+    Base.metadata.create_all(bind=engine)
+    TestSessionLocal = sessionmaker(bind=engine)
+
+    @contextmanager
+    def test_db_context():
+        db = TestSessionLocal()
+        try:
+            yield db
+            db.commit()
+        finally:
+            db.close()
+
+    monkeypatch.setattr(stats_task, "get_db_context", test_db_context)
+
+    with test_db_context() as db:
+        db.add(User(telegram_id=930000001, is_verified=True))
+
+    asyncio.run(stats_task.run_stats_collection())
+
+    with test_db_context() as db:
+        metrics = db.query(SystemMetric).all()
+        names = {m.metric_name for m in metrics}
+
+        assert {
+            "users_total", "users_verified", "traffic_sessions_active",
+            "payments_pending", "packages_available",
+            "stats_collection_duration_ms"
+        } <= names
+        # One batch shares one timestamp
+        assert len({m.timestamp for m in metrics}) == 1
+        assert next(m for m in metrics if m.metric_name == "users_verified").metric_value == 1
+
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,259 @@
+"""
+Test the job queue, task schedules and task worker
+"""
+
+import asyncio
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from traffic_share.server.config import settings
+from traffic_share.server.database import Base
+from traffic_share.server.models import TaskJob, TaskJobStatus
+from traffic_share.server.tasks import queue
+from traffic_share.server.tasks.schedule import (
+    CronSchedule, IntervalSchedule, parse_schedule, run_times
+)
+from traffic_share.server.tasks.worker import Scheduler, TaskSpec, TaskWorker, default_tasks
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    """File database shared by the test and worker threads"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'tasks.db'}")
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(bind=engine)
+    engine.dispose()
+
+
+def test_cron_schedule():
+    """Test cron fields, steps and the day-of-month / day-of-week rule"""
+    every_15 = CronSchedule("*/15 * * * *")
+    assert every_15.next_after(datetime(2024, 1, 1, 10, 7, 30)) == datetime(2024, 1, 1, 10, 15)
+    assert every_15.next_after(datetime(2024, 1, 1, 10, 15)) == datetime(2024, 1, 1, 10, 30)
+
+    weekdays = CronSchedule("0 3 * * 1-5")
+    # Friday 2024-01-05 04:00 -> Monday 03:00
+    assert weekdays.next_after(datetime(2024, 1, 5, 4, 0)) == datetime(2024, 1, 8, 3, 0)
+
+    # Either the 1st or a Sunday
+    either = CronSchedule("0 0 1 * 0")
+    assert either.next_after(datetime(2024, 1, 2)) == datetime(2024, 1, 7)
+
+    assert run_times(CronSchedule("30 1,13 * * *"), datetime(2024, 1, 1), datetime(2024, 1, 2)) == [
+        datetime(2024, 1, 1, 1, 30), datetime(2024, 1, 1, 13, 30)
+    ]
+
+    for invalid in ("* * * *", "60 * * * *", "*/0 * * * *", "5-1 * * * *", "0 0 31 2 *"):
+        with pytest.raises(ValueError):
+            CronSchedule(invalid).next_after(datetime(2024, 1, 1))
+
+
+def test_interval_schedule_is_aligned():
+    """Test interval runs land on the same times in every process"""
+    schedule = parse_schedule("300")
+    assert isinstance(schedule, IntervalSchedule)
+    assert schedule.next_after(datetime(2024, 1, 1, 10, 7, 30)) == datetime(2024, 1, 1, 10, 10)
+    assert isinstance(parse_schedule("0 * * * *"), CronSchedule)
+
+
+def test_default_tasks(monkeypatch):
+    """Test schedule overrides and the report snapshot time"""
+    monkeypatch.setattr(settings, "TASK_SCHEDULES", "backup=0 3 * * *; stats=1800")
+    monkeypatch.setattr(settings, "REPORT_SNAPSHOT_DELAY", 300)
+    tasks = default_tasks()
+
+    assert tasks["backup"].schedule.expression == "0 3 * * *"
+    assert tasks["stats"].schedule.seconds == 1800
+    assert tasks["reports"].schedule.next_after(datetime(2024, 1, 1, 12)) == datetime(2024, 1, 2, 0, 5)
+
+
+def test_enqueue_dedupe_and_claim(session_factory):
+    """Test a dedupe key is queued once and claimed jobs are not claimed again"""
+    db = session_factory()
+    now = datetime.utcnow()
+
+    assert queue.enqueue(db, "cleanup", dedupe_key="cleanup@1") is True
+    assert queue.enqueue(db, "cleanup", dedupe_key="cleanup@1") is False
+    assert queue.enqueue(db, "stats", {"full": True}, run_at=now - timedelta(minutes=1)) is True
+    assert queue.enqueue(db, "later", run_at=now + timedelta(hours=1)) is True
+
+    jobs = queue.claim(db, "worker-a", limit=10)
+    assert [job.name for job in jobs] == ["stats", "cleanup"]
+    assert jobs[0].payload == {"full": True}
+    assert jobs[0].attempts == 1
+
+    assert queue.claim(db, "worker-b", limit=10) == []
+
+    queue.complete(db, jobs[0])
+    db.expire_all()
+    assert db.get(TaskJob, jobs[0].id).status == TaskJobStatus.SUCCEEDED
+    assert db.get(TaskJob, jobs[1].id).locked_by == "worker-a"
+
+
+def test_fail_retries_with_backoff_then_dies(session_factory, monkeypatch):
+    """Test failed jobs are retried later and dead after max attempts"""
+    monkeypatch.setattr(settings, "TASK_RETRY_BACKOFF", 10.0)
+    monkeypatch.setattr(settings, "TASK_RETRY_BACKOFF_MAX", 15.0)
+    db = session_factory()
+    now = datetime.utcnow()
+    queue.enqueue(db, "flaky", run_at=now, max_attempts=3)
+
+    job = queue.claim(db, "w", now=now)[0]
+    assert queue.fail(db, job, "boom", now=now) is True
+    row = db.get(TaskJob, job.id)
+    assert (row.status, row.run_at, row.last_error) == (
+        TaskJobStatus.QUEUED, now + timedelta(seconds=10), "boom"
+    )
+
+    # Not due until the backoff has passed
+    assert queue.claim(db, "w", now=now) == []
+    job = queue.claim(db, "w", now=now + timedelta(seconds=10))[0]
+    assert queue.fail(db, job, "boom", now=now) is True
+    db.expire_all()
+    assert db.get(TaskJob, job.id).run_at == now + timedelta(seconds=15)
+
+    job = queue.claim(db, "w", now=now + timedelta(seconds=15))[0]
+    assert job.attempts == 3
+    assert queue.fail(db, job, "boom", now=now) is False
+    db.expire_all()
+    assert db.get(TaskJob, job.id).status == TaskJobStatus.DEAD
+
+
+def test_recover_stale_and_prune(session_factory, monkeypatch):
+    """Test jobs of a stopped worker are requeued, or dead on their last attempt"""
+    monkeypatch.setattr(settings, "TASK_VISIBILITY_TIMEOUT", 60)
+    db = session_factory()
+    now = datetime.utcnow()
+    queue.enqueue(db, "stuck", run_at=now)
+    queue.enqueue(db, "stuck-last", run_at=now, max_attempts=1)
+    stuck, last = queue.claim(db, "w", limit=2, now=now)
+
+    assert queue.recover_stale(db, now + timedelta(seconds=30)) == 0
+    assert queue.recover_stale(db, now + timedelta(seconds=61)) == 1
+    db.expire_all()
+    assert db.get(TaskJob, stuck.id).status == TaskJobStatus.QUEUED
+    assert db.get(TaskJob, last.id).status == TaskJobStatus.DEAD
+
+    later = now + timedelta(days=settings.TASK_JOB_RETENTION_DAYS + 1)
+    assert queue.prune_finished(db, later) == 1
+    assert db.get(TaskJob, last.id) is None
+
+
+def test_scheduler_queues_each_run_once(session_factory):
+    """Test two schedulers queue a due run once"""
+    calls = []
+    tasks = {
+        "tick": TaskSpec("tick", calls.append, IntervalSchedule(60)),
+        "boot": TaskSpec("boot", calls.append, None, run_on_start=True),
+    }
+    first, second = Scheduler(tasks, session_factory), Scheduler(tasks, session_factory)
+    start = datetime(2024, 1, 1, 10, 0, 30)
+
+    assert first.tick(start) == ["boot"]
+    assert second.tick(start + timedelta(seconds=1)) == ["boot"]
+    assert first.tick(start + timedelta(seconds=10)) == []
+
+    assert first.tick(start + timedelta(seconds=31)) == ["tick"]
+    assert second.tick(start + timedelta(seconds=32)) == []
+
+    db = session_factory()
+    assert db.query(TaskJob).filter(TaskJob.name == "tick").one().run_at == datetime(2024, 1, 1, 10, 1)
+
+
+def test_worker_runs_jobs(session_factory, monkeypatch):
+    """Test sync and async tasks succeed and failures are retried"""
+    monkeypatch.setattr(settings, "TASK_POLL_INTERVAL", 0.01)
+    monkeypatch.setattr(settings, "TASK_SCHEDULER_INTERVAL", 60)
+    results = []
+
+    def add(value):
+        results.append(value)
+
+    async def async_add(value):
+        await asyncio.sleep(0)
+        results.append(value)
+
+    def broken():
+        raise RuntimeError("broken")
+
+    async def slow():
+        await asyncio.sleep(10)
+
+    tasks = {
+        "add": TaskSpec("add", add),
+        "async_add": TaskSpec("async_add", async_add),
+        "broken": TaskSpec("broken", broken),
+        "slow": TaskSpec("slow", slow, timeout=0.05),
+    }
+
+    db = session_factory()
+    queue.enqueue(db, "add", {"value": 1})
+    queue.enqueue(db, "async_add", {"value": 2})
+    queue.enqueue(db, "broken", max_attempts=1)
+    queue.enqueue(db, "slow")
+    queue.enqueue(db, "missing", max_attempts=1)
+
+    async def run():
+        worker = TaskWorker(tasks, concurrency=2, session_factory=session_factory)
+        await worker.start()
+        for _ in range(300):
+            await asyncio.sleep(0.01)
+            db.expire_all()
+            # Every job either succeeded or recorded an error
+            finished = db.query(TaskJob).filter(
+                (TaskJob.status == TaskJobStatus.SUCCEEDED) | TaskJob.last_error.isnot(None)
+            ).count()
+            if finished == 5:
+                break
+        await worker.stop()
+
+    asyncio.run(run())
+
+    db.expire_all()
+    statuses = {job.name: (job.status, job.last_error) for job in db.query(TaskJob)}
+    assert sorted(results) == [1, 2]
+    assert statuses["add"] == (TaskJobStatus.SUCCEEDED, None)
+    assert statuses["async_add"] == (TaskJobStatus.SUCCEEDED, None)
+    assert statuses["broken"] == (TaskJobStatus.DEAD, "RuntimeError: broken")
+    assert statuses["missing"][0] == TaskJobStatus.DEAD
+    # Timed out, queued again after the backoff
+    assert statuses["slow"] == (TaskJobStatus.QUEUED, "Timed out")
+
+
+def test_timed_out_thread_is_not_run_twice(session_factory, monkeypatch):
+    """Test a sync task is deferred while its timed-out thread is still running"""
+    monkeypatch.setattr(settings, "TASK_RETRY_BACKOFF", 0)
+    release = threading.Event()
+    calls = []
+
+    def stuck():
+        calls.append(1)
+        release.wait(5)
+
+    tasks = {"stuck": TaskSpec("stuck", stuck, timeout=0.05)}
+    queue.enqueue(session_factory(), "stuck", max_attempts=2)
+
+    async def run():
+        worker = TaskWorker(tasks, session_factory=session_factory)
+
+        async def claim_and_run():
+            jobs = await asyncio.to_thread(worker._call, queue.claim, "test")
+            return await worker.run_job(jobs[0])
+
+        assert await claim_and_run() == "retry"
+        # Deferring does not use up the last attempt
+        assert await claim_and_run() == "deferred"
+        assert await claim_and_run() == "deferred"
+        assert len(calls) == 1
+
+        release.set()
+        while worker._overruns:
+            await asyncio.sleep(0.01)
+        assert await claim_and_run() == "succeeded"
+
+    asyncio.run(run())
+    assert len(calls) == 2
@@ -0,0 +1,141 @@
+"""
+Test traffic write-behind buffer
+"""
+
+import pytest
+from traffic_share.server.models import (
+    User, Device, TrafficSession, TrafficSessionStatus, TrafficLog
+)
+from traffic_share.server.traffic_buffer import TrafficWriteBuffer
+
+
+def create_session(test_db, telegram_id: int) -> TrafficSession:
+    """Create user, device and active session"""
+    user = User(telegram_id=telegram_id)
+    test_db.add(user)
+    test_db.commit()
+
+    device = Device(user_id=user.id, device_id=f"buffer-device-{telegram_id}")
+    test_db.add(device)
+    test_db.commit()
+
+    session = TrafficSession(
+        user_id=user.id,
+        device_id=device.id,
+        session_uuid=f"buffer-session-{telegram_id}"
+    )
+    test_db.add(session)
+    test_db.commit()
+    return session
+
+
+def test_buffer_coalesces_heartbeats(test_db):
+    """Test several heartbeats become one session update"""
+    session = create_session(test_db, 900000001)
+    buffer = TrafficWriteBuffer(flush_interval=60, max_entries=1000)
+
+    buffer.add(session.id, 100, 50)
+    buffer.add(session.id, 200, 25)
+
+    assert buffer.pending == 2
+
+    written = buffer.flush_sync(test_db)
+    test_db.refresh(session)
+
+    assert written == 2
+    assert buffer.pending == 0
+    assert session.bytes_uploaded == 300
+    assert session.bytes_downloaded == 75
+    assert session.total_bytes == 375
+
+    logs = test_db.query(TrafficLog).filter_by(session_id=session.id).all()
+    assert sorted(log.bytes_transferred for log in logs) == [150, 225]
+
+
+def test_buffer_requeues_failed_batch():
+    """Test a failed flush keeps the data for the next attempt"""
+    buffer = TrafficWriteBuffer(flush_interval=60, max_entries=1000)
+
+    buffer.add(1, 10, 10)
+    deltas, logs = buffer.drain()
+    buffer.add(1, 5, 0)
+    buffer.requeue(deltas, logs)
+
+    deltas, logs = buffer.drain()
+    assert len(deltas) == 1
+    assert deltas[0].bytes_tx == 15
+    assert deltas[0].bytes_rx == 10
+    assert [log["bytes_transferred"] for log in logs] == [20, 5]
+
+
+def test_buffer_skips_stopped_sessions(test_db):
+    """Test heartbeats flushed after a stop do not change the final totals"""
+    active = create_session(test_db, 900000021)
+    stopped = create_session(test_db, 900000022)
+    buffer = TrafficWriteBuffer(flush_interval=60, max_entries=1000)
+
+    buffer.add(active.id, 100, 0)
+    buffer.add(stopped.id, 100, 0)
+    stopped.status = TrafficSessionStatus.COMPLETED
+    test_db.commit()
+
+    buffer.flush_sync(test_db)
+    test_db.refresh(active)
+    test_db.refresh(stopped)
+
+    assert active.total_bytes == 100
+    assert stopped.total_bytes == 0
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
+
+
+def test_batch_update_applies_valid_items(test_db, monkeypatch):
+    """Test a batch is validated per item and written in one transaction"""
+    from traffic_share.server.config import settings
+    from traffic_share.server.schemas import TrafficUpdateRequest
+    from traffic_share.server.services.traffic_service import TrafficService
+
+    monkeypatch.setattr(settings, "TRAFFIC_BUFFER_ENABLED", False)
+    session = create_session(test_db, 900000011)
+    other = create_session(test_db, 900000012)
+
+    response = TrafficService(test_db).update_sessions_batch(session.user_id, [
+        TrafficUpdateRequest(session_id=session.session_uuid, bytes_tx=100, bytes_rx=10),
+        TrafficUpdateRequest(session_id="missing-session", bytes_tx=1, bytes_rx=1),
+        TrafficUpdateRequest(session_id=session.session_uuid, bytes_tx=200, bytes_rx=20),
+        TrafficUpdateRequest(session_id=other.session_uuid, bytes_tx=5, bytes_rx=5),
+    ])
+
+    assert response.accepted == 2
+    assert response.rejected == 2
+    assert [r.ok for r in response.results] == [True, False, True, False]
+    assert response.results[1].error == "Session not found"
+
+    test_db.refresh(session)
+    assert session.total_bytes == 330
+    assert test_db.query(TrafficLog).filter_by(session_id=session.id).count() == 2
+
+
+def test_batch_update_queues_in_buffer(test_db, monkeypatch):
+    """Test batch deltas are merged into the write-behind buffer"""
+    from traffic_share.server.config import settings
+    from traffic_share.server.schemas import TrafficUpdateRequest
+    from traffic_share.server.services import traffic_service
+
+    buffer = TrafficWriteBuffer(flush_interval=60, max_entries=1000)
+    monkeypatch.setattr(settings, "TRAFFIC_BUFFER_ENABLED", True)
+    monkeypatch.setattr(traffic_service, "traffic_buffer", buffer)
+    session = create_session(test_db, 900000013)
+
+    buffer.add(session.id, 1, 1)
+    traffic_service.TrafficService(test_db).update_sessions_batch(session.user_id, [
+        TrafficUpdateRequest(session_id=session.session_uuid, bytes_tx=10, bytes_rx=0),
+        TrafficUpdateRequest(session_id=session.session_uuid, bytes_tx=20, bytes_rx=0),
+    ])
+
+    assert buffer.pending == 3
+    buffer.flush_sync(test_db)
+    test_db.refresh(session)
+    assert session.bytes_uploaded == 31
@@ -0,0 +1,110 @@
+"""
+Test traffic WebSocket stream
+"""
+
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from starlette.websockets import WebSocketDisconnect
+
+from traffic_share.server.config import settings
+from traffic_share.server.database import Base
+from traffic_share.server.dependencies import security_manager
+from traffic_share.server.models import User, Device, TrafficSession
+from traffic_share.server.routes import traffic_stream_routes
+from traffic_share.server.traffic_buffer import TrafficWriteBuffer
+
+
+@pytest.fixture
+def stream_env(tmp_path, monkeypatch):
+    """File database shared by sync setup and the async endpoint"""
+    path = tmp_path / "stream.db"
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+
+    user = User(telegram_id=910000001)
+    db.add(user)
+    db.commit()
+    device = Device(user_id=user.id, device_id="stream-device")
+    db.add(device)
+    db.commit()
+    session = TrafficSession(user_id=user.id, device_id=device.id, session_uuid="stream-session")
+    db.add(session)
+    db.commit()
+
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    buffer = TrafficWriteBuffer(flush_interval=60, max_entries=1000)
+    monkeypatch.setattr(
+        traffic_stream_routes, "AsyncSessionLocal",
+        async_sessionmaker(bind=async_engine, expire_on_commit=False)
+    )
+    monkeypatch.setattr(traffic_stream_routes, "traffic_buffer", buffer)
+    monkeypatch.setattr(settings, "TRAFFIC_BUFFER_ENABLED", True)
+    monkeypatch.setattr(settings, "TRAFFIC_STREAM_FLUSH_INTERVAL", 0.01)
+    monkeypatch.setattr(settings, "TRAFFIC_STREAM_STATUS_INTERVAL", 3600.0)
+
+    app = FastAPI()
+    app.include_router(traffic_stream_routes.router, prefix="/api")
+    token = security_manager.create_access_token({"user_id": user.id})
+
+    yield TestClient(app), token, session.id, buffer
+
+    db.close()
+    engine.dispose()
+
+
+def test_stream_requires_token(stream_env):
+    """Test connections without credentials are closed with the application code"""
+    client, _, _, _ = stream_env
+
+    with client.websocket_connect("/api/traffic/stream?session_id=stream-session") as websocket:
+        with pytest.raises(WebSocketDisconnect) as closed:
+            websocket.receive_json()
+    assert closed.value.code == traffic_stream_routes.CLOSE_UNAUTHORIZED
+
+
+def test_stream_unknown_session_closes_not_found(stream_env):
+    """Test an unknown session is refused with 4404"""
+    client, token, _, _ = stream_env
+
+    url = f"/api/traffic/stream?session_id=missing-session&token={token}"
+    with client.websocket_connect(url) as websocket:
+        with pytest.raises(WebSocketDisconnect) as closed:
+            websocket.receive_json()
+    assert closed.value.code == traffic_stream_routes.CLOSE_NOT_FOUND
+
+
+def test_status_counts_buffered_bytes(stream_env):
+    """Test status includes bytes handed to the write buffer but not flushed"""
+    _, _, session_pk, buffer = stream_env
+    buffer.add(session_pk, 600, 400)
+
+    stream = traffic_stream_routes.TrafficStream(1, session_pk, "stream-session")
+    stream.record(20, 4)
+    state = asyncio.run(stream.status())
+
+    assert state["type"] == "status"
+    assert state["total_bytes"] == 1024
+
+
+def test_stream_updates_reach_buffer(stream_env):
+    """Test streamed counters are handed to the write buffer"""
+    client, token, session_pk, buffer = stream_env
+
+    url = f"/api/traffic/stream?session_id=stream-session&token={token}"
+    with client.websocket_connect(url) as websocket:
+        websocket.send_json({"type": "update", "bytes_tx": 100, "bytes_rx": 50})
+        websocket.send_json({"type": "update", "bytes_tx": 10, "bytes_rx": 5})
+        websocket.send_json({"type": "ping"})
+        assert websocket.receive_json() == {"type": "pong"}
+
+    deltas, logs = buffer.drain()
+    assert sum(d.bytes_tx for d in deltas) == 110
+    assert sum(d.bytes_rx for d in deltas) == 55
+    assert all(d.session_id == session_pk for d in deltas)
@@ -11,6 +11,10 @@ from telegram.ext import (
 
 from traffic_share.server.config import settings
 from traffic_share.server.logger import logger
+from traffic_share.server.http_clients import http_clients
+from traffic_share.bot.delivery import (
+    admin_chats, format_notification, send_to_admins, telegram_sender
+)
 from traffic_share.bot.handlers.user_handlers import (
     start_command, help_command, balance_command, stats_command
 )
@@ -32,6 +36,16 @@ def get_bot() -> Bot:
     return _bot_instance
 
 
+async def on_startup(application: Application):
+    """Open pooled HTTP clients"""
+    await http_clients.start()
+
+
+async def on_shutdown(application: Application):
+    """Close pooled HTTP clients"""
+    await http_clients.stop()
+
+
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle errors"""
     logger.error(f"Update {update} caused error {context.error}")
@@ -40,7 +54,13 @@ async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 def create_bot_application():
     """Create and configure bot application"""
     # Create application
-    application = Application.builder().token(settings.TELEGRAM_BOT_TOKEN).build()
+    application = (
+        Application.builder()
+        .token(settings.TELEGRAM_BOT_TOKEN)
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        .build()
+    )
     
     # User handlers
     application.add_handler(CommandHandler("start", start_command))
@@ -81,17 +101,9 @@ async def send_login_code(telegram_id: int, code: str):
 
 
 async def send_notification(telegram_id: int, message: str, title: str = None):
-    """Send notification to user"""
+    """Send notification to user (throttled with the notification queue)"""
     try:
-        bot = get_bot()
-        
-        text = f"📢 *{title}*\n\n{message}" if title else message
-        
-        await bot.send_message(
-            chat_id=telegram_id,
-            text=text,
-            parse_mode="Markdown"
-        )
+        await telegram_sender.send_text(telegram_id, format_notification(title, message))
         logger.info(f"Notification sent to {telegram_id}")
         return True
     except Exception as e:
@@ -100,27 +112,16 @@ async def send_notification(telegram_id: int, message: str, title: str = None):
 
 
 async def notify_admin(message: str):
-    """Notify admin channel"""
+    """Notify admins and the admin channel (in parallel)"""
     try:
-        admin_ids = settings.get_admin_ids()
-        if not admin_ids:
+        if not admin_chats():
             logger.warning("No admin IDs configured")
             return False
         
-        bot = get_bot()
-        
-        for admin_id in admin_ids:
-            try:
-                await bot.send_message(
-                    chat_id=admin_id,
-                    text=f"🔔 *Admin Alert*\n\n{message}",
-                    parse_mode="Markdown"
-                )
-            except Exception as e:
-                logger.error(f"Failed to send to admin {admin_id}: {e}")
+        reached = await send_to_admins(f"🔔 *Admin Alert*\n\n{message}")
         
-        logger.info("Admin notification sent")
-        return True
+        logger.info(f"Admin notification sent to {reached} chats")
+        return reached > 0
     except Exception as e:
         logger.error(f"Failed to send admin notification: {e}", exc_info=True)
         return False
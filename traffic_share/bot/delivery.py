@@ -0,0 +1,223 @@
+"""
+Throttled Telegram delivery
+
+TelegramSender sends through the shared Bot within Telegram's limits:
+at most NOTIFY_GLOBAL_RATE messages per second overall, one message per
+NOTIFY_CHAT_INTERVAL seconds to the same chat, and NOTIFY_CONCURRENCY
+requests in flight. A RetryAfter (flood control) pauses every send for
+the requested time and the message is retried after it. Blocked users
+and invalid chats fail permanently; other errors are retried with
+exponential backoff until NOTIFY_MAX_ATTEMPTS.
+
+The limits are per process - run the notify task in one worker process,
+or divide NOTIFY_GLOBAL_RATE between them.
+"""
+
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Union
+
+from telegram.error import BadRequest, Forbidden, RetryAfter
+
+from traffic_share.server.config import settings
+from traffic_share.server.logger import logger
+from traffic_share.server.models import NotificationDeliveryStatus
+from traffic_share.server.services.notification_service import (
+    DeliveryResult, PendingDelivery
+)
+
+
+# Per-chat slots kept before expired ones are pruned
+MAX_CHAT_SLOTS = 10000
+
+
+def format_notification(title: Optional[str], message: str) -> str:
+    """Notification text as sent to users"""
+    return f"📢 *{title}*\n\n{message}" if title else message
+
+
+def retry_delay(attempts: int) -> float:
+    """Seconds before retry number `attempts`: doubling, capped"""
+    delay = settings.NOTIFY_RETRY_BACKOFF * 2 ** max(attempts - 1, 0)
+    return min(delay, settings.NOTIFY_RETRY_BACKOFF_MAX)
+
+
+def _retry_after_seconds(error: RetryAfter) -> float:
+    retry_after = error.retry_after
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+class TelegramSender:
+    """Sends messages through the shared Bot at Telegram's rate limits"""
+
+    def __init__(
+        self,
+        bot_factory=None,
+        rate: float = None,
+        chat_interval: float = None,
+        concurrency: int = None
+    ):
+        self._bot_factory = bot_factory
+        self.rate = rate or settings.NOTIFY_GLOBAL_RATE
+        self.chat_interval = (
+            settings.NOTIFY_CHAT_INTERVAL if chat_interval is None else chat_interval
+        )
+        self.concurrency = concurrency or settings.NOTIFY_CONCURRENCY
+        self._next_slot = 0.0
+        self._chat_slots: Dict[Union[int, str], float] = {}  # reserved next send per chat
+        self._chat_sent: Dict[Union[int, str], float] = {}  # last actual send per chat
+        self._paused_until = 0.0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._semaphore_loop = None
+
+    @property
+    def bot(self):
+        if self._bot_factory is None:
+            from traffic_share.bot.bot import get_bot
+            self._bot_factory = get_bot
+        return self._bot_factory()
+
+    def _limit(self) -> asyncio.Semaphore:
+        """Concurrency limit of the running event loop"""
+        loop = asyncio.get_running_loop()
+        if self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    def pause(self, seconds: float):
+        """Hold every send for seconds (flood control)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def _reserve_chat(self, chat_id: Union[int, str]) -> float:
+        """Monotonic time this chat may receive its next message"""
+        now = time.monotonic()
+        slot = max(now, self._chat_slots.get(chat_id, 0.0))
+        self._chat_slots[chat_id] = slot + self.chat_interval
+
+        if len(self._chat_slots) > MAX_CHAT_SLOTS:
+            self._chat_slots = {
+                chat: next_slot for chat, next_slot in self._chat_slots.items()
+                if next_slot > now
+            }
+            self._chat_sent = {
+                chat: sent_at for chat, sent_at in self._chat_sent.items()
+                if sent_at + self.chat_interval > now
+            }
+        return slot
+
+    async def _wait_global(self):
+        """Wait for a global send slot, outside any flood control pause"""
+        while True:
+            now = time.monotonic()
+            if self._paused_until > now:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + 1.0 / self.rate
+            if slot > now:
+                await asyncio.sleep(slot - now)
+            # A pause may have started while waiting for the slot
+            if time.monotonic() >= self._paused_until:
+                return
+
+    async def send_text(
+        self,
+        chat_id: Union[int, str],
+        text: str,
+        parse_mode: Optional[str] = "Markdown"
+    ):
+        """Send one message within the limits (Telegram errors are raised)"""
+        delay = self._reserve_chat(chat_id) - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        async with self._limit():
+            # Queueing for a slot may have put this send right after the chat's last one
+            while True:
+                await self._wait_global()
+                last_sent = self._chat_sent.get(chat_id, float("-inf"))
+                delay = last_sent + self.chat_interval - time.monotonic()
+                if delay <= 0:
+                    break
+                await asyncio.sleep(delay)
+            self._chat_sent[chat_id] = time.monotonic()
+
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=text, parse_mode=parse_mode)
+            except RetryAfter as e:
+                self.pause(_retry_after_seconds(e))
+                raise
+            except BadRequest as e:
+                if not parse_mode or "can't parse entities" not in str(e).lower():
+                    raise
+                # Markdown characters in user-provided text, send it plain
+                await self._wait_global()
+                await self.bot.send_message(chat_id=chat_id, text=text)
+
+    async def deliver(self, delivery: PendingDelivery) -> DeliveryResult:
+        """Send a claimed notification and classify the outcome"""
+        if delivery.chat_id is None:
+            return DeliveryResult(delivery.id, NotificationDeliveryStatus.FAILED, "User not found")
+
+        try:
+            await self.send_text(
+                delivery.chat_id, format_notification(delivery.title, delivery.message)
+            )
+        except RetryAfter as e:
+            # Not the message's fault, retried regardless of attempts
+            return DeliveryResult(
+                delivery.id,
+                NotificationDeliveryStatus.PENDING,
+                f"Flood control: {e}",
+                datetime.utcnow() + timedelta(seconds=_retry_after_seconds(e))
+            )
+        except (Forbidden, BadRequest) as e:
+            # Bot blocked by the user, chat not found, ...
+            return DeliveryResult(delivery.id, NotificationDeliveryStatus.FAILED, str(e))
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if delivery.attempts >= settings.NOTIFY_MAX_ATTEMPTS:
+                return DeliveryResult(delivery.id, NotificationDeliveryStatus.FAILED, error)
+            return DeliveryResult(
+                delivery.id,
+                NotificationDeliveryStatus.PENDING,
+                error,
+                datetime.utcnow() + timedelta(seconds=retry_delay(delivery.attempts))
+            )
+
+        return DeliveryResult(delivery.id, NotificationDeliveryStatus.SENT)
+
+    async def send_many(self, deliveries: Iterable[PendingDelivery]) -> List[DeliveryResult]:
+        """Deliver a batch concurrently, in the order given"""
+        return list(await asyncio.gather(*(self.deliver(delivery) for delivery in deliveries)))
+
+
+# Global sender shared by the notify task and bot helpers
+telegram_sender = TelegramSender()
+
+
+def admin_chats() -> List[Union[int, str]]:
+    """Admin ids plus the optional admin channel"""
+    chats: List[Union[int, str]] = list(settings.get_admin_ids())
+    if settings.TELEGRAM_ADMIN_CHANNEL:
+        chats.append(settings.TELEGRAM_ADMIN_CHANNEL)
+    return chats
+
+
+async def send_to_admins(text: str, sender: TelegramSender = None) -> int:
+    """Send text to all admin chats in parallel; returns the number reached"""
+    sender = sender or telegram_sender
+    chats = admin_chats()
+    results = await asyncio.gather(
+        *(sender.send_text(chat, text) for chat in chats), return_exceptions=True
+    )
+
+    for chat, result in zip(chats, results):
+        if isinstance(result, Exception):
+            logger.error(f"Failed to send to admin chat {chat}: {result}")
+    return sum(1 for result in results if not isinstance(result, Exception))
@@ -47,9 +47,9 @@ async def users_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     with get_db_context() as db:
         service = AdminService(db)
-        users, total = service.get_all_users(page=1, page_size=10)
+        users, total, _ = service.get_all_users(page_size=10)
         
-        users_text = f"👥 *Users Overview*\n\nTotal users: {total}\n\n"
+        users_text = f"👥 *Users Overview*\n\nTotal users: ~{total}\n\n"
         
         for user in users[:5]:
             users_text += f"• User {user.id}: ${user.balance:.2f}\n"
@@ -2,11 +2,11 @@
 Helper for making API requests from bot to server
 """
 
-import httpx
 from typing import Optional, Dict, Any
 
 from traffic_share.server.config import settings
 from traffic_share.server.logger import logger
+from traffic_share.server.http_clients import http_clients
 
 
 class APIClient:
@@ -28,19 +28,22 @@ class APIClient:
                 "X-Bot-Token": self.bot_token
             }
             
-            async with httpx.AsyncClient() as client:
-                url = f"{self.base_url}{endpoint}"
-                
-                if method == "GET":
-                    response = await client.get(url, headers=headers)
-                elif method == "POST":
-                    response = await client.post(url, json=data, headers=headers)
-                else:
-                    raise ValueError(f"Unsupported method: {method}")
-                
-                response.raise_for_status()
-                return response.json()
-                
+            url = f"{self.base_url}{endpoint}"
+            
+            if method == "GET":
+                response = await http_clients.request(
+                    "internal_api", "GET", url, headers=headers
+                )
+            elif method == "POST":
+                response = await http_clients.request(
+                    "internal_api", "POST", url, json=data, headers=headers
+                )
+            else:
+                raise ValueError(f"Unsupported method: {method}")
+            
+            response.raise_for_status()
+            return response.json()
+            
         except Exception as e:
             logger.error(f"API request failed: {e}")
             return {"error": str(e)}
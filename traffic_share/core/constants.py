@@ -57,7 +57,7 @@ MAX_WITHDRAWAL_AMOUNT = 1000.0  # Maximum USD
 
 # Package allocation
 PACKAGE_ALLOCATION_TTL_SECONDS = 60  # Time before allocated package expires
-MAX_PACKAGES_PER_REQUEST = 10
+MAX_PACKAGES_PER_REQUEST = 1000
 
 # File upload limits
 MAX_UPLOAD_SIZE_MB = 10
@@ -0,0 +1,322 @@
+"""
+Offline IP database - country / ASN lookups without network calls
+
+Ranges are loaded from a CSV file (or a MaxMind .mmdb file when the
+optional maxminddb package is installed) into sorted integer interval
+arrays, one per address family, so a lookup is a single bisect.
+Hosting / VPN ranges are merged into a compiled range set.
+
+CSV columns (header names, common MaxMind / ip2asn aliases accepted):
+    network            CIDR, or start_ip + end_ip (addresses or integers)
+    country_code       ISO country code
+    asn, as_org        optional
+    is_hosting         optional truthy flag, adds the range to the hosting set
+
+The hosting ranges file holds one CIDR or "start-end" range per line.
+Files are reloaded when their modification time changes.
+"""
+
+import csv
+import ipaddress
+import logging
+import os
+import threading
+from array import array
+from bisect import bisect_right
+from collections import namedtuple
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+logger = logging.getLogger("traffic_share.ip_database")
+
+IPRecord = namedtuple("IPRecord", ["country_code", "asn", "as_org", "hosting"])
+
+Interval = Tuple[int, int]
+
+_COLUMN_ALIASES = {
+    "network": ("network", "cidr", "range"),
+    "start": ("start_ip", "ip_start", "range_start", "start"),
+    "end": ("end_ip", "ip_end", "range_end", "end"),
+    "country_code": ("country_code", "country_iso_code", "country"),
+    "asn": ("asn", "autonomous_system_number", "as_number"),
+    "as_org": ("as_org", "autonomous_system_organization", "as_description", "org"),
+    "hosting": ("is_hosting", "hosting", "is_anonymous_proxy", "is_vpn"),
+}
+
+_TRUE_VALUES = {"1", "true", "yes", "y", "t"}
+
+
+def parse_address(value: str) -> Tuple[int, int]:
+    """(version, integer) of an address given as text or integer"""
+    value = value.strip()
+    if value.isdigit():
+        number = int(value)
+        return (4 if number <= 0xFFFFFFFF else 6), number
+    address = ipaddress.ip_address(value)
+    return address.version, int(address)
+
+
+def parse_range(value: str) -> Tuple[int, int, int]:
+    """(version, first, last) of a CIDR or "start-end" range"""
+    value = value.strip()
+    if "-" in value:
+        start, end = value.split("-", 1)
+        version, first = parse_address(start)
+        _, last = parse_address(end)
+        return version, first, last
+
+    network = ipaddress.ip_network(value, strict=False)
+    return network.version, int(network.network_address), int(network.broadcast_address)
+
+
+class IntervalTable:
+    """Sorted non-overlapping intervals mapped to values"""
+
+    def __init__(self, intervals: List[Tuple[int, int, int]], wide: bool):
+        # wide (IPv6) values do not fit a machine word
+        intervals.sort()
+        if wide:
+            self.starts = [start for start, _, _ in intervals]
+            self.ends = [end for _, end, _ in intervals]
+        else:
+            self.starts = array("Q", (start for start, _, _ in intervals))
+            self.ends = array("Q", (end for _, end, _ in intervals))
+        self.values = array("L", (value for _, _, value in intervals))
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def find(self, number: int) -> Optional[int]:
+        """Value of the interval containing number"""
+        index = bisect_right(self.starts, number) - 1
+        if index >= 0 and number <= self.ends[index]:
+            return self.values[index]
+        return None
+
+
+class IPRangeSet:
+    """Compiled set of IPv4 / IPv6 ranges with O(log n) membership"""
+
+    def __init__(
+        self,
+        ranges: Iterable[str] = (),
+        intervals: Dict[int, List[Interval]] = None
+    ):
+        by_version: Dict[int, List[Interval]] = {4: [], 6: []}
+        for version, parsed in (intervals or {}).items():
+            by_version[version].extend(parsed)
+        for value in ranges:
+            try:
+                version, first, last = parse_range(value)
+            except ValueError:
+                logger.warning(f"Skipping invalid IP range: {value!r}")
+                continue
+            by_version[version].append((first, last))
+
+        self._tables = {
+            version: self._merge(intervals)
+            for version, intervals in by_version.items()
+        }
+
+    @staticmethod
+    def _merge(intervals: List[Interval]) -> Tuple[list, list]:
+        """Union of intervals as sorted (starts, ends)"""
+        starts, ends = [], []
+        for first, last in sorted(intervals):
+            if ends and first <= ends[-1] + 1:
+                ends[-1] = max(ends[-1], last)
+            else:
+                starts.append(first)
+                ends.append(last)
+        return starts, ends
+
+    def __len__(self) -> int:
+        return sum(len(starts) for starts, _ in self._tables.values())
+
+    def contains(self, ip: str) -> bool:
+        """Whether ip falls into any range"""
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return False
+
+        starts, ends = self._tables[address.version]
+        number = int(address)
+        index = bisect_right(starts, number) - 1
+        return index >= 0 and number <= ends[index]
+
+    __contains__ = contains
+
+
+class IPDatabase:
+    """Country / ASN lookups from a local range database"""
+
+    def __init__(self, path: str = None, hosting_path: str = None):
+        self.path = path
+        self.hosting_path = hosting_path
+        self._lock = threading.Lock()
+        self._mtimes: Tuple[Optional[float], Optional[float]] = (None, None)
+        # (interval tables, records, mmdb reader, hosting set), swapped as a whole
+        self._state = ({}, [], None, IPRangeSet())
+
+    @property
+    def loaded(self) -> bool:
+        tables, _, reader, _ = self._state
+        return bool(tables) or reader is not None
+
+    def _file_mtimes(self) -> Tuple[Optional[float], Optional[float]]:
+        def mtime(path):
+            try:
+                return os.stat(path).st_mtime if path else None
+            except OSError:
+                return None
+        return mtime(self.path), mtime(self.hosting_path)
+
+    def load(self):
+        """(Re)load both files and swap them in"""
+        mtimes = self._file_mtimes()
+        tables, records, reader, hosting_intervals = {}, [], None, {}
+
+        if self.path and mtimes[0] is not None:
+            if self.path.endswith(".mmdb"):
+                reader = self._open_mmdb(self.path)
+            else:
+                tables, records, hosting_intervals = self._read_csv(self.path)
+
+        hosting_ranges = []
+        if self.hosting_path and mtimes[1] is not None:
+            hosting_ranges = self._read_ranges(self.hosting_path)
+
+        hosting = IPRangeSet(hosting_ranges, intervals=hosting_intervals)
+
+        # Lookups in flight keep using the previous state
+        with self._lock:
+            self._state = (tables, records, reader, hosting)
+            self._mtimes = mtimes
+
+        logger.info(
+            f"IP database loaded: {sum(len(t) for t in tables.values())} ranges, "
+            f"{len(hosting)} hosting ranges"
+        )
+
+    def reload_if_changed(self) -> bool:
+        """Reload when a file changed since the last load"""
+        if self._file_mtimes() == self._mtimes:
+            return False
+        self.load()
+        return True
+
+    @staticmethod
+    def _open_mmdb(path: str):
+        try:
+            import maxminddb
+        except ImportError:
+            logger.error("maxminddb is not installed, cannot read .mmdb files")
+            return None
+        return maxminddb.open_database(path, maxminddb.MODE_MMAP)
+
+    @staticmethod
+    def _read_csv(path: str):
+        """Interval tables, distinct records and hosting intervals of a CSV file"""
+        by_version: Dict[int, List[Tuple[int, int, int]]] = {4: [], 6: []}
+        record_ids: Dict[IPRecord, int] = {}
+        records: List[IPRecord] = []
+        hosting_intervals: Dict[int, List[Interval]] = {4: [], 6: []}
+
+        with open(path, newline="", encoding="utf-8") as f:
+            reader = csv.DictReader(f)
+            header = {name.strip().lower(): name for name in reader.fieldnames or []}
+            columns = {
+                key: next((header[alias] for alias in aliases if alias in header), None)
+                for key, aliases in _COLUMN_ALIASES.items()
+            }
+
+            for row in reader:
+                try:
+                    if columns["network"]:
+                        version, first, last = parse_range(row[columns["network"]])
+                    else:
+                        version, first = parse_address(row[columns["start"]])
+                        _, last = parse_address(row[columns["end"]])
+                except (KeyError, TypeError, ValueError):
+                    continue
+
+                asn = row.get(columns["asn"]) if columns["asn"] else None
+                hosting = bool(columns["hosting"]) and (
+                    (row.get(columns["hosting"]) or "").strip().lower() in _TRUE_VALUES
+                )
+                record = IPRecord(
+                    country_code=(row.get(columns["country_code"]) or "").strip().upper()
+                    if columns["country_code"] else "",
+                    asn=int(asn) if asn and asn.strip().isdigit() else None,
+                    as_org=(row.get(columns["as_org"]) or "").strip()
+                    if columns["as_org"] else "",
+                    hosting=hosting
+                )
+
+                # Records repeat a lot (same country / ASN), store each once
+                record_id = record_ids.get(record)
+                if record_id is None:
+                    record_id = record_ids[record] = len(records)
+                    records.append(record)
+
+                by_version[version].append((first, last, record_id))
+                if hosting:
+                    hosting_intervals[version].append((first, last))
+
+        tables = {
+            version: IntervalTable(intervals, wide=version == 6)
+            for version, intervals in by_version.items()
+            if intervals
+        }
+        return tables, records, hosting_intervals
+
+    @staticmethod
+    def _read_ranges(path: str) -> List[str]:
+        """Ranges of a hosting ranges file"""
+        with open(path, encoding="utf-8") as f:
+            return [
+                line.split("#", 1)[0].strip()
+                for line in f
+                if line.split("#", 1)[0].strip()
+            ]
+
+    def lookup(self, ip: str) -> Optional[IPRecord]:
+        """Record of the range containing ip"""
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+
+        tables, records, reader, _ = self._state
+        if reader is not None:
+            return self._lookup_mmdb(reader, ip)
+
+        table = tables.get(address.version)
+        if table is None:
+            return None
+
+        record_id = table.find(int(address))
+        return records[record_id] if record_id is not None else None
+
+    @staticmethod
+    def _lookup_mmdb(reader, ip: str) -> Optional[IPRecord]:
+        data = reader.get(ip)
+        if not data:
+            return None
+
+        country = data.get("country") or data.get("registered_country") or {}
+        traits = data.get("traits") or {}
+        return IPRecord(
+            country_code=country.get("iso_code", ""),
+            asn=data.get("autonomous_system_number") or traits.get("autonomous_system_number"),
+            as_org=data.get("autonomous_system_organization")
+            or traits.get("autonomous_system_organization", ""),
+            hosting=bool(
+                traits.get("is_hosting_provider") or traits.get("is_anonymous_proxy")
+            )
+        )
+
+    def is_hosting(self, ip: str) -> bool:
+        """Whether ip is in a hosting / VPN range"""
+        return self._state[3].contains(ip)
@@ -4,11 +4,19 @@ IP region and VPN detection utilities
 
 import ipaddress
 import re
+from functools import lru_cache
 from typing import Optional, Dict, Any
 import httpx
 
 from traffic_share.core.constants import ALLOWED_REGIONS
 from traffic_share.core.exceptions import RegionNotAllowedError, VPNDetectedError
+from traffic_share.core.ip_database import IPDatabase, IPRangeSet
+
+
+@lru_cache(maxsize=64)
+def compile_ranges(ip_ranges: tuple) -> IPRangeSet:
+    """Parse CIDR ranges once into a searchable set"""
+    return IPRangeSet(ip_ranges)
 
 
 class RegionChecker:
@@ -26,8 +34,24 @@ class RegionChecker:
         # Add AWS, GCP, Azure ranges
     ]
     
-    def __init__(self, ip_api_enabled: bool = True):
+    def __init__(
+        self,
+        ip_api_enabled: bool = True,
+        http_client: httpx.AsyncClient = None,
+        ip_database: IPDatabase = None
+    ):
         self.ip_api_enabled = ip_api_enabled
+        self.http_client = http_client
+        self.ip_database = ip_database
+    
+    async def _fetch(self, url: str) -> httpx.Response:
+        """GET via the injected client, or the application's pooled ip-api client"""
+        if self.http_client is not None:
+            return await self.http_client.get(url)
+        
+        from traffic_share.server.http_clients import http_clients
+        
+        return await http_clients.request("ip_api", "GET", url)
     
     def is_private_ip(self, ip: str) -> bool:
         """Check if IP is private"""
@@ -39,14 +63,9 @@ class RegionChecker:
     
     def is_in_range(self, ip: str, ip_ranges: list) -> bool:
         """Check if IP is in given ranges"""
-        try:
-            ip_obj = ipaddress.ip_address(ip)
-            for ip_range in ip_ranges:
-                if ip_obj in ipaddress.ip_network(ip_range):
-                    return True
-            return False
-        except ValueError:
+        if not ip_ranges:
             return False
+        return compile_ranges(tuple(ip_ranges)).contains(ip)
     
     def is_vpn_or_proxy(self, ip: str) -> bool:
         """Detect if IP is VPN or proxy"""
@@ -62,40 +81,69 @@ class RegionChecker:
         if self.is_in_range(ip, self.CLOUD_PROVIDER_RANGES):
             return True
         
+        # Check hosting / VPN ranges of the offline database
+        if self.ip_database is not None and self.ip_database.is_hosting(ip):
+            return True
+        
         return False
     
+    def lookup_offline(self, ip: str) -> Optional[Dict[str, Any]]:
+        """IP information from the offline database, None when unknown"""
+        if self.ip_database is None:
+            return None
+        
+        record = self.ip_database.lookup(ip)
+        if record is None or not record.country_code:
+            return None
+        
+        return {
+            "ip": ip,
+            "country_code": record.country_code,
+            "region": record.country_code,
+            "asn": record.asn,
+            "isp": record.as_org,
+            "is_vpn": (
+                record.hosting
+                or self.is_vpn_or_proxy(ip)
+                or self._is_hosting_provider(record.as_org or "")
+            ),
+            "source": "database"
+        }
+    
     async def get_ip_info(self, ip: str) -> Dict[str, Any]:
-        """Get IP information from external API"""
+        """Get IP information from the offline database or external API"""
+        ip_info = self.lookup_offline(ip)
+        if ip_info is not None:
+            return ip_info
+        
         if not self.ip_api_enabled:
             # Fallback to basic check
             return {
                 "ip": ip,
                 "country_code": "US",  # Default
                 "region": "US",
-                "is_vpn": self.is_vpn_or_proxy(ip)
+                "is_vpn": self.is_vpn_or_proxy(ip),
+                "source": "fallback"
             }
         
         try:
-            async with httpx.AsyncClient() as client:
-                # Using ip-api.com (free tier)
-                response = await client.get(
-                    f"http://ip-api.com/json/{ip}",
-                    timeout=5.0
-                )
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    
-                    return {
-                        "ip": ip,
-                        "country_code": data.get("countryCode", ""),
-                        "country": data.get("country", ""),
-                        "region": data.get("countryCode", ""),
-                        "city": data.get("city", ""),
-                        "isp": data.get("isp", ""),
-                        "is_vpn": self.is_vpn_or_proxy(ip) or self._is_hosting_provider(data.get("isp", ""))
-                    }
+            # Using ip-api.com (free tier)
+            response = await self._fetch(f"http://ip-api.com/json/{ip}")
+            
+            if response.status_code == 200:
+                data = response.json()
                 
+                return {
+                    "ip": ip,
+                    "country_code": data.get("countryCode", ""),
+                    "country": data.get("country", ""),
+                    "region": data.get("countryCode", ""),
+                    "city": data.get("city", ""),
+                    "isp": data.get("isp", ""),
+                    "is_vpn": self.is_vpn_or_proxy(ip) or self._is_hosting_provider(data.get("isp", "")),
+                    "source": "ip-api"
+                }
+            
         except Exception:
             pass
         
@@ -104,7 +152,8 @@ class RegionChecker:
             "ip": ip,
             "country_code": "US",
             "region": "US",
-            "is_vpn": self.is_vpn_or_proxy(ip)
+            "is_vpn": self.is_vpn_or_proxy(ip),
+            "source": "fallback"
         }
     
     def _is_hosting_provider(self, isp: str) -> bool:
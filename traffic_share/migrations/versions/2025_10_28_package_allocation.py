@@ -0,0 +1,108 @@
+"""
+Package allocation columns on packages
+
+Packages carry their traffic source (user_id, ip), size in bytes, the
+buyer they are allocated to and completion data, and status becomes a
+plain string (PackageStatus values) instead of a database enum. Old enum
+values are mapped: PENDING -> available, IN_USE -> in_progress,
+EXPIRED -> failed. package_allocations gains a status column.
+
+Also adds the allocation scan index (available packages by region and
+id, partial on PostgreSQL) and the buyer + user + IP index behind the
+one-package-per-pair rule.
+
+Every step is skipped when it is already in place, so the migration can
+run against a database whose tables create_all made from current models.
+
+Revision ID: 001a_package_allocation
+Revises: 001_init
+Create Date: 2025-10-28
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers
+revision = '001a_package_allocation'
+down_revision = '001_init'
+branch_labels = None
+depends_on = None
+
+
+STATUS_MAPPING = {
+    'PENDING': 'available',
+    'ALLOCATED': 'allocated',
+    'IN_USE': 'in_progress',
+    'COMPLETED': 'completed',
+    'EXPIRED': 'failed',
+}
+
+
+def _package_columns():
+    return [
+        sa.Column(
+            'user_id', sa.Integer(),
+            sa.ForeignKey('users.id', name='fk_packages_user_id'), nullable=True
+        ),
+        sa.Column('ip', sa.String(45), nullable=True),
+        sa.Column('size_bytes', sa.BigInteger(), server_default='0', nullable=False),
+        sa.Column(
+            'assigned_buyer_id', sa.Integer(),
+            sa.ForeignKey('buyers.id', name='fk_packages_assigned_buyer_id'), nullable=True
+        ),
+        sa.Column('bytes_sent', sa.BigInteger(), server_default='0', nullable=False),
+        sa.Column('completed_at', sa.DateTime(), nullable=True),
+    ]
+
+
+def upgrade() -> None:
+    """Add allocation columns and indexes, store status as a string"""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    columns = {column['name']: column for column in inspector.get_columns('packages')}
+
+    with op.batch_alter_table('packages') as batch:
+        for column in _package_columns():
+            if column.name not in columns:
+                batch.add_column(column)
+        batch.alter_column('size_gb', existing_type=sa.Float(), nullable=True)
+        batch.alter_column('region', existing_type=sa.String(10), nullable=True)
+
+    if bind.dialect.name == 'postgresql' and isinstance(columns['status']['type'], sa.Enum):
+        op.execute("ALTER TABLE packages ALTER COLUMN status TYPE VARCHAR(20) USING status::text")
+        op.execute("DROP TYPE IF EXISTS packagestatus")
+
+    cases = " ".join(f"WHEN '{old}' THEN '{new}'" for old, new in STATUS_MAPPING.items())
+    op.execute(f"UPDATE packages SET status = CASE status {cases} ELSE status END")
+
+    allocation_columns = {column['name'] for column in inspector.get_columns('package_allocations')}
+    if 'status' not in allocation_columns:
+        op.add_column('package_allocations', sa.Column(
+            'status', sa.String(20), server_default='allocated', nullable=False
+        ))
+        op.execute(
+            "UPDATE package_allocations SET status = 'completed' WHERE completed_at IS NOT NULL"
+        )
+
+    indexes = {index['name'] for index in inspector.get_indexes('packages')}
+    if 'idx_package_available' not in indexes:
+        op.create_index(
+            'idx_package_available', 'packages', ['region', 'id'],
+            postgresql_where=sa.text("status = 'available'")
+        )
+    if 'idx_package_buyer_user_ip' not in indexes:
+        op.create_index(
+            'idx_package_buyer_user_ip', 'packages', ['assigned_buyer_id', 'user_id', 'ip']
+        )
+
+
+def downgrade() -> None:
+    """Drop allocation columns and indexes (status stays a string)"""
+    op.drop_index('idx_package_buyer_user_ip', table_name='packages')
+    op.drop_index('idx_package_available', table_name='packages')
+    op.drop_column('package_allocations', 'status')
+
+    with op.batch_alter_table('packages') as batch:
+        for column in reversed(_package_columns()):
+            batch.drop_column(column.name)
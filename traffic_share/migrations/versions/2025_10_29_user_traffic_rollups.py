@@ -0,0 +1,86 @@
+"""
+Per-user traffic rollups
+
+Creates user_traffic_rollups (hour, day, month and total buckets per user,
+read by the traffic summary) and fills it from the existing
+traffic_sessions, bucketed by session start, so summaries keep their
+history after the upgrade. The backfill only runs while the table is
+empty; a table create_all already made is reused.
+
+Revision ID: 001b_user_traffic_rollups
+Revises: 001a_package_allocation
+Create Date: 2025-10-29
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers
+revision = '001b_user_traffic_rollups'
+down_revision = '001a_package_allocation'
+branch_labels = None
+depends_on = None
+
+
+# period -> bucket start of traffic_sessions.started_at
+POSTGRES_BUCKETS = {
+    'hour': "date_trunc('hour', started_at)",
+    'day': "date_trunc('day', started_at)",
+    'month': "date_trunc('month', started_at)",
+    'total': "TIMESTAMP '1970-01-01 00:00:00'",
+}
+
+# SQLite stores datetimes as text in SQLAlchemy's format
+SQLITE_BUCKETS = {
+    'hour': "strftime('%Y-%m-%d %H:00:00.000000', started_at)",
+    'day': "strftime('%Y-%m-%d 00:00:00.000000', started_at)",
+    'month': "strftime('%Y-%m-01 00:00:00.000000', started_at)",
+    'total': "'1970-01-01 00:00:00.000000'",
+}
+
+
+def upgrade() -> None:
+    """Create and backfill user_traffic_rollups"""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    if not inspector.has_table('user_traffic_rollups'):
+        op.create_table(
+            'user_traffic_rollups',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=False),
+            sa.Column('period', sa.String(10), nullable=False),
+            sa.Column('bucket_start', sa.DateTime(), nullable=False),
+            sa.Column('bytes_total', sa.BigInteger(), nullable=False),
+            sa.Column('earnings', sa.Float(), nullable=False),
+            sa.Column('updated_at', sa.DateTime(), nullable=False),
+        )
+        op.create_index('ix_user_traffic_rollups_id', 'user_traffic_rollups', ['id'])
+        op.create_index(
+            'idx_rollup_user_bucket', 'user_traffic_rollups',
+            ['user_id', 'period', 'bucket_start'], unique=True
+        )
+        op.create_index(
+            'idx_rollup_period_bucket', 'user_traffic_rollups', ['period', 'bucket_start']
+        )
+
+    if bind.execute(sa.text("SELECT 1 FROM user_traffic_rollups LIMIT 1")).first():
+        return
+
+    is_postgres = bind.dialect.name == 'postgresql'
+    buckets = POSTGRES_BUCKETS if is_postgres else SQLITE_BUCKETS
+    now = "now()" if is_postgres else "strftime('%Y-%m-%d %H:%M:%f000', 'now')"
+    for period, bucket in buckets.items():
+        op.execute(f"""
+            INSERT INTO user_traffic_rollups
+                (user_id, period, bucket_start, bytes_total, earnings, updated_at)
+            SELECT user_id, '{period}', {bucket}, SUM(total_bytes), SUM(earnings), {now}
+            FROM traffic_sessions
+            GROUP BY user_id, {bucket}
+        """)
+
+
+def downgrade() -> None:
+    """Drop user_traffic_rollups"""
+    op.drop_table('user_traffic_rollups')
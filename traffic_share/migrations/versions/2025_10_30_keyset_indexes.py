@@ -0,0 +1,44 @@
+"""
+Keyset pagination indexes
+
+Adds the (sort column, id) indexes the admin user list, audit log list
+and per-user traffic history page through with cursors. Indexes that
+already exist (tables made by create_all from current models) are
+skipped.
+
+Revision ID: 001c_keyset_indexes
+Revises: 001b_user_traffic_rollups
+Create Date: 2025-10-30
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers
+revision = '001c_keyset_indexes'
+down_revision = '001b_user_traffic_rollups'
+branch_labels = None
+depends_on = None
+
+
+# index name -> (table, columns)
+INDEXES = {
+    'idx_user_created_id': ('users', ['created_at', 'id']),
+    'idx_user_started_id': ('traffic_sessions', ['user_id', 'started_at', 'id']),
+    'idx_audit_created_id': ('audit_logs', ['created_at', 'id']),
+}
+
+
+def upgrade() -> None:
+    """Create keyset pagination indexes"""
+    inspector = sa.inspect(op.get_bind())
+    for name, (table, columns) in INDEXES.items():
+        if name not in {index['name'] for index in inspector.get_indexes(table)}:
+            op.create_index(name, table, columns)
+
+
+def downgrade() -> None:
+    """Drop keyset pagination indexes"""
+    for name, (table, _) in INDEXES.items():
+        op.drop_index(name, table_name=table)
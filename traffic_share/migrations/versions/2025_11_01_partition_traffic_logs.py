@@ -0,0 +1,143 @@
+"""
+Partition traffic_logs by timestamp
+
+Turns traffic_logs into a table partitioned by RANGE (timestamp). The
+existing table is kept as-is and attached as the first partition
+(traffic_logs_legacy, everything before the next interval boundary), so
+no rows are copied. Partitions follow PARTITION_INTERVAL (day or week),
+PARTITIONS_AHEAD of them are created here and later ones by
+server/tasks/partition_task.py, which also drops partitions past retention.
+
+create_all (API and worker startup) only makes a plain traffic_logs, so
+PostgreSQL installs need this migration, fresh ones included: run
+alembic upgrade head after the first start and the empty table is
+converted the same way.
+
+The primary key becomes (id, timestamp) in the database, as Postgres
+requires the partition key in unique constraints; ids still come from the
+same sequence and stay unique.
+
+Revision ID: 002_partition_traffic_logs
+Revises: 001c_keyset_indexes
+Create Date: 2025-11-01
+"""
+
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+from traffic_share.server.config import settings
+from traffic_share.server.tasks.partition_task import (
+    interval_start, next_boundary, partition_name
+)
+
+
+# revision identifiers
+revision = '002_partition_traffic_logs'
+down_revision = '001c_keyset_indexes'
+branch_labels = None
+depends_on = None
+
+
+def _is_partitioned(bind) -> bool:
+    return bool(bind.execute(sa.text("""
+        SELECT EXISTS (
+            SELECT 1 FROM pg_partitioned_table pt
+            JOIN pg_class c ON c.oid = pt.partrelid
+            WHERE c.relname = 'traffic_logs'
+        )
+    """)).scalar())
+
+
+def _table_exists(bind, table: str) -> bool:
+    return bind.execute(
+        sa.text("SELECT to_regclass(:table) IS NOT NULL"),
+        {"table": table}
+    ).scalar()
+
+
+def upgrade() -> None:
+    """Partition traffic_logs"""
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql" or _is_partitioned(bind):
+        return
+
+    interval = settings.PARTITION_INTERVAL
+    current = interval_start(datetime.utcnow(), interval)
+    boundary = next_boundary(current, interval)
+    has_legacy = _table_exists(bind, "traffic_logs")
+
+    if has_legacy:
+        # Free the names used by the new parent table
+        op.execute("ALTER TABLE traffic_logs RENAME TO traffic_logs_legacy")
+        op.execute("ALTER INDEX IF EXISTS traffic_logs_pkey RENAME TO traffic_logs_legacy_pkey")
+        op.execute("ALTER INDEX IF EXISTS ix_traffic_logs_id RENAME TO ix_traffic_logs_legacy_id")
+        op.execute("ALTER INDEX IF EXISTS idx_session_timestamp RENAME TO idx_session_timestamp_legacy")
+        op.execute("ALTER TABLE traffic_logs_legacy ALTER COLUMN id DROP DEFAULT")
+        op.execute("ALTER SEQUENCE traffic_logs_id_seq OWNED BY NONE")
+    else:
+        op.execute("CREATE SEQUENCE IF NOT EXISTS traffic_logs_id_seq")
+
+    # Column types match the existing table so it attaches without a rewrite
+    op.execute("""
+        CREATE TABLE traffic_logs (
+            id INTEGER NOT NULL DEFAULT nextval('traffic_logs_id_seq'),
+            session_id INTEGER NOT NULL REFERENCES traffic_sessions (id),
+            timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            bytes_transferred BIGINT NOT NULL,
+            connection_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (id, timestamp)
+        ) PARTITION BY RANGE (timestamp)
+    """)
+    op.execute("ALTER SEQUENCE traffic_logs_id_seq OWNED BY traffic_logs.id")
+    op.execute("CREATE INDEX idx_session_timestamp ON traffic_logs (session_id, timestamp)")
+
+    if has_legacy:
+        # Proven range lets ATTACH skip its own validation scan
+        op.execute(
+            "ALTER TABLE traffic_logs_legacy ADD CONSTRAINT traffic_logs_legacy_range "
+            f"CHECK (timestamp < '{boundary.isoformat()}')"
+        )
+        op.execute(
+            "ALTER TABLE traffic_logs ATTACH PARTITION traffic_logs_legacy "
+            f"FOR VALUES FROM (MINVALUE) TO ('{boundary.isoformat()}')"
+        )
+        start = boundary
+    else:
+        start = current
+
+    for _ in range(settings.PARTITIONS_AHEAD + 1):
+        end = next_boundary(start, interval)
+        op.execute(
+            f'CREATE TABLE "{partition_name("traffic_logs", start)}" PARTITION OF traffic_logs '
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        )
+        start = end
+
+
+def downgrade() -> None:
+    """Copy traffic_logs back into a plain table"""
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql" or not _is_partitioned(bind):
+        return
+
+    op.execute("""
+        CREATE TABLE traffic_logs_plain (
+            id INTEGER NOT NULL,
+            session_id INTEGER NOT NULL REFERENCES traffic_sessions (id),
+            timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            bytes_transferred BIGINT NOT NULL,
+            connection_count INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    op.execute("INSERT INTO traffic_logs_plain SELECT id, session_id, timestamp, bytes_transferred, connection_count FROM traffic_logs")
+    op.execute("ALTER SEQUENCE traffic_logs_id_seq OWNED BY NONE")
+    op.execute("DROP TABLE traffic_logs CASCADE")
+
+    op.execute("ALTER TABLE traffic_logs_plain RENAME TO traffic_logs")
+    op.execute("ALTER TABLE traffic_logs ADD CONSTRAINT traffic_logs_pkey PRIMARY KEY (id)")
+    op.execute("ALTER TABLE traffic_logs ALTER COLUMN id SET DEFAULT nextval('traffic_logs_id_seq')")
+    op.execute("ALTER SEQUENCE traffic_logs_id_seq OWNED BY traffic_logs.id")
+    op.execute("CREATE INDEX ix_traffic_logs_id ON traffic_logs (id)")
+    op.execute("CREATE INDEX idx_session_timestamp ON traffic_logs (session_id, timestamp)")
@@ -0,0 +1,49 @@
+"""
+Daily report snapshots
+
+Creates daily_reports, one row per closed UTC day, written by the report
+task (server/tasks/report_task.py). active_sessions is only known for
+days snapshotted right after they closed and stays empty otherwise. A
+table create_all already made is kept, with active_sessions made
+nullable.
+
+Revision ID: 002a_daily_reports
+Revises: 002_partition_traffic_logs
+Create Date: 2025-11-03
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers
+revision = '002a_daily_reports'
+down_revision = '002_partition_traffic_logs'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """Create daily_reports"""
+    if sa.inspect(op.get_bind()).has_table('daily_reports'):
+        with op.batch_alter_table('daily_reports') as batch:
+            batch.alter_column('active_sessions', existing_type=sa.Integer(), nullable=True)
+        return
+
+    op.create_table(
+        'daily_reports',
+        sa.Column('report_date', sa.DateTime(), primary_key=True),
+        sa.Column('total_users', sa.Integer(), nullable=False),
+        sa.Column('active_users', sa.Integer(), nullable=False),
+        sa.Column('new_users', sa.Integer(), nullable=False),
+        sa.Column('traffic_bytes', sa.BigInteger(), nullable=False),
+        sa.Column('total_earnings', sa.Float(), nullable=False),
+        sa.Column('total_payouts', sa.Float(), nullable=False),
+        sa.Column('active_sessions', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    """Drop daily_reports"""
+    op.drop_table('daily_reports')
@@ -0,0 +1,58 @@
+"""
+Broadcast jobs
+
+Creates broadcast_jobs, the admin broadcasts the broadcast task fans out
+to user notifications in chunks (keyset cursor in last_user_id). A table
+create_all already made is left alone.
+
+Revision ID: 002b_broadcast_jobs
+Revises: 002a_daily_reports
+Create Date: 2025-11-05
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers
+revision = '002b_broadcast_jobs'
+down_revision = '002a_daily_reports'
+branch_labels = None
+depends_on = None
+
+
+STATUS = sa.Enum(
+    'PENDING', 'RUNNING', 'COMPLETED', 'FAILED', 'CANCELLED', name='broadcastjobstatus'
+)
+
+
+def upgrade() -> None:
+    """Create broadcast_jobs"""
+    if sa.inspect(op.get_bind()).has_table('broadcast_jobs'):
+        return
+
+    op.create_table(
+        'broadcast_jobs',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('admin_id', sa.Integer(), sa.ForeignKey('admins.id'), nullable=True),
+        sa.Column('notification_type', sa.String(50), nullable=False),
+        sa.Column('title', sa.String(255), nullable=False),
+        sa.Column('message', sa.Text(), nullable=False),
+        sa.Column('target', sa.String(100), nullable=False),
+        sa.Column('status', STATUS, nullable=False),
+        sa.Column('total', sa.Integer(), nullable=False),
+        sa.Column('processed', sa.Integer(), nullable=False),
+        sa.Column('last_user_id', sa.Integer(), nullable=False),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+    )
+    op.create_index('ix_broadcast_jobs_id', 'broadcast_jobs', ['id'])
+    op.create_index('idx_broadcast_status', 'broadcast_jobs', ['status'])
+
+
+def downgrade() -> None:
+    """Drop broadcast_jobs"""
+    op.drop_table('broadcast_jobs')
+    STATUS.drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,57 @@
+"""
+Background job queue
+
+Creates task_jobs, the queue the worker pool claims jobs from with
+FOR UPDATE SKIP LOCKED (server/tasks/queue.py), with the (status,
+run_at) claim index and the unique dedupe_key that keeps a scheduled
+tick from being queued twice. A table create_all already made is left
+alone.
+
+Revision ID: 002c_task_jobs
+Revises: 002b_broadcast_jobs
+Create Date: 2025-11-06
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers
+revision = '002c_task_jobs'
+down_revision = '002b_broadcast_jobs'
+branch_labels = None
+depends_on = None
+
+
+STATUS = sa.Enum('QUEUED', 'RUNNING', 'SUCCEEDED', 'DEAD', name='taskjobstatus')
+
+
+def upgrade() -> None:
+    """Create task_jobs"""
+    if sa.inspect(op.get_bind()).has_table('task_jobs'):
+        return
+
+    op.create_table(
+        'task_jobs',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('name', sa.String(100), nullable=False),
+        sa.Column('payload', sa.Text(), nullable=True),
+        sa.Column('status', STATUS, nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('max_attempts', sa.Integer(), nullable=False),
+        sa.Column('run_at', sa.DateTime(), nullable=False),
+        sa.Column('locked_by', sa.String(100), nullable=True),
+        sa.Column('locked_at', sa.DateTime(), nullable=True),
+        sa.Column('dedupe_key', sa.String(150), nullable=True, unique=True),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+    )
+    op.create_index('ix_task_jobs_id', 'task_jobs', ['id'])
+    op.create_index('idx_task_job_claim', 'task_jobs', ['status', 'run_at'])
+
+
+def downgrade() -> None:
+    """Drop task_jobs"""
+    op.drop_table('task_jobs')
+    STATUS.drop(op.get_bind(), checkfirst=True)
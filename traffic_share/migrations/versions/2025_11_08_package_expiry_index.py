@@ -0,0 +1,36 @@
+"""
+Allocated package deadline index
+
+Adds idx_package_allocated_expiry on packages.expires_at (partial on
+allocated packages on PostgreSQL), which the stale allocation sweep
+scans instead of the whole table. Skipped when the index exists.
+
+Revision ID: 002d_package_expiry_index
+Revises: 002c_task_jobs
+Create Date: 2025-11-08
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers
+revision = '002d_package_expiry_index'
+down_revision = '002c_task_jobs'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """Create the allocated package deadline index"""
+    indexes = {index['name'] for index in sa.inspect(op.get_bind()).get_indexes('packages')}
+    if 'idx_package_allocated_expiry' not in indexes:
+        op.create_index(
+            'idx_package_allocated_expiry', 'packages', ['expires_at'],
+            postgresql_where=sa.text("status = 'allocated'")
+        )
+
+
+def downgrade() -> None:
+    """Drop the allocated package deadline index"""
+    op.drop_index('idx_package_allocated_expiry', table_name='packages')
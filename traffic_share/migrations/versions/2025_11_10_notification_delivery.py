@@ -0,0 +1,63 @@
+"""
+Telegram delivery queue columns on notifications
+
+Adds the delivery status, attempt counter, retry / claim deadline and
+outcome columns used by the notify task (server/tasks/notify_task.py),
+plus the (delivery_status, next_attempt_at) index it claims through.
+Notifications already flagged sent_via_bot are marked sent so they are
+not delivered again. Steps already in place (tables made by create_all
+from current models) are skipped.
+
+Revision ID: 003_notification_delivery
+Revises: 002d_package_expiry_index
+Create Date: 2025-11-10
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers
+revision = '003_notification_delivery'
+down_revision = '002d_package_expiry_index'
+branch_labels = None
+depends_on = None
+
+
+def _delivery_columns():
+    return [
+        sa.Column('delivery_status', sa.String(20), server_default='pending', nullable=False),
+        sa.Column('delivery_attempts', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('next_attempt_at', sa.DateTime(), nullable=True),
+        sa.Column('delivered_at', sa.DateTime(), nullable=True),
+        sa.Column('delivery_error', sa.String(255), nullable=True),
+    ]
+
+
+def upgrade() -> None:
+    """Add delivery columns"""
+    inspector = sa.inspect(op.get_bind())
+    columns = {column['name'] for column in inspector.get_columns('notifications')}
+
+    if 'delivery_status' not in columns:
+        for column in _delivery_columns():
+            if column.name not in columns:
+                op.add_column('notifications', column)
+
+        op.execute(
+            "UPDATE notifications SET delivery_status = 'sent', delivered_at = created_at "
+            "WHERE sent_via_bot"
+        )
+
+    indexes = {index['name'] for index in inspector.get_indexes('notifications')}
+    if 'idx_notification_delivery' not in indexes:
+        op.create_index(
+            'idx_notification_delivery', 'notifications', ['delivery_status', 'next_attempt_at']
+        )
+
+
+def downgrade() -> None:
+    """Drop delivery columns"""
+    op.drop_index('idx_notification_delivery', table_name='notifications')
+    for column in reversed(_delivery_columns()):
+        op.drop_column('notifications', column.name)
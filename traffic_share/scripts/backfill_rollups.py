@@ -0,0 +1,70 @@
+"""
+Rebuild per-user traffic rollups from session history
+
+Sessions are bucketed by their start time. The rollup table is locked for
+the duration of the rebuild, so heartbeats flushed meanwhile wait and are
+added on top of the rebuilt totals.
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from sqlalchemy import text
+
+from traffic_share.server.database import get_db_context
+from traffic_share.server.logger import logger
+from traffic_share.server.rollups import (
+    PERIOD_HOUR, PERIOD_DAY, PERIOD_MONTH, TOTAL_BUCKET
+)
+
+
+BUCKET_SQL = """
+    INSERT INTO user_traffic_rollups
+        (user_id, period, bucket_start, bytes_total, earnings, updated_at)
+    SELECT user_id, :period, {bucket}, SUM(total_bytes), SUM(earnings), now()
+    FROM traffic_sessions
+    {where}
+    GROUP BY user_id, 3
+"""
+
+
+def backfill_rollups(user_id: int = None):
+    """Rebuild rollups for one user or everybody"""
+    where = "WHERE user_id = :user_id" if user_id else ""
+    params = {"user_id": user_id}
+
+    with get_db_context() as db:
+        db.execute(text("LOCK TABLE user_traffic_rollups IN EXCLUSIVE MODE"))
+        db.execute(text(f"DELETE FROM user_traffic_rollups {where}"), params)
+
+        for period in (PERIOD_HOUR, PERIOD_DAY, PERIOD_MONTH):
+            result = db.execute(
+                text(BUCKET_SQL.format(
+                    bucket="date_trunc(:period, started_at)", where=where
+                )),
+                {**params, "period": period}
+            )
+            logger.info(f"Backfilled {result.rowcount} {period} rollups")
+
+        result = db.execute(
+            text(BUCKET_SQL.format(bucket=":total_bucket", where=where)),
+            {**params, "period": "total", "total_bucket": TOTAL_BUCKET}
+        )
+        logger.info(f"Backfilled {result.rowcount} total rollups")
+
+
+def main():
+    """Main function"""
+    try:
+        user_id = int(sys.argv[1]) if len(sys.argv) > 1 else None
+        backfill_rollups(user_id)
+        logger.info("Rollup backfill completed!")
+    except Exception as e:
+        logger.error(f"Rollup backfill failed: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
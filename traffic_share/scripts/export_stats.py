@@ -1,73 +1,94 @@
 """
-Export statistics to CSV
+Export statistics to CSV, gzip CSV or Parquet
+
+Usage:
+    python export_stats.py [users|traffic|payments ...] [--format csv|csv.gz|parquet]
+                           [--start YYYY-MM-DD] [--end YYYY-MM-DD] [--incremental]
+                           [--output-dir DIR]
+
+Rows are streamed in batches, so exports of large tables use bounded memory.
 """
 
 import sys
-import csv
+import argparse
 from pathlib import Path
 from datetime import datetime
 
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 
-from traffic_share.server.database import get_db_context
-from traffic_share.server.models import User, TrafficSession, Payment
 from traffic_share.server.logger import logger
-from traffic_share.server.utils import bytes_to_gb
+from traffic_share.server.services.stats_export import (
+    DATASETS, FORMATS, FORMAT_CSV, open_export
+)
 
 
-def export_user_stats(output_file: str = "user_stats.csv"):
-    """Export user statistics to CSV"""
-    with get_db_context() as db:
-        users = db.query(User).all()
+def export_dataset(
+    name: str,
+    fmt: str = FORMAT_CSV,
+    output_dir: str = ".",
+    start: datetime = None,
+    end: datetime = None,
+    incremental: bool = False
+) -> Path:
+    """Export one dataset to a file, written batch by batch"""
+    output_file = Path(output_dir) / f"{name}_stats.{fmt}"
+    stream, _ = open_export(name, fmt, start, end, incremental)
         
-        with open(output_file, 'w', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow([
-                'User ID', 'Telegram ID', 'Username',
-                'Balance', 'Total Earned', 'Is Active',
-                'Created At'
-            ])
+    # Write to a temporary name so a failed export never replaces a good file
+    tmp_file = output_file.with_name(output_file.name + ".part")
+    with open(tmp_file, "wb") as f:
+        for chunk in stream:
+            f.write(chunk)
+    tmp_file.replace(output_file)
             
-            for user in users:
-                writer.writerow([
-                    user.id, user.telegram_id, user.username,
-                    user.balance, user.total_earned, user.is_active,
-                    user.created_at
-                ])
-        
-        logger.info(f"Exported {len(users)} users to {output_file}")
+    logger.info(f"Exported {name} to {output_file}")
+    return output_file
+
+
+def export_user_stats(output_dir: str = "."):
+    """Export user statistics to CSV"""
+    return export_dataset("users", output_dir=output_dir)
 
 
-def export_traffic_stats(output_file: str = "traffic_stats.csv"):
+def export_traffic_stats(output_dir: str = "."):
     """Export traffic statistics to CSV"""
-    with get_db_context() as db:
-        sessions = db.query(TrafficSession).all()
+    return export_dataset("traffic", output_dir=output_dir)
         
-        with open(output_file, 'w', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow([
-                'Session ID', 'User ID', 'Start Time', 'End Time',
-                'Total GB', 'Earnings', 'Status'
-            ])
             
-            for session in sessions:
-                writer.writerow([
-                    session.session_id, session.user_id,
-                    session.start_time, session.end_time,
-                    bytes_to_gb(session.bytes_total),
-                    session.earnings, session.status
-                ])
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Export statistics")
+    parser.add_argument(
+        "datasets", nargs="*", metavar="dataset",
+        help=f"{', '.join(sorted(DATASETS))} (default: users traffic)"
+    )
+    parser.add_argument("--format", choices=sorted(FORMATS), default=FORMAT_CSV)
+    parser.add_argument("--start", type=datetime.fromisoformat, default=None)
+    parser.add_argument("--end", type=datetime.fromisoformat, default=None)
+    parser.add_argument(
+        "--incremental", action="store_true",
+        help="only rows changed since the previous incremental export"
+    )
+    parser.add_argument("--output-dir", default=".")
+    args = parser.parse_args(argv)
         
-        logger.info(f"Exported {len(sessions)} sessions to {output_file}")
+    unknown = set(args.datasets) - set(DATASETS)
+    if unknown:
+        parser.error(f"unknown dataset: {', '.join(sorted(unknown))}")
+    args.datasets = args.datasets or ["users", "traffic"]
+    return args
 
 
 def main():
     """Main function"""
+    args = parse_args()
     try:
         logger.info("Exporting statistics...")
         
-        export_user_stats()
-        export_traffic_stats()
+        for name in args.datasets:
+            export_dataset(
+                name, args.format, args.output_dir,
+                start=args.start, end=args.end, incremental=args.incremental
+            )
         
         logger.info("Export completed!")
         
@@ -11,6 +11,7 @@ from traffic_share.server.database import get_db_context
 from traffic_share.server.models import BuyerToken
 from traffic_share.core.security import SecurityManager
 from traffic_share.server.logger import logger
+from traffic_share.server.principal_cache import principal_cache
 
 
 def rotate_buyer_token(buyer_id: int):
@@ -36,8 +37,11 @@ def rotate_buyer_token(buyer_id: int):
         )
         db.add(new_token)
         
-        logger.info(f"Rotated token for buyer {buyer_id}")
-        print(f"\n✅ New token for buyer {buyer_id}: {plain_token}\n")
+    # Old tokens are committed as revoked - drop them from API caches
+    principal_cache.invalidate_buyer(buyer_id)
+    
+    logger.info(f"Rotated token for buyer {buyer_id}")
+    print(f"\n✅ New token for buyer {buyer_id}: {plain_token}\n")
 
 
 def main():
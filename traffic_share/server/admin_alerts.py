@@ -0,0 +1,179 @@
+"""
+Admin alert bus
+
+Services report operational events with admin_alerts.emit(key, message):
+payout failures, stale session spikes, allocation exhaustion. emit only
+records the event in memory; every ADMIN_ALERT_FLUSH_INTERVAL seconds the
+pending events are sent as one digest, in parallel to every admin id and
+TELEGRAM_ADMIN_CHANNEL.
+
+Events with the same key are merged into one digest line with an
+occurrence count, and a key is reported at most once per
+ADMIN_ALERT_KEY_INTERVAL seconds - repeats in between are counted and
+reported with the key's next line. With the redis backend that window is
+shared by all processes, so every API worker hitting the same payout
+error still produces one line per window.
+"""
+
+import asyncio
+import threading
+import time
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+from traffic_share.server.config import settings
+from traffic_share.server.logger import logger
+from traffic_share.server.redis_client import get_sync_redis, redis_key
+
+
+# Telegram rejects longer messages
+MAX_DIGEST_LENGTH = 4000
+
+
+class PendingAlert(NamedTuple):
+    """Events of one key since its last report"""
+    key: str
+    message: str  # latest message
+    count: int
+
+
+class AdminAlertBus:
+    """Deduplicates, rate-limits and batches admin alerts"""
+
+    def __init__(
+        self,
+        send: Callable[[str], Awaitable[int]] = None,
+        client_factory=None,
+        interval: float = None
+    ):
+        self._send = send
+        self._client_factory = client_factory or get_sync_redis
+        self.interval = interval or settings.ADMIN_ALERT_FLUSH_INTERVAL
+        self._lock = threading.Lock()
+        self._pending: Dict[str, PendingAlert] = {}
+        self._reported_at: Dict[str, float] = {}  # windows of the memory backend
+        self._dropped = 0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return settings.ADMIN_ALERTS_ENABLED
+
+    def emit(self, key: str, message: str):
+        """Record an event (cheap, thread-safe, never raises)"""
+        if not self.enabled:
+            return
+
+        with self._lock:
+            pending = self._pending.get(key)
+            if pending is not None:
+                self._pending[key] = pending._replace(message=message, count=pending.count + 1)
+            elif len(self._pending) < settings.ADMIN_ALERT_MAX_KEYS:
+                self._pending[key] = PendingAlert(key, message, 1)
+            else:
+                self._dropped += 1
+
+    def _open_window_locally(self, key: str, now: float) -> bool:
+        reported_at = self._reported_at.get(key)
+        if reported_at is not None and now - reported_at < settings.ADMIN_ALERT_KEY_INTERVAL:
+            return False
+        self._reported_at[key] = now
+        return True
+
+    def _open_window(self, key: str, now: float) -> bool:
+        """Start the key's report window; False while one is open"""
+        if settings.ADMIN_ALERT_BACKEND == "memory":
+            return self._open_window_locally(key, now)
+        try:
+            return bool(self._client_factory().set(
+                redis_key("alerts", key), 1, nx=True, ex=settings.ADMIN_ALERT_KEY_INTERVAL
+            ))
+        except Exception as e:
+            logger.warning(f"Admin alert window check failed, using local windows: {e}")
+            return self._open_window_locally(key, now)
+
+    def take_digest(self, now: float = None) -> Optional[str]:
+        """Remove reportable events and format them; None when there are none"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            candidates = list(self._pending.values())
+            dropped, self._dropped = self._dropped, 0
+
+        due: List[PendingAlert] = [
+            alert for alert in candidates if self._open_window(alert.key, now)
+        ]
+        with self._lock:
+            for alert in due:
+                current = self._pending.pop(alert.key)
+                # Events emitted since the snapshot stay pending for the next window
+                if current.count > alert.count:
+                    self._pending[alert.key] = current._replace(count=current.count - alert.count)
+            self._reported_at = {
+                key: reported_at for key, reported_at in self._reported_at.items()
+                if now - reported_at < settings.ADMIN_ALERT_KEY_INTERVAL
+            }
+
+        if not due and not dropped:
+            return None
+
+        lines = []
+        for alert in due:
+            repeats = f" (x{alert.count})" if alert.count > 1 else ""
+            lines.append(f"• {alert.key}{repeats}: {alert.message}")
+        if dropped:
+            lines.append(f"• {dropped} more events not shown (too many alert keys)")
+
+        text = "🔔 *Admin Alert*\n\n" + "\n".join(lines)
+        if len(text) > MAX_DIGEST_LENGTH:
+            text = text[:MAX_DIGEST_LENGTH - 1] + "…"
+        return text
+
+    async def flush(self) -> bool:
+        """Send the pending digest; True when one was sent"""
+        text = await asyncio.to_thread(self.take_digest)
+        if text is None:
+            return False
+
+        send = self._send
+        if send is None:
+            from traffic_share.bot.delivery import send_to_admins
+            send = send_to_admins
+        await send(text)
+        return True
+
+    async def _run(self):
+        """Background digest loop"""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Admin alert digest failed: {e}")
+
+    async def start(self):
+        """Start sending digests"""
+        if not self.enabled or self._task is not None:
+            return
+
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Admin alerts started (digest every {self.interval}s)")
+
+    async def stop(self):
+        """Stop the loop and send what is still pending"""
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Admin alert digest failed: {e}")
+
+
+# Global admin alert bus
+admin_alerts = AdminAlertBus()
@@ -0,0 +1,241 @@
+"""
+Allocation expiry index and reaper
+
+Every committed allocation records its package id under its deadline
+(expires_at) in an expiry index - a Redis sorted set scored by deadline, or an
+in-process heap. The reaper pops due ids every ALLOCATION_REAPER_INTERVAL
+seconds and releases those packages that are still allocated and past
+their deadline, so unconfirmed inventory is back in the ready queues
+within about a second of its TTL instead of waiting for the periodic
+table sweep.
+
+PostgreSQL stays the source of truth: the release is guarded by
+status = allocated AND expires_at <= now, so an id that was confirmed or
+allocated again in the meantime is left alone. Ids are popped atomically,
+so concurrent reapers never release the same package. Entries lost to a
+Redis or database error are caught by BuyerService.cleanup_stale_allocations
+in the cleanup task, which scans only the indexed deadline column.
+"""
+
+import asyncio
+import heapq
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from traffic_share.server.config import settings
+from traffic_share.server.database import SessionLocal
+from traffic_share.server.logger import logger
+from traffic_share.server.models import Package, PackageStatus
+from traffic_share.server.package_pool import package_pool
+from traffic_share.server.redis_client import get_async_redis, get_sync_redis, redis_key
+
+
+# KEYS[1] - expiry set, ARGV[1] - now (unix seconds), ARGV[2] - max ids
+# Removes and returns ids whose deadline has passed
+POP_DUE_SCRIPT = """
+local ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+if #ids > 0 then
+    redis.call('ZREM', KEYS[1], unpack(ids))
+end
+return ids
+"""
+
+
+def _timestamp(moment: datetime) -> float:
+    """Naive UTC datetime as unix seconds"""
+    return (moment - datetime(1970, 1, 1)).total_seconds()
+
+
+class MemoryExpiryIndex:
+    """Per-process expiry index (single-process deployments and tests)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._heap: List[Tuple[float, int]] = []
+        self._deadlines: Dict[int, float] = {}
+
+    async def add(self, entries: Iterable[Tuple[int, datetime]]):
+        """Record (package id, deadline) pairs, replacing older deadlines"""
+        with self._lock:
+            for package_id, deadline in entries:
+                score = _timestamp(deadline)
+                self._deadlines[package_id] = score
+                heapq.heappush(self._heap, (score, package_id))
+
+    def pop_due(self, now: datetime, limit: int) -> List[int]:
+        """Remove and return up to limit ids whose deadline has passed"""
+        cutoff = _timestamp(now)
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= cutoff and len(due) < limit:
+                score, package_id = heapq.heappop(self._heap)
+                # Skip entries superseded by a later deadline
+                if self._deadlines.get(package_id) == score:
+                    del self._deadlines[package_id]
+                    due.append(package_id)
+        return due
+
+    def size(self) -> int:
+        with self._lock:
+            return len(self._deadlines)
+
+
+class RedisExpiryIndex:
+    """Expiry index shared by all workers (one sorted set)"""
+
+    def __init__(self, client_factory=None, async_client_factory=None):
+        self._client_factory = client_factory or get_sync_redis
+        self._async_client_factory = async_client_factory or get_async_redis
+        self._script = None
+
+    @staticmethod
+    def _key() -> str:
+        return redis_key("alloc", "expiry")
+
+    async def add(self, entries: Iterable[Tuple[int, datetime]]):
+        """Record (package id, deadline) pairs, replacing older deadlines"""
+        mapping = {str(package_id): _timestamp(deadline) for package_id, deadline in entries}
+        if mapping:
+            await self._async_client_factory().zadd(self._key(), mapping)
+
+    def pop_due(self, now: datetime, limit: int) -> List[int]:
+        """Remove and return up to limit ids whose deadline has passed (atomic)"""
+        if self._script is None:
+            self._script = self._client_factory().register_script(POP_DUE_SCRIPT)
+
+        popped = self._script(keys=[self._key()], args=[_timestamp(now), limit])
+        return [int(package_id) for package_id in popped]
+
+    def size(self) -> int:
+        return self._client_factory().zcard(self._key())
+
+
+class AllocationReaper:
+    """Releases expired allocations from the expiry index"""
+
+    # Seconds to stop writing to the index after a backend error
+    BACKOFF_SECONDS = 5.0
+
+    def __init__(
+        self,
+        index=None,
+        session_factory=SessionLocal,
+        interval: float = None,
+        batch_size: int = None
+    ):
+        self._index = index
+        self.session_factory = session_factory
+        self.interval = interval or settings.ALLOCATION_REAPER_INTERVAL
+        self.batch_size = batch_size or settings.ALLOCATION_REAPER_BATCH_SIZE
+        self._paused_until = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return settings.ALLOCATION_EXPIRY_ENABLED
+
+    @property
+    def index(self):
+        if self._index is None:
+            if settings.ALLOCATION_EXPIRY_BACKEND == "memory":
+                self._index = MemoryExpiryIndex()
+            else:
+                self._index = RedisExpiryIndex()
+        return self._index
+
+    async def track(self, entries: Iterable[Tuple[int, datetime]]):
+        """Record new allocations (called once the allocating transaction committed)"""
+        if not self.enabled or time.monotonic() < self._paused_until:
+            return
+        try:
+            await self.index.add(entries)
+        except Exception as e:
+            # The table sweep releases these allocations instead
+            self._paused_until = time.monotonic() + self.BACKOFF_SECONDS
+            logger.warning(f"Allocation expiry index write failed: {e}")
+
+    def release(self, db: Session, package_ids: List[int], now: datetime) -> List[Tuple[int, Optional[str]]]:
+        """
+        Release packages that are still allocated and past their deadline
+        Returns (id, region) of released packages. Does not commit.
+        """
+        table = Package.__table__
+        rows = db.execute(
+            update(table)
+            .where(
+                table.c.id.in_(package_ids),
+                table.c.status == PackageStatus.ALLOCATED.value,
+                table.c.expires_at <= now
+            )
+            .values(
+                status=PackageStatus.AVAILABLE.value,
+                assigned_buyer_id=None,
+                allocated_at=None,
+                expires_at=None
+            )
+            .returning(table.c.id, table.c.region)
+        ).all()
+        return [(row.id, row.region) for row in rows]
+
+    def reap_once(self, now: datetime = None) -> Tuple[int, List[Tuple[int, Optional[str]]]]:
+        """Pop one batch of due ids and release them; returns (popped, released)"""
+        now = now or datetime.utcnow()
+        due = self.index.pop_due(now, self.batch_size)
+        if not due:
+            return 0, []
+
+        db = self.session_factory()
+        try:
+            released = self.release(db, sorted(due), now)
+            db.commit()
+        finally:
+            db.close()
+
+        if released:
+            logger.info(f"Released {len(released)} expired package allocations")
+        return len(due), released
+
+    async def _run(self):
+        """Background reaper loop"""
+        while True:
+            try:
+                while True:
+                    popped, released = await asyncio.to_thread(self.reap_once)
+                    if released and package_pool.enabled:
+                        await package_pool.requeue(released)
+                    # A full batch means more may be due right away
+                    if popped < self.batch_size:
+                        break
+            except Exception as e:
+                logger.error(f"Allocation reaper failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        """Start the background reaper"""
+        if not self.enabled or self._task is not None:
+            return
+
+        self._task = asyncio.create_task(self._run())
+        logger.info(
+            f"Allocation reaper started (backend={settings.ALLOCATION_EXPIRY_BACKEND}, "
+            f"interval={self.interval}s)"
+        )
+
+    async def stop(self):
+        """Stop the background reaper"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# Global allocation reaper instance
+allocation_reaper = AllocationReaper()
@@ -0,0 +1,83 @@
+"""
+Background runner for admin broadcasts
+
+An admin broadcast is stored as a broadcast_jobs row and returned to the
+admin right away. The runner fans it out in chunks of BROADCAST_CHUNK_SIZE
+users (one INSERT ... SELECT and one commit per chunk), pausing
+BROADCAST_CHUNK_DELAY seconds between chunks so a large broadcast does not
+monopolise the database. Jobs left pending or running by a restart are
+resumed at startup from their last committed chunk.
+"""
+
+import asyncio
+from typing import Dict
+
+from traffic_share.server.config import settings
+from traffic_share.server.database import SessionLocal
+from traffic_share.server.logger import logger
+from traffic_share.server.services.notification_service import NotificationService
+
+
+class BroadcastRunner:
+    """Runs broadcast jobs as asyncio tasks, one chunk at a time"""
+
+    def __init__(self):
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._slots = asyncio.Semaphore(settings.BROADCAST_MAX_CONCURRENT_JOBS)
+
+    @staticmethod
+    def _call(method: str, *args):
+        db = SessionLocal()
+        try:
+            return getattr(NotificationService(db), method)(*args)
+        finally:
+            db.close()
+
+    def submit(self, job_id: int):
+        """Start a job in the background (no-op when it is already running)"""
+        task = self._tasks.get(job_id)
+        if task is not None and not task.done():
+            return
+        self._tasks[job_id] = asyncio.create_task(self._run(job_id))
+
+    async def _run(self, job_id: int):
+        try:
+            async with self._slots:
+                while await asyncio.to_thread(self._call, "run_broadcast_chunk", job_id):
+                    await asyncio.sleep(settings.BROADCAST_CHUNK_DELAY)
+        except asyncio.CancelledError:
+            # Shutdown - the job is resumed at the next start
+            raise
+        except Exception as e:
+            logger.error(f"Broadcast job {job_id} failed: {e}")
+            await asyncio.to_thread(self._call, "fail_broadcast_job", job_id, str(e))
+        finally:
+            self._tasks.pop(job_id, None)
+
+    async def start(self):
+        """Resume jobs interrupted by a restart"""
+        try:
+            job_ids = await asyncio.to_thread(self._call, "unfinished_broadcast_jobs")
+        except Exception as e:
+            logger.error(f"Could not resume broadcast jobs: {e}")
+            return
+
+        for job_id in job_ids:
+            self.submit(job_id)
+        if job_ids:
+            logger.info(f"Resumed {len(job_ids)} broadcast jobs")
+
+    async def stop(self):
+        """Cancel running jobs"""
+        tasks, self._tasks = list(self._tasks.values()), {}
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+
+# Global broadcast runner
+broadcast_runner = BroadcastRunner()
@@ -51,15 +51,32 @@ class Settings(BaseSettings):
     # IP & Region Check
     IP_API_ENABLED: bool = True
     REGION_CHECK_ENABLED: bool = True
+    IP_DATABASE_PATH: Optional[str] = None  # CSV or .mmdb range database
+    IP_HOSTING_RANGES_PATH: Optional[str] = None  # Hosting / VPN CIDRs, one per line
+    IP_DATABASE_RELOAD_INTERVAL: int = 60  # seconds between file change checks
+    IP_INFO_CACHE_SIZE: int = 100000
+    IP_INFO_CACHE_TTL: int = 3600  # seconds
+    IP_INFO_NEGATIVE_TTL: int = 60  # seconds, for failed lookups
+    IP_INFO_REDIS_ENABLED: bool = True
     
     # Traffic & Pricing
     PRICE_PER_GB: float = 0.50
     MIN_WITHDRAWAL_AMOUNT: float = 5.0
     MAX_WITHDRAWAL_AMOUNT: float = 1000.0
+    MAX_TRAFFIC_UPDATES_PER_BATCH: int = 500
+    
+    # Traffic WebSocket stream (/api/traffic/stream)
+    TRAFFIC_STREAM_FLUSH_INTERVAL: float = 5.0  # seconds between buffered writes
+    TRAFFIC_STREAM_STATUS_INTERVAL: float = 15.0  # seconds between status pushes
+    TRAFFIC_STREAM_IDLE_TIMEOUT: float = 120.0  # close after this long without messages
     
     # Package Allocation
     PACKAGE_ALLOCATION_TTL: int = 60  # seconds
-    MAX_PACKAGES_PER_REQUEST: int = 10
+    MAX_PACKAGES_PER_REQUEST: int = 1000
+    
+    # Package Ingest (/api/admin/packages/ingest)
+    PACKAGE_INGEST_CHUNK_SIZE: int = 10000  # rows per COPY / transaction
+    PACKAGE_INGEST_MAX_ERRORS: int = 100  # row errors listed in the report
     
     # Rate Limiting
     RATE_LIMIT_ENABLED: bool = True
@@ -80,6 +97,99 @@ class Settings(BaseSettings):
     CLEANUP_TASK_INTERVAL: int = 300  # 5 minutes
     STATS_TASK_INTERVAL: int = 3600  # 1 hour
     BACKUP_TASK_INTERVAL: int = 86400  # 24 hours
+    NOTIFY_TASK_INTERVAL: int = 10  # seconds
+    STALE_SESSION_TIMEOUT: int = 86400  # active sessions without updates for this long are closed
+    STALE_SWEEP_BATCH_SIZE: int = 1000  # rows per UPDATE ... SKIP LOCKED batch
+    STALE_SWEEP_MAX_BATCHES: int = 100  # per run, the next run continues a larger backlog
+    
+    # Traffic write-behind buffer
+    TRAFFIC_BUFFER_ENABLED: bool = True
+    TRAFFIC_BUFFER_FLUSH_INTERVAL: float = 2.0  # seconds
+    TRAFFIC_BUFFER_MAX_ENTRIES: int = 5000  # flush early once this many heartbeats are pending
+    TRAFFIC_BUFFER_MAX_PENDING_LOGS: int = 200000  # cap while the database is unavailable
+    
+    # Principal cache (authenticated users / buyer tokens)
+    PRINCIPAL_CACHE_ENABLED: bool = True
+    PRINCIPAL_CACHE_TTL: int = 30  # seconds
+    PRINCIPAL_CACHE_MAX_SIZE: int = 50000
+    TOKEN_USAGE_FLUSH_INTERVAL: int = 30  # seconds between last_used_at writes
+    
+    # Package pool (ready queues of available packages per region)
+    PACKAGE_POOL_ENABLED: bool = False
+    PACKAGE_POOL_BACKEND: str = "redis"  # redis or memory
+    PACKAGE_POOL_TARGET_SIZE: int = 5000  # ids queued per region
+    PACKAGE_POOL_REFILL_INTERVAL: float = 2.0  # seconds
+    
+    # Allocation expiry index (releases unconfirmed allocations at their TTL)
+    ALLOCATION_EXPIRY_ENABLED: bool = True
+    ALLOCATION_EXPIRY_BACKEND: str = "redis"  # redis or memory
+    ALLOCATION_REAPER_INTERVAL: float = 1.0  # seconds
+    ALLOCATION_REAPER_BATCH_SIZE: int = 500  # ids released per statement
+    
+    # Partitioned time-series tables (traffic_logs)
+    PARTITION_MAINTENANCE_ENABLED: bool = True
+    PARTITION_INTERVAL: str = "day"  # day or week
+    PARTITIONS_AHEAD: int = 7  # intervals created in advance
+    PARTITION_TASK_INTERVAL: int = 3600  # seconds
+    TRAFFIC_LOG_RETENTION_DAYS: int = 90
+    
+    # Prometheus metrics (/api/system/metrics)
+    METRICS_ENABLED: bool = True
+    METRICS_TOKEN: Optional[str] = None  # Bearer token required to scrape
+    
+    # Outgoing HTTP clients (Cryptomus, ip-api, bot -> API)
+    HTTP_CLIENT_HTTP2: bool = True  # Used when the h2 package is installed
+    HTTP_CLIENT_RETRIES: int = 2
+    HTTP_CLIENT_BACKOFF: float = 0.2  # seconds, doubled per retry
+    
+    # Statistics export (scripts/export_stats.py, /api/admin/export)
+    EXPORT_CHUNK_SIZE: int = 5000  # rows fetched and encoded per batch
+    EXPORT_STATE_PATH: str = "data/export_state.json"  # incremental export watermarks
+    
+    # Daily report snapshots (/api/admin/reports/daily)
+    REPORT_SNAPSHOT_ENABLED: bool = True
+    REPORT_SNAPSHOT_DELAY: int = 300  # seconds after UTC midnight, lets late writes land
+    REPORT_BACKFILL_DAYS: int = 7  # missing closed days snapshotted after downtime
+    REPORT_COUNTERS_ENABLED: bool = True  # intraday Redis counters for today
+    MAX_REPORT_RANGE_DAYS: int = 366
+    
+    # Admin broadcasts (background fan-out to notifications)
+    BROADCAST_CHUNK_SIZE: int = 5000  # users per INSERT ... SELECT
+    BROADCAST_CHUNK_DELAY: float = 0.1  # seconds between chunks
+    BROADCAST_MAX_CONCURRENT_JOBS: int = 2
+    
+    # Telegram notification delivery (notify task, see bot/delivery.py)
+    NOTIFY_BATCH_SIZE: int = 100  # notifications claimed per batch
+    NOTIFY_MAX_BATCHES: int = 50  # per run, the next run continues a larger backlog
+    NOTIFY_GLOBAL_RATE: float = 25.0  # messages per second per process (Telegram allows ~30)
+    NOTIFY_CHAT_INTERVAL: float = 1.0  # seconds between messages to the same chat
+    NOTIFY_CONCURRENCY: int = 10  # requests in flight
+    NOTIFY_MAX_ATTEMPTS: int = 5
+    NOTIFY_RETRY_BACKOFF: float = 30.0  # seconds, doubled per attempt
+    NOTIFY_RETRY_BACKOFF_MAX: float = 3600.0
+    NOTIFY_CLAIM_TIMEOUT: int = 300  # claimed notifications not recorded by then are sent again
+    
+    # Admin alerts (deduplicated digests to TELEGRAM_ADMIN_IDS and TELEGRAM_ADMIN_CHANNEL)
+    ADMIN_ALERTS_ENABLED: bool = True
+    ADMIN_ALERT_BACKEND: str = "redis"  # redis (windows shared by processes) or memory
+    ADMIN_ALERT_FLUSH_INTERVAL: float = 30.0  # seconds between digests
+    ADMIN_ALERT_KEY_INTERVAL: int = 600  # a key is reported at most once per window (seconds)
+    ADMIN_ALERT_MAX_KEYS: int = 200  # pending keys, events of further keys are only counted
+    ADMIN_ALERT_STALE_SESSIONS: int = 100  # stale sessions closed in one sweep that raise an alert
+    
+    # Task worker (job queue, schedules and worker pool, see tasks/worker.py)
+    TASK_WORKER_IN_API: bool = False  # run workers in the API processes too
+    TASK_WORKER_CONCURRENCY: int = 4  # jobs run at once per process
+    TASK_POLL_INTERVAL: float = 1.0  # seconds between claims when the queue is empty
+    TASK_SCHEDULER_INTERVAL: float = 5.0  # seconds between scheduler ticks
+    TASK_LEADER_RETRY_INTERVAL: float = 15.0  # seconds between leadership attempts
+    TASK_SCHEDULES: str = ""  # overrides, e.g. "backup=0 3 * * *; stats=1800"
+    TASK_MAX_ATTEMPTS: int = 3
+    TASK_RETRY_BACKOFF: float = 30.0  # seconds, doubled per attempt
+    TASK_RETRY_BACKOFF_MAX: float = 3600.0
+    TASK_VISIBILITY_TIMEOUT: int = 7200  # running jobs older than this are requeued
+    TASK_JOB_RETENTION_DAYS: int = 7  # finished jobs kept for inspection
+    TASK_METRICS_PORT: int = 9101  # standalone worker /metrics port, 0 disables
     
     class Config:
         env_file = ".env"
@@ -0,0 +1,311 @@
+"""
+Daily admin report snapshots
+
+Closed days are stored once in daily_reports by the report task shortly
+after midnight (UTC), so historic reports are a primary key lookup and a
+range of days is one indexed scan. Today's report is assembled from
+incremental counters instead of aggregating users and payments:
+
+    new users, payouts   Redis hash per day, incremented on register / payout
+    active users         Redis HyperLogLog of user ids that logged in
+    traffic, earnings    today's bucket of the per-user rollups
+    total users          yesterday's snapshot plus today's new users
+
+When the Redis counters of today are missing (Redis restarted, counters
+enabled mid-day) they are seeded once from the database. Increments go
+through the async client after the request's commit, and stop for a few
+seconds after a Redis error, so an unreachable Redis does not add its
+timeout to every register and login.
+
+active_sessions is a live count, so it is only stored for the day that
+just closed; days snapshotted later (backfill, lazy lookups) leave it
+empty.
+"""
+
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import redis
+from sqlalchemy import and_, func
+from sqlalchemy.orm import Session
+
+from traffic_share.server.config import settings
+from traffic_share.server.logger import logger
+from traffic_share.server.models import (
+    DailyReport, Payment, PaymentStatus, TrafficSession, TrafficSessionStatus,
+    User, UserTrafficRollup
+)
+from traffic_share.server.redis_client import get_async_redis, get_sync_redis, redis_key
+from traffic_share.server.rollups import PERIOD_DAY
+
+
+# Counters outlive their day so the snapshot can still read them
+COUNTER_TTL = 3 * 86400
+
+REPORT_FIELDS = (
+    "total_users", "active_users", "new_users", "traffic_bytes",
+    "total_earnings", "total_payouts", "active_sessions"
+)
+
+
+def day_start(moment: datetime = None) -> datetime:
+    moment = moment or datetime.utcnow()
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class IntradayCounters:
+    """Per-day Redis counters written on the request path (best effort)"""
+
+    # Seconds to skip counter writes after a Redis error
+    BACKOFF_SECONDS = 5.0
+
+    def __init__(self, client_factory=get_sync_redis, async_client_factory=get_async_redis):
+        self._client_factory = client_factory
+        self._async_client_factory = async_client_factory
+        self._paused_until = 0.0
+
+    @staticmethod
+    def _keys(day: datetime):
+        stamp = day.strftime("%Y-%m-%d")
+        return redis_key("report", stamp), redis_key("report", stamp, "logins")
+
+    async def _record(self, apply):
+        if not settings.REPORT_COUNTERS_ENABLED or time.monotonic() < self._paused_until:
+            return
+        counters_key, logins_key = self._keys(day_start())
+        try:
+            pipe = self._async_client_factory().pipeline(transaction=False)
+            apply(pipe, counters_key, logins_key)
+            pipe.expire(counters_key, COUNTER_TTL)
+            pipe.expire(logins_key, COUNTER_TTL)
+            await pipe.execute()
+        except redis.RedisError as e:
+            # Closed days are snapshotted from the database; only today's view drifts
+            self._paused_until = time.monotonic() + self.BACKOFF_SECONDS
+            logger.warning(f"Report counter update skipped: {e}")
+
+    async def record_new_user(self):
+        await self._record(lambda pipe, key, _: pipe.hincrby(key, "new_users", 1))
+
+    async def record_login(self, user_id: int):
+        await self._record(lambda pipe, _, logins: pipe.pfadd(logins, user_id))
+
+    async def record_payout(self, amount: float):
+        await self._record(lambda pipe, key, _: pipe.hincrbyfloat(key, "total_payouts", amount))
+
+    def read(self, day: datetime) -> Optional[Dict[str, float]]:
+        """Counters of a day, None when they were never seeded"""
+        if not settings.REPORT_COUNTERS_ENABLED:
+            return None
+        counters_key, logins_key = self._keys(day)
+        try:
+            pipe = self._client_factory().pipeline(transaction=False)
+            pipe.hgetall(counters_key)
+            pipe.pfcount(logins_key)
+            values, active_users = pipe.execute()
+        except redis.RedisError as e:
+            logger.debug(f"Report counters unavailable: {e}")
+            return None
+
+        if not values.get("seeded"):
+            return None
+        return {
+            "new_users": int(values.get("new_users", 0)),
+            "total_payouts": float(values.get("total_payouts", 0)),
+            "active_users": active_users
+        }
+
+    def seed(self, day: datetime, new_users: int, total_payouts: float, login_user_ids: List[int]):
+        """
+        Initialise a day's counters from the database
+        Increments that race with seeding can be lost; closed days are
+        snapshotted from the database, so this only affects today's view.
+        """
+        if not settings.REPORT_COUNTERS_ENABLED:
+            return
+        counters_key, logins_key = self._keys(day)
+        try:
+            pipe = self._client_factory().pipeline(transaction=True)
+            pipe.hset(counters_key, mapping={
+                "new_users": new_users,
+                "total_payouts": total_payouts,
+                "seeded": 1
+            })
+            for start in range(0, len(login_user_ids), 1000):
+                pipe.pfadd(logins_key, *login_user_ids[start:start + 1000])
+            pipe.expire(counters_key, COUNTER_TTL)
+            pipe.expire(logins_key, COUNTER_TTL)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.debug(f"Report counters not seeded: {e}")
+
+
+# Global intraday counters
+report_counters = IntradayCounters()
+
+
+def _traffic_totals(db: Session, day: datetime) -> tuple:
+    """Bytes and earnings written during a day (from user rollups)"""
+    row = db.query(
+        func.sum(UserTrafficRollup.bytes_total).label("bytes"),
+        func.sum(UserTrafficRollup.earnings).label("earnings")
+    ).filter(
+        UserTrafficRollup.period == PERIOD_DAY,
+        UserTrafficRollup.bucket_start == day
+    ).one()
+    return int(row.bytes or 0), float(row.earnings or 0.0)
+
+
+def _payout_total(db: Session, day: datetime) -> float:
+    amount = db.query(func.sum(Payment.amount)).filter(
+        Payment.status == PaymentStatus.COMPLETED,
+        Payment.completed_at >= day,
+        Payment.completed_at < day + timedelta(days=1)
+    ).scalar()
+    return float(amount or 0.0)
+
+
+def _active_sessions(db: Session) -> int:
+    return db.query(func.count(TrafficSession.id)).filter(
+        TrafficSession.status == TrafficSessionStatus.ACTIVE
+    ).scalar() or 0
+
+
+def compute_report(db: Session, day: datetime, now: datetime = None) -> Dict[str, float]:
+    """
+    Aggregate one day from the database (used for snapshots)
+    active_sessions is None unless day is the one that just closed.
+    """
+    day_end = day + timedelta(days=1)
+    users = db.query(
+        func.count(User.id).filter(User.created_at < day_end).label("total"),
+        func.count(User.id).filter(
+            and_(User.created_at >= day, User.created_at < day_end)
+        ).label("new"),
+        func.count(User.id).filter(
+            and_(User.last_login_at >= day, User.last_login_at < day_end)
+        ).label("active")
+    ).one()
+
+    # last_login_at only keeps the latest login; the day's HyperLogLog,
+    # when still present, also counts users who logged in again since
+    counters = report_counters.read(day)
+    active_users = users.active
+    if counters is not None:
+        active_users = max(active_users, counters["active_users"])
+
+    traffic_bytes, earnings = _traffic_totals(db, day)
+    just_closed = day_end == day_start(now)
+
+    return {
+        "report_date": day,
+        "total_users": users.total,
+        "active_users": active_users,
+        "new_users": users.new,
+        "traffic_bytes": traffic_bytes,
+        "total_earnings": earnings,
+        "total_payouts": _payout_total(db, day),
+        "active_sessions": _active_sessions(db) if just_closed else None
+    }
+
+
+def store_snapshot(db: Session, values: Dict[str, float]):
+    """Insert or replace a day's snapshot (commits)"""
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    row = {**values, "created_at": datetime.utcnow()}
+    stmt = insert(DailyReport.__table__).values(row)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["report_date"],
+        set_={field: stmt.excluded[field] for field in (*REPORT_FIELDS, "created_at")}
+    )
+    db.execute(stmt)
+    db.commit()
+
+
+def snapshot_day(db: Session, day: datetime, now: datetime = None) -> Dict[str, float]:
+    """Compute and store a closed day"""
+    values = compute_report(db, day, now)
+    store_snapshot(db, values)
+    logger.info(f"Daily report snapshot stored for {day:%Y-%m-%d}")
+    return values
+
+
+def today_report(db: Session, now: datetime = None) -> Dict[str, float]:
+    """Today's report from the intraday counters"""
+    today = day_start(now)
+
+    counters = report_counters.read(today)
+    if counters is None:
+        new_users = db.query(func.count(User.id)).filter(User.created_at >= today).scalar() or 0
+        total_payouts = _payout_total(db, today)
+        login_ids = [
+            user_id for (user_id,) in
+            db.query(User.id).filter(User.last_login_at >= today)
+        ]
+        report_counters.seed(today, new_users, total_payouts, login_ids)
+        counters = {
+            "new_users": new_users,
+            "total_payouts": total_payouts,
+            "active_users": len(login_ids)
+        }
+
+    yesterday = db.get(DailyReport, today - timedelta(days=1))
+    if yesterday is not None:
+        total_users = yesterday.total_users + counters["new_users"]
+    else:
+        total_users = db.query(func.count(User.id)).scalar() or 0
+
+    traffic_bytes, earnings = _traffic_totals(db, today)
+
+    return {
+        "report_date": today,
+        "total_users": total_users,
+        "active_users": counters["active_users"],
+        "new_users": counters["new_users"],
+        "traffic_bytes": traffic_bytes,
+        "total_earnings": earnings,
+        "total_payouts": counters["total_payouts"],
+        "active_sessions": _active_sessions(db)
+    }
+
+
+def _as_values(report: DailyReport) -> Dict[str, float]:
+    return {
+        "report_date": report.report_date,
+        **{field: getattr(report, field) for field in REPORT_FIELDS}
+    }
+
+
+def get_reports(db: Session, first_day: datetime, last_day: datetime) -> List[Dict[str, float]]:
+    """
+    Reports of first_day..last_day (inclusive), oldest first
+    Closed days come from the snapshot table; a missing one is computed
+    and stored on the way, today comes from the intraday counters.
+    """
+    today = day_start()
+    first_day, last_day = day_start(first_day), min(day_start(last_day), today)
+
+    stored = {
+        report.report_date: _as_values(report)
+        for report in db.query(DailyReport).filter(
+            DailyReport.report_date >= first_day,
+            DailyReport.report_date <= last_day
+        )
+    }
+
+    reports = []
+    day = first_day
+    while day <= last_day:
+        if day == today:
+            reports.append(today_report(db))
+        elif day in stored:
+            reports.append(stored[day])
+        else:
+            reports.append(snapshot_day(db, day))
+        day += timedelta(days=1)
+    return reports
@@ -3,10 +3,11 @@ Database connection and session management
 """
 
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
 from contextlib import contextmanager
-from typing import Generator
+from typing import AsyncGenerator, Generator
 
 from traffic_share.server.config import settings
 
@@ -27,6 +28,34 @@ SessionLocal = sessionmaker(
     bind=engine
 )
 
+
+
+def to_async_database_url(url: str) -> str:
+    """Map a sync PostgreSQL URL onto the asyncpg driver"""
+    for prefix in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    return url
+
+
+# Async engine for request handlers - DB waits yield to the event loop
+async_engine = create_async_engine(
+    to_async_database_url(settings.DATABASE_URL),
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_pre_ping=True,
+    echo=settings.DB_ECHO
+)
+
+# Async session factory
+# Objects stay readable after commit, since lazy refresh is not possible
+# outside the session's greenlet
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    autoflush=False,
+    expire_on_commit=False
+)
+
 # Base class for models
 Base = declarative_base()
 
@@ -43,6 +72,15 @@ def get_db() -> Generator[Session, None, None]:
         db.close()
 
 
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    """
+    Async dependency for FastAPI endpoints
+    Provides AsyncSession bound to the async engine
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
 @contextmanager
 def get_db_context():
     """
@@ -4,13 +4,15 @@ FastAPI dependencies for authentication and authorization
 
 from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
 
-from traffic_share.server.database import get_db
+from traffic_share.server.database import get_async_db
 from traffic_share.server.models import User, Admin, Buyer, BuyerToken
 from traffic_share.core.security import SecurityManager
 from traffic_share.server.config import settings
+from traffic_share.server.principal_cache import principal_cache, token_usage
 
 
 security_bearer = HTTPBearer()
@@ -19,13 +21,20 @@ security_manager = SecurityManager(secret_key=settings.SECRET_KEY)
 
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security_bearer),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> User:
     """
     Dependency to get current authenticated user from JWT token
     """
+    return await authenticate_user(credentials.credentials, db)
+
+
+async def authenticate_user(token: str, db: AsyncSession) -> User:
+    """
+    Resolve an access token to an active user
+    Shared by get_current_user and WebSocket endpoints.
+    """
     try:
-        token = credentials.credentials
         payload = security_manager.decode_token(token)
         
         # Verify token type
@@ -42,13 +51,17 @@ async def get_current_user(
                 detail="Invalid token payload"
             )
         
-        # Get user from database
-        user = db.query(User).filter(User.id == user_id).first()
-        if not user:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="User not found"
-            )
+        # Get user from cache or database
+        user = principal_cache.get_user(user_id)
+        if user is None:
+            user = await db.get(User, user_id)
+            if not user:
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="User not found"
+                )
+            db.expunge(user)
+            principal_cache.set_user(user)
         
         # Check if user is active
         if not user.is_active or user.is_banned:
@@ -68,7 +81,7 @@ async def get_current_user(
 
 async def get_current_admin(
     credentials: HTTPAuthorizationCredentials = Depends(security_bearer),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> Admin:
     """
     Dependency to get current authenticated admin from JWT token
@@ -85,7 +98,7 @@ async def get_current_admin(
             )
         
         # Get admin from database
-        admin = db.query(Admin).filter(Admin.id == admin_id).first()
+        admin = await db.get(Admin, admin_id)
         if not admin:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
@@ -109,7 +122,7 @@ async def get_current_admin(
 
 async def get_current_buyer(
     credentials: HTTPAuthorizationCredentials = Depends(security_bearer),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> tuple[Buyer, BuyerToken]:
     """
     Dependency to get current authenticated buyer from API token
@@ -121,16 +134,27 @@ async def get_current_buyer(
         # Hash the token to compare with stored hash
         token_hash = SecurityManager.hash_token(token)
         
-        # Find token in database
-        buyer_token = db.query(BuyerToken).filter(
-            BuyerToken.token_hash == token_hash
-        ).first()
-        
-        if not buyer_token:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid buyer token"
+        cached = principal_cache.get_buyer(token_hash)
+        if cached is not None:
+            buyer, buyer_token = cached
+        else:
+            # Find token in database
+            result = await db.execute(
+                select(BuyerToken).where(BuyerToken.token_hash == token_hash)
             )
+            buyer_token = result.scalar_one_or_none()
+            
+            if not buyer_token:
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="Invalid buyer token"
+                )
+            
+            buyer = await db.get(Buyer, buyer_token.buyer_id)
+            if buyer:
+                db.expunge(buyer)
+                db.expunge(buyer_token)
+                principal_cache.set_buyer(buyer, buyer_token)
         
         # Check if token is revoked
         if buyer_token.is_revoked:
@@ -147,8 +171,6 @@ async def get_current_buyer(
                 detail="Token has expired"
             )
         
-        # Get buyer
-        buyer = db.query(Buyer).filter(Buyer.id == buyer_token.buyer_id).first()
         if not buyer:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -161,9 +183,8 @@ async def get_current_buyer(
                 detail="Buyer account is inactive"
             )
         
-        # Update last used timestamp
-        buyer_token.last_used_at = dt.utcnow()
-        db.commit()
+        # Record last used timestamp (written in batches)
+        token_usage.touch(buyer_token.id)
         
         return buyer, buyer_token
         
@@ -178,7 +199,7 @@ async def get_current_buyer(
 
 async def get_optional_user(
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> Optional[User]:
     """
     Optional user dependency - returns None if not authenticated
@@ -195,7 +216,7 @@ async def get_optional_user(
         if not user_id:
             return None
         
-        user = db.query(User).filter(User.id == user_id).first()
+        user = await db.get(User, user_id)
         return user if user and user.is_active else None
         
     except Exception:
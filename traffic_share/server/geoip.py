@@ -0,0 +1,167 @@
+"""
+Shared region checker backed by the offline IP database
+
+The database files are loaded at startup and watched for changes, so a
+new download is picked up without a restart.
+
+IP info is cached in front of the lookup: an in-process LRU, then Redis
+shared by all workers. Fallback answers (lookup failed) are cached for a
+short time only, and concurrent lookups of one IP share a single upstream
+request.
+"""
+
+import asyncio
+import json
+from typing import Any, Dict, Optional
+
+from traffic_share.core.ip_database import IPDatabase
+from traffic_share.core.region_check import RegionChecker
+from traffic_share.server.config import settings
+from traffic_share.server.logger import logger
+from traffic_share.server.metrics import IP_INFO_LOOKUPS
+from traffic_share.server.principal_cache import TTLCache
+from traffic_share.server.redis_client import get_async_redis, redis_key
+
+
+class IPInfoCache:
+    """Two-tier cache of IP info with single-flight loading"""
+
+    def __init__(
+        self,
+        max_size: int = None,
+        ttl: float = None,
+        negative_ttl: float = None,
+        use_redis: bool = None
+    ):
+        self.ttl = ttl or settings.IP_INFO_CACHE_TTL
+        self.negative_ttl = negative_ttl or settings.IP_INFO_NEGATIVE_TTL
+        self.use_redis = settings.IP_INFO_REDIS_ENABLED if use_redis is None else use_redis
+        self.local = TTLCache(max_size or settings.IP_INFO_CACHE_SIZE, self.ttl)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.stats = {"memory_hit": 0, "redis_hit": 0, "coalesced": 0, "miss": 0}
+
+    def _count(self, result: str):
+        self.stats[result] += 1
+        IP_INFO_LOOKUPS.labels(result=result).inc()
+
+    def _ttl_for(self, ip_info: Dict[str, Any]) -> float:
+        """Fallback answers are kept briefly so failures are retried soon"""
+        return self.negative_ttl if ip_info.get("source") == "fallback" else self.ttl
+
+    async def _redis_get(self, ip: str) -> Optional[Dict[str, Any]]:
+        try:
+            cached = await get_async_redis().get(redis_key("ipinfo", ip))
+        except Exception as e:
+            logger.debug(f"IP info cache read failed: {e}")
+            return None
+        return json.loads(cached) if cached else None
+
+    async def _redis_set(self, ip: str, ip_info: Dict[str, Any]):
+        try:
+            await get_async_redis().set(
+                redis_key("ipinfo", ip),
+                json.dumps(ip_info),
+                ex=int(self._ttl_for(ip_info))
+            )
+        except Exception as e:
+            logger.debug(f"IP info cache write failed: {e}")
+
+    async def _load(self, ip: str, loader) -> Dict[str, Any]:
+        """Redis tier, then the loader; result stored in both tiers"""
+        if self.use_redis:
+            ip_info = await self._redis_get(ip)
+            if ip_info is not None:
+                self._count("redis_hit")
+                self.local.set(ip, ip_info, ttl=self._ttl_for(ip_info))
+                return ip_info
+
+        self._count("miss")
+        ip_info = await loader(ip)
+        self.local.set(ip, ip_info, ttl=self._ttl_for(ip_info))
+        if self.use_redis:
+            await self._redis_set(ip, ip_info)
+        return ip_info
+
+    async def get(self, ip: str, loader) -> Dict[str, Any]:
+        """Cached IP info, calling loader(ip) at most once per IP at a time"""
+        ip_info = self.local.get(ip)
+        if ip_info is not None:
+            self._count("memory_hit")
+            return ip_info
+
+        future = self._inflight.get(ip)
+        if future is not None:
+            self._count("coalesced")
+            return await asyncio.shield(future)
+
+        future = asyncio.ensure_future(self._load(ip, loader))
+        self._inflight[ip] = future
+        future.add_done_callback(lambda _: self._inflight.pop(ip, None))
+        # A cancelled caller must not cancel the lookup others wait for
+        return await asyncio.shield(future)
+
+
+class CachedRegionChecker(RegionChecker):
+    """RegionChecker with cached get_ip_info (used by validate_region too)"""
+
+    def __init__(self, cache: IPInfoCache = None, **kwargs):
+        super().__init__(**kwargs)
+        self.cache = cache or IPInfoCache()
+
+    async def get_ip_info(self, ip: str) -> Dict[str, Any]:
+        return await self.cache.get(ip, super().get_ip_info)
+
+
+class GeoIPService:
+    """Owns the IP database and its reload loop"""
+
+    def __init__(self):
+        self.ip_database = IPDatabase(
+            settings.IP_DATABASE_PATH,
+            settings.IP_HOSTING_RANGES_PATH
+        )
+        self.region_checker = CachedRegionChecker(
+            ip_api_enabled=settings.IP_API_ENABLED,
+            ip_database=self.ip_database
+        )
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(settings.IP_DATABASE_PATH or settings.IP_HOSTING_RANGES_PATH)
+
+    async def _watch(self):
+        """Reload the database when its files change"""
+        while True:
+            await asyncio.sleep(settings.IP_DATABASE_RELOAD_INTERVAL)
+            try:
+                if await asyncio.to_thread(self.ip_database.reload_if_changed):
+                    logger.info("IP database reloaded")
+            except Exception as e:
+                logger.error(f"IP database reload failed: {e}")
+
+    async def start(self):
+        """Load the database and start watching it"""
+        if not self.enabled or self._task is not None:
+            return
+
+        try:
+            await asyncio.to_thread(self.ip_database.load)
+        except Exception as e:
+            logger.error(f"IP database load failed: {e}")
+
+        self._task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        """Stop watching the database"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# Global GeoIP service instance
+geoip = GeoIPService()
@@ -0,0 +1,191 @@
+"""
+Shared HTTP clients for upstream services
+
+One pooled httpx.AsyncClient per upstream (Cryptomus, ip-api, the bot's
+calls to our own API), opened at application startup and closed at
+shutdown, so connections and TLS sessions are reused between requests.
+Each upstream has its own connection limits, timeouts and retry policy.
+
+Retries use exponential backoff. Connection failures are retried for any
+method since the request never reached the server; timeouts and 502/503/504
+responses only for idempotent methods, so a payout POST is never sent twice.
+"""
+
+import asyncio
+from typing import Callable, Dict
+
+import httpx
+
+from traffic_share.server.config import settings
+from traffic_share.server.logger import logger
+
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+RETRY_STATUS_CODES = {502, 503, 504}
+
+
+def http2_available() -> bool:
+    """Whether the h2 package needed for HTTP/2 is installed"""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class UpstreamConfig:
+    """Connection, timeout and retry policy of one upstream"""
+
+    def __init__(
+        self,
+        base_url: str = "",
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        keepalive_expiry: float = 30.0,
+        timeout: float = 10.0,
+        connect_timeout: float = 3.0,
+        retries: int = None,
+        backoff: float = None,
+        http2: bool = True,
+        transport: httpx.AsyncBaseTransport = None
+    ):
+        self.base_url = base_url
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.retries = settings.HTTP_CLIENT_RETRIES if retries is None else retries
+        self.backoff = settings.HTTP_CLIENT_BACKOFF if backoff is None else backoff
+        self.http2 = http2
+        self.transport = transport
+
+    def build_client(self) -> httpx.AsyncClient:
+        """Create the pooled client for this upstream"""
+        return httpx.AsyncClient(
+            base_url=self.base_url,
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive_connections,
+                keepalive_expiry=self.keepalive_expiry
+            ),
+            timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+            http2=self.http2 and settings.HTTP_CLIENT_HTTP2 and http2_available(),
+            transport=self.transport
+        )
+
+
+def default_upstreams() -> Dict[str, Callable[[], UpstreamConfig]]:
+    """Known upstreams, built lazily so settings can change in tests"""
+    return {
+        "cryptomus": lambda: UpstreamConfig(
+            base_url=settings.CRYPTOMUS_API_URL,
+            max_connections=10,
+            max_keepalive_connections=5,
+            timeout=30.0
+        ),
+        "ip_api": lambda: UpstreamConfig(
+            base_url="http://ip-api.com",
+            max_connections=20,
+            timeout=5.0,
+            retries=1,
+            # ip-api free tier is plain HTTP/1.1
+            http2=False
+        ),
+        "internal_api": lambda: UpstreamConfig(
+            base_url=f"http://localhost:{settings.PORT}/api",
+            max_connections=50,
+            max_keepalive_connections=20,
+            http2=False
+        ),
+    }
+
+
+class HTTPClientRegistry:
+    """Application-scoped pooled clients, one per upstream"""
+
+    def __init__(self, upstreams: Dict[str, Callable[[], UpstreamConfig]] = None):
+        self._factories = upstreams if upstreams is not None else default_upstreams()
+        self._configs: Dict[str, UpstreamConfig] = {}
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+
+    def config(self, name: str) -> UpstreamConfig:
+        """Policy of an upstream"""
+        if name not in self._configs:
+            if name not in self._factories:
+                raise KeyError(f"Unknown upstream: {name}")
+            self._configs[name] = self._factories[name]()
+        return self._configs[name]
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        """
+        Pooled client of an upstream
+        Opened on first use when called outside the application lifespan
+        (scripts, tests).
+        """
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            client = self.config(name).build_client()
+            self._clients[name] = client
+        return client
+
+    async def request(
+        self,
+        name: str,
+        method: str,
+        url: str,
+        **kwargs
+    ) -> httpx.Response:
+        """Send a request through an upstream client with its retry policy"""
+        config = self.config(name)
+        client = self.get(name)
+        method = method.upper()
+        idempotent = method in IDEMPOTENT_METHODS
+
+        attempt = 0
+        while True:
+            try:
+                response = await client.request(method, url, **kwargs)
+                if not (
+                    idempotent
+                    and response.status_code in RETRY_STATUS_CODES
+                    and attempt < config.retries
+                ):
+                    return response
+                await response.aclose()
+                reason = f"HTTP {response.status_code}"
+            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                if attempt >= config.retries:
+                    raise
+                reason = repr(e)
+            except httpx.TransportError as e:
+                if not idempotent or attempt >= config.retries:
+                    raise
+                reason = repr(e)
+
+            delay = config.backoff * (2 ** attempt)
+            attempt += 1
+            logger.warning(
+                f"{name} {method} {url} failed ({reason}), "
+                f"retry {attempt}/{config.retries} in {delay:.2f}s"
+            )
+            await asyncio.sleep(delay)
+
+    async def start(self):
+        """Open clients of all known upstreams"""
+        for name in self._factories:
+            self.get(name)
+        logger.info(f"HTTP clients opened: {', '.join(self._clients)}")
+
+    async def stop(self):
+        """Close all clients"""
+        clients, self._clients = self._clients, {}
+        for name, client in clients.items():
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.warning(f"Error closing {name} HTTP client: {e}")
+
+
+# Global HTTP client registry
+http_clients = HTTPClientRegistry()
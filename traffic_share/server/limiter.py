@@ -1,91 +1,215 @@
 """
 Rate limiting using Redis
+
+Each check is a single EVALSHA of a GCRA (generic cell rate algorithm)
+script: one key per limited principal holding its theoretical arrival
+time, so the check is atomic, O(1) in memory and one round trip.
+When Redis is unreachable, requests are limited by an in-process token
+bucket instead (per worker) until Redis comes back.
 """
 
+import math
 import time
+from collections import OrderedDict
 from typing import Optional
 import redis.asyncio as redis
 from fastapi import HTTPException, Request, status
 
 from traffic_share.server.config import settings
 from traffic_share.server.logger import logger
+from traffic_share.server.metrics import RATE_LIMIT_LATENCY
+from traffic_share.core.security import SecurityManager
+
+
+# KEYS[1] - limiter key
+# ARGV[1] - now (ms), ARGV[2] - window (ms), ARGV[3] - max requests in window
+# Returns {limited, remaining, retry_after_ms, reset_after_ms}
+GCRA_SCRIPT = """
+local now = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
+local emission = period / limit
+
+local tat = tonumber(redis.call('GET', KEYS[1]))
+if not tat or tat < now then
+    tat = now
+end
+
+local new_tat = tat + emission
+local allow_at = new_tat - period
+
+if allow_at > now then
+    return {1, 0, math.ceil(allow_at - now), math.ceil(tat - now)}
+end
+
+redis.call('SET', KEYS[1], new_tat, 'PX', math.ceil(new_tat - now))
+
+local remaining = math.floor((period - (new_tat - now)) / emission)
+return {0, remaining, 0, math.ceil(new_tat - now)}
+"""
+
+
+class LocalTokenBucket:
+    """In-process token bucket used while Redis is unavailable"""
+    
+    def __init__(self, max_keys: int = 10000):
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+    
+    def consume(
+        self,
+        key: str,
+        max_requests: int,
+        window_seconds: int,
+        now: float = None
+    ) -> tuple[bool, dict]:
+        """
+        Take one token for key
+        Returns (is_limited: bool, info: dict)
+        """
+        now = time.monotonic() if now is None else now
+        refill_rate = max_requests / window_seconds
+        
+        tokens, updated_at = self._buckets.get(key, (float(max_requests), now))
+        tokens = min(float(max_requests), tokens + (now - updated_at) * refill_rate)
+        
+        if tokens < 1:
+            self._store(key, tokens, now)
+            return True, {
+                "limit": max_requests,
+                "remaining": 0,
+                "reset_in": math.ceil((1 - tokens) / refill_rate)
+            }
+        
+        tokens -= 1
+        self._store(key, tokens, now)
+        
+        return False, {
+            "limit": max_requests,
+            "remaining": int(tokens),
+            "reset_in": math.ceil((max_requests - tokens) / refill_rate)
+        }
+    
+    def _store(self, key: str, tokens: float, now: float):
+        """Save bucket state and evict least recently used keys"""
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
 
 
 class RateLimiter:
     """Rate limiter using Redis"""
     
+    # How long to stay on the local bucket after a Redis error
+    REDIS_RETRY_SECONDS = 5.0
+    
     def __init__(self, redis_url: str = None):
         self.redis_url = redis_url or settings.REDIS_URL
         self.redis_client: Optional[redis.Redis] = None
         self.key_prefix = settings.REDIS_KEY_PREFIX + "ratelimit:"
+        self.local_bucket = LocalTokenBucket()
+        self._script = None
+        self._redis_down_until = 0.0
     
     async def connect(self):
         """Connect to Redis"""
+        self.redis_client = redis.from_url(
+            self.redis_url,
+            encoding="utf-8",
+            decode_responses=True,
+            socket_timeout=0.25,
+            socket_connect_timeout=0.25
+        )
+        self._script = self.redis_client.register_script(GCRA_SCRIPT)
+        
         try:
-            self.redis_client = redis.from_url(
-                self.redis_url,
-                encoding="utf-8",
-                decode_responses=True
-            )
             await self.redis_client.ping()
             logger.info("Connected to Redis for rate limiting")
         except Exception as e:
+            # Keep the client - the limiter falls back to the local bucket
+            # and retries Redis periodically
+            self._mark_redis_down()
             logger.error(f"Failed to connect to Redis: {e}")
-            self.redis_client = None
     
     async def disconnect(self):
         """Disconnect from Redis"""
         if self.redis_client:
             await self.redis_client.close()
+            self.redis_client = None
+            self._script = None
+    
+    def _mark_redis_down(self):
+        """Route checks to the local bucket for a while"""
+        self._redis_down_until = time.monotonic() + self.REDIS_RETRY_SECONDS
+    
+    def _redis_available(self) -> bool:
+        """Whether the next check should go to Redis"""
+        return (
+            self._script is not None
+            and time.monotonic() >= self._redis_down_until
+        )
+    
+    @property
+    def redis_connected(self) -> bool:
+        """Whether checks currently go to Redis"""
+        return self._redis_available()
+    
+    def _consume_local(
+        self,
+        key: str,
+        max_requests: int,
+        window_seconds: int
+    ) -> tuple[bool, dict]:
+        """Check against the local bucket"""
+        with RATE_LIMIT_LATENCY.labels(backend="local").time():
+            return self.local_bucket.consume(key, max_requests, window_seconds)
     
     async def is_rate_limited(
-        self, 
-        key: str, 
-        max_requests: int, 
+        self,
+        key: str,
+        max_requests: int,
         window_seconds: int
     ) -> tuple[bool, dict]:
         """
         Check if rate limit is exceeded
         Returns (is_limited: bool, info: dict)
         """
-        if not self.redis_client or not settings.RATE_LIMIT_ENABLED:
+        if not settings.RATE_LIMIT_ENABLED:
             return False, {}
         
+        if not self._redis_available():
+            return self._consume_local(key, max_requests, window_seconds)
+        
+        started = time.perf_counter()
         try:
-            full_key = f"{self.key_prefix}{key}"
-            current_time = int(time.time())
-            window_start = current_time - window_seconds
-            
-            # Remove old entries
-            await self.redis_client.zremrangebyscore(full_key, 0, window_start)
-            
-            # Count current requests in window
-            current_count = await self.redis_client.zcard(full_key)
-            
-            if current_count >= max_requests:
-                # Rate limit exceeded
-                ttl = await self.redis_client.ttl(full_key)
-                return True, {
-                    "limit": max_requests,
-                    "remaining": 0,
-                    "reset_in": ttl if ttl > 0 else window_seconds
-                }
-            
-            # Add current request
-            await self.redis_client.zadd(full_key, {str(current_time): current_time})
-            
-            # Set expiry
-            await self.redis_client.expire(full_key, window_seconds)
+            limited, remaining, retry_after_ms, reset_after_ms = await self._script(
+                keys=[f"{self.key_prefix}{key}"],
+                args=[int(time.time() * 1000), window_seconds * 1000, max_requests]
+            )
+        except Exception as e:
+            if time.monotonic() >= self._redis_down_until:
+                logger.error(f"Rate limit check failed, using local bucket: {e}")
+            self._mark_redis_down()
+            return self._consume_local(key, max_requests, window_seconds)
+        finally:
+            RATE_LIMIT_LATENCY.labels(backend="redis").observe(
+                time.perf_counter() - started
+            )
             
-            return False, {
+        if limited:
+            return True, {
                 "limit": max_requests,
-                "remaining": max_requests - current_count - 1,
-                "reset_in": window_seconds
+                "remaining": 0,
+                "reset_in": max(1, math.ceil(int(retry_after_ms) / 1000))
             }
             
-        except Exception as e:
-            logger.error(f"Rate limit check failed: {e}")
-            return False, {}
+        return False, {
+            "limit": max_requests,
+            "remaining": int(remaining),
+            "reset_in": max(1, math.ceil(int(reset_after_ms) / 1000))
+        }
     
     def parse_rate_string(self, rate_string: str) -> tuple[int, int]:
         """
@@ -114,23 +238,59 @@ class RateLimiter:
 rate_limiter = RateLimiter()
 
 
+def _bearer_token(request: Request) -> Optional[str]:
+    """Extract bearer token from Authorization header"""
+    auth_header = request.headers.get("Authorization", "")
+    if not auth_header.startswith("Bearer "):
+        return None
+    return auth_header[len("Bearer "):].strip() or None
+
+
+def get_rate_limit_key(request: Request, scope: str = "ip") -> str:
+    """
+    Build rate limit key for the request
+    Scopes: "ip", "user" (JWT user_id) and "buyer" (API token hash);
+    user and buyer scopes fall back to the client IP without credentials
+    """
+    if scope == "user":
+        token = _bearer_token(request)
+        if token:
+            from traffic_share.server.dependencies import security_manager
+            
+            try:
+                user_id = security_manager.decode_token(token).get("user_id")
+                if user_id:
+                    return f"user:{user_id}"
+            except ValueError:
+                pass
+    
+    elif scope == "buyer":
+        token = _bearer_token(request)
+        if token:
+            return f"buyer:{SecurityManager.hash_token(token)[:32]}"
+    
+    from traffic_share.server.utils import get_client_ip
+    
+    return f"ip:{get_client_ip(request)}"
+
+
 async def check_rate_limit(
     request: Request,
     rate_string: str,
-    key_suffix: str = None
+    key_suffix: str = None,
+    scope: str = "ip"
 ):
     """
     FastAPI dependency for rate limiting
     
     Usage:
-        @app.get("/endpoint", dependencies=[Depends(lambda req: check_rate_limit(req, "10/minute"))])
+        @app.get("/endpoint", dependencies=[Depends(rate_limit("10/minute", scope="user"))])
     """
     if not settings.RATE_LIMIT_ENABLED:
         return
     
-    # Build rate limit key from IP or user
-    client_ip = request.client.host if request.client else "unknown"
-    key = f"{client_ip}"
+    # Build rate limit key from IP, user or buyer token
+    key = get_rate_limit_key(request, scope)
     
     if key_suffix:
         key = f"{key}:{key_suffix}"
@@ -150,9 +310,18 @@ async def check_rate_limit(
             headers={
                 "X-RateLimit-Limit": str(info.get("limit", max_requests)),
                 "X-RateLimit-Remaining": "0",
-                "X-RateLimit-Reset": str(info.get("reset_in", window_seconds))
+                "X-RateLimit-Reset": str(info.get("reset_in", window_seconds)),
+                "Retry-After": str(info.get("reset_in", window_seconds))
             }
         )
     
     # Add rate limit headers to response
     request.state.rate_limit_info = info
+
+
+def rate_limit(rate_string: str, scope: str = "ip", name: str = None):
+    """Build a rate limit dependency for a route or router"""
+    async def dependency(request: Request):
+        await check_rate_limit(request, rate_string, key_suffix=name, scope=scope)
+    
+    return dependency
@@ -10,15 +10,27 @@ from contextlib import asynccontextmanager
 import time
 
 from traffic_share.server.config import settings
-from traffic_share.server.database import engine, Base
+from traffic_share.server.database import engine, async_engine, Base
 from traffic_share.server.logger import logger
 from traffic_share.server.limiter import rate_limiter
+from traffic_share.server.traffic_buffer import traffic_buffer
+from traffic_share.server.principal_cache import principal_cache, token_usage
+from traffic_share.server.redis_client import close_redis
+from traffic_share.server.package_pool import package_pool
+from traffic_share.server.allocation_expiry import allocation_reaper
+from traffic_share.server.metrics import observe_request
+from traffic_share.server.http_clients import http_clients
+from traffic_share.server.geoip import geoip
+from traffic_share.server.broadcast_runner import broadcast_runner
+from traffic_share.server.admin_alerts import admin_alerts
+from traffic_share.server.tasks.worker import task_worker
 
 # Import all routes
 from traffic_share.server.routes import (
     auth_routes,
     user_routes,
     traffic_routes,
+    traffic_stream_routes,
     payment_routes,
     buyer_routes,
     admin_routes,
@@ -47,6 +59,37 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.warning(f"Redis connection failed: {e}")
     
+    # Start write-behind buffer for traffic heartbeats
+    if settings.TRAFFIC_BUFFER_ENABLED:
+        await traffic_buffer.start()
+    
+    # Principal cache invalidation listener and token usage writer
+    await principal_cache.start()
+    await token_usage.start()
+    
+    # Ready queues for buyer pulls (optional)
+    await package_pool.start()
+    
+    # Release unconfirmed allocations as soon as their TTL passes
+    await allocation_reaper.start()
+    
+    # Pooled clients for Cryptomus and ip-api
+    await http_clients.start()
+    
+    # Offline IP database for region checks (optional)
+    await geoip.start()
+    
+    # Resume admin broadcasts interrupted by a restart
+    await broadcast_runner.start()
+    
+    # Deduplicated admin alert digests
+    await admin_alerts.start()
+    
+    # Scheduled tasks (partitions, report snapshots, cleanup, ...) normally
+    # run in the dedicated worker process (python -m traffic_share.server.tasks.worker)
+    if settings.TASK_WORKER_IN_API:
+        await task_worker.start()
+    
     logger.info("Traffic Share API started successfully!")
     
     yield
@@ -54,12 +97,40 @@ async def lifespan(app: FastAPI):
     # Shutdown
     logger.info("Shutting down Traffic Share API...")
     
+    # Drain buffered heartbeats before the process exits
+    try:
+        await traffic_buffer.stop()
+    except Exception as e:
+        logger.error(f"Traffic buffer shutdown flush failed: {e}")
+    
+    await task_worker.stop()
+    
+    await broadcast_runner.stop()
+    
+    # Sends alerts still pending
+    await admin_alerts.stop()
+    
+    try:
+        await principal_cache.stop()
+        await token_usage.stop()
+        await package_pool.stop()
+        await allocation_reaper.stop()
+    except Exception as e:
+        logger.error(f"Principal cache shutdown failed: {e}")
+    
+    await http_clients.stop()
+    await geoip.stop()
+    
     # Disconnect from Redis
     try:
         await rate_limiter.disconnect()
+        await close_redis()
     except Exception:
         pass
     
+    # Close async connection pool
+    await async_engine.dispose()
+    
     logger.info("Traffic Share API stopped")
 
 
@@ -86,9 +157,18 @@ app.add_middleware(
 @app.middleware("http")
 async def add_process_time_header(request: Request, call_next):
     """Add request processing time to response headers"""
-    start_time = time.time()
-    response = await call_next(request)
-    process_time = time.time() - start_time
+    start_time = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        process_time = time.perf_counter() - start_time
+        # Route template (e.g. /api/traffic/{session_id}), not the raw path
+        route = request.scope.get("route")
+        observe_request(
+            request.method, getattr(route, "path", None), status_code, process_time
+        )
     response.headers["X-Process-Time"] = str(process_time)
     return response
 
@@ -125,6 +205,7 @@ async def general_exception_handler(request: Request, exc: Exception):
 app.include_router(auth_routes.router, prefix="/api")
 app.include_router(user_routes.router, prefix="/api")
 app.include_router(traffic_routes.router, prefix="/api")
+app.include_router(traffic_stream_routes.router, prefix="/api")
 app.include_router(payment_routes.router, prefix="/api")
 app.include_router(buyer_routes.router, prefix="/api")
 app.include_router(admin_routes.router, prefix="/api")
@@ -0,0 +1,200 @@
+"""
+Prometheus metrics for the API hot paths
+
+Request latency per route template, rate limiter check latency, traffic
+update and package allocation counters, background job timings, and
+database pool gauges that are read from the engine pools at scrape time.
+Metrics are per worker process; Prometheus aggregates workers by instance
+labels.
+"""
+
+import threading
+import time
+from typing import Dict, Optional
+
+import psutil
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, Counter, Histogram, generate_latest
+)
+from prometheus_client.core import GaugeMetricFamily
+
+from traffic_share.server.database import engine, async_engine
+
+
+# Process start, used for uptime
+STARTED_AT = time.time()
+
+# Label for requests that matched no route (keeps label cardinality bounded)
+UNMATCHED_ROUTE = "unmatched"
+
+REQUEST_LATENCY = Histogram(
+    "traffic_share_http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+
+RATE_LIMIT_LATENCY = Histogram(
+    "traffic_share_rate_limit_check_seconds",
+    "Rate limit check latency by backend",
+    ["backend"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+)
+
+TRAFFIC_UPDATES = Counter(
+    "traffic_share_traffic_updates",
+    "Traffic heartbeats accepted"
+)
+
+TRAFFIC_BYTES = Counter(
+    "traffic_share_traffic_bytes",
+    "Bytes reported by traffic heartbeats"
+)
+
+PACKAGE_PULLS = Counter(
+    "traffic_share_package_pulls",
+    "Buyer package pull requests served"
+)
+
+PACKAGES_ALLOCATED = Counter(
+    "traffic_share_packages_allocated",
+    "Packages allocated to buyers"
+)
+
+IP_INFO_LOOKUPS = Counter(
+    "traffic_share_ip_info_lookups",
+    "IP info lookups by cache result (memory_hit, redis_hit, coalesced, miss)",
+    ["result"]
+)
+
+TASK_DURATION = Histogram(
+    "traffic_share_task_duration_seconds",
+    "Background job run time by task and outcome (succeeded, retry, dead)",
+    ["task", "outcome"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)
+)
+
+TASK_LAG = Histogram(
+    "traffic_share_task_lag_seconds",
+    "Delay between a job's run time and a worker claiming it",
+    ["task"],
+    buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+)
+
+
+NOTIFICATION_DELIVERIES = Counter(
+    "traffic_share_notification_deliveries",
+    "Telegram notification delivery attempts by result (sent, pending, failed)",
+    ["result"]
+)
+
+NOTIFICATION_LAG = Histogram(
+    "traffic_share_notification_lag_seconds",
+    "Delay between a notification being created and delivered",
+    buckets=(1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 900.0, 1800.0, 3600.0)
+)
+
+
+class RequestRate:
+    """Requests seen in the last minute, in one-second slots"""
+
+    def __init__(self, window_seconds: int = 60):
+        self.window_seconds = window_seconds
+        self._seconds = [0] * window_seconds
+        self._counts = [0] * window_seconds
+        self._lock = threading.Lock()
+
+    def mark(self, now: float = None):
+        """Count one request"""
+        second = int(time.time() if now is None else now)
+        slot = second % self.window_seconds
+        with self._lock:
+            if self._seconds[slot] != second:
+                self._seconds[slot] = second
+                self._counts[slot] = 0
+            self._counts[slot] += 1
+
+    def per_minute(self, now: float = None) -> float:
+        """Requests per minute over the window"""
+        second = int(time.time() if now is None else now)
+        with self._lock:
+            total = sum(
+                count
+                for slot_second, count in zip(self._seconds, self._counts)
+                if 0 <= second - slot_second < self.window_seconds
+            )
+        return total * 60.0 / self.window_seconds
+
+
+request_rate = RequestRate()
+
+
+def observe_request(method: str, route: Optional[str], status: int, duration: float):
+    """Record one handled request"""
+    REQUEST_LATENCY.labels(
+        method=method,
+        route=route or UNMATCHED_ROUTE,
+        status=str(status)
+    ).observe(duration)
+    request_rate.mark()
+
+
+def db_pool_stats() -> Dict[str, Dict[str, int]]:
+    """Checked out / overflow / size of the sync and async engine pools"""
+    stats = {}
+    for name, pool in (("sync", engine.pool), ("async", async_engine.sync_engine.pool)):
+        # SQLite test pools have no size accounting
+        if not hasattr(pool, "checkedout"):
+            continue
+        stats[name] = {
+            "checked_out": pool.checkedout(),
+            "overflow": max(pool.overflow(), 0),
+            "size": pool.size()
+        }
+    return stats
+
+
+class DBPoolCollector:
+    """Reads engine pool state at scrape time"""
+
+    def collect(self):
+        checked_out = GaugeMetricFamily(
+            "traffic_share_db_pool_checked_out",
+            "Database connections in use",
+            labels=["pool"]
+        )
+        overflow = GaugeMetricFamily(
+            "traffic_share_db_pool_overflow",
+            "Database connections opened above pool size",
+            labels=["pool"]
+        )
+        size = GaugeMetricFamily(
+            "traffic_share_db_pool_size",
+            "Configured database pool size",
+            labels=["pool"]
+        )
+
+        for name, stats in db_pool_stats().items():
+            checked_out.add_metric([name], stats["checked_out"])
+            overflow.add_metric([name], stats["overflow"])
+            size.add_metric([name], stats["size"])
+
+        yield checked_out
+        yield overflow
+        yield size
+
+
+REGISTRY.register(DBPoolCollector())
+
+# First cpu_percent(interval=None) call only sets the baseline
+psutil.cpu_percent(interval=None)
+
+
+def uptime_seconds() -> int:
+    """Seconds since this process started"""
+    return int(time.time() - STARTED_AT)
+
+
+def render_latest() -> tuple:
+    """(body, content type) in Prometheus text format"""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -43,6 +43,7 @@ class User(Base):
     __table_args__ = (
         Index('idx_telegram_id', 'telegram_id'),
         Index('idx_is_active', 'is_active'),
+        Index('idx_user_created_id', 'created_at', 'id'),
     )
 
 
@@ -134,6 +135,10 @@ class TrafficSession(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
     
     # Aliases for compatibility
+    @property
+    def session_id(self):
+        return self.session_uuid
+    
     @property
     def start_time(self):
         return self.started_at
@@ -154,11 +159,17 @@ class TrafficSession(Base):
     __table_args__ = (
         Index('idx_user_status', 'user_id', 'status'),
         Index('idx_session_uuid', 'session_uuid'),
+        Index('idx_user_started_id', 'user_id', 'started_at', 'id'),
     )
 
 
 class TrafficLog(Base):
-    """Detailed traffic logs"""
+    """
+    Detailed traffic logs
+    Partitioned by RANGE (timestamp) in PostgreSQL, with primary key
+    (id, timestamp) - see migration 002_partition_traffic_logs. create_all
+    makes a plain table; the migration partitions it.
+    """
     __tablename__ = "traffic_logs"
     
     id = Column(Integer, primary_key=True, index=True)
@@ -176,6 +187,46 @@ class TrafficLog(Base):
     )
 
 
+class UserTrafficRollup(Base):
+    """Per-user traffic totals by hour, day and month, plus a running total"""
+    __tablename__ = "user_traffic_rollups"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    
+    period = Column(String(10), nullable=False)  # hour, day, month, total
+    bucket_start = Column(DateTime, nullable=False)
+    
+    bytes_total = Column(BigInteger, default=0, nullable=False)
+    earnings = Column(Float, default=0.0, nullable=False)
+    
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    
+    __table_args__ = (
+        Index('idx_rollup_user_bucket', 'user_id', 'period', 'bucket_start', unique=True),
+        Index('idx_rollup_period_bucket', 'period', 'bucket_start'),
+    )
+
+
+class DailyReport(Base):
+    """Closed-day admin report snapshots, one row per UTC day"""
+    __tablename__ = "daily_reports"
+    
+    report_date = Column(DateTime, primary_key=True)  # day start (UTC)
+    
+    total_users = Column(Integer, default=0, nullable=False)
+    active_users = Column(Integer, default=0, nullable=False)
+    new_users = Column(Integer, default=0, nullable=False)
+    
+    traffic_bytes = Column(BigInteger, default=0, nullable=False)
+    total_earnings = Column(Float, default=0.0, nullable=False)
+    total_payouts = Column(Float, default=0.0, nullable=False)
+    
+    active_sessions = Column(Integer, nullable=True)  # at close, only when snapshotted on time
+    
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
 class Buyer(Base):
     """Buyers who purchase traffic"""
     __tablename__ = "buyers"
@@ -214,13 +265,14 @@ class BuyerToken(Base):
     buyer = relationship("Buyer", back_populates="tokens")
 
 
-class PackageStatus(enum.Enum):
-    """Package status enum"""
-    PENDING = "pending"
+class PackageStatus(str, enum.Enum):
+    """Package status enum (stored as plain strings)"""
+    AVAILABLE = "available"
     ALLOCATED = "allocated"
-    IN_USE = "in_use"
+    IN_PROGRESS = "in_progress"
     COMPLETED = "completed"
-    EXPIRED = "expired"
+    FAILED = "failed"
+    REVOKED = "revoked"
 
 
 class Package(Base):
@@ -230,20 +282,40 @@ class Package(Base):
     id = Column(Integer, primary_key=True, index=True)
     package_uuid = Column(String(100), unique=True, nullable=False, index=True)
     
-    size_gb = Column(Float, nullable=False)
-    region = Column(String(10), nullable=False)
+    # Traffic source - one buyer may hold one package per user + IP
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    ip = Column(String(45), nullable=True)
+    
+    size_gb = Column(Float, nullable=True)
+    size_bytes = Column(BigInteger, default=0, nullable=False)
+    region = Column(String(10), nullable=True)
     
-    status = Column(Enum(PackageStatus), default=PackageStatus.PENDING, nullable=False)
+    status = Column(String(20), default=PackageStatus.AVAILABLE.value, nullable=False)
+    assigned_buyer_id = Column(Integer, ForeignKey("buyers.id"), nullable=True)
+    bytes_sent = Column(BigInteger, default=0, nullable=False)
     
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     allocated_at = Column(DateTime, nullable=True)
     expires_at = Column(DateTime, nullable=True)
+    completed_at = Column(DateTime, nullable=True)
     
     # Relationships
     allocations = relationship("PackageAllocation", back_populates="package")
     
     __table_args__ = (
         Index('idx_status_region', 'status', 'region'),
+        # Allocation scan: available packages in id order
+        Index(
+            'idx_package_available', 'region', 'id',
+            postgresql_where=(status == PackageStatus.AVAILABLE.value)
+        ),
+        # One user + IP per buyer rule
+        Index('idx_package_buyer_user_ip', 'assigned_buyer_id', 'user_id', 'ip'),
+        # Stale allocation sweep: allocated packages by deadline
+        Index(
+            'idx_package_allocated_expiry', 'expires_at',
+            postgresql_where=(status == PackageStatus.ALLOCATED.value)
+        ),
     )
 
 
@@ -255,6 +327,7 @@ class PackageAllocation(Base):
     package_id = Column(Integer, ForeignKey("packages.id"), nullable=False)
     buyer_id = Column(Integer, ForeignKey("buyers.id"), nullable=False)
     
+    status = Column(String(20), default=PackageStatus.ALLOCATED.value, nullable=False)
     bytes_used = Column(BigInteger, default=0, nullable=False)
     allocated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     completed_at = Column(DateTime, nullable=True)
@@ -301,6 +374,14 @@ class Payment(Base):
     )
 
 
+class NotificationDeliveryStatus(str, enum.Enum):
+    """Telegram delivery status of a notification (stored as plain strings)"""
+    PENDING = "pending"
+    SENDING = "sending"
+    SENT = "sent"
+    FAILED = "failed"
+
+
 class Notification(Base):
     """User notifications"""
     __tablename__ = "notifications"
@@ -315,6 +396,61 @@ class Notification(Base):
     is_read = Column(Boolean, default=False, nullable=False)
     sent_via_bot = Column(Boolean, default=False, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    
+    # Telegram delivery queue (claimed with FOR UPDATE SKIP LOCKED)
+    delivery_status = Column(
+        String(20),
+        default=NotificationDeliveryStatus.PENDING.value,
+        server_default=NotificationDeliveryStatus.PENDING.value,
+        nullable=False
+    )
+    delivery_attempts = Column(Integer, default=0, server_default="0", nullable=False)
+    # Retry time while pending, claim deadline while sending
+    next_attempt_at = Column(DateTime, nullable=True)
+    delivered_at = Column(DateTime, nullable=True)
+    delivery_error = Column(String(255), nullable=True)
+    
+    __table_args__ = (
+        Index('idx_notification_delivery', 'delivery_status', 'next_attempt_at'),
+    )
+
+
+class BroadcastJobStatus(enum.Enum):
+    """Broadcast job status enum"""
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+class BroadcastJob(Base):
+    """Admin broadcast fanned out to user notifications in chunks"""
+    __tablename__ = "broadcast_jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    admin_id = Column(Integer, ForeignKey("admins.id"), nullable=True)
+    
+    notification_type = Column(String(50), nullable=False)
+    title = Column(String(255), nullable=False)
+    message = Column(Text, nullable=False)
+    target = Column(String(100), nullable=False, default="all")
+    
+    status = Column(Enum(BroadcastJobStatus), default=BroadcastJobStatus.PENDING, nullable=False)
+    
+    # Progress; last_user_id is the keyset cursor the next chunk starts after
+    total = Column(Integer, default=0, nullable=False)
+    processed = Column(Integer, default=0, nullable=False)
+    last_user_id = Column(Integer, default=0, nullable=False)
+    error = Column(Text, nullable=True)
+    
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    
+    __table_args__ = (
+        Index('idx_broadcast_status', 'status'),
+    )
 
 
 class AuditLog(Base):
@@ -338,6 +474,7 @@ class AuditLog(Base):
     
     __table_args__ = (
         Index('idx_action_created', 'action', 'created_at'),
+        Index('idx_audit_created_id', 'created_at', 'id'),
     )
 
 
@@ -386,3 +523,39 @@ class AppVersion(Base):
         Index('idx_platform_version', 'platform', 'version_code'),
         Index('idx_active', 'is_active', 'platform'),
     )
+
+
+class TaskJobStatus(enum.Enum):
+    """Background job status enum"""
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    DEAD = "dead"  # failed and out of attempts
+
+
+class TaskJob(Base):
+    """Background job queue (claimed with FOR UPDATE SKIP LOCKED)"""
+    __tablename__ = "task_jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(100), nullable=False)
+    payload = Column(Text, nullable=True)  # JSON keyword arguments
+    
+    status = Column(Enum(TaskJobStatus), default=TaskJobStatus.QUEUED, nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    max_attempts = Column(Integer, default=3, nullable=False)
+    
+    run_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    locked_by = Column(String(100), nullable=True)
+    locked_at = Column(DateTime, nullable=True)
+    
+    # Set for scheduled runs ("name@run time") so a tick is queued once
+    dedupe_key = Column(String(150), nullable=True, unique=True)
+    last_error = Column(Text, nullable=True)
+    
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    finished_at = Column(DateTime, nullable=True)
+    
+    __table_args__ = (
+        Index('idx_task_job_claim', 'status', 'run_at'),
+    )
@@ -0,0 +1,289 @@
+"""
+Ready queues of available packages
+
+Keeps ids of available packages in one queue per region (a Redis sorted
+set scored by package id, or an in-process heap), so a buyer pull takes
+candidate ids with one ZPOPMIN instead of scanning the packages table.
+
+PostgreSQL stays the source of truth: popped ids are only candidates and
+are allocated with the usual status transition (available -> allocated)
+by PackageAllocator, which skips anything no longer available. Ids that
+were popped but not allocated and are still available are put back.
+Packages released by the allocation reaper are queued again right away;
+those released by the periodic TTL sweep are picked up by the next refill.
+"""
+
+import asyncio
+import heapq
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from traffic_share.server.config import settings
+from traffic_share.server.database import SessionLocal
+from traffic_share.server.logger import logger
+from traffic_share.server.models import Package, PackageStatus
+from traffic_share.server.redis_client import get_async_redis, redis_key
+
+
+# Shard for packages without a region (served to pulls without region)
+NO_REGION = "_"
+
+# KEYS - region queues in pop order, ARGV[1] - max ids
+# Returns popped ids
+POP_SCRIPT = """
+local result = {}
+local remaining = tonumber(ARGV[1])
+for _, key in ipairs(KEYS) do
+    if remaining <= 0 then
+        break
+    end
+    local popped = redis.call('ZPOPMIN', key, remaining)
+    for i = 1, #popped, 2 do
+        table.insert(result, popped[i])
+    end
+    remaining = remaining - #popped / 2
+end
+return result
+"""
+
+
+def region_shard(region: Optional[str]) -> str:
+    """Queue name for a package region"""
+    return region or NO_REGION
+
+
+class MemoryReadyQueues:
+    """Per-process ready queues"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._heaps: Dict[str, List[int]] = {}
+        self._members: Dict[str, set] = {}
+
+    async def add(self, shard: str, ids: Iterable[int]):
+        """Add ids that are not queued yet"""
+        with self._lock:
+            heap = self._heaps.setdefault(shard, [])
+            members = self._members.setdefault(shard, set())
+            for package_id in ids:
+                if package_id not in members:
+                    members.add(package_id)
+                    heapq.heappush(heap, package_id)
+
+    async def pop(self, shards: List[str], count: int) -> List[int]:
+        """Pop up to count lowest ids, shard by shard"""
+        result = []
+        with self._lock:
+            for shard in shards:
+                heap = self._heaps.get(shard)
+                while heap and len(result) < count:
+                    package_id = heapq.heappop(heap)
+                    self._members[shard].discard(package_id)
+                    result.append(package_id)
+                if len(result) >= count:
+                    break
+        return result
+
+    async def sizes(self) -> Dict[str, int]:
+        """Queue length per shard"""
+        with self._lock:
+            return {shard: len(heap) for shard, heap in self._heaps.items()}
+
+
+class RedisReadyQueues:
+    """Ready queues shared by all workers (one sorted set per region)"""
+
+    def __init__(self):
+        self._script = None
+
+    @staticmethod
+    def _key(shard: str) -> str:
+        return redis_key("pool", "ready", shard)
+
+    async def add(self, shard: str, ids: Iterable[int]):
+        """Add ids that are not queued yet"""
+        mapping = {str(package_id): package_id for package_id in ids}
+        if not mapping:
+            return
+
+        client = get_async_redis()
+        async with client.pipeline(transaction=False) as pipe:
+            pipe.zadd(self._key(shard), mapping, nx=True)
+            pipe.sadd(redis_key("pool", "regions"), shard)
+            await pipe.execute()
+
+    async def pop(self, shards: List[str], count: int) -> List[int]:
+        """Pop up to count lowest ids, shard by shard (one round trip)"""
+        if self._script is None:
+            self._script = get_async_redis().register_script(POP_SCRIPT)
+
+        popped = await self._script(
+            keys=[self._key(shard) for shard in shards],
+            args=[count]
+        )
+        return [int(package_id) for package_id in popped]
+
+    async def sizes(self) -> Dict[str, int]:
+        """Queue length per shard"""
+        client = get_async_redis()
+        shards = sorted(await client.smembers(redis_key("pool", "regions")))
+
+        async with client.pipeline(transaction=False) as pipe:
+            for shard in shards:
+                pipe.zcard(self._key(shard))
+            counts = await pipe.execute()
+
+        return dict(zip(shards, counts))
+
+
+class PackagePool:
+    """Region-sharded ready queues of available packages"""
+
+    # Refill ticks between unconditional refills
+    FULL_REFILL_EVERY = 15
+
+    def __init__(
+        self,
+        queues=None,
+        session_factory=SessionLocal,
+        target_size: int = None,
+        refill_interval: float = None
+    ):
+        self._queues = queues
+        self.session_factory = session_factory
+        self.target_size = target_size or settings.PACKAGE_POOL_TARGET_SIZE
+        self.refill_interval = refill_interval or settings.PACKAGE_POOL_REFILL_INTERVAL
+        self._shards: List[str] = []
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return settings.PACKAGE_POOL_ENABLED
+
+    @property
+    def queues(self):
+        if self._queues is None:
+            if settings.PACKAGE_POOL_BACKEND == "memory":
+                self._queues = MemoryReadyQueues()
+            else:
+                self._queues = RedisReadyQueues()
+        return self._queues
+
+    async def pop(self, region: Optional[str], count: int) -> List[int]:
+        """
+        Take up to count candidate package ids
+        With a region only that region's queue is used; without one,
+        all known queues are drained in turn.
+        """
+        shards = [region_shard(region)] if region else list(self._shards)
+        if not shards or count <= 0:
+            return []
+
+        try:
+            return await self.queues.pop(shards, count)
+        except Exception as e:
+            logger.warning(f"Package pool pop failed: {e}")
+            return []
+
+    async def requeue(self, packages: Iterable[Tuple[int, Optional[str]]]):
+        """Put back (id, region) pairs that are still available"""
+        by_shard: Dict[str, List[int]] = {}
+        for package_id, region in packages:
+            by_shard.setdefault(region_shard(region), []).append(package_id)
+
+        try:
+            for shard, ids in by_shard.items():
+                await self.queues.add(shard, ids)
+        except Exception as e:
+            # Refill puts them back anyway
+            logger.warning(f"Package pool requeue failed: {e}")
+
+    def load_available(self, db: Session) -> Dict[str, List[int]]:
+        """Lowest available package ids per region, up to target size each"""
+        ranked = select(
+            Package.id,
+            Package.region,
+            func.row_number().over(
+                partition_by=Package.region,
+                order_by=Package.id
+            ).label("rank")
+        ).where(
+            Package.status == PackageStatus.AVAILABLE.value,
+            Package.assigned_buyer_id.is_(None)
+        ).subquery()
+
+        rows = db.execute(
+            select(ranked.c.id, ranked.c.region).where(
+                ranked.c.rank <= self.target_size
+            )
+        ).all()
+
+        by_shard: Dict[str, List[int]] = {}
+        for package_id, region in rows:
+            by_shard.setdefault(region_shard(region), []).append(package_id)
+        return by_shard
+
+    def _load_available(self) -> Dict[str, List[int]]:
+        db = self.session_factory()
+        try:
+            return self.load_available(db)
+        finally:
+            db.close()
+
+    async def refill(self, force: bool = True) -> int:
+        """
+        Top up queues from the database, returns ids offered
+        Without force, skips the query while every queue is at least half full.
+        """
+        if not force and self._shards:
+            sizes = await self.queues.sizes()
+            if all(sizes.get(shard, 0) >= self.target_size // 2 for shard in self._shards):
+                return 0
+
+        by_shard = await asyncio.to_thread(self._load_available)
+
+        for shard, ids in by_shard.items():
+            await self.queues.add(shard, ids)
+
+        self._shards = sorted(set(self._shards) | set(by_shard))
+        return sum(len(ids) for ids in by_shard.values())
+
+    async def _run(self):
+        """Background refill loop"""
+        tick = 0
+        while True:
+            try:
+                # Periodic full refill also discovers new regions
+                await self.refill(force=tick % self.FULL_REFILL_EVERY == 0)
+            except Exception as e:
+                logger.error(f"Package pool refill failed: {e}")
+            tick += 1
+            await asyncio.sleep(self.refill_interval)
+
+    async def start(self):
+        """Start background refilling"""
+        if not self.enabled or self._task is not None:
+            return
+
+        self._task = asyncio.create_task(self._run())
+        logger.info(
+            f"Package pool started (backend={settings.PACKAGE_POOL_BACKEND}, "
+            f"target={self.target_size})"
+        )
+
+    async def stop(self):
+        """Stop background refilling"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# Global package pool instance
+package_pool = PackagePool()
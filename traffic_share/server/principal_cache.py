@@ -0,0 +1,325 @@
+"""
+Authenticated principal cache
+
+Keeps recently authenticated users (by user_id) and buyer tokens (by
+token_hash) in a TTL + LRU cache, so get_current_user / get_current_buyer
+do not hit the database on every request. Ban, active, revoked and expiry
+state are part of the cached objects and are re-checked on every hit.
+
+Invalidation is explicit: the async layer awaits invalidate_* once the
+change to principal state is committed, which drops the local entry and
+publishes the key on a Redis channel so other API workers drop it too.
+Scripts use the sync invalidate_buyer. The TTL bounds staleness if a
+message is missed.
+
+Buyer token last_used_at is recorded in memory and written in batches.
+"""
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from sqlalchemy import bindparam, or_, update
+from sqlalchemy.orm import Session
+
+from traffic_share.server.config import settings
+from traffic_share.server.database import SessionLocal
+from traffic_share.server.logger import logger
+from traffic_share.server.models import BuyerToken
+from traffic_share.server.redis_client import get_async_redis, get_sync_redis, redis_key
+
+
+INVALIDATION_CHANNEL = redis_key("principal", "invalidate")
+
+
+class TTLCache:
+    """Thread-safe TTL + LRU cache"""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._items: OrderedDict = OrderedDict()
+
+    def get(self, key) -> Optional[Any]:
+        """Get value, None if missing or expired"""
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._items[key]
+                return None
+
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float = None):
+        """Store value for ttl seconds (defaults to cache TTL)"""
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+
+        with self._lock:
+            self._items[key] = (time.monotonic() + ttl, value)
+            self._items.move_to_end(key)
+
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def pop(self, key) -> Optional[Any]:
+        """Remove key, returning its value"""
+        with self._lock:
+            item = self._items.pop(key, None)
+        return item[1] if item else None
+
+    def pop_where(self, predicate: Callable[[Any], bool]) -> int:
+        """Remove all entries whose value matches predicate"""
+        with self._lock:
+            keys = [key for key, (_, value) in self._items.items() if predicate(value)]
+            for key in keys:
+                del self._items[key]
+        return len(keys)
+
+    def clear(self):
+        """Remove everything"""
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class PrincipalCache:
+    """Cache of authenticated users and buyer tokens"""
+
+    def __init__(self, max_size: int = None, ttl: float = None):
+        max_size = max_size or settings.PRINCIPAL_CACHE_MAX_SIZE
+        ttl = ttl or settings.PRINCIPAL_CACHE_TTL
+
+        self.users = TTLCache(max_size, ttl)
+        self.buyer_tokens = TTLCache(max_size, ttl)
+        self._listener: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return settings.PRINCIPAL_CACHE_ENABLED
+
+    # ---- Users ----
+
+    def get_user(self, user_id: int):
+        """Get cached User (detached) or None"""
+        if not self.enabled:
+            return None
+        return self.users.get(user_id)
+
+    def set_user(self, user):
+        """Cache a detached User"""
+        if self.enabled:
+            self.users.set(user.id, user)
+
+    async def invalidate_user(self, user_id: int):
+        """Drop user everywhere (ban, unban, deactivate)"""
+        self.users.pop(user_id)
+        await self._publish(f"user:{user_id}")
+
+    # ---- Buyer tokens ----
+
+    def get_buyer(self, token_hash: str) -> Optional[Tuple[Any, Any]]:
+        """Get cached (Buyer, BuyerToken) or None"""
+        if not self.enabled:
+            return None
+        return self.buyer_tokens.get(token_hash)
+
+    def set_buyer(self, buyer, buyer_token):
+        """Cache detached (Buyer, BuyerToken), not past token expiry"""
+        if not self.enabled:
+            return
+
+        ttl = None
+        if buyer_token.expires_at:
+            ttl = (buyer_token.expires_at - datetime.utcnow()).total_seconds()
+
+        self.buyer_tokens.set(buyer_token.token_hash, (buyer, buyer_token), ttl)
+
+    async def invalidate_token(self, token_hash: str):
+        """Drop one buyer token everywhere (revoke)"""
+        self.buyer_tokens.pop(token_hash)
+        await self._publish(f"token:{token_hash}")
+
+    def invalidate_buyer(self, buyer_id: int):
+        """Drop all tokens of a buyer everywhere (token rotation script)"""
+        self._drop_buyer(buyer_id)
+        self._publish_sync(f"buyer:{buyer_id}")
+
+    def _drop_buyer(self, buyer_id: int) -> int:
+        return self.buyer_tokens.pop_where(
+            lambda entry: entry[1].buyer_id == buyer_id
+        )
+
+    # ---- Cross-process invalidation ----
+
+    async def _publish(self, message: str):
+        """Tell other processes to drop a key"""
+        try:
+            await get_async_redis().publish(INVALIDATION_CHANNEL, message)
+        except Exception as e:
+            logger.warning(f"Principal cache invalidation not published: {e}")
+
+    def _publish_sync(self, message: str):
+        """Tell the API processes to drop a key (from scripts)"""
+        try:
+            get_sync_redis().publish(INVALIDATION_CHANNEL, message)
+        except Exception as e:
+            logger.warning(f"Principal cache invalidation not published: {e}")
+
+    def apply_invalidation(self, message: str):
+        """Apply invalidation message from the channel"""
+        kind, _, value = message.partition(":")
+
+        if kind == "user" and value.isdigit():
+            self.users.pop(int(value))
+        elif kind == "token":
+            self.buyer_tokens.pop(value)
+        elif kind == "buyer" and value.isdigit():
+            self._drop_buyer(int(value))
+        elif kind == "all":
+            self.users.clear()
+            self.buyer_tokens.clear()
+
+    async def _listen(self):
+        """Subscribe to invalidation channel until cancelled"""
+        while True:
+            pubsub = get_async_redis().pubsub()
+            try:
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                async for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        self.apply_invalidation(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Entries may have been missed while disconnected
+                self.users.clear()
+                self.buyer_tokens.clear()
+                logger.warning(f"Principal cache listener error, retrying: {e}")
+                await asyncio.sleep(5)
+            finally:
+                try:
+                    await pubsub.close()
+                except Exception:
+                    pass
+
+    async def start(self):
+        """Start invalidation listener"""
+        if self.enabled and self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        """Stop invalidation listener"""
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+
+class TokenUsageRecorder:
+    """Collects buyer token last_used_at and writes it in batches"""
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        flush_interval: float = None
+    ):
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval or settings.TOKEN_USAGE_FLUSH_INTERVAL
+        self._lock = threading.Lock()
+        self._last_used: Dict[int, datetime] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def touch(self, token_id: int, used_at: datetime = None):
+        """Record token use"""
+        with self._lock:
+            self._last_used[token_id] = used_at or datetime.utcnow()
+
+    def flush_sync(self, db: Session = None) -> int:
+        """Write pending timestamps, returns number of tokens updated"""
+        with self._lock:
+            pending = self._last_used
+            self._last_used = {}
+
+        if not pending:
+            return 0
+
+        own_session = db is None
+        if own_session:
+            db = self.session_factory()
+
+        try:
+            table = BuyerToken.__table__
+            stmt = (
+                update(table)
+                .where(table.c.id == bindparam("b_id"))
+                .where(or_(
+                    table.c.last_used_at.is_(None),
+                    table.c.last_used_at < bindparam("b_used_at")
+                ))
+                .values(last_used_at=bindparam("b_used_at"))
+            )
+            db.execute(stmt, [
+                {"b_id": token_id, "b_used_at": used_at}
+                for token_id, used_at in pending.items()
+            ])
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            with self._lock:
+                for token_id, used_at in pending.items():
+                    current = self._last_used.get(token_id)
+                    if current is None or current < used_at:
+                        self._last_used[token_id] = used_at
+            logger.error(f"Token usage flush failed: {e}")
+            return 0
+        finally:
+            if own_session:
+                db.close()
+
+        return len(pending)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await asyncio.to_thread(self.flush_sync)
+            except Exception as e:
+                logger.error(f"Token usage loop error: {e}")
+
+    async def start(self):
+        """Start periodic flushing"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop periodic flushing and write what is left"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        await asyncio.to_thread(self.flush_sync)
+
+
+# Global instances
+principal_cache = PrincipalCache()
+token_usage = TokenUsageRecorder()
@@ -0,0 +1,59 @@
+"""
+Shared Redis connections
+
+One lazily created async client for request handlers and background loops,
+and one sync client for service code, tasks and scripts.
+"""
+
+from typing import Optional
+import redis
+import redis.asyncio as aioredis
+
+from traffic_share.server.config import settings
+
+
+_async_client: Optional[aioredis.Redis] = None
+_sync_client: Optional[redis.Redis] = None
+
+
+def redis_key(*parts) -> str:
+    """Build namespaced Redis key"""
+    return settings.REDIS_KEY_PREFIX + ":".join(str(part) for part in parts)
+
+
+def get_async_redis() -> aioredis.Redis:
+    """Get shared async Redis client"""
+    global _async_client
+    if _async_client is None:
+        _async_client = aioredis.from_url(
+            settings.REDIS_URL,
+            encoding="utf-8",
+            decode_responses=True,
+            socket_connect_timeout=1.0
+        )
+    return _async_client
+
+
+def get_sync_redis() -> redis.Redis:
+    """Get shared sync Redis client"""
+    global _sync_client
+    if _sync_client is None:
+        _sync_client = redis.Redis.from_url(
+            settings.REDIS_URL,
+            encoding="utf-8",
+            decode_responses=True,
+            socket_timeout=1.0,
+            socket_connect_timeout=1.0
+        )
+    return _sync_client
+
+
+async def close_redis():
+    """Close shared clients"""
+    global _async_client, _sync_client
+    if _async_client is not None:
+        await _async_client.close()
+        _async_client = None
+    if _sync_client is not None:
+        _sync_client.close()
+        _sync_client = None
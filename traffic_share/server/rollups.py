@@ -0,0 +1,133 @@
+"""
+Per-user traffic rollups
+
+Traffic writes (buffer flushes, session stop) add their byte and earnings
+deltas to the user's hour, day and month buckets and to a running total in
+user_traffic_rollups, using one multi-row upsert per write. The traffic
+summary then reads a handful of rows by (user_id, period, bucket_start)
+instead of aggregating traffic_sessions.
+"""
+
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Tuple
+
+from sqlalchemy import func, or_, and_
+from sqlalchemy.orm import Session
+
+from traffic_share.server.models import UserTrafficRollup
+
+
+PERIOD_HOUR = "hour"
+PERIOD_DAY = "day"
+PERIOD_MONTH = "month"
+PERIOD_TOTAL = "total"
+
+# Bucket start used for the running total
+TOTAL_BUCKET = datetime(1970, 1, 1)
+
+
+def bucket_starts(at: datetime) -> List[Tuple[str, datetime]]:
+    """(period, bucket_start) pairs a moment falls into"""
+    hour = at.replace(minute=0, second=0, microsecond=0)
+    day = hour.replace(hour=0)
+    month = day.replace(day=1)
+
+    return [
+        (PERIOD_HOUR, hour),
+        (PERIOD_DAY, day),
+        (PERIOD_MONTH, month),
+        (PERIOD_TOTAL, TOTAL_BUCKET)
+    ]
+
+
+def _insert_for(db: Session):
+    """Dialect insert construct with ON CONFLICT support"""
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+
+def apply_rollups(
+    db: Session,
+    entries: Iterable[Tuple[int, datetime, int, float]]
+) -> int:
+    """
+    Add (user_id, at, bytes, earnings) deltas to the rollups
+    Does not commit - callers own the transaction.
+    Returns number of bucket rows touched.
+    """
+    buckets: Dict[Tuple[int, str, datetime], List] = {}
+
+    for user_id, at, bytes_delta, earnings_delta in entries:
+        if not bytes_delta and not earnings_delta:
+            continue
+        for period, bucket_start in bucket_starts(at):
+            totals = buckets.setdefault((user_id, period, bucket_start), [0, 0.0])
+            totals[0] += bytes_delta
+            totals[1] += earnings_delta
+
+    if not buckets:
+        return 0
+
+    now = datetime.utcnow()
+    # Sorted keys keep lock order stable between concurrent writers
+    rows = [
+        {
+            "user_id": user_id,
+            "period": period,
+            "bucket_start": bucket_start,
+            "bytes_total": totals[0],
+            "earnings": totals[1],
+            "updated_at": now
+        }
+        for (user_id, period, bucket_start), totals in sorted(buckets.items())
+    ]
+
+    table = UserTrafficRollup.__table__
+    stmt = _insert_for(db)(table).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id", "period", "bucket_start"],
+        set_={
+            "bytes_total": table.c.bytes_total + stmt.excluded.bytes_total,
+            "earnings": table.c.earnings + stmt.excluded.earnings,
+            "updated_at": stmt.excluded.updated_at
+        }
+    )
+    db.execute(stmt)
+
+    return len(rows)
+
+
+def read_summary(db: Session, user_id: int, now: datetime = None) -> dict:
+    """
+    Daily, weekly (last 7 days), monthly and total bytes / earnings
+    One indexed query over at most 9 rollup rows.
+    """
+    now = now or datetime.utcnow()
+    day_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    week_start = day_start - timedelta(days=6)
+    month_start = day_start.replace(day=1)
+
+    r = UserTrafficRollup
+    is_today = and_(r.period == PERIOD_DAY, r.bucket_start == day_start)
+    in_week = and_(r.period == PERIOD_DAY, r.bucket_start >= week_start)
+    is_month = and_(r.period == PERIOD_MONTH, r.bucket_start == month_start)
+    is_total = r.period == PERIOD_TOTAL
+
+    row = db.query(
+        func.sum(r.bytes_total).filter(is_today).label("daily_bytes"),
+        func.sum(r.earnings).filter(is_today).label("daily_earnings"),
+        func.sum(r.bytes_total).filter(in_week).label("weekly_bytes"),
+        func.sum(r.earnings).filter(in_week).label("weekly_earnings"),
+        func.sum(r.bytes_total).filter(is_month).label("monthly_bytes"),
+        func.sum(r.earnings).filter(is_month).label("monthly_earnings"),
+        func.sum(r.bytes_total).filter(is_total).label("total_bytes"),
+        func.sum(r.earnings).filter(is_total).label("total_earnings")
+    ).filter(
+        r.user_id == user_id,
+        or_(in_week, is_month, is_total)
+    ).one()
+
+    return {key: value or 0 for key, value in row._mapping.items()}
@@ -2,27 +2,37 @@
 Admin routes - management and monitoring
 """
 
-from fastapi import APIRouter, Depends, Query, Path
+import io
+
+from fastapi import APIRouter, Depends, Query, Path, UploadFile, File
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
-from datetime import datetime
+from datetime import datetime, timedelta
 
-from traffic_share.server.database import get_db
+from traffic_share.server.database import get_async_db, get_db
 from traffic_share.server.dependencies import get_current_admin
 from traffic_share.server.models import Admin
 from traffic_share.server.schemas import (
     CreateBuyerRequest, BuyerResponse,
     CreateBuyerTokenRequest, BuyerTokenResponse,
     BuyerTokenMetadata, BuyerUsageResponse,
-    BulkCreatePackagesRequest, BulkCreatePackagesResponse,
+    BulkCreatePackagesRequest, BulkCreatePackagesResponse, PackageIngestResponse,
     PackageResponse, AssignPackageRequest,
     UserProfile, UserListResponse, BanUserRequest,
-    NotifyRequest, DailyReportResponse,
+    AuditLogEntry, AuditLogListResponse,
+    NotifyRequest, BroadcastJobResponse, DailyReportResponse, DailyReportRangeResponse,
     StandardResponse, CreateAdminRequest
 )
-from traffic_share.server.services.buyer_service import BuyerService
+from traffic_share.server.services.buyer_service import AsyncBuyerService, BuyerService
 from traffic_share.server.services.admin_service import AdminService
 from traffic_share.server.services.notification_service import NotificationService
+from traffic_share.server.services.package_ingest import detect_format
+from traffic_share.server.services.stats_export import FORMATS, open_export
+from traffic_share.server.broadcast_runner import broadcast_runner
+from traffic_share.server.principal_cache import principal_cache
 from traffic_share.core.exceptions import create_http_exception, TrafficShareException
 
 
@@ -79,12 +89,12 @@ async def create_buyer_token(
 async def revoke_token(
     token_id: int = Path(...),
     current_admin: Admin = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Revoke buyer token"""
     try:
-        service = BuyerService(db)
-        service.revoke_token(token_id)
+        service = AsyncBuyerService(db)
+        await service.revoke_token(token_id)
         return StandardResponse(ok=True, message="Token revoked")
     except TrafficShareException as e:
         raise create_http_exception(e)
@@ -123,6 +133,29 @@ async def bulk_create_packages(
         raise create_http_exception(e)
 
 
+@router.post("/packages/ingest", response_model=PackageIngestResponse)
+async def ingest_packages(
+    file: UploadFile = File(...),
+    format: Optional[str] = Query(default=None, description="ndjson or csv, default from the file name"),
+    on_conflict: str = Query(default="skip", description="skip or update"),
+    current_admin: Admin = Depends(get_current_admin),
+    db: Session = Depends(get_db)
+):
+    """Bulk load packages from an NDJSON or CSV upload"""
+    try:
+        fmt = detect_format(file.filename, format)
+        lines = io.TextIOWrapper(file.file, encoding="utf-8", newline="")
+        
+        service = AdminService(db)
+        report = await run_in_threadpool(
+            service.ingest_packages, lines, fmt, on_conflict, current_admin.id
+        )
+        
+        return PackageIngestResponse(**report)
+    except TrafficShareException as e:
+        raise create_http_exception(e)
+
+
 @router.post("/packages/cleanup_stale_allocations", response_model=StandardResponse)
 async def cleanup_stale_allocations(
     current_admin: Admin = Depends(get_current_admin),
@@ -143,28 +176,61 @@ async def cleanup_stale_allocations(
 
 # ==================== User Management ====================
 
-@router.get("/users")
+@router.get("/users", response_model=UserListResponse)
 async def get_all_users(
-    page: int = Query(default=1, ge=1),
+    page: int = Query(default=1, ge=1, deprecated=True),
     page_size: int = Query(default=50, ge=1, le=100),
+    cursor: Optional[str] = None,
     is_active: Optional[bool] = None,
+    exact_total: bool = False,
     current_admin: Admin = Depends(get_current_admin),
     db: Session = Depends(get_db)
 ):
-    """Get all users"""
+    """
+    Get all users (pass next_cursor back as cursor for the next page)
+    page still works for old clients but has no next_cursor.
+    """
     try:
         service = AdminService(db)
-        users, total = service.get_all_users(page, page_size, is_active)
+        users, total, next_cursor = service.get_all_users(
+            page_size, is_active, cursor, exact_total, page
+        )
         
-        total_pages = (total + page_size - 1) // page_size
+        return UserListResponse(
+            users=[UserProfile.from_orm(u) for u in users],
+            total=total,
+            total_is_estimate=total is not None and not exact_total,
+            page=None if cursor else page,
+            page_size=page_size,
+            total_pages=(total + page_size - 1) // page_size if total is not None else None,
+            next_cursor=next_cursor
+        )
+    except TrafficShareException as e:
+        raise create_http_exception(e)
+
+
+@router.get("/audit_logs", response_model=AuditLogListResponse)
+async def search_audit_logs(
+    action: Optional[str] = None,
+    user_id: Optional[int] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    limit: int = Query(default=100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    current_admin: Admin = Depends(get_current_admin),
+    db: Session = Depends(get_db)
+):
+    """Search audit logs, newest first"""
+    try:
+        service = AdminService(db)
+        logs, next_cursor = service.search_audit_logs(
+            action, user_id, start_date, end_date, limit, cursor
+        )
         
-        return {
-            "users": [UserProfile.from_orm(u) for u in users],
-            "total": total,
-            "page": page,
-            "page_size": page_size,
-            "total_pages": total_pages
-        }
+        return AuditLogListResponse(
+            logs=[AuditLogEntry.from_orm(log) for log in logs],
+            next_cursor=next_cursor
+        )
     except TrafficShareException as e:
         raise create_http_exception(e)
 
@@ -180,32 +246,61 @@ async def ban_user(
     try:
         service = AdminService(db)
         service.ban_user(user_id, request.reason)
+        await principal_cache.invalidate_user(user_id)
         
         return StandardResponse(ok=True, message="User banned")
     except TrafficShareException as e:
         raise create_http_exception(e)
 
 
-@router.post("/notify", response_model=StandardResponse)
+@router.post("/notify", response_model=BroadcastJobResponse, status_code=202)
 async def send_notification(
     request: NotifyRequest,
     current_admin: Admin = Depends(get_current_admin),
     db: Session = Depends(get_db)
 ):
-    """Send notification to users"""
+    """Queue a notification broadcast (poll /notify/jobs/{job_id} for progress)"""
     try:
         service = NotificationService(db)
-        count = service.broadcast_notification(
+        job = service.create_broadcast_job(
             type="admin",
             title=request.title or "System Notification",
             message=request.message,
-            target_filter=request.target
+            target=request.target,
+            admin_id=current_admin.id
         )
+        broadcast_runner.submit(job.id)
         
-        return StandardResponse(
-            ok=True,
-            message=f"Notification sent to {count} users"
-        )
+        return service.broadcast_job_response(job)
+    except TrafficShareException as e:
+        raise create_http_exception(e)
+
+
+@router.get("/notify/jobs/{job_id}", response_model=BroadcastJobResponse)
+async def get_broadcast_job(
+    job_id: int = Path(...),
+    current_admin: Admin = Depends(get_current_admin),
+    db: Session = Depends(get_db)
+):
+    """Get broadcast progress"""
+    try:
+        service = NotificationService(db)
+        return service.get_broadcast_job(job_id)
+    except TrafficShareException as e:
+        raise create_http_exception(e)
+
+
+@router.post("/notify/jobs/{job_id}/cancel", response_model=BroadcastJobResponse)
+async def cancel_broadcast_job(
+    job_id: int = Path(...),
+    current_admin: Admin = Depends(get_current_admin),
+    db: Session = Depends(get_db)
+):
+    """Cancel a broadcast before its remaining chunks"""
+    try:
+        service = NotificationService(db)
+        job = service.cancel_broadcast_job(job_id)
+        return service.broadcast_job_response(job)
     except TrafficShareException as e:
         raise create_http_exception(e)
 
@@ -231,6 +326,27 @@ async def get_daily_report(
         raise create_http_exception(e)
 
 
+@router.get("/reports/daily/range", response_model=DailyReportRangeResponse)
+async def get_daily_reports(
+    end: Optional[str] = Query(default=None, description="YYYY-MM-DD, default today"),
+    days: int = Query(default=30, ge=1),
+    current_admin: Admin = Depends(get_current_admin),
+    db: Session = Depends(get_db)
+):
+    """Get daily reports of the last N days up to end (for dashboards)"""
+    try:
+        service = AdminService(db)
+        
+        end_date = datetime.strptime(end, "%Y-%m-%d") if end else datetime.utcnow()
+        start_date = end_date - timedelta(days=days - 1)
+        
+        return DailyReportRangeResponse(
+            reports=service.get_daily_reports(start_date, end_date)
+        )
+    except TrafficShareException as e:
+        raise create_http_exception(e)
+
+
 @router.get("/metrics")
 async def get_metrics(
     current_admin: Admin = Depends(get_current_admin),
@@ -244,6 +360,29 @@ async def get_metrics(
         raise create_http_exception(e)
 
 
+@router.get("/export/{dataset}")
+async def export_stats(
+    dataset: str = Path(..., description="users, traffic or payments"),
+    format: str = Query(default="csv", description="csv, csv.gz or parquet"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    incremental: bool = False,
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """Stream a statistics export"""
+    try:
+        stream, watermark = open_export(dataset, format, start, end, incremental)
+    except TrafficShareException as e:
+        raise create_http_exception(e)
+
+    filename = f"{dataset}_{datetime.utcnow():%Y%m%d_%H%M%S}.{format}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    if watermark:
+        headers["X-Export-Watermark"] = watermark.isoformat()
+
+    return StreamingResponse(stream, media_type=FORMATS[format], headers=headers)
+
+
 @router.post("/create_superadmin", response_model=StandardResponse)
 async def create_superadmin(
     request: CreateAdminRequest,
@@ -3,31 +3,37 @@ Authentication routes
 """
 
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from traffic_share.server.database import get_db
+from traffic_share.server.database import get_async_db
+from traffic_share.server.config import settings
+from traffic_share.server.limiter import rate_limit
 from traffic_share.server.schemas import (
     RegisterRequest, RegisterResponse,
     LoginCodeRequest, LoginCodeResponse,
     VerifyCodeRequest, TokenResponse,
     RefreshTokenRequest
 )
-from traffic_share.server.services.auth_service import AuthService
+from traffic_share.server.services.auth_service import AsyncAuthService
 from traffic_share.core.exceptions import create_http_exception, TrafficShareException
 
 
-router = APIRouter(prefix="/auth", tags=["Authentication"])
+router = APIRouter(
+    prefix="/auth",
+    tags=["Authentication"],
+    dependencies=[Depends(rate_limit(settings.RATE_LIMIT_AUTH, scope="ip", name="auth"))]
+)
 
 
 @router.post("/register", response_model=RegisterResponse)
 async def register(
     request: RegisterRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Register new user or update existing"""
     try:
-        service = AuthService(db)
-        user = service.register_user(request)
+        service = AsyncAuthService(db)
+        user = await service.register_user(request)
         
         return RegisterResponse(
             user_id=user.id,
@@ -40,12 +46,12 @@ async def register(
 @router.post("/request_login_code", response_model=LoginCodeResponse)
 async def request_login_code(
     request: LoginCodeRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Request login code - will be sent via Telegram bot"""
     try:
-        service = AuthService(db)
-        user, code = service.generate_login_code(request.telegram_id)
+        service = AsyncAuthService(db)
+        user, code = await service.generate_login_code(request.telegram_id)
         
         # Send code via Telegram bot
         from traffic_share.bot.bot import send_login_code
@@ -66,12 +72,12 @@ async def request_login_code(
 @router.post("/verify_code", response_model=TokenResponse)
 async def verify_code(
     request: VerifyCodeRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Verify login code and get JWT tokens"""
     try:
-        service = AuthService(db)
-        tokens = service.verify_login_code(request.telegram_id, request.code)
+        service = AsyncAuthService(db)
+        tokens = await service.verify_login_code(request.telegram_id, request.code)
         
         return tokens
     except TrafficShareException as e:
@@ -81,12 +87,12 @@ async def verify_code(
 @router.post("/refresh", response_model=TokenResponse)
 async def refresh_token(
     request: RefreshTokenRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Refresh access token"""
     try:
-        service = AuthService(db)
-        tokens = service.refresh_access_token(request.refresh_token)
+        service = AsyncAuthService(db)
+        tokens = await service.refresh_access_token(request.refresh_token)
         
         return tokens
     except TrafficShareException as e:
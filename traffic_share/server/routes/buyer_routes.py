@@ -3,35 +3,43 @@ Buyer routes - for traffic consumers
 """
 
 from fastapi import APIRouter, Depends, Path
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 
-from traffic_share.server.database import get_db
+from traffic_share.server.database import get_async_db
 from traffic_share.server.dependencies import get_current_buyer
+from traffic_share.server.config import settings
+from traffic_share.server.limiter import rate_limit
 from traffic_share.server.models import Buyer, BuyerToken
 from traffic_share.server.schemas import (
     PullPacketsRequest, PullPacketsResponse,
     UpdatePacketStatusRequest, StandardResponse
 )
-from traffic_share.server.services.buyer_service import BuyerService
+from traffic_share.server.services.buyer_service import AsyncBuyerService
 from traffic_share.core.exceptions import create_http_exception, TrafficShareException
 
 
 router = APIRouter(prefix="/buyer", tags=["Buyer"])
 
 
-@router.post("/packets/pull", response_model=PullPacketsResponse)
+@router.post(
+    "/packets/pull",
+    response_model=PullPacketsResponse,
+    dependencies=[Depends(rate_limit(
+        settings.RATE_LIMIT_BUYER_PULL, scope="buyer", name="buyer_pull"
+    ))]
+)
 async def pull_packets(
     request: PullPacketsRequest,
     buyer_info: tuple[Buyer, BuyerToken] = Depends(get_current_buyer),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Pull available traffic packets"""
     try:
         buyer, token = buyer_info
-        service = BuyerService(db)
+        service = AsyncBuyerService(db)
         
-        return service.pull_packets(buyer.id, request)
+        return await service.pull_packets(buyer.id, request)
     except TrafficShareException as e:
         raise create_http_exception(e)
 
@@ -41,14 +49,14 @@ async def update_packet_status(
     uuid: str = Path(...),
     request: UpdatePacketStatusRequest = ...,
     buyer_info: tuple[Buyer, BuyerToken] = Depends(get_current_buyer),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update packet status (in_progress, completed, failed)"""
     try:
         buyer, token = buyer_info
-        service = BuyerService(db)
+        service = AsyncBuyerService(db)
         
-        success = service.update_packet_status(buyer.id, uuid, request)
+        success = await service.update_packet_status(buyer.id, uuid, request)
         
         return StandardResponse(
             ok=success,
@@ -61,13 +69,13 @@ async def update_packet_status(
 @router.get("/me/allocations")
 async def get_my_allocations(
     buyer_info: tuple[Buyer, BuyerToken] = Depends(get_current_buyer),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get current allocations"""
     try:
         buyer, token = buyer_info
-        service = BuyerService(db)
+        service = AsyncBuyerService(db)
         
-        return service.get_buyer_allocations(buyer.id)
+        return await service.get_buyer_allocations(buyer.id)
     except TrafficShareException as e:
         raise create_http_exception(e)
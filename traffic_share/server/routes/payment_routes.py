@@ -3,17 +3,17 @@ Payment and balance routes
 """
 
 from fastapi import APIRouter, Depends, Request
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from traffic_share.server.database import get_db
+from traffic_share.server.database import get_async_db
 from traffic_share.server.dependencies import get_current_user
 from traffic_share.server.models import User
 from traffic_share.server.schemas import (
     BalanceResponse, WithdrawRequest, WithdrawResponse,
     PaymentStatusResponse, StandardResponse
 )
-from traffic_share.server.services.user_service import UserService
-from traffic_share.server.services.payment_service import PaymentService
+from traffic_share.server.services.user_service import AsyncUserService
+from traffic_share.server.services.payment_service import AsyncPaymentService
 from traffic_share.core.exceptions import create_http_exception, TrafficShareException
 
 
@@ -23,12 +23,12 @@ router = APIRouter(tags=["Balance & Payments"])
 @router.get("/balance", response_model=BalanceResponse)
 async def get_balance(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get user balance"""
     try:
-        service = UserService(db)
-        balance_info = service.get_user_balance(current_user.id)
+        service = AsyncUserService(db)
+        balance_info = await service.get_user_balance(current_user.id)
         
         return BalanceResponse(**balance_info)
     except TrafficShareException as e:
@@ -39,11 +39,11 @@ async def get_balance(
 async def request_withdrawal(
     request: WithdrawRequest,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Request withdrawal/payout"""
     try:
-        service = PaymentService(db)
+        service = AsyncPaymentService(db)
         return await service.request_withdrawal(current_user.id, request)
     except TrafficShareException as e:
         raise create_http_exception(e)
@@ -53,12 +53,12 @@ async def request_withdrawal(
 async def get_withdrawal_status(
     payment_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get withdrawal status"""
     try:
-        service = PaymentService(db)
-        return service.get_payment_status(payment_id, current_user.id)
+        service = AsyncPaymentService(db)
+        return await service.get_payment_status(payment_id, current_user.id)
     except TrafficShareException as e:
         raise create_http_exception(e)
 
@@ -66,14 +66,14 @@ async def get_withdrawal_status(
 @router.post("/webhook/cryptomus", response_model=StandardResponse)
 async def cryptomus_webhook(
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Cryptomus payment webhook"""
     try:
         payload = await request.json()
         
-        service = PaymentService(db)
-        success = service.handle_webhook(payload)
+        service = AsyncPaymentService(db)
+        success = await service.handle_webhook(payload)
         
         return StandardResponse(
             ok=success,
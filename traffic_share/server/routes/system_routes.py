@@ -2,26 +2,28 @@
 System routes - health, version, monitoring
 """
 
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
 
-from traffic_share.server.database import get_db
+from traffic_share.server.database import get_async_db
 from traffic_share.server.schemas import (
     HealthCheckResponse, VersionResponse, StandardResponse
 )
 from traffic_share.server.config import settings
+from traffic_share.server.metrics import render_latest
 
 
 router = APIRouter(prefix="/system", tags=["System"])
 
 
 @router.get("/health", response_model=HealthCheckResponse)
-async def health_check(db: Session = Depends(get_db)):
+async def health_check(db: AsyncSession = Depends(get_async_db)):
     """Health check endpoint"""
     try:
         # Test database connection
-        db.execute("SELECT 1")
+        await db.execute(text("SELECT 1"))
         
         return HealthCheckResponse(
             status="ok",
@@ -51,3 +53,17 @@ async def get_version():
 async def ping():
     """Simple ping endpoint"""
     return StandardResponse(ok=True, message="pong")
+
+
+@router.get("/metrics", include_in_schema=False)
+async def prometheus_metrics(request: Request):
+    """Prometheus metrics in text exposition format"""
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found")
+    
+    if settings.METRICS_TOKEN:
+        if request.headers.get("Authorization") != f"Bearer {settings.METRICS_TOKEN}":
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized")
+    
+    body, content_type = render_latest()
+    return Response(content=body, media_type=content_type)
@@ -2,20 +2,23 @@
 Traffic routes - session management
 """
 
-from fastapi import APIRouter, Depends, Query
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 
-from traffic_share.server.database import get_db
+from traffic_share.server.database import get_async_db
 from traffic_share.server.dependencies import get_current_user
+from traffic_share.server.config import settings
+from traffic_share.server.limiter import rate_limit
 from traffic_share.server.models import User
 from traffic_share.server.schemas import (
     TrafficStartRequest, TrafficStartResponse,
     TrafficUpdateRequest, TrafficUpdateResponse,
+    TrafficUpdateBatchRequest, TrafficUpdateBatchResponse,
     TrafficStopRequest, TrafficStopResponse,
     TrafficSessionResponse, TrafficSummaryResponse
 )
-from traffic_share.server.services.traffic_service import TrafficService
+from traffic_share.server.services.traffic_service import AsyncTrafficService
 from traffic_share.core.exceptions import create_http_exception, TrafficShareException
 
 
@@ -26,26 +29,56 @@ router = APIRouter(prefix="/traffic", tags=["Traffic"])
 async def start_traffic_session(
     request: TrafficStartRequest,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Start new traffic sharing session"""
     try:
-        service = TrafficService(db)
-        return service.start_session(current_user.id, request)
+        service = AsyncTrafficService(db)
+        return await service.start_session(current_user.id, request)
     except TrafficShareException as e:
         raise create_http_exception(e)
 
 
-@router.post("/update", response_model=TrafficUpdateResponse)
+@router.post(
+    "/update",
+    response_model=TrafficUpdateResponse,
+    dependencies=[Depends(rate_limit(
+        settings.RATE_LIMIT_TRAFFIC_UPDATE, scope="user", name="traffic_update"
+    ))]
+)
 async def update_traffic(
     request: TrafficUpdateRequest,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update traffic session with new data"""
     try:
-        service = TrafficService(db)
-        return service.update_session(current_user.id, request)
+        service = AsyncTrafficService(db)
+        return await service.update_session(current_user.id, request)
+    except TrafficShareException as e:
+        raise create_http_exception(e)
+
+
+@router.post(
+    "/update/batch",
+    response_model=TrafficUpdateBatchResponse,
+    dependencies=[Depends(rate_limit(
+        settings.RATE_LIMIT_TRAFFIC_UPDATE, scope="user", name="traffic_update_batch"
+    ))]
+)
+async def update_traffic_batch(
+    request: TrafficUpdateBatchRequest,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Submit several buffered traffic updates at once
+    Results are reported per item; unknown or stopped sessions are rejected
+    without failing the rest of the batch.
+    """
+    try:
+        service = AsyncTrafficService(db)
+        return await service.update_sessions_batch(current_user.id, request.updates)
     except TrafficShareException as e:
         raise create_http_exception(e)
 
@@ -54,27 +87,39 @@ async def update_traffic(
 async def stop_traffic_session(
     request: TrafficStopRequest,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Stop traffic sharing session"""
     try:
-        service = TrafficService(db)
-        return service.stop_session(current_user.id, request)
+        service = AsyncTrafficService(db)
+        return await service.stop_session(current_user.id, request)
     except TrafficShareException as e:
         raise create_http_exception(e)
 
 
 @router.get("/history", response_model=List[TrafficSessionResponse])
 async def get_traffic_history(
+    response: Response,
     page: int = Query(default=1, ge=1),
     page_size: int = Query(default=50, ge=1, le=100),
+    cursor: Optional[str] = Query(default=None),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get traffic session history"""
+    """
+    Get traffic session history
+    The continuation token for the next page is returned in X-Next-Cursor.
+    """
     try:
-        service = TrafficService(db)
-        return service.get_session_history(current_user.id, page, page_size)
+        service = AsyncTrafficService(db)
+        sessions, next_cursor = await service.get_session_history(
+            current_user.id, page, page_size, cursor
+        )
+        
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+        
+        return sessions
     except TrafficShareException as e:
         raise create_http_exception(e)
 
@@ -82,11 +127,11 @@ async def get_traffic_history(
 @router.get("/summary", response_model=TrafficSummaryResponse)
 async def get_traffic_summary(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get aggregated traffic statistics"""
     try:
-        service = TrafficService(db)
-        return service.get_traffic_summary(current_user.id)
+        service = AsyncTrafficService(db)
+        return await service.get_traffic_summary(current_user.id)
     except TrafficShareException as e:
         raise create_http_exception(e)
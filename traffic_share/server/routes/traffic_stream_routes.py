@@ -0,0 +1,281 @@
+"""
+Traffic stream routes - WebSocket channel for device traffic reporting
+
+A device opens one connection per traffic session:
+
+    /api/traffic/stream?session_id=<uuid>&token=<access token>
+
+(the token may also be sent as "Authorization: Bearer ..."). The token and
+session are checked once at connect. The device then sends byte counters
+as JSON messages:
+
+    {"type": "update", "bytes_tx": 1024, "bytes_rx": 2048}
+    {"type": "stop", "final_bytes_tx": ..., "final_bytes_rx": ...}
+    {"type": "ping"}
+
+Updates are summed per connection and handed to the write-behind buffer at
+most every TRAFFIC_STREAM_FLUSH_INTERVAL seconds as one heartbeat. Every
+TRAFFIC_STREAM_STATUS_INTERVAL seconds the server pushes
+{"type": "status", "status": ..., "total_bytes": ..., "earnings": ...} and
+closes the channel with {"type": "stop", "reason": ...} once the session
+is no longer active or the user is banned.
+"""
+
+import asyncio
+import time
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect, status
+from pydantic import ValidationError as PydanticValidationError
+from sqlalchemy import select
+
+from traffic_share.server.config import settings
+from traffic_share.server.database import AsyncSessionLocal, SessionLocal
+from traffic_share.server.dependencies import authenticate_user
+from traffic_share.server.logger import logger
+from traffic_share.server.metrics import TRAFFIC_UPDATES, TRAFFIC_BYTES
+from traffic_share.server.models import TrafficSession, TrafficSessionStatus, User
+from traffic_share.server.schemas import TrafficStopRequest
+from traffic_share.server.services.traffic_service import AsyncTrafficService
+from traffic_share.server.traffic_buffer import traffic_buffer, SessionDelta
+from traffic_share.server.utils import calculate_earnings
+from traffic_share.core.exceptions import TrafficShareException
+
+
+router = APIRouter(prefix="/traffic", tags=["Traffic"])
+
+# Application close codes (4000-4999)
+CLOSE_UNAUTHORIZED = 4401
+CLOSE_FORBIDDEN = 4403
+CLOSE_NOT_FOUND = 4404
+CLOSE_IDLE = 4408
+
+
+def _token_from(websocket: WebSocket) -> Optional[str]:
+    """Access token from the query string or Authorization header"""
+    token = websocket.query_params.get("token")
+    if token:
+        return token
+
+    auth_header = websocket.headers.get("authorization", "")
+    if auth_header.startswith("Bearer "):
+        return auth_header[len("Bearer "):].strip() or None
+    return None
+
+
+class TrafficStream:
+    """Per-connection counters, debounced into the write-behind buffer"""
+
+    def __init__(self, user_id: int, session_pk: int, session_uuid: str):
+        self.user_id = user_id
+        self.session_pk = session_pk
+        self.session_uuid = session_uuid
+        self.pending = SessionDelta(session_pk, user_id)
+        self.pending_updates = 0
+
+    def record(self, bytes_tx: int, bytes_rx: int):
+        """Add one update to the pending counters"""
+        self.pending.bytes_tx += bytes_tx
+        self.pending.bytes_rx += bytes_rx
+        self.pending_updates += 1
+
+    def discard(self):
+        """Drop pending counters (session stopped or user banned)"""
+        self.pending = SessionDelta(self.session_pk, self.user_id)
+        self.pending_updates = 0
+
+    async def flush(self):
+        """Hand pending counters over as one heartbeat"""
+        if not self.pending_updates:
+            return
+
+        delta, updates = self.pending, self.pending_updates
+        self.pending = SessionDelta(self.session_pk, self.user_id)
+        self.pending_updates = 0
+
+        if settings.TRAFFIC_BUFFER_ENABLED:
+            traffic_buffer.add(
+                delta.session_id, delta.bytes_tx, delta.bytes_rx, user_id=self.user_id
+            )
+        else:
+            await asyncio.to_thread(self._write_through, delta)
+
+        TRAFFIC_UPDATES.inc(updates)
+        TRAFFIC_BYTES.inc(delta.bytes_tx + delta.bytes_rx)
+
+    @staticmethod
+    def _write_through(delta: SessionDelta):
+        db = SessionLocal()
+        try:
+            traffic_buffer.write_through(
+                db, delta.session_id, delta.bytes_tx, delta.bytes_rx,
+                user_id=delta.user_id
+            )
+        finally:
+            db.close()
+
+    async def status(self) -> dict:
+        """Session / user state and approximate earnings so far"""
+        async with AsyncSessionLocal() as db:
+            row = (await db.execute(
+                select(
+                    TrafficSession.status,
+                    TrafficSession.total_bytes,
+                    User.is_active,
+                    User.is_banned
+                )
+                .join(User, User.id == TrafficSession.user_id)
+                .where(TrafficSession.id == self.session_pk)
+            )).first()
+
+        if row is None:
+            return {"type": "stop", "reason": "session_not_found"}
+        if not row.is_active or row.is_banned:
+            return {"type": "stop", "reason": "banned"}
+        if row.status != TrafficSessionStatus.ACTIVE:
+            return {"type": "stop", "reason": "session_stopped"}
+
+        total_bytes = (row.total_bytes or 0) + self.pending.bytes_tx + self.pending.bytes_rx
+        if settings.TRAFFIC_BUFFER_ENABLED:
+            # Handed over but not flushed yet
+            total_bytes += traffic_buffer.pending_bytes(self.session_pk)
+        return {
+            "type": "status",
+            "status": row.status.value,
+            "total_bytes": total_bytes,
+            "earnings": calculate_earnings(total_bytes, settings.PRICE_PER_GB)
+        }
+
+    async def stop(self, message: dict) -> dict:
+        """Stop the session with the device's final counters"""
+        request = TrafficStopRequest(session_id=self.session_uuid, **{
+            key: message.get(key) for key in ("final_bytes_tx", "final_bytes_rx")
+        })
+
+        # Final counters are absolute and supersede anything pending
+        self.discard()
+
+        async with AsyncSessionLocal() as db:
+            response = await AsyncTrafficService(db).stop_session(self.user_id, request)
+        return {"type": "stopped", "earnings": response.earnings}
+
+
+async def _open_stream(websocket: WebSocket) -> Optional[TrafficStream]:
+    """
+    Authenticate and resolve the session, closing the socket on failure
+    The handshake is accepted first: a close before accept reaches the
+    client as HTTP 403 and the application close code is lost.
+    """
+    await websocket.accept()
+
+    token = _token_from(websocket)
+    session_uuid = websocket.query_params.get("session_id")
+    if not token or not session_uuid:
+        await websocket.close(code=CLOSE_UNAUTHORIZED)
+        return None
+
+    async with AsyncSessionLocal() as db:
+        try:
+            user = await authenticate_user(token, db)
+        except HTTPException as e:
+            await websocket.close(
+                code=CLOSE_FORBIDDEN if e.status_code == status.HTTP_403_FORBIDDEN
+                else CLOSE_UNAUTHORIZED
+            )
+            return None
+
+        row = (await db.execute(
+            select(TrafficSession.id, TrafficSession.status).where(
+                TrafficSession.session_uuid == session_uuid,
+                TrafficSession.user_id == user.id
+            )
+        )).first()
+
+    if row is None or row.status != TrafficSessionStatus.ACTIVE:
+        await websocket.close(code=CLOSE_NOT_FOUND)
+        return None
+
+    return TrafficStream(user.id, row.id, session_uuid)
+
+
+@router.websocket("/stream")
+async def traffic_stream(websocket: WebSocket):
+    """Stream byte counters for one traffic session"""
+    stream = await _open_stream(websocket)
+    if stream is None:
+        return
+
+    flush_at = time.monotonic() + settings.TRAFFIC_STREAM_FLUSH_INTERVAL
+    status_at = time.monotonic() + settings.TRAFFIC_STREAM_STATUS_INTERVAL
+    last_message_at = time.monotonic()
+
+    try:
+        while True:
+            now = time.monotonic()
+            # Flush deadline only matters while counters are pending
+            wake_at = min(flush_at, status_at) if stream.pending_updates else status_at
+            timeout = max(0.0, wake_at - now)
+
+            try:
+                message = await asyncio.wait_for(websocket.receive_json(), timeout=timeout)
+            except asyncio.TimeoutError:
+                message = None
+            except ValueError:
+                await websocket.send_json({"type": "error", "error": "Invalid JSON"})
+                continue
+
+            now = time.monotonic()
+            if message is not None:
+                last_message_at = now
+                kind = message.get("type") if isinstance(message, dict) else None
+
+                if kind == "update":
+                    try:
+                        bytes_tx = int(message.get("bytes_tx", 0))
+                        bytes_rx = int(message.get("bytes_rx", 0))
+                    except (TypeError, ValueError):
+                        bytes_tx = bytes_rx = -1
+                    if bytes_tx < 0 or bytes_rx < 0:
+                        await websocket.send_json({"type": "error", "error": "Invalid counters"})
+                    else:
+                        stream.record(bytes_tx, bytes_rx)
+                elif kind == "stop":
+                    try:
+                        await websocket.send_json(await stream.stop(message))
+                    except (TrafficShareException, PydanticValidationError) as e:
+                        await websocket.send_json({"type": "error", "error": str(e)})
+                        continue
+                    await websocket.close()
+                    return
+                elif kind == "ping":
+                    await websocket.send_json({"type": "pong"})
+                else:
+                    await websocket.send_json({"type": "error", "error": "Unknown message type"})
+
+            if now >= flush_at and stream.pending_updates:
+                await stream.flush()
+                flush_at = now + settings.TRAFFIC_STREAM_FLUSH_INTERVAL
+
+            if now >= status_at:
+                state = await stream.status()
+                await websocket.send_json(state)
+                if state["type"] == "stop":
+                    stream.discard()
+                    await websocket.close()
+                    return
+                status_at = now + settings.TRAFFIC_STREAM_STATUS_INTERVAL
+
+            if now - last_message_at > settings.TRAFFIC_STREAM_IDLE_TIMEOUT:
+                await websocket.close(code=CLOSE_IDLE)
+                return
+
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.error(f"Traffic stream error for session {stream.session_uuid}: {e}")
+    finally:
+        # Counters received before the disconnect are still written
+        try:
+            await stream.flush()
+        except Exception as e:
+            logger.error(f"Traffic stream final flush failed: {e}")
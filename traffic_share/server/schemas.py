@@ -3,8 +3,10 @@ Pydantic schemas for API request/response validation
 """
 
 from datetime import datetime
-from typing import Optional, List
-from pydantic import BaseModel, Field, EmailStr, validator
+from typing import Optional, List, Dict
+from pydantic import BaseModel, Field, EmailStr, validator, field_validator
+
+from traffic_share.server.config import settings
 
 
 # ==================== App Update Schemas ====================
@@ -149,6 +151,26 @@ class TrafficUpdateResponse(BaseModel):
     ok: bool
 
 
+class TrafficUpdateBatchRequest(BaseModel):
+    updates: List[TrafficUpdateRequest] = Field(
+        min_length=1, max_length=settings.MAX_TRAFFIC_UPDATES_PER_BATCH
+    )
+
+
+class TrafficUpdateItemResult(BaseModel):
+    index: int
+    session_id: str
+    ok: bool
+    error: Optional[str] = None
+
+
+class TrafficUpdateBatchResponse(BaseModel):
+    ok: bool
+    accepted: int
+    rejected: int
+    results: List[TrafficUpdateItemResult]
+
+
 class TrafficStopRequest(BaseModel):
     session_id: str
     final_bytes_tx: int = Field(ge=0)
@@ -169,6 +191,11 @@ class TrafficSessionResponse(BaseModel):
     earnings: float
     status: str
     
+    @field_validator("status", mode="before")
+    @classmethod
+    def status_value(cls, v):
+        return getattr(v, "value", v)
+    
     class Config:
         from_attributes = True
 
@@ -283,6 +310,23 @@ class BulkCreatePackagesResponse(BaseModel):
     errors: List[str] = []
 
 
+class PackageIngestError(BaseModel):
+    line: int
+    error: str
+
+
+class PackageIngestResponse(BaseModel):
+    received: int
+    inserted: int
+    updated: int
+    skipped: int
+    failed: int
+    errors: List[PackageIngestError] = []
+    error_counts: Dict[str, int] = {}
+    duration_seconds: float
+    rows_per_second: float
+
+
 class PackageResponse(BaseModel):
     id: int
     uuid: str
@@ -301,7 +345,7 @@ class PackageResponse(BaseModel):
 
 
 class PullPacketsRequest(BaseModel):
-    max_count: int = Field(default=1, ge=1, le=10)
+    max_count: int = Field(default=1, ge=1, le=settings.MAX_PACKAGES_PER_REQUEST)
     region: Optional[str] = None
 
 
@@ -345,9 +389,33 @@ class CreateAdminRequest(BaseModel):
 
 class UserListResponse(BaseModel):
     users: List[UserProfile]
-    total: int
-    page: int
+    total: Optional[int] = None
+    total_is_estimate: bool = False
+    page: Optional[int] = None  # deprecated, set when paging by number
     page_size: int
+    total_pages: Optional[int] = None
+    next_cursor: Optional[str] = None
+
+
+class AuditLogEntry(BaseModel):
+    id: int
+    action: str
+    entity_type: Optional[str]
+    entity_id: Optional[int]
+    user_id: Optional[int]
+    admin_id: Optional[int]
+    buyer_id: Optional[int]
+    details: Optional[str]
+    ip_address: Optional[str]
+    created_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+
+class AuditLogListResponse(BaseModel):
+    logs: List[AuditLogEntry]
+    next_cursor: Optional[str] = None
 
 
 class BanUserRequest(BaseModel):
@@ -360,6 +428,19 @@ class NotifyRequest(BaseModel):
     title: Optional[str] = None
 
 
+class BroadcastJobResponse(BaseModel):
+    job_id: int
+    status: str  # pending, running, completed, failed, cancelled
+    target: str
+    total: int  # users matching the target when the job was queued
+    processed: int
+    progress: float
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+
 class DailyReportResponse(BaseModel):
     date: str
     total_users: int
@@ -368,7 +449,11 @@ class DailyReportResponse(BaseModel):
     total_traffic_gb: float
     total_earnings: float
     total_payouts: float
-    active_sessions: int
+    active_sessions: Optional[int] = None
+
+
+class DailyReportRangeResponse(BaseModel):
+    reports: List[DailyReportResponse]
 
 
 class MetricsResponse(BaseModel):
@@ -378,6 +463,9 @@ class MetricsResponse(BaseModel):
     db_connections: int
     redis_connected: bool
     uptime_seconds: int
+    cpu_percent: float = 0.0
+    memory_percent: float = 0.0
+    memory_used_mb: int = 0
 
 
 # ==================== System Schemas ====================
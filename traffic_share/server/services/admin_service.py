@@ -2,18 +2,25 @@
 Admin service - admin operations and monitoring
 """
 
-from datetime import datetime, timedelta
-from typing import List, Dict, Any
+from datetime import datetime
+from typing import List, Dict, Any, Iterable, Optional
 from sqlalchemy.orm import Session
 from sqlalchemy import func, and_
 
 from traffic_share.server.models import (
-    User, Admin, TrafficSession, Payment, Package, Buyer, AuditLog
+    User, Admin, TrafficSession, Buyer, AuditLog
 )
 from traffic_share.server.schemas import DailyReportResponse, MetricsResponse
+from traffic_share.server.config import settings
 from traffic_share.core.exceptions import ResourceNotFoundError, AuthorizationError, ValidationError
 from traffic_share.server.logger import logger
-from traffic_share.server.utils import bytes_to_gb
+from traffic_share.server.utils import (
+    bytes_to_gb, keyset_paginate, approximate_count, create_audit_log
+)
+from traffic_share.server.limiter import rate_limiter
+from traffic_share.server.metrics import db_pool_stats, request_rate, uptime_seconds
+from traffic_share.server.services.package_ingest import PackageIngestor
+from traffic_share.server.daily_reports import get_reports
 
 
 class AdminService:
@@ -55,27 +62,50 @@ class AdminService:
     
     def get_all_users(
         self, 
-        page: int = 1, 
         page_size: int = 50,
-        is_active: bool = None
-    ) -> tuple[List[User], int]:
-        """Get all users with pagination"""
+        is_active: bool = None,
+        cursor: str = None,
+        exact_total: bool = False,
+        page: int = 1
+    ) -> tuple[List[User], Optional[int], Optional[str]]:
+        """
+        Get users, newest first, with keyset pagination
+        Returns (users, total, next_cursor). Without exact_total the total is
+        the planner estimate for the whole table (None when filtered).
+        page is only honoured without a cursor, for clients that still page
+        by number.
+        """
         query = self.db.query(User)
         
         if is_active is not None:
             query = query.filter(User.is_active == is_active)
         
-        total = query.count()
-        
-        offset = (page - 1) * page_size
-        users = query.order_by(
-            User.created_at.desc()
-        ).offset(offset).limit(page_size).all()
-        
-        return users, total
+        if page > 1 and not cursor:
+            users = query.order_by(
+                User.created_at.desc(),
+                User.id.desc()
+            ).offset((page - 1) * page_size).limit(page_size).all()
+            next_cursor = None
+        else:
+            users, next_cursor = keyset_paginate(
+                query, [User.created_at, User.id], cursor, page_size
+            )
+        
+        total = None
+        if exact_total:
+            total = query.count()
+        elif is_active is None:
+            total = approximate_count(self.db, User)
+            if total is None:
+                total = query.count()
+        
+        return users, total, next_cursor
     
     def ban_user(self, user_id: int, reason: str = None) -> bool:
-        """Ban a user"""
+        """
+        Ban a user
+        Callers await principal_cache.invalidate_user once this returns.
+        """
         user = self.db.query(User).filter(User.id == user_id).first()
         
         if not user:
@@ -91,7 +121,10 @@ class AdminService:
         return True
     
     def unban_user(self, user_id: int) -> bool:
-        """Unban a user"""
+        """
+        Unban a user
+        Callers await principal_cache.invalidate_user once this returns.
+        """
         user = self.db.query(User).filter(User.id == user_id).first()
         
         if not user:
@@ -107,74 +140,46 @@ class AdminService:
         return True
     
     def get_daily_report(self, date: datetime = None) -> DailyReportResponse:
-        """Generate daily report"""
-        if not date:
-            date = datetime.utcnow()
-        
-        day_start = date.replace(hour=0, minute=0, second=0, microsecond=0)
-        day_end = day_start + timedelta(days=1)
-        
-        # Total users
-        total_users = self.db.query(func.count(User.id)).scalar()
-        
-        # Active users (logged in today)
-        active_users = self.db.query(func.count(User.id)).filter(
-            User.last_login_at >= day_start
-        ).scalar()
-        
-        # New users
-        new_users = self.db.query(func.count(User.id)).filter(
-            User.created_at >= day_start,
-            User.created_at < day_end
-        ).scalar()
-        
-        # Traffic stats
-        traffic_stats = self.db.query(
-            func.sum(TrafficSession.bytes_total).label("bytes"),
-            func.sum(TrafficSession.earnings).label("earnings")
-        ).filter(
-            TrafficSession.start_time >= day_start,
-            TrafficSession.start_time < day_end
-        ).first()
-        
-        total_traffic_gb = bytes_to_gb(traffic_stats.bytes or 0)
-        total_earnings = traffic_stats.earnings or 0.0
-        
-        # Payouts
-        payout_stats = self.db.query(
-            func.sum(Payment.amount).label("amount")
-        ).filter(
-            Payment.created_at >= day_start,
-            Payment.created_at < day_end,
-            Payment.status == "completed"
-        ).first()
-        
-        total_payouts = payout_stats.amount or 0.0
-        
-        # Active sessions
-        active_sessions = self.db.query(func.count(TrafficSession.id)).filter(
-            TrafficSession.status == "active"
-        ).scalar()
+        """Daily report (snapshot for closed days, live counters for today)"""
+        day = date or datetime.utcnow()
+        report = get_reports(self.db, day, day)
+        if not report:
+            raise ValidationError("Report date is in the future")
         
+        return self._report_response(report[0])
+    
+    def get_daily_reports(self, start: datetime, end: datetime) -> List[DailyReportResponse]:
+        """Daily reports of a date range (inclusive), oldest first"""
+        if end < start:
+            raise ValidationError("end must not be before start")
+        if (end - start).days + 1 > settings.MAX_REPORT_RANGE_DAYS:
+            raise ValidationError(
+                f"Range is limited to {settings.MAX_REPORT_RANGE_DAYS} days"
+            )
+        
+        return [self._report_response(values) for values in get_reports(self.db, start, end)]
+    
+    @staticmethod
+    def _report_response(values: Dict[str, Any]) -> DailyReportResponse:
         return DailyReportResponse(
-            date=day_start.strftime("%Y-%m-%d"),
-            total_users=total_users or 0,
-            active_users=active_users or 0,
-            new_users=new_users or 0,
-            total_traffic_gb=total_traffic_gb,
-            total_earnings=total_earnings,
-            total_payouts=total_payouts,
-            active_sessions=active_sessions or 0
+            date=values["report_date"].strftime("%Y-%m-%d"),
+            total_users=values["total_users"],
+            active_users=values["active_users"],
+            new_users=values["new_users"],
+            total_traffic_gb=bytes_to_gb(values["traffic_bytes"]),
+            total_earnings=values["total_earnings"],
+            total_payouts=values["total_payouts"],
+            active_sessions=values["active_sessions"]
         )
     
     def get_system_metrics(self) -> Dict[str, Any]:
         """Get system metrics"""
         import psutil
-        import time
         
-        # Database connections
-        # This is simplified - in production use proper DB pool monitoring
-        db_connections = 0
+        # Connections currently checked out of the engine pools
+        db_connections = sum(
+            stats["checked_out"] for stats in db_pool_stats().values()
+        )
         
         # Active sessions
         active_sessions = self.db.query(func.count(TrafficSession.id)).filter(
@@ -186,20 +191,17 @@ class AdminService:
             Buyer.is_active == True
         ).scalar()
         
-        # System metrics
-        cpu_percent = psutil.cpu_percent(interval=1)
+        # CPU usage since the previous call - never blocks the request
+        cpu_percent = psutil.cpu_percent(interval=None)
         memory = psutil.virtual_memory()
         
-        # Uptime (simplified - should track actual app start time)
-        uptime_seconds = int(time.time())
-        
         return {
-            "requests_per_minute": 0.0,  # Would need request counter
+            "requests_per_minute": request_rate.per_minute(),
             "active_sessions": active_sessions or 0,
             "active_buyers": active_buyers or 0,
             "db_connections": db_connections,
-            "redis_connected": True,  # Would need actual Redis check
-            "uptime_seconds": uptime_seconds,
+            "redis_connected": rate_limiter.redis_connected,
+            "uptime_seconds": uptime_seconds(),
             "cpu_percent": cpu_percent,
             "memory_percent": memory.percent,
             "memory_used_mb": memory.used // (1024 * 1024)
@@ -211,9 +213,13 @@ class AdminService:
         user_id: int = None,
         start_date: datetime = None,
         end_date: datetime = None,
-        limit: int = 100
-    ) -> List[AuditLog]:
-        """Search audit logs"""
+        limit: int = 100,
+        cursor: str = None
+    ) -> tuple[List[AuditLog], Optional[str]]:
+        """
+        Search audit logs, newest first
+        Returns (logs, next_cursor)
+        """
         query = self.db.query(AuditLog)
         
         if action:
@@ -228,46 +234,42 @@ class AdminService:
         if end_date:
             query = query.filter(AuditLog.created_at <= end_date)
         
-        logs = query.order_by(
-            AuditLog.created_at.desc()
-        ).limit(limit).all()
-        
-        return logs
+        return keyset_paginate(
+            query, [AuditLog.created_at, AuditLog.id], cursor, limit
+        )
     
     def bulk_create_packages(self, packages_data: List[Dict]) -> tuple[int, List[str]]:
-        """Bulk create packages"""
-        created = 0
-        errors = []
-        
-        for pkg_data in packages_data:
-            try:
-                # Verify user exists
-                user = self.db.query(User).filter(
-                    User.id == pkg_data["user_id"]
-                ).first()
-                
-                if not user:
-                    errors.append(f"User {pkg_data['user_id']} not found")
-                    continue
-                
-                # Create package
-                package = Package(
-                    uuid=pkg_data["uuid"],
-                    user_id=pkg_data["user_id"],
-                    ip=pkg_data["ip"],
-                    size_bytes=pkg_data["size_bytes"],
-                    status="available"
-                )
-                
-                self.db.add(package)
-                created += 1
-                
-            except Exception as e:
-                errors.append(f"Error creating package: {str(e)}")
-        
-        if created > 0:
-            self.db.commit()
-        
-        logger.info(f"Bulk created {created} packages, {len(errors)} errors")
-        
-        return created, errors
+        """Bulk create packages (chunked set-based load, see PackageIngestor)"""
+        report = PackageIngestor(self.db).ingest(
+            enumerate(packages_data, start=1)
+        )
+        
+        errors = [f"Row {e['line']}: {e['error']}" for e in report.errors]
+        logger.info(f"Bulk created {report.inserted} packages, {report.failed} errors")
+        
+        return report.inserted, errors
+    
+    def ingest_packages(
+        self,
+        lines: Iterable[str],
+        fmt: str,
+        on_conflict: str = "skip",
+        admin_id: int = None
+    ) -> Dict[str, Any]:
+        """Stream NDJSON / CSV package rows into the packages table"""
+        report = PackageIngestor(self.db, on_conflict=on_conflict).ingest_lines(lines, fmt)
+        
+        create_audit_log(
+            self.db,
+            action="packages_ingested",
+            admin_id=admin_id,
+            details={
+                "received": report.received,
+                "inserted": report.inserted,
+                "updated": report.updated,
+                "skipped": report.skipped,
+                "failed": report.failed
+            }
+        )
+        
+        return report.as_dict()
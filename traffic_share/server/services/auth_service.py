@@ -5,6 +5,7 @@ Authentication service - handles login, registration, tokens
 from datetime import datetime, timedelta
 from typing import Optional, Tuple
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from traffic_share.server.models import User, LoginCode
 from traffic_share.server.schemas import RegisterRequest, TokenResponse
@@ -14,6 +15,7 @@ from traffic_share.core.exceptions import (
 )
 from traffic_share.server.config import settings
 from traffic_share.server.logger import logger
+from traffic_share.server.daily_reports import report_counters
 
 
 class AuthService:
@@ -25,6 +27,14 @@ class AuthService:
     
     def register_user(self, request: RegisterRequest) -> User:
         """Register new user or return existing one"""
+        user, _ = self._register_user(request)
+        return user
+    
+    def _register_user(self, request: RegisterRequest) -> Tuple[User, bool]:
+        """
+        Register new user or update existing one
+        Returns (User, created)
+        """
         # Check if user exists
         user = self.db.query(User).filter(
             User.telegram_id == request.telegram_id
@@ -39,7 +49,7 @@ class AuthService:
             self.db.commit()
             self.db.refresh(user)
             logger.info(f"User {user.id} updated profile")
-            return user
+            return user, False
         
         # Create new user
         user = User(
@@ -54,7 +64,7 @@ class AuthService:
         self.db.refresh(user)
         
         logger.info(f"New user registered: {user.id}")
-        return user
+        return user, True
     
     def generate_login_code(self, telegram_id: int) -> Tuple[User, str]:
         """
@@ -97,6 +107,18 @@ class AuthService:
         """
         Verify login code and issue tokens
         """
+        _, tokens = self._verify_login_code(telegram_id, code)
+        return tokens
+    
+    def _verify_login_code(
+        self, 
+        telegram_id: int, 
+        code: str
+    ) -> Tuple[User, TokenResponse]:
+        """
+        Verify login code and issue tokens
+        Returns (User, TokenResponse)
+        """
         # Get user
         user = self.db.query(User).filter(
             User.telegram_id == telegram_id
@@ -142,7 +164,7 @@ class AuthService:
         
         logger.info(f"User {user.id} logged in successfully")
         
-        return TokenResponse(
+        return user, TokenResponse(
             access_token=access_token,
             refresh_token=refresh_token,
             expires_in=settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
@@ -187,3 +209,49 @@ class AuthService:
         except Exception as e:
             logger.error(f"Token refresh failed: {e}")
             raise AuthenticationError("Invalid refresh token")
+
+
+class AsyncAuthService:
+    """
+    Async variant of AuthService
+    Runs the same logic on an AsyncSession, so DB waits yield to the event loop
+    """
+    
+    def __init__(self, db: AsyncSession):
+        self.db = db
+    
+    async def register_user(self, request: RegisterRequest) -> User:
+        """Register new user or return existing one"""
+        user, created = await self.db.run_sync(
+            lambda session: AuthService(session)._register_user(request)
+        )
+        if created:
+            await report_counters.record_new_user()
+        return user
+    
+    async def generate_login_code(self, telegram_id: int) -> Tuple[User, str]:
+        """
+        Generate login code for user
+        Returns (User, code)
+        """
+        return await self.db.run_sync(
+            lambda session: AuthService(session).generate_login_code(telegram_id)
+        )
+    
+    async def verify_login_code(
+        self, 
+        telegram_id: int, 
+        code: str
+    ) -> TokenResponse:
+        """Verify login code and issue tokens"""
+        user, tokens = await self.db.run_sync(
+            lambda session: AuthService(session)._verify_login_code(telegram_id, code)
+        )
+        await report_counters.record_login(user.id)
+        return tokens
+    
+    async def refresh_access_token(self, refresh_token: str) -> TokenResponse:
+        """Refresh access token using refresh token"""
+        return await self.db.run_sync(
+            lambda session: AuthService(session).refresh_access_token(refresh_token)
+        )
@@ -2,18 +2,19 @@
 Buyer service - manages buyers, tokens, and package allocation
 """
 
-from datetime import datetime, timedelta
+from datetime import datetime
 from typing import List, Tuple
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import or_
 
 from traffic_share.server.models import (
-    Buyer, BuyerToken, Package, PackageAllocation
+    Buyer, BuyerToken, Package, PackageAllocation, PackageStatus
 )
 from traffic_share.server.schemas import (
     CreateBuyerRequest, BuyerResponse,
     CreateBuyerTokenRequest, BuyerTokenResponse,
-    PullPacketsRequest, PacketInfo, PullPacketsResponse,
+    PullPacketsRequest, PullPacketsResponse,
     UpdatePacketStatusRequest, BuyerUsageResponse
 )
 from traffic_share.core.security import SecurityManager
@@ -22,7 +23,12 @@ from traffic_share.core.exceptions import (
 )
 from traffic_share.server.config import settings
 from traffic_share.server.logger import logger
-from traffic_share.server.utils import create_audit_log
+from traffic_share.server.utils import create_audit_log, update_batch_skip_locked
+from traffic_share.server.principal_cache import principal_cache
+from traffic_share.server.services.package_allocator import PackageAllocator
+from traffic_share.server.package_pool import package_pool
+from traffic_share.server.allocation_expiry import allocation_reaper
+from traffic_share.server.metrics import PACKAGE_PULLS, PACKAGES_ALLOCATED
 
 
 class BuyerService:
@@ -106,7 +112,19 @@ class BuyerService:
         )
     
     def revoke_token(self, token_id: int) -> bool:
-        """Revoke a buyer token"""
+        """
+        Revoke a buyer token
+        Cached principals expire with the cache TTL; AsyncBuyerService
+        drops them right away.
+        """
+        self._revoke_token(token_id)
+        return True
+    
+    def _revoke_token(self, token_id: int) -> str:
+        """
+        Revoke a buyer token
+        Returns the token hash to drop from the principal cache
+        """
         token = self.db.query(BuyerToken).filter(
             BuyerToken.id == token_id
         ).first()
@@ -119,89 +137,69 @@ class BuyerService:
         
         logger.info(f"Token {token_id} revoked for buyer {token.buyer_id}")
         
-        return True
+        return token.token_hash
     
     def pull_packets(
         self, 
         buyer_id: int, 
-        request: PullPacketsRequest
+        request: PullPacketsRequest,
+        candidate_ids: List[int] = None
     ) -> PullPacketsResponse:
         """
         Allocate packages to buyer (atomic operation)
         Enforces: one user + one IP = one package rule
+        candidate_ids (from the package pool) are tried first; the rest is
+        allocated straight from the table.
         """
-        # Get available packages
-        query = self.db.query(Package).filter(
-            Package.status == "available",
-            Package.assigned_buyer_id.is_(None)
-        )
-        
-        if request.region:
-            # Filter by region if needed (would need region column in Package)
-            pass
-        
-        # Use FOR UPDATE SKIP LOCKED for atomic allocation
-        packages = query.limit(request.max_count).with_for_update(
-            skip_locked=True
-        ).all()
-        
-        if not packages:
-            # No packages available
-            return PullPacketsResponse(packages=[])
-        
+        response, _ = self._pull_packets(buyer_id, request, candidate_ids)
+        return response
+    
+    def _pull_packets(
+        self, 
+        buyer_id: int, 
+        request: PullPacketsRequest,
+        candidate_ids: List[int] = None
+    ) -> Tuple[PullPacketsResponse, List[Tuple[int, datetime]]]:
+        """
+        Allocate packages to buyer and commit
+        Returns (response, (package id, expires_at) pairs for the allocation reaper)
+        """
+        max_count = min(request.max_count, settings.MAX_PACKAGES_PER_REQUEST)
+        PACKAGE_PULLS.inc()
+        allocator = PackageAllocator(self.db)
         allocated_packages = []
+        deadlines = []
+        
+        if candidate_ids:
+            allocated_packages, deadlines = allocator.allocate(
+                buyer_id,
+                max_count,
+                region=request.region,
+                candidate_ids=candidate_ids
+            )
         
-        for package in packages:
-            # Check if buyer already has package for this user+ip combination
-            existing = self.db.query(Package).filter(
-                and_(
-                    Package.user_id == package.user_id,
-                    Package.ip == package.ip,
-                    Package.assigned_buyer_id == buyer_id,
-                    or_(
-                        Package.status == "allocated",
-                        Package.status == "in_progress"
-                    )
-                )
-            ).first()
-            
-            if existing:
-                # Skip this package - buyer already has one for this user+ip
-                logger.warning(
-                    f"Buyer {buyer_id} already has package for "
-                    f"user {package.user_id} ip {package.ip}"
-                )
-                continue
-            
-            # Allocate package
-            package.assigned_buyer_id = buyer_id
-            package.status = "allocated"
-            package.allocated_at = datetime.utcnow()
-            
-            # Create allocation record
-            allocation = PackageAllocation(
-                package_id=package.id,
-                buyer_id=buyer_id,
-                status="allocated",
-                allocated_at=datetime.utcnow()
+        if len(allocated_packages) < max_count:
+            allocation = allocator.allocate(
+                buyer_id,
+                max_count - len(allocated_packages),
+                region=request.region
             )
-            self.db.add(allocation)
-            
-            allocated_packages.append(PacketInfo(
-                uuid=package.uuid,
-                user_id=package.user_id,
-                ip=package.ip,
-                size_bytes=package.size_bytes,
-                assigned_at=package.allocated_at
-            ))
+            allocated_packages += allocation.packages
+            deadlines += allocation.deadlines
+        
+        if not allocated_packages:
+            # No packages available
+            self.db.rollback()
+            return PullPacketsResponse(packages=[]), []
         
         self.db.commit()
+        PACKAGES_ALLOCATED.inc(len(allocated_packages))
         
         logger.info(
             f"Buyer {buyer_id} pulled {len(allocated_packages)} packages"
         )
         
-        return PullPacketsResponse(packages=allocated_packages)
+        return PullPacketsResponse(packages=allocated_packages), deadlines
     
     def update_packet_status(
         self, 
@@ -317,29 +315,158 @@ class BuyerService:
             total_bytes_sent=total_bytes
         )
     
-    def cleanup_stale_allocations(self) -> int:
+    def cleanup_stale_allocations(
+        self,
+        batch_size: int = None,
+        max_batches: int = None
+    ) -> int:
         """
         Cleanup packages that were allocated but not confirmed
+        Released in committed batches of STALE_SWEEP_BATCH_SIZE rows, so
+        a large backlog is never loaded at once and concurrent sweeps
+        skip each other's rows. Normally the allocation reaper has released
+        them already; this sweep catches what its index missed, reading
+        only the deadline index of allocated packages.
         Returns number of cleaned packages
         """
-        ttl_threshold = datetime.utcnow() - timedelta(
-            seconds=settings.PACKAGE_ALLOCATION_TTL
-        )
-        
-        stale_packages = self.db.query(Package).filter(
-            Package.status == "allocated",
-            Package.allocated_at < ttl_threshold
-        ).all()
+        batch_size = batch_size or settings.STALE_SWEEP_BATCH_SIZE
+        max_batches = max_batches or settings.STALE_SWEEP_MAX_BATCHES
+        now = datetime.utcnow()
         
         count = 0
-        for package in stale_packages:
-            package.status = "available"
-            package.assigned_buyer_id = None
-            package.allocated_at = None
-            count += 1
+        for batch in range(1, max_batches + 1):
+            released = update_batch_skip_locked(
+                self.db,
+                Package,
+                [
+                    Package.status == PackageStatus.ALLOCATED.value,
+                    Package.expires_at <= now
+                ],
+                {
+                    "status": PackageStatus.AVAILABLE.value,
+                    "assigned_buyer_id": None,
+                    "allocated_at": None,
+                    "expires_at": None
+                },
+                [Package.id],
+                batch_size,
+                order_by=Package.expires_at
+            )
+            self.db.commit()
+            
+            if not released:
+                break
+            count += len(released)
+            logger.info(f"Released {len(released)} stale package allocations (batch {batch})")
+            
+            if len(released) < batch_size:
+                break
         
         if count > 0:
-            self.db.commit()
             logger.info(f"Cleaned up {count} stale package allocations")
         
         return count
+
+
+class AsyncBuyerService:
+    """
+    Async variant of BuyerService
+    Runs the same logic on an AsyncSession, so DB waits yield to the event loop
+    """
+    
+    def __init__(self, db: AsyncSession):
+        self.db = db
+    
+    async def create_buyer(self, request: CreateBuyerRequest) -> BuyerResponse:
+        """Create new buyer"""
+        return await self.db.run_sync(
+            lambda session: BuyerService(session).create_buyer(request)
+        )
+    
+    async def get_buyers(self, is_active: bool = None) -> List[BuyerResponse]:
+        """Get all buyers"""
+        return await self.db.run_sync(
+            lambda session: BuyerService(session).get_buyers(is_active)
+        )
+    
+    async def create_buyer_token(
+        self, 
+        request: CreateBuyerTokenRequest
+    ) -> BuyerTokenResponse:
+        """Create new API token for buyer"""
+        return await self.db.run_sync(
+            lambda session: BuyerService(session).create_buyer_token(request)
+        )
+    
+    async def revoke_token(self, token_id: int) -> bool:
+        """Revoke a buyer token"""
+        token_hash = await self.db.run_sync(
+            lambda session: BuyerService(session)._revoke_token(token_id)
+        )
+        await principal_cache.invalidate_token(token_hash)
+        return True
+    
+    async def pull_packets(
+        self, 
+        buyer_id: int, 
+        request: PullPacketsRequest
+    ) -> PullPacketsResponse:
+        """Allocate packages to buyer (atomic operation)"""
+        if not package_pool.enabled:
+            response, deadlines = await self.db.run_sync(
+                lambda session: BuyerService(session)._pull_packets(buyer_id, request)
+            )
+            await allocation_reaper.track(deadlines)
+            return response
+        
+        max_count = min(request.max_count, settings.MAX_PACKAGES_PER_REQUEST)
+        candidate_ids = await package_pool.pop(request.region, max_count)
+        
+        def pull(session: Session):
+            response, deadlines = BuyerService(session)._pull_packets(
+                buyer_id, request, candidate_ids=candidate_ids
+            )
+            # Popped but not allocated (user + IP rule) - others may take them
+            leftover = PackageAllocator(session).still_available(candidate_ids)
+            return response, deadlines, leftover
+        
+        # On failure popped ids are still available in the table and come
+        # back with the next refill
+        response, deadlines, leftover = await self.db.run_sync(pull)
+        await allocation_reaper.track(deadlines)
+        
+        if leftover:
+            await package_pool.requeue(leftover)
+        
+        return response
+    
+    async def update_packet_status(
+        self, 
+        buyer_id: int, 
+        uuid: str, 
+        request: UpdatePacketStatusRequest
+    ) -> bool:
+        """Update packet status"""
+        return await self.db.run_sync(
+            lambda session: BuyerService(session).update_packet_status(
+                buyer_id, uuid, request
+            )
+        )
+    
+    async def get_buyer_allocations(self, buyer_id: int) -> List[dict]:
+        """Get active allocations for buyer"""
+        return await self.db.run_sync(
+            lambda session: BuyerService(session).get_buyer_allocations(buyer_id)
+        )
+    
+    async def get_buyer_usage(self, buyer_id: int) -> BuyerUsageResponse:
+        """Get buyer usage statistics"""
+        return await self.db.run_sync(
+            lambda session: BuyerService(session).get_buyer_usage(buyer_id)
+        )
+    
+    async def cleanup_stale_allocations(self) -> int:
+        """Cleanup packages that were allocated but not confirmed"""
+        return await self.db.run_sync(
+            lambda session: BuyerService(session).cleanup_stale_allocations()
+        )
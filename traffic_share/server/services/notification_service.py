@@ -2,12 +2,70 @@
 Notification service - manages system notifications
 """
 
-from datetime import datetime
-from typing import List, Optional
+from datetime import datetime, timedelta
+from typing import List, NamedTuple, Optional
+from sqlalchemy import and_, bindparam, exists, false, func, insert, literal, or_, select, update
 from sqlalchemy.orm import Session
 
-from traffic_share.server.models import Notification, User
+from traffic_share.server.models import (
+    Notification, NotificationDeliveryStatus, User, TrafficSession,
+    BroadcastJob, BroadcastJobStatus
+)
+from traffic_share.server.schemas import BroadcastJobResponse
+from traffic_share.core.exceptions import ResourceNotFoundError, ValidationError
+from traffic_share.server.config import settings
 from traffic_share.server.logger import logger
+from traffic_share.server.utils import update_batch_skip_locked
+
+
+FINISHED_BROADCAST_STATUSES = (
+    BroadcastJobStatus.COMPLETED,
+    BroadcastJobStatus.FAILED,
+    BroadcastJobStatus.CANCELLED
+)
+
+
+class PendingDelivery(NamedTuple):
+    """A claimed notification to send to a Telegram chat"""
+    id: int
+    chat_id: Optional[int]  # None when the user no longer exists
+    title: str
+    message: str
+    attempts: int  # including this one
+    created_at: datetime
+
+
+class DeliveryResult(NamedTuple):
+    """Outcome of one delivery attempt"""
+    id: int
+    status: NotificationDeliveryStatus  # SENT, PENDING (retry) or FAILED
+    error: Optional[str] = None
+    retry_at: Optional[datetime] = None
+
+
+def broadcast_target_filter(target: str):
+    """
+    Users condition of a broadcast target
+    all / active, verified, region:XX (users with sessions from XX), user_id:N
+    """
+    conditions = [User.is_active == True]
+    
+    if target in ("all", "active"):
+        pass
+    elif target == "verified":
+        conditions.append(User.is_verified == True)
+    elif target.startswith("region:") and len(target) > len("region:"):
+        region = target.split(":", 1)[1].upper()
+        conditions.append(exists().where(
+            TrafficSession.user_id == User.id,
+            TrafficSession.region == region
+        ))
+    elif target.startswith("user_id:") and target.split(":", 1)[1].isdigit():
+        conditions.append(User.id == int(target.split(":", 1)[1]))
+    else:
+        raise ValidationError(f"Unsupported broadcast target: {target}")
+    
+    return and_(*conditions)
 
 
 class NotificationService:
@@ -27,7 +85,7 @@ class NotificationService:
         """Create a notification"""
         notification = Notification(
             user_id=user_id,
-            type=type,
+            notification_type=type,
             title=title,
             message=message,
             sent_via_bot=send_via_bot
@@ -85,30 +143,273 @@ class NotificationService:
         target_filter: str = "all"
     ) -> int:
         """
-        Broadcast notification to multiple users
-        Returns count of notifications created
+        Broadcast notification to multiple users in one go
+        Returns count of notifications created. Large broadcasts should go
+        through create_broadcast_job, which fans out in the background.
         """
-        # Get target users
-        query = self.db.query(User).filter(User.is_active == True)
-        
-        if target_filter == "verified":
-            query = query.filter(User.is_verified == True)
-        elif target_filter.startswith("region:"):
-            # Would need region field in User model
+        job = self.create_broadcast_job(type, title, message, target_filter)
+        while self.run_broadcast_chunk(job.id):
             pass
         
-        users = query.all()
+        self.db.refresh(job)
+        return job.processed
+    
+    def create_broadcast_job(
+        self,
+        type: str,
+        title: str,
+        message: str,
+        target: str = "all",
+        admin_id: int = None
+    ) -> BroadcastJob:
+        """Queue a broadcast; the runner fans it out chunk by chunk"""
+        condition = broadcast_target_filter(target)
+        total = self.db.query(func.count(User.id)).filter(condition).scalar() or 0
+        
+        job = BroadcastJob(
+            admin_id=admin_id,
+            notification_type=type,
+            title=title,
+            message=message,
+            target=target,
+            total=total
+        )
+        
+        self.db.add(job)
+        self.db.commit()
+        self.db.refresh(job)
+        
+        logger.info(f"Broadcast job {job.id} queued for ~{total} users ({target})")
+        
+        return job
+    
+    def run_broadcast_chunk(self, job_id: int, chunk_size: int = None) -> bool:
+        """
+        Fan out the next chunk of a broadcast with one INSERT ... SELECT
+        Notifications and job progress are committed together, so a job
+        resumed after a restart continues after the last committed user.
+        Returns True while more chunks remain.
+        """
+        chunk_size = chunk_size or settings.BROADCAST_CHUNK_SIZE
+        
+        # Another worker holding the job row is already running this chunk
+        job = self.db.query(BroadcastJob).filter(
+            BroadcastJob.id == job_id
+        ).with_for_update(skip_locked=True).first()
+        
+        if not job or job.status in FINISHED_BROADCAST_STATUSES:
+            self.db.rollback()
+            return False
+        
+        now = datetime.utcnow()
+        if job.status == BroadcastJobStatus.PENDING:
+            job.status = BroadcastJobStatus.RUNNING
+            job.started_at = now
+        
+        condition = and_(
+            broadcast_target_filter(job.target),
+            User.id > job.last_user_id
+        )
+        
+        # Last user id of this chunk (keyset, no OFFSET over done users)
+        upper = self.db.execute(
+            select(User.id).where(condition).order_by(User.id)
+            .offset(chunk_size - 1).limit(1)
+        ).scalar()
+        if upper is None:
+            upper = self.db.execute(select(func.max(User.id)).where(condition)).scalar()
         
-        count = 0
-        for user in users:
-            self.create_notification(
-                user_id=user.id,
-                type=type,
-                title=title,
-                message=message
+        if upper is None:
+            job.status = BroadcastJobStatus.COMPLETED
+            job.finished_at = now
+            self.db.commit()
+            logger.info(f"Broadcast job {job.id} completed: {job.processed} notifications")
+            return False
+        
+        result = self.db.execute(
+            insert(Notification).from_select(
+                ["user_id", "title", "message", "notification_type",
+                 "is_read", "sent_via_bot", "created_at"],
+                select(
+                    User.id,
+                    literal(job.title),
+                    literal(job.message),
+                    literal(job.notification_type),
+                    false(),
+                    false(),
+                    literal(now)
+                ).where(condition, User.id <= upper)
             )
-            count += 1
+        )
+        
+        job.processed += result.rowcount
+        job.last_user_id = upper
+        self.db.commit()
+        
+        return True
+    
+    def fail_broadcast_job(self, job_id: int, error: str):
+        """Mark a broadcast as failed (progress so far is kept)"""
+        job = self.db.query(BroadcastJob).filter(BroadcastJob.id == job_id).first()
+        if job and job.status not in FINISHED_BROADCAST_STATUSES:
+            job.status = BroadcastJobStatus.FAILED
+            job.error = error[:1000]
+            job.finished_at = datetime.utcnow()
+            self.db.commit()
+    
+    def cancel_broadcast_job(self, job_id: int) -> BroadcastJob:
+        """Stop a broadcast before its next chunk"""
+        job = self.db.query(BroadcastJob).filter(BroadcastJob.id == job_id).first()
+        if not job:
+            raise ResourceNotFoundError("Broadcast job not found")
+        
+        if job.status not in FINISHED_BROADCAST_STATUSES:
+            job.status = BroadcastJobStatus.CANCELLED
+            job.finished_at = datetime.utcnow()
+            self.db.commit()
+        
+        return job
+    
+    def unfinished_broadcast_jobs(self) -> List[int]:
+        """Ids of queued or interrupted broadcasts, oldest first"""
+        return [
+            job_id for (job_id,) in self.db.query(BroadcastJob.id).filter(
+                BroadcastJob.status.in_([
+                    BroadcastJobStatus.PENDING, BroadcastJobStatus.RUNNING
+                ])
+            ).order_by(BroadcastJob.id)
+        ]
+    
+    def get_broadcast_job(self, job_id: int) -> BroadcastJobResponse:
+        """Broadcast progress"""
+        job = self.db.query(BroadcastJob).filter(BroadcastJob.id == job_id).first()
+        if not job:
+            raise ResourceNotFoundError("Broadcast job not found")
+        
+        return self.broadcast_job_response(job)
+    
+    @staticmethod
+    def broadcast_job_response(job: BroadcastJob) -> BroadcastJobResponse:
+        progress = 1.0 if job.status == BroadcastJobStatus.COMPLETED else (
+            min(job.processed / job.total, 1.0) if job.total else 0.0
+        )
+        return BroadcastJobResponse(
+            job_id=job.id,
+            status=job.status.value,
+            target=job.target,
+            total=job.total,
+            processed=job.processed,
+            progress=round(progress, 4),
+            error=job.error,
+            created_at=job.created_at,
+            started_at=job.started_at,
+            finished_at=job.finished_at
+        )
+    
+    def claim_deliveries(self, batch_size: int = None, now: datetime = None) -> List[PendingDelivery]:
+        """
+        Claim due notifications for Telegram delivery (commits)
+        Claimed rows are SENDING until NOTIFY_CLAIM_TIMEOUT; rows locked by
+        another worker are skipped, so concurrent workers split the queue.
+        """
+        now = now or datetime.utcnow()
+        rows = update_batch_skip_locked(
+            self.db,
+            Notification,
+            [
+                Notification.delivery_status == NotificationDeliveryStatus.PENDING.value,
+                Notification.user_id.isnot(None),
+                or_(Notification.next_attempt_at.is_(None), Notification.next_attempt_at <= now)
+            ],
+            {
+                "delivery_status": NotificationDeliveryStatus.SENDING.value,
+                "delivery_attempts": Notification.delivery_attempts + 1,
+                "next_attempt_at": now + timedelta(seconds=settings.NOTIFY_CLAIM_TIMEOUT)
+            },
+            [
+                Notification.id, Notification.user_id, Notification.title,
+                Notification.message, Notification.delivery_attempts,
+                Notification.created_at
+            ],
+            batch_size or settings.NOTIFY_BATCH_SIZE
+        )
+        
+        chat_ids = {}
+        if rows:
+            chat_ids = dict(self.db.execute(
+                select(User.id, User.telegram_id).where(
+                    User.id.in_({row.user_id for row in rows})
+                )
+            ).all())
+        self.db.commit()
+        
+        return sorted(
+            (
+                PendingDelivery(
+                    id=row.id,
+                    chat_id=chat_ids.get(row.user_id),
+                    title=row.title,
+                    message=row.message,
+                    attempts=row.delivery_attempts,
+                    created_at=row.created_at
+                )
+                for row in rows
+            ),
+            key=lambda delivery: delivery.id
+        )
+    
+    def record_deliveries(self, results: List[DeliveryResult], now: datetime = None):
+        """Store delivery outcomes in one executemany UPDATE (commits)"""
+        if not results:
+            return
         
-        logger.info(f"Broadcast notification sent to {count} users")
+        now = now or datetime.utcnow()
+        table = Notification.__table__
+        self.db.execute(
+            update(table)
+            .where(table.c.id == bindparam("n_id"))
+            .values(
+                delivery_status=bindparam("n_status"),
+                sent_via_bot=bindparam("n_sent"),
+                delivered_at=bindparam("n_delivered_at"),
+                next_attempt_at=bindparam("n_next_attempt_at"),
+                delivery_error=bindparam("n_error")
+            ),
+            [
+                {
+                    "n_id": result.id,
+                    "n_status": result.status.value,
+                    "n_sent": result.status == NotificationDeliveryStatus.SENT,
+                    "n_delivered_at": now if result.status == NotificationDeliveryStatus.SENT else None,
+                    "n_next_attempt_at": result.retry_at,
+                    "n_error": result.error[:255] if result.error else None
+                }
+                for result in sorted(results, key=lambda result: result.id)
+            ]
+        )
+        self.db.commit()
+    
+    def release_stale_deliveries(self, now: datetime = None) -> int:
+        """
+        Return notifications whose worker stopped while sending them to the
+        queue (commits). Delivery is at least once: such a message may
+        have been sent before the worker stopped.
+        """
+        now = now or datetime.utcnow()
+        released = self.db.execute(
+            update(Notification)
+            .where(
+                Notification.delivery_status == NotificationDeliveryStatus.SENDING.value,
+                Notification.next_attempt_at <= now
+            )
+            .values(
+                delivery_status=NotificationDeliveryStatus.PENDING.value,
+                next_attempt_at=now
+            )
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        self.db.commit()
         
-        return count
+        if released:
+            logger.warning(f"Requeued {released} notifications from stopped delivery workers")
+        return released
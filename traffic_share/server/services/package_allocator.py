@@ -0,0 +1,285 @@
+"""
+Package allocation engine - set-based allocation of packages to buyers
+
+On PostgreSQL a pull is a single statement:
+
+    candidates  available packages, FOR UPDATE SKIP LOCKED, excluding
+                user + IP pairs the buyer already holds
+    picked      DISTINCT ON (user_id, ip) - at most one package per pair
+    allocated   UPDATE ... RETURNING
+    logged      bulk INSERT into package_allocations
+
+Concurrent pulls of the same buyer are serialized with a transaction-level
+advisory lock, so two pulls can not both hand out the same user + IP pair.
+Other databases (SQLite in tests / local dev) use an equivalent fixed
+number of queries without row locking.
+"""
+
+from collections import namedtuple
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy import insert, text, update
+from sqlalchemy.orm import Session
+
+from traffic_share.server.models import Package, PackageAllocation, PackageStatus
+from traffic_share.server.schemas import PacketInfo
+from traffic_share.server.config import settings
+from traffic_share.server.admin_alerts import admin_alerts
+
+
+# Advisory lock namespace for per-buyer allocation (arbitrary, app-wide)
+ALLOCATION_LOCK_NAMESPACE = 7301
+
+# Row shape returned by both allocation paths
+AllocatedRow = namedtuple(
+    "AllocatedRow",
+    ["id", "package_uuid", "user_id", "ip", "size_bytes", "allocated_at"]
+)
+
+# Result of allocate(): packets for the buyer and (id, expires_at) pairs
+# for the allocation reaper
+Allocation = namedtuple("Allocation", ["packages", "deadlines"])
+
+
+class PackageAllocator:
+    """Allocates packages to buyers in one round trip"""
+
+    # Candidates scanned per requested package, leaves room for
+    # rows dropped by DISTINCT ON (user_id, ip)
+    SCAN_FACTOR = 4
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def allocate(
+        self,
+        buyer_id: int,
+        max_count: int,
+        region: Optional[str] = None,
+        candidate_ids: Optional[Iterable[int]] = None
+    ) -> Allocation:
+        """
+        Allocate up to max_count packages to buyer
+        Enforces: one user + one IP = one package per buyer.
+        candidate_ids restricts allocation to the given package ids.
+        Does not commit - callers own the transaction and hand the
+        deadlines to the allocation reaper once it is committed.
+        """
+        if max_count <= 0:
+            return Allocation([], [])
+
+        if candidate_ids is not None:
+            candidate_ids = list(candidate_ids)
+            if not candidate_ids:
+                return Allocation([], [])
+
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=settings.PACKAGE_ALLOCATION_TTL)
+
+        if self.db.get_bind().dialect.name == "postgresql":
+            rows = self._allocate_postgres(
+                buyer_id, max_count, region, candidate_ids, now, expires_at
+            )
+        else:
+            rows = self._allocate_generic(
+                buyer_id, max_count, region, candidate_ids, now, expires_at
+            )
+
+        if not rows and candidate_ids is None:
+            admin_alerts.emit(
+                f"allocation_exhausted:{region or 'any'}",
+                f"No packages available for buyer {buyer_id} (region {region or 'any'})"
+            )
+
+        packages = [
+            PacketInfo(
+                uuid=row.package_uuid,
+                user_id=row.user_id,
+                ip=row.ip,
+                size_bytes=row.size_bytes or 0,
+                assigned_at=row.allocated_at
+            )
+            for row in rows
+        ]
+        return Allocation(packages, [(row.id, expires_at) for row in rows])
+
+    def still_available(self, package_ids: Iterable[int]) -> List[Tuple[int, Optional[str]]]:
+        """(id, region) of the given packages that can still be allocated"""
+        package_ids = list(package_ids)
+        if not package_ids:
+            return []
+
+        rows = self.db.query(Package.id, Package.region).filter(
+            Package.id.in_(package_ids),
+            Package.status == PackageStatus.AVAILABLE.value,
+            Package.assigned_buyer_id.is_(None)
+        ).all()
+
+        return [(row.id, row.region) for row in rows]
+
+    def _allocate_postgres(
+        self,
+        buyer_id: int,
+        max_count: int,
+        region: Optional[str],
+        candidate_ids: Optional[List[int]],
+        now: datetime,
+        expires_at: datetime
+    ) -> list:
+        """Single CTE statement: lock, dedupe, update, log"""
+        filters = []
+        params = {
+            "buyer_id": buyer_id,
+            "max_count": max_count,
+            "scan_limit": max_count * self.SCAN_FACTOR,
+            "available": PackageStatus.AVAILABLE.value,
+            "allocated": PackageStatus.ALLOCATED.value,
+            "in_progress": PackageStatus.IN_PROGRESS.value,
+            "now": now,
+            "expires_at": expires_at
+        }
+
+        if region:
+            filters.append("AND p.region = :region")
+            params["region"] = region
+
+        if candidate_ids is not None:
+            filters.append("AND p.id = ANY(:candidate_ids)")
+            params["candidate_ids"] = candidate_ids
+            params["scan_limit"] = max(params["scan_limit"], len(candidate_ids))
+
+        self.db.execute(
+            text("SELECT pg_advisory_xact_lock(:namespace, :buyer_id)"),
+            {"namespace": ALLOCATION_LOCK_NAMESPACE, "buyer_id": buyer_id}
+        )
+
+        stmt = text(f"""
+            WITH candidates AS (
+                SELECT p.id, p.user_id, p.ip
+                FROM packages p
+                WHERE p.status = :available
+                  AND p.assigned_buyer_id IS NULL
+                  {" ".join(filters)}
+                  AND NOT EXISTS (
+                      SELECT 1 FROM packages held
+                      WHERE held.assigned_buyer_id = :buyer_id
+                        AND held.user_id = p.user_id
+                        AND held.ip = p.ip
+                        AND held.status IN (:allocated, :in_progress)
+                  )
+                ORDER BY p.id
+                LIMIT :scan_limit
+                FOR UPDATE OF p SKIP LOCKED
+            ),
+            picked AS (
+                SELECT DISTINCT ON (user_id, ip) id
+                FROM candidates
+                ORDER BY user_id, ip, id
+            ),
+            chosen AS (
+                SELECT id FROM picked ORDER BY id LIMIT :max_count
+            ),
+            allocated AS (
+                UPDATE packages p
+                SET status = :allocated,
+                    assigned_buyer_id = :buyer_id,
+                    allocated_at = :now,
+                    expires_at = :expires_at
+                FROM chosen
+                WHERE p.id = chosen.id
+                RETURNING p.id, p.package_uuid, p.user_id, p.ip,
+                          p.size_bytes, p.allocated_at
+            ),
+            logged AS (
+                INSERT INTO package_allocations
+                    (package_id, buyer_id, status, bytes_used, allocated_at)
+                SELECT id, :buyer_id, :allocated, 0, allocated_at
+                FROM allocated
+            )
+            SELECT id, package_uuid, user_id, ip, size_bytes, allocated_at
+            FROM allocated
+            ORDER BY id
+        """)
+
+        return self.db.execute(stmt, params).all()
+
+    def _allocate_generic(
+        self,
+        buyer_id: int,
+        max_count: int,
+        region: Optional[str],
+        candidate_ids: Optional[List[int]],
+        now: datetime,
+        expires_at: datetime
+    ) -> list:
+        """Same rules in a fixed number of queries (no row locking)"""
+        query = self.db.query(
+            Package.id, Package.package_uuid, Package.user_id,
+            Package.ip, Package.size_bytes
+        ).filter(
+            Package.status == PackageStatus.AVAILABLE.value,
+            Package.assigned_buyer_id.is_(None)
+        )
+
+        if region:
+            query = query.filter(Package.region == region)
+
+        if candidate_ids is not None:
+            query = query.filter(Package.id.in_(candidate_ids))
+
+        candidates = query.order_by(Package.id).limit(
+            max(max_count * self.SCAN_FACTOR, len(candidate_ids or ()))
+        ).all()
+
+        held = {
+            (row.user_id, row.ip)
+            for row in self.db.query(Package.user_id, Package.ip).filter(
+                Package.assigned_buyer_id == buyer_id,
+                Package.status.in_([
+                    PackageStatus.ALLOCATED.value,
+                    PackageStatus.IN_PROGRESS.value
+                ])
+            ).distinct()
+        }
+
+        chosen = []
+        for row in candidates:
+            pair = (row.user_id, row.ip)
+            if pair in held:
+                continue
+            held.add(pair)
+            chosen.append(row)
+            if len(chosen) >= max_count:
+                break
+
+        if not chosen:
+            return []
+
+        table = Package.__table__
+        self.db.execute(
+            update(table)
+            .where(table.c.id.in_([row.id for row in chosen]))
+            .values(
+                status=PackageStatus.ALLOCATED.value,
+                assigned_buyer_id=buyer_id,
+                allocated_at=now,
+                expires_at=expires_at
+            )
+        )
+        self.db.execute(insert(PackageAllocation.__table__), [
+            {
+                "package_id": row.id,
+                "buyer_id": buyer_id,
+                "status": PackageStatus.ALLOCATED.value,
+                "bytes_used": 0,
+                "allocated_at": now
+            }
+            for row in chosen
+        ])
+
+        return [
+            AllocatedRow(row.id, row.package_uuid, row.user_id, row.ip, row.size_bytes, now)
+            for row in chosen
+        ]
+
@@ -0,0 +1,374 @@
+"""
+Bulk package ingestion
+
+Streams packages from NDJSON or CSV input in chunks. Each chunk is
+validated in memory, its user ids are checked with one set-based query,
+and the valid rows are loaded into packages:
+
+    PostgreSQL  COPY into a temporary staging table, then one
+    (psycopg2)  INSERT ... SELECT ... ON CONFLICT (package_uuid)
+    other       multi-row INSERT ... ON CONFLICT (package_uuid), with the
+                PostgreSQL or SQLite insert construct
+
+Each chunk is its own transaction, so a large import makes steady progress
+and never holds locks for the whole file. Conflicting uuids are skipped, or
+with on_conflict="update" refreshed while the package is still available
+(allocated packages are never touched).
+"""
+
+import csv
+import io
+import ipaddress
+import json
+import time
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+
+from traffic_share.core.exceptions import ValidationError
+from traffic_share.server.config import settings
+from traffic_share.server.logger import logger
+from traffic_share.server.models import Package, PackageStatus, User
+
+
+FORMAT_NDJSON = "ndjson"
+FORMAT_CSV = "csv"
+
+CONFLICT_SKIP = "skip"
+CONFLICT_UPDATE = "update"
+
+# Columns loaded from input, in staging / COPY order
+COLUMNS = ("package_uuid", "user_id", "ip", "size_bytes", "size_gb", "region")
+
+STAGING_TABLE = "package_ingest_staging"
+
+# Bound parameters per statement on SQLite builds before 3.32
+SQLITE_MAX_VARIABLES = 999
+
+# Rows per INSERT: one parameter per inserted column (the input columns
+# plus status, bytes_sent, created_at) and one for the conflict filter
+INSERT_BATCH_ROWS = (SQLITE_MAX_VARIABLES - 1) // (len(COLUMNS) + 3)
+
+Row = Dict[str, object]
+
+
+def detect_format(filename: Optional[str], declared: Optional[str] = None) -> str:
+    """Input format from an explicit value or the file extension"""
+    if declared:
+        declared = declared.lower()
+        if declared in ("ndjson", "jsonl", "json"):
+            return FORMAT_NDJSON
+        if declared == "csv":
+            return FORMAT_CSV
+        raise ValidationError(f"Unsupported format: {declared}")
+
+    if filename and filename.lower().endswith(".csv"):
+        return FORMAT_CSV
+    return FORMAT_NDJSON
+
+
+def read_records(lines: Iterable[str], fmt: str) -> Iterator[Tuple[int, object]]:
+    """(line number, raw record) pairs; unparsable lines yield the error text"""
+    if fmt == FORMAT_CSV:
+        reader = csv.DictReader(lines)
+        for record in reader:
+            yield reader.line_num, record
+        return
+
+    for line_no, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield line_no, json.loads(line)
+        except ValueError as e:
+            yield line_no, f"invalid JSON: {e.msg}"
+
+
+def normalize(record: object) -> Row:
+    """Validated package row, raises ValueError with the reason"""
+    if isinstance(record, str):
+        raise ValueError(record)
+    if not isinstance(record, dict):
+        raise ValueError("record is not an object")
+
+    package_uuid = str(record.get("package_uuid") or record.get("uuid") or "").strip()
+    if not package_uuid:
+        raise ValueError("missing uuid")
+    if len(package_uuid) > 100:
+        raise ValueError("uuid too long")
+
+    try:
+        user_id = int(record.get("user_id"))
+    except (TypeError, ValueError):
+        raise ValueError("invalid user_id")
+
+    try:
+        ip = str(ipaddress.ip_address(str(record.get("ip", "")).strip()))
+    except ValueError:
+        raise ValueError("invalid ip")
+
+    try:
+        size_bytes = int(record.get("size_bytes") or 0)
+        size_gb = record.get("size_gb")
+        size_gb = float(size_gb) if size_gb not in (None, "") else None
+    except (TypeError, ValueError):
+        raise ValueError("invalid size")
+    if size_bytes < 0:
+        raise ValueError("invalid size")
+
+    region = (record.get("region") or None)
+    if region is not None:
+        region = str(region).strip().upper()[:10] or None
+
+    return {
+        "package_uuid": package_uuid,
+        "user_id": user_id,
+        "ip": ip,
+        "size_bytes": size_bytes,
+        "size_gb": size_gb,
+        "region": region
+    }
+
+
+class IngestReport:
+    """Counters and per-row errors of one ingest run"""
+
+    def __init__(self, max_errors: int):
+        self.max_errors = max_errors
+        self.received = 0
+        self.inserted = 0
+        self.updated = 0
+        self.skipped = 0
+        self.failed = 0
+        self.errors: List[Dict[str, object]] = []
+        self.error_counts: Dict[str, int] = {}
+        self.started_at = time.monotonic()
+        self.duration_seconds = 0.0
+
+    def error(self, line: int, reason: str):
+        self.failed += 1
+        self.error_counts[reason] = self.error_counts.get(reason, 0) + 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"line": line, "error": reason})
+
+    def finish(self):
+        self.duration_seconds = time.monotonic() - self.started_at
+
+    @property
+    def rows_per_second(self) -> float:
+        if self.duration_seconds <= 0:
+            return 0.0
+        return self.received / self.duration_seconds
+
+    def as_dict(self) -> dict:
+        return {
+            "received": self.received,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "errors": self.errors,
+            "error_counts": self.error_counts,
+            "duration_seconds": round(self.duration_seconds, 3),
+            "rows_per_second": round(self.rows_per_second, 1)
+        }
+
+
+class PackageIngestor:
+    """Chunked, set-based package loader"""
+
+    def __init__(
+        self,
+        db: Session,
+        chunk_size: int = None,
+        on_conflict: str = CONFLICT_SKIP,
+        max_errors: int = None
+    ):
+        if on_conflict not in (CONFLICT_SKIP, CONFLICT_UPDATE):
+            raise ValidationError(f"Unsupported conflict mode: {on_conflict}")
+
+        self.db = db
+        self.chunk_size = chunk_size or settings.PACKAGE_INGEST_CHUNK_SIZE
+        self.on_conflict = on_conflict
+        self.max_errors = max_errors or settings.PACKAGE_INGEST_MAX_ERRORS
+        self._known_users: Set[int] = set()
+
+    def ingest(self, records: Iterable[Tuple[int, object]]) -> IngestReport:
+        """Load (line number, record) pairs, committing chunk by chunk"""
+        report = IngestReport(self.max_errors)
+        chunk: List[Tuple[int, Row]] = []
+
+        for line_no, record in records:
+            report.received += 1
+            try:
+                chunk.append((line_no, normalize(record)))
+            except ValueError as e:
+                report.error(line_no, str(e))
+                continue
+
+            if len(chunk) >= self.chunk_size:
+                self._load_chunk(chunk, report)
+                chunk = []
+
+        if chunk:
+            self._load_chunk(chunk, report)
+
+        report.finish()
+        logger.info(
+            f"Package ingest: {report.received} rows, {report.inserted} inserted, "
+            f"{report.updated} updated, {report.skipped} skipped, {report.failed} failed "
+            f"({report.rows_per_second:.0f} rows/s)"
+        )
+        return report
+
+    def ingest_lines(self, lines: Iterable[str], fmt: str) -> IngestReport:
+        """Load NDJSON or CSV text lines"""
+        return self.ingest(read_records(lines, fmt))
+
+    def _missing_users(self, user_ids: Set[int]) -> Set[int]:
+        """User ids of a chunk that do not exist (one query per chunk)"""
+        unknown = user_ids - self._known_users
+        if unknown:
+            found = set(self.db.execute(
+                select(User.id).where(User.id.in_(unknown))
+            ).scalars())
+            self._known_users |= found
+        return user_ids - self._known_users
+
+    def _load_chunk(self, chunk: List[Tuple[int, Row]], report: IngestReport):
+        """Validate users and uuids of one chunk and write it"""
+        missing = self._missing_users({row["user_id"] for _, row in chunk})
+
+        rows: Dict[str, Row] = {}
+        for line_no, row in chunk:
+            if row["user_id"] in missing:
+                report.error(line_no, "user not found")
+            elif row["package_uuid"] in rows:
+                report.error(line_no, "duplicate uuid in input")
+            else:
+                rows[row["package_uuid"]] = row
+
+        if not rows:
+            return
+
+        try:
+            dialect = self.db.get_bind().dialect
+            if dialect.name == "postgresql" and dialect.driver == "psycopg2":
+                written = self._copy_merge(list(rows.values()))
+            else:
+                written = self._insert_merge(list(rows.values()))
+            self.db.commit()
+        except Exception as e:
+            self.db.rollback()
+            logger.error(f"Package ingest chunk failed: {e}")
+            for line_no, row in chunk:
+                if rows.get(row["package_uuid"]) is row:
+                    report.error(line_no, "database error")
+            return
+
+        if self.on_conflict == CONFLICT_UPDATE:
+            report.updated += written[1]
+        report.inserted += written[0]
+        report.skipped += len(rows) - written[0] - written[1]
+
+    def _copy_merge(self, rows: List[Row]) -> Tuple[int, int]:
+        """COPY rows into a staging table and merge; (inserted, updated)"""
+        self.db.execute(text(f"""
+            CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} (
+                package_uuid VARCHAR(100) NOT NULL,
+                user_id INTEGER NOT NULL,
+                ip VARCHAR(45) NOT NULL,
+                size_bytes BIGINT NOT NULL,
+                size_gb DOUBLE PRECISION,
+                region VARCHAR(10)
+            ) ON COMMIT DROP
+        """))
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([
+                "" if row[column] is None else row[column] for column in COLUMNS
+            ])
+        buffer.seek(0)
+
+        cursor = self.db.connection().connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY {STAGING_TABLE} ({', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+                buffer
+            )
+        finally:
+            cursor.close()
+
+        if self.on_conflict == CONFLICT_UPDATE:
+            conflict = """
+                DO UPDATE SET
+                    user_id = EXCLUDED.user_id,
+                    ip = EXCLUDED.ip,
+                    size_bytes = EXCLUDED.size_bytes,
+                    size_gb = EXCLUDED.size_gb,
+                    region = EXCLUDED.region
+                WHERE packages.status = :available
+            """
+        else:
+            conflict = "DO NOTHING"
+
+        # xmax = 0 only for freshly inserted rows
+        result = self.db.execute(text(f"""
+            INSERT INTO packages
+                (package_uuid, user_id, ip, size_bytes, size_gb, region,
+                 status, bytes_sent, created_at)
+            SELECT package_uuid, user_id, ip, size_bytes, size_gb, region,
+                   :available, 0, now() AT TIME ZONE 'utc'
+            FROM {STAGING_TABLE}
+            ON CONFLICT (package_uuid) {conflict}
+            RETURNING (xmax = 0) AS inserted
+        """), {"available": PackageStatus.AVAILABLE.value}).scalars().all()
+
+        inserted = sum(1 for flag in result if flag)
+        return inserted, len(result) - inserted
+
+    def _insert_merge(self, rows: List[Row]) -> Tuple[int, int]:
+        """Multi-row upsert for databases without COPY; (inserted, updated)"""
+        if self.db.get_bind().dialect.name == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+
+        table = Package.__table__
+        uuids = [row["package_uuid"] for row in rows]
+        existing = set()
+        for start in range(0, len(uuids), SQLITE_MAX_VARIABLES):
+            existing.update(self.db.execute(
+                select(table.c.package_uuid).where(
+                    table.c.package_uuid.in_(uuids[start:start + SQLITE_MAX_VARIABLES])
+                )
+            ).scalars())
+
+        now = datetime.utcnow()
+        changed = 0
+        # Stay below SQLite's bound parameter limit
+        for start in range(0, len(rows), INSERT_BATCH_ROWS):
+            stmt = insert(table).values([
+                {**row, "status": PackageStatus.AVAILABLE.value, "bytes_sent": 0, "created_at": now}
+                for row in rows[start:start + INSERT_BATCH_ROWS]
+            ])
+            if self.on_conflict == CONFLICT_UPDATE:
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=["package_uuid"],
+                    set_={
+                        column: stmt.excluded[column]
+                        for column in COLUMNS if column != "package_uuid"
+                    },
+                    where=table.c.status == PackageStatus.AVAILABLE.value
+                )
+            else:
+                stmt = stmt.on_conflict_do_nothing(index_elements=["package_uuid"])
+            changed += self.db.execute(stmt).rowcount
+
+        inserted = len(rows) - len(existing)
+        return inserted, max(changed - inserted, 0)
@@ -6,11 +6,12 @@ import hashlib
 import base64
 import json
 from datetime import datetime
-from typing import Optional
+from typing import Optional, Tuple
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-import httpx
 
-from traffic_share.server.models import Payment, User
+from traffic_share.server.models import Payment, PaymentStatus, User
 from traffic_share.server.schemas import (
     WithdrawRequest, WithdrawResponse,
     PaymentStatusResponse
@@ -22,6 +23,9 @@ from traffic_share.core.exceptions import (
 from traffic_share.server.config import settings
 from traffic_share.server.logger import logger
 from traffic_share.server.utils import create_audit_log
+from traffic_share.server.admin_alerts import admin_alerts
+from traffic_share.server.http_clients import http_clients
+from traffic_share.server.daily_reports import report_counters
 
 
 class CryptomusPaymentService:
@@ -47,14 +51,8 @@ class CryptomusPaymentService:
         
         return signature
     
-    async def create_payout(
-        self, 
-        user_id: int, 
-        request: WithdrawRequest
-    ) -> WithdrawResponse:
-        """Create payout request via Cryptomus"""
-        # Get user
-        user = self.db.query(User).filter(User.id == user_id).first()
+    def _validate_withdrawal(self, user: Optional[User], request: WithdrawRequest):
+        """Validate withdrawal amount against limits and balance"""
         if not user:
             raise ResourceNotFoundError("User not found")
         
@@ -74,16 +72,78 @@ class CryptomusPaymentService:
             raise InsufficientBalanceError(
                 f"Insufficient balance. Available: ${user.balance:.2f}"
             )
-        
-        # Create payment record
-        payment = Payment(
+    
+    @staticmethod
+    def _new_payment(user_id: int, request: WithdrawRequest) -> Payment:
+        """Build pending payment record for a withdrawal"""
+        return Payment(
             user_id=user_id,
             amount=request.amount,
-            currency="USD",
-            method=request.method,
-            target=request.target,
-            status="pending"
+            payment_method=request.method,
+            payment_address=request.target,
+            status=PaymentStatus.PENDING
         )
+    
+    async def _submit_payout(
+        self, 
+        payment_id: int, 
+        request: WithdrawRequest
+    ) -> tuple[str, dict]:
+        """
+        Send payout request to Cryptomus
+        Returns (order_id, payout_info), raises PaymentError on API errors
+        """
+        # Prepare Cryptomus API request
+        order_id = f"payout_{payment_id}_{int(datetime.utcnow().timestamp())}"
+        
+        payout_data = {
+            "amount": str(request.amount),
+            "currency": "USD",
+            "network": "TRX",  # USDT TRC20 as default
+            "order_id": order_id,
+            "address": request.target,
+            "is_subtract": "0"  # Don't subtract fee from amount
+        }
+        
+        # Generate signature
+        signature = self._generate_signature(payout_data)
+        
+        # Make API request
+        headers = {
+            "merchant": self.merchant_id,
+            "sign": signature,
+            "Content-Type": "application/json"
+        }
+        
+        response = await http_clients.request(
+            "cryptomus",
+            "POST",
+            f"{self.api_url}/payout",
+            json=payout_data,
+            headers=headers
+        )
+        
+        result = response.json()
+        
+        if response.status_code == 200 and result.get("state") == 0:
+            return order_id, result.get("result", {})
+        
+        # API error
+        error_msg = result.get("message", "Unknown error")
+        raise PaymentError(f"Cryptomus API error: {error_msg}")
+    
+    async def create_payout(
+        self, 
+        user_id: int, 
+        request: WithdrawRequest
+    ) -> WithdrawResponse:
+        """Create payout request via Cryptomus"""
+        # Get user
+        user = self.db.query(User).filter(User.id == user_id).first()
+        self._validate_withdrawal(user, request)
+        
+        # Create payment record
+        payment = self._new_payment(user_id, request)
         
         self.db.add(payment)
         self.db.flush()  # Get payment ID
@@ -92,84 +152,45 @@ class CryptomusPaymentService:
         user.balance -= request.amount
         
         try:
-            # Prepare Cryptomus API request
-            order_id = f"payout_{payment.id}_{int(datetime.utcnow().timestamp())}"
+            order_id, payout_info = await self._submit_payout(payment.id, request)
             
-            payout_data = {
-                "amount": str(request.amount),
-                "currency": "USD",
-                "network": "TRX",  # USDT TRC20 as default
-                "order_id": order_id,
-                "address": request.target,
-                "is_subtract": "0"  # Don't subtract fee from amount
-            }
+            payment.status = PaymentStatus.PROCESSING
+            payment.external_id = payout_info.get("uuid")
             
-            # Generate signature
-            signature = self._generate_signature(payout_data)
+            self.db.commit()
             
-            # Make API request
-            headers = {
-                "merchant": self.merchant_id,
-                "sign": signature,
-                "Content-Type": "application/json"
-            }
+            logger.info(
+                f"Payout created for user {user_id}: "
+                f"${request.amount} to {request.target}"
+            )
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.api_url}/payout",
-                    json=payout_data,
-                    headers=headers,
-                    timeout=30.0
-                )
-                
-                result = response.json()
-                
-                if response.status_code == 200 and result.get("state") == 0:
-                    # Success
-                    payout_info = result.get("result", {})
-                    
-                    payment.status = "processing"
-                    payment.tx_reference = payout_info.get("uuid")
-                    payment.processed_at = datetime.utcnow()
-                    
-                    self.db.commit()
-                    
-                    logger.info(
-                        f"Payout created for user {user_id}: "
-                        f"${request.amount} to {request.target}"
-                    )
-                    
-                    create_audit_log(
-                        self.db,
-                        action="create_payout",
-                        entity_type="payment",
-                        entity_id=payment.id,
-                        user_id=user_id,
-                        details={
-                            "amount": request.amount,
-                            "target": request.target,
-                            "order_id": order_id
-                        }
-                    )
-                    
-                    return WithdrawResponse(
-                        payment_id=payment.id,
-                        status="processing",
-                        message="Payout request submitted successfully"
-                    )
-                else:
-                    # API error
-                    error_msg = result.get("message", "Unknown error")
-                    raise PaymentError(f"Cryptomus API error: {error_msg}")
+            create_audit_log(
+                self.db,
+                action="create_payout",
+                entity_type="payment",
+                entity_id=payment.id,
+                user_id=user_id,
+                details={
+                    "amount": request.amount,
+                    "target": request.target,
+                    "order_id": order_id
+                }
+            )
+            
+            return WithdrawResponse(
+                payment_id=payment.id,
+                status="processing",
+                message="Payout request submitted successfully"
+            )
         
         except Exception as e:
             # Refund balance on error
             user.balance += request.amount
-            payment.status = "failed"
-            payment.error_message = str(e)
+            payment.status = PaymentStatus.FAILED
             self.db.commit()
             
             logger.error(f"Payout failed for user {user_id}: {str(e)}")
+            admin_alerts.emit("payout_failed", f"Payout failed for user {user_id}: {e}")
             
             raise PaymentError(f"Failed to create payout: {str(e)}")
     
@@ -191,6 +212,14 @@ class CryptomusPaymentService:
         """
         Handle Cryptomus webhook for payout status update
         """
+        handled, _ = self._apply_webhook(payload)
+        return handled
+    
+    def _apply_webhook(self, payload: dict) -> Tuple[bool, Optional[float]]:
+        """
+        Apply Cryptomus webhook to the payment
+        Returns (handled, amount of a payout completed by this webhook)
+        """
         try:
             # Extract order_id to find payment
             order_id = payload.get("order_id", "")
@@ -198,12 +227,12 @@ class CryptomusPaymentService:
             # Parse payment_id from order_id (format: payout_{payment_id}_{timestamp})
             if not order_id.startswith("payout_"):
                 logger.warning(f"Invalid order_id format: {order_id}")
-                return False
+                return False, None
             
             parts = order_id.split("_")
             if len(parts) < 3:
                 logger.warning(f"Cannot parse payment_id from order_id: {order_id}")
-                return False
+                return False, None
             
             payment_id = int(parts[1])
             
@@ -214,13 +243,15 @@ class CryptomusPaymentService:
             
             if not payment:
                 logger.warning(f"Payment {payment_id} not found for webhook")
-                return False
+                return False, None
             
             # Update payment based on status
             status = payload.get("status", "")
             
+            completed_now = False
             if status == "paid" or status == "paid_over":
-                # Payout completed
+                # Payout completed (webhooks can repeat)
+                completed_now = payment.status != PaymentStatus.COMPLETED
                 payment.status = "completed"
                 payment.completed_at = datetime.utcnow()
                 payment.tx_hash = payload.get("txid")
@@ -238,17 +269,22 @@ class CryptomusPaymentService:
                     user.balance += payment.amount
                 
                 logger.warning(f"Payout {payment_id} failed, balance refunded")
+                admin_alerts.emit(
+                    "payout_rejected",
+                    f"Payout {payment_id} failed at Cryptomus ({status}), balance refunded"
+                )
             
             elif status == "process":
                 payment.status = "processing"
             
             self.db.commit()
             
-            return True
+            return True, payment.amount if completed_now else None
             
         except Exception as e:
             logger.error(f"Webhook processing error: {str(e)}")
-            return False
+            admin_alerts.emit("payout_webhook_error", f"Webhook processing error: {e}")
+            return False, None
 
 
 class PaymentService:
@@ -277,3 +313,118 @@ class PaymentService:
     def handle_webhook(self, payload: dict) -> bool:
         """Handle payment webhook"""
         return self.cryptomus.handle_webhook(payload)
+
+
+class AsyncCryptomusPaymentService(CryptomusPaymentService):
+    """Cryptomus integration on an AsyncSession"""
+    
+    def __init__(self, db: AsyncSession):
+        super().__init__(db)
+    
+    async def create_payout(
+        self, 
+        user_id: int, 
+        request: WithdrawRequest
+    ) -> WithdrawResponse:
+        """Create payout request via Cryptomus"""
+        # Lock the user row so concurrent withdrawals cannot overdraw
+        result = await self.db.execute(
+            select(User).where(User.id == user_id).with_for_update()
+        )
+        user = result.scalar_one_or_none()
+        self._validate_withdrawal(user, request)
+        
+        # Create payment record
+        payment = self._new_payment(user_id, request)
+        
+        self.db.add(payment)
+        await self.db.flush()  # Get payment ID
+        
+        # Reserve balance (deduct immediately, will refund if payout fails)
+        user.balance -= request.amount
+        await self.db.commit()
+        
+        try:
+            order_id, payout_info = await self._submit_payout(payment.id, request)
+        except Exception as e:
+            # Refund balance on error
+            await self.db.refresh(user, with_for_update=True)
+            user.balance += request.amount
+            payment.status = PaymentStatus.FAILED
+            await self.db.commit()
+            
+            logger.error(f"Payout failed for user {user_id}: {str(e)}")
+            admin_alerts.emit("payout_failed", f"Payout failed for user {user_id}: {e}")
+            
+            raise PaymentError(f"Failed to create payout: {str(e)}")
+        
+        payment.status = PaymentStatus.PROCESSING
+        payment.external_id = payout_info.get("uuid")
+        await self.db.commit()
+        
+        logger.info(
+            f"Payout created for user {user_id}: "
+            f"${request.amount} to {request.target}"
+        )
+        
+        await self.db.run_sync(
+            lambda session: create_audit_log(
+                session,
+                action="create_payout",
+                entity_type="payment",
+                entity_id=payment.id,
+                user_id=user_id,
+                details={
+                    "amount": request.amount,
+                    "target": request.target,
+                    "order_id": order_id
+                }
+            )
+        )
+        
+        return WithdrawResponse(
+            payment_id=payment.id,
+            status="processing",
+            message="Payout request submitted successfully"
+        )
+
+
+class AsyncPaymentService:
+    """
+    Async variant of PaymentService
+    Payouts run natively on the AsyncSession; the remaining calls reuse
+    the sync logic through run_sync
+    """
+    
+    def __init__(self, db: AsyncSession):
+        self.db = db
+        self.cryptomus = AsyncCryptomusPaymentService(db)
+    
+    async def request_withdrawal(
+        self, 
+        user_id: int, 
+        request: WithdrawRequest
+    ) -> WithdrawResponse:
+        """Request withdrawal"""
+        return await self.cryptomus.create_payout(user_id, request)
+    
+    async def get_payment_status(
+        self, 
+        payment_id: int, 
+        user_id: int = None
+    ) -> PaymentStatusResponse:
+        """Get payment status"""
+        return await self.db.run_sync(
+            lambda session: CryptomusPaymentService(session).get_payment_status(
+                payment_id, user_id
+            )
+        )
+    
+    async def handle_webhook(self, payload: dict) -> bool:
+        """Handle payment webhook"""
+        handled, payout = await self.db.run_sync(
+            lambda session: CryptomusPaymentService(session)._apply_webhook(payload)
+        )
+        if payout is not None:
+            await report_counters.record_payout(payout)
+        return handled
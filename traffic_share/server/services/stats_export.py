@@ -0,0 +1,351 @@
+"""
+Streaming statistics export
+
+Exports users, traffic sessions and payments without loading whole tables: a
+column-only select is read through a server-side cursor in batches of
+EXPORT_CHUNK_SIZE rows, and each batch is encoded and handed out as bytes
+before the next one is fetched, so memory stays bounded by one batch.
+
+Formats:
+    csv       plain CSV
+    csv.gz    gzip-compressed CSV, compressed incrementally
+    parquet   one row group per batch (needs the optional pyarrow package)
+
+Rows can be limited to a date range, or exported incrementally: the export
+covers rows changed since the previous incremental export of the dataset,
+up to the moment the export started. That moment is returned as the new
+watermark and stored in EXPORT_STATE_PATH once the export has completed.
+"""
+
+import csv
+import enum
+import io
+import json
+import os
+import zlib
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import Boolean, DateTime, Float, Integer, BigInteger, select
+from sqlalchemy.orm import Session
+
+from traffic_share.core.exceptions import ValidationError
+from traffic_share.server.config import settings
+from traffic_share.server.database import SessionLocal
+from traffic_share.server.logger import logger
+from traffic_share.server.models import User, TrafficSession, Payment
+
+
+FORMAT_CSV = "csv"
+FORMAT_CSV_GZIP = "csv.gz"
+FORMAT_PARQUET = "parquet"
+
+FORMATS = {
+    FORMAT_CSV: "text/csv",
+    FORMAT_CSV_GZIP: "application/gzip",
+    FORMAT_PARQUET: "application/vnd.apache.parquet",
+}
+
+
+class ExportDataset:
+    """Exported columns of one table"""
+
+    def __init__(self, name: str, model, columns: List[str], range_column: str, changed_column: str):
+        self.name = name
+        self.model = model
+        self.columns = [getattr(model, column) for column in columns]
+        # Date range filter, and "changed since" filter for incremental exports
+        self.range_column = getattr(model, range_column)
+        self.changed_column = getattr(model, changed_column)
+
+    @property
+    def headers(self) -> List[str]:
+        return [column.key for column in self.columns]
+
+
+DATASETS: Dict[str, ExportDataset] = {
+    dataset.name: dataset for dataset in (
+        ExportDataset(
+            "users", User,
+            ["id", "telegram_id", "username", "balance", "total_earned",
+             "is_active", "is_banned", "created_at", "last_login_at", "updated_at"],
+            range_column="created_at",
+            changed_column="updated_at"
+        ),
+        ExportDataset(
+            "traffic", TrafficSession,
+            ["id", "session_uuid", "user_id", "status", "bytes_uploaded",
+             "bytes_downloaded", "total_bytes", "earnings", "region",
+             "started_at", "ended_at", "updated_at"],
+            range_column="started_at",
+            changed_column="updated_at"
+        ),
+        ExportDataset(
+            "payments", Payment,
+            ["id", "user_id", "amount", "payment_method", "status",
+             "created_at", "completed_at", "updated_at"],
+            range_column="created_at",
+            changed_column="updated_at"
+        ),
+    )
+}
+
+
+def get_dataset(name: str) -> ExportDataset:
+    dataset = DATASETS.get(name)
+    if dataset is None:
+        raise ValidationError(f"Unknown export dataset: {name}")
+    return dataset
+
+
+def check_format(fmt: str) -> str:
+    if fmt not in FORMATS:
+        raise ValidationError(f"Unsupported export format: {fmt}")
+    if fmt == FORMAT_PARQUET:
+        _pyarrow()
+    return fmt
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        raise ValidationError("Parquet export requires the pyarrow package")
+    return pyarrow
+
+
+def _plain(value):
+    """CSV cell of a column value"""
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+class ExportState:
+    """Incremental export watermarks, one per dataset, kept in a JSON file"""
+
+    def __init__(self, path: str = None):
+        self.path = path or settings.EXPORT_STATE_PATH
+
+    def _read(self) -> Dict[str, str]:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, dataset: str) -> Optional[datetime]:
+        value = self._read().get(dataset)
+        return datetime.fromisoformat(value) if value else None
+
+    def set(self, dataset: str, watermark: datetime):
+        state = self._read()
+        state[dataset] = watermark.isoformat()
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+
+
+class _Sink:
+    """Write-only file that hands out what was written since the last drain"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+
+class _CSVEncoder:
+    def __init__(self, headers: List[str], compress: bool):
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+        # wbits=31 writes a gzip header and trailer
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+        self._writer.writerow(headers)
+
+    def _take(self) -> bytes:
+        data = self._buffer.getvalue().encode("utf-8")
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return self._compressor.compress(data) if self._compressor else data
+
+    def encode(self, rows) -> bytes:
+        self._writer.writerows([_plain(value) for value in row] for row in rows)
+        return self._take()
+
+    def finish(self) -> bytes:
+        data = self._take()
+        if self._compressor:
+            data += self._compressor.flush()
+        return data
+
+
+class _ParquetEncoder:
+    _TYPES = (
+        (Boolean, "bool_"),
+        (BigInteger, "int64"),
+        (Integer, "int64"),
+        (Float, "float64"),
+    )
+
+    def __init__(self, dataset: ExportDataset):
+        pa = _pyarrow()
+        self._pa = pa
+        self._schema = pa.schema([
+            (column.key, self._arrow_type(column.type)) for column in dataset.columns
+        ])
+        self._sink = _Sink()
+        self._writer = pa.parquet.ParquetWriter(self._sink, self._schema, compression="snappy")
+
+    def _arrow_type(self, column_type):
+        if isinstance(column_type, DateTime):
+            return self._pa.timestamp("us")
+        for sql_type, arrow_type in self._TYPES:
+            if isinstance(column_type, sql_type):
+                return getattr(self._pa, arrow_type)()
+        return self._pa.string()
+
+    def encode(self, rows) -> bytes:
+        columns = list(zip(*rows))
+        arrays = [
+            self._pa.array(
+                [value.value if isinstance(value, enum.Enum) else value for value in values],
+                type=field.type
+            )
+            for field, values in zip(self._schema, columns)
+        ]
+        self._writer.write_table(self._pa.Table.from_arrays(arrays, schema=self._schema))
+        return self._sink.drain()
+
+    def finish(self) -> bytes:
+        self._writer.close()
+        return self._sink.drain()
+
+
+class StatsExporter:
+    """Streams one dataset as CSV / gzip CSV / Parquet bytes"""
+
+    def __init__(self, db: Session, chunk_size: int = None):
+        self.db = db
+        self.chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+        self.rows_exported = 0
+
+    def window(
+        self,
+        name: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None
+    ):
+        """Column-only, ordered select of the rows to export"""
+        dataset = get_dataset(name)
+        query = select(*dataset.columns)
+
+        if start is not None:
+            query = query.where(dataset.range_column >= start)
+        if end is not None:
+            query = query.where(dataset.range_column < end)
+        if since is not None:
+            query = query.where(dataset.changed_column > since)
+        if until is not None:
+            query = query.where(dataset.changed_column <= until)
+
+        return query.order_by(dataset.model.id)
+
+    def iter_bytes(
+        self,
+        name: str,
+        fmt: str = FORMAT_CSV,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None
+    ) -> Iterator[bytes]:
+        """Encoded export, one piece per fetched batch"""
+        dataset = get_dataset(name)
+        check_format(fmt)
+
+        if fmt == FORMAT_PARQUET:
+            encoder = _ParquetEncoder(dataset)
+        else:
+            encoder = _CSVEncoder(dataset.headers, compress=fmt == FORMAT_CSV_GZIP)
+
+        result = self.db.execute(
+            self.window(name, start, end, since, until).execution_options(
+                stream_results=True, yield_per=self.chunk_size
+            )
+        )
+        try:
+            for rows in result.partitions():
+                self.rows_exported += len(rows)
+                data = encoder.encode(rows)
+                if data:
+                    yield data
+        finally:
+            result.close()
+
+        data = encoder.finish()
+        if data:
+            yield data
+
+        logger.info(f"Exported {self.rows_exported} {name} rows as {fmt}")
+
+
+def open_export(
+    name: str,
+    fmt: str = FORMAT_CSV,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    incremental: bool = False,
+    state: ExportState = None
+) -> Tuple[Iterator[bytes], Optional[datetime]]:
+    """
+    Validate an export and return (byte stream, watermark)
+    The stream uses its own database session, so it can outlive the
+    request handler; an incremental watermark is stored only after the
+    last byte was produced.
+    """
+    get_dataset(name)
+    check_format(fmt)
+
+    state = state or ExportState()
+    since, until = (state.get(name), datetime.utcnow()) if incremental else (None, None)
+
+    def stream() -> Iterator[bytes]:
+        db = SessionLocal()
+        try:
+            yield from StatsExporter(db).iter_bytes(name, fmt, start, end, since, until)
+        finally:
+            db.close()
+        if incremental:
+            state.set(name, until)
+
+    return stream(), until
@@ -3,14 +3,18 @@ Traffic service - manages traffic sessions and logs
 """
 
 from datetime import datetime, timedelta
-from typing import List, Optional
+from typing import Dict, List, Optional
+from sqlalchemy import bindparam
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from traffic_share.server.models import TrafficSession, TrafficLog, User
+from traffic_share.server.models import (
+    TrafficSession, TrafficSessionStatus, User
+)
 from traffic_share.server.schemas import (
     TrafficStartRequest, TrafficStartResponse,
     TrafficUpdateRequest, TrafficUpdateResponse,
+    TrafficUpdateItemResult, TrafficUpdateBatchResponse,
     TrafficStopRequest, TrafficStopResponse,
     TrafficSessionResponse, TrafficSummaryResponse
 )
@@ -18,9 +22,15 @@ from traffic_share.core.security import SecurityManager
 from traffic_share.core.exceptions import (
     ResourceNotFoundError, ValidationError, SessionError
 )
-from traffic_share.server.utils import calculate_earnings, bytes_to_gb
+from traffic_share.server.utils import (
+    calculate_earnings, bytes_to_gb, keyset_paginate, update_batch_skip_locked
+)
 from traffic_share.server.config import settings
 from traffic_share.server.logger import logger
+from traffic_share.server.traffic_buffer import traffic_buffer, SessionDelta
+from traffic_share.server.rollups import apply_rollups, read_summary
+from traffic_share.server.metrics import TRAFFIC_UPDATES, TRAFFIC_BYTES
+from traffic_share.server.admin_alerts import admin_alerts
 
 
 class TrafficService:
@@ -72,63 +82,169 @@ class TrafficService:
         user_id: int, 
         request: TrafficUpdateRequest
     ) -> TrafficUpdateResponse:
-        """Update traffic session with new data"""
+        """
+        Update traffic session with new data
+        Counters and logs go through the write-behind buffer
+        """
         # Get session
-        session = self.db.query(TrafficSession).filter(
-            TrafficSession.session_id == request.session_id,
+        session = self.db.query(
+            TrafficSession.id, TrafficSession.status
+        ).filter(
+            TrafficSession.session_uuid == request.session_id,
             TrafficSession.user_id == user_id
         ).first()
         
         if not session:
             raise ResourceNotFoundError("Session not found")
         
-        if session.status != "active":
+        if session.status != TrafficSessionStatus.ACTIVE:
             raise SessionError("Session is not active")
         
-        # Update session totals
-        session.bytes_tx += request.bytes_tx
-        session.bytes_rx += request.bytes_rx
-        session.bytes_total = session.bytes_tx + session.bytes_rx
-        session.updated_at = datetime.utcnow()
-        
-        # Create traffic log entry
-        traffic_log = TrafficLog(
-            session_id=session.id,
-            bytes_tx=request.bytes_tx,
-            bytes_rx=request.bytes_rx,
-            interval_seconds=request.interval_seconds
-        )
+        if settings.TRAFFIC_BUFFER_ENABLED:
+            traffic_buffer.add(
+                session.id, request.bytes_tx, request.bytes_rx, user_id=user_id
+            )
+        else:
+            traffic_buffer.write_through(
+                self.db, session.id, request.bytes_tx, request.bytes_rx,
+                user_id=user_id
+            )
         
-        self.db.add(traffic_log)
-        self.db.commit()
+        TRAFFIC_UPDATES.inc()
+        TRAFFIC_BYTES.inc(request.bytes_tx + request.bytes_rx)
         
         return TrafficUpdateResponse(ok=True)
     
+    def update_sessions_batch(
+        self,
+        user_id: int,
+        updates: List[TrafficUpdateRequest]
+    ) -> TrafficUpdateBatchResponse:
+        """
+        Apply many traffic updates, possibly for several sessions
+        All sessions are checked with one query; accepted updates are
+        written in one transaction (or queued in the write-behind buffer).
+        Invalid items are reported per item and do not fail the batch.
+        """
+        if len(updates) > settings.MAX_TRAFFIC_UPDATES_PER_BATCH:
+            raise ValidationError(
+                f"At most {settings.MAX_TRAFFIC_UPDATES_PER_BATCH} updates per batch"
+            )
+        
+        sessions = {
+            row.session_uuid: row
+            for row in self.db.query(
+                TrafficSession.id, TrafficSession.session_uuid, TrafficSession.status
+            ).filter(
+                TrafficSession.user_id == user_id,
+                TrafficSession.session_uuid.in_({u.session_id for u in updates})
+            )
+        }
+        
+        now = datetime.utcnow()
+        results = []
+        deltas = {}
+        logs = []
+        
+        for index, update in enumerate(updates):
+            session = sessions.get(update.session_id)
+            error = None
+            if session is None:
+                error = "Session not found"
+            elif session.status != TrafficSessionStatus.ACTIVE:
+                error = "Session is not active"
+            
+            results.append(TrafficUpdateItemResult(
+                index=index,
+                session_id=update.session_id,
+                ok=error is None,
+                error=error
+            ))
+            if error:
+                continue
+            
+            delta = deltas.get(session.id)
+            if delta is None:
+                delta = deltas[session.id] = SessionDelta(session.id, user_id)
+            delta.bytes_tx += update.bytes_tx
+            delta.bytes_rx += update.bytes_rx
+            delta.last_seen_at = now
+            
+            logs.append({
+                "session_id": session.id,
+                "timestamp": now,
+                "bytes_transferred": update.bytes_tx + update.bytes_rx,
+                "connection_count": 0
+            })
+        
+        if logs:
+            if settings.TRAFFIC_BUFFER_ENABLED:
+                traffic_buffer.add_batch(list(deltas.values()), logs)
+            else:
+                traffic_buffer.apply_batch(self.db, list(deltas.values()), logs)
+                self.db.commit()
+            
+            TRAFFIC_UPDATES.inc(len(logs))
+            TRAFFIC_BYTES.inc(sum(log["bytes_transferred"] for log in logs))
+        
+        return TrafficUpdateBatchResponse(
+            ok=len(logs) == len(updates),
+            accepted=len(logs),
+            rejected=len(updates) - len(logs),
+            results=results
+        )
+    
     def stop_session(
         self, 
         user_id: int, 
         request: TrafficStopRequest
     ) -> TrafficStopResponse:
-        """Stop traffic session"""
+        """
+        Stop traffic session
+        The row is locked, so a concurrent stale sweep either skips it or
+        has settled it already. A session the sweep closed is settled again
+        from the final counters and only the difference is credited.
+        """
         # Get session
         session = self.db.query(TrafficSession).filter(
-            TrafficSession.session_id == request.session_id,
+            TrafficSession.session_uuid == request.session_id,
             TrafficSession.user_id == user_id
-        ).first()
+        ).with_for_update().first()
         
         if not session:
             raise ResourceNotFoundError("Session not found")
         
+        if session.status == TrafficSessionStatus.COMPLETED:
+            raise SessionError("Session is not active")
+        
+        # Final counters are absolute, so buffered deltas are superseded
+        traffic_buffer.discard_session(session.id)
+        
+        # Bytes already counted in rollups are the flushed session total
+        rolled_up_bytes = session.total_bytes or 0
+        # Earnings already credited by the stale session sweep
+        paid = 0.0
+        if session.status != TrafficSessionStatus.ACTIVE:
+            paid = session.earnings or 0.0
+        
         # Update final bytes
-        session.bytes_tx = request.final_bytes_tx
-        session.bytes_rx = request.final_bytes_rx
-        session.bytes_total = session.bytes_tx + session.bytes_rx
-        session.end_time = datetime.utcnow()
-        session.status = "completed"
+        session.bytes_uploaded = request.final_bytes_tx
+        session.bytes_downloaded = request.final_bytes_rx
+        session.total_bytes = session.bytes_uploaded + session.bytes_downloaded
+        if session.status == TrafficSessionStatus.ACTIVE:
+            session.ended_at = datetime.utcnow()
+        session.status = TrafficSessionStatus.COMPLETED
         
-        # Calculate earnings
-        earnings = calculate_earnings(session.bytes_total, settings.PRICE_PER_GB)
-        session.earnings = earnings
+        # Calculate earnings (never below what was paid already)
+        earnings = max(calculate_earnings(session.total_bytes, settings.PRICE_PER_GB) - paid, 0.0)
+        session.earnings = paid + earnings
+        
+        apply_rollups(self.db, [(
+            user_id,
+            session.ended_at,
+            session.total_bytes - rolled_up_bytes,
+            earnings
+        )])
         
         # Update user balance
         user = self.db.query(User).filter(User.id == user_id).first()
@@ -140,78 +256,237 @@ class TrafficService:
         
         logger.info(
             f"Session {request.session_id} stopped. "
-            f"Total: {bytes_to_gb(session.bytes_total):.2f} GB, "
-            f"Earnings: ${earnings:.2f}"
+            f"Total: {bytes_to_gb(session.total_bytes):.2f} GB, "
+            f"Earnings: ${session.earnings:.2f}"
         )
         
-        return TrafficStopResponse(ok=True, earnings=earnings)
+        return TrafficStopResponse(ok=True, earnings=session.earnings)
     
-    def get_session_history(
-        self, 
-        user_id: int, 
-        page: int = 1, 
-        page_size: int = 50
-    ) -> List[TrafficSessionResponse]:
-        """Get user's traffic session history"""
-        offset = (page - 1) * page_size
+    def settle_stale_sessions(
+        self,
+        batch_size: int = None,
+        max_batches: int = None
+    ) -> int:
+        """
+        Close active sessions without updates for STALE_SESSION_TIMEOUT
+        Each batch is claimed with one UPDATE ... SKIP LOCKED ... RETURNING
+        (marked failed, ended at their last update) and settled in the same
+        transaction like stop_session: earnings from the reported bytes are
+        stored on the session and added to the user balance and rollups.
+        Concurrent sweeps skip each other's rows, so no session is paid twice.
+        Returns number of sessions closed
+        """
+        batch_size = batch_size or settings.STALE_SWEEP_BATCH_SIZE
+        max_batches = max_batches or settings.STALE_SWEEP_MAX_BATCHES
+        now = datetime.utcnow()
+        cutoff = now - timedelta(seconds=settings.STALE_SESSION_TIMEOUT)
         
-        sessions = self.db.query(TrafficSession).filter(
-            TrafficSession.user_id == user_id
-        ).order_by(
-            TrafficSession.start_time.desc()
-        ).offset(offset).limit(page_size).all()
+        count = 0
+        for batch in range(1, max_batches + 1):
+            rows = update_batch_skip_locked(
+                self.db,
+                TrafficSession,
+                [
+                    TrafficSession.status == TrafficSessionStatus.ACTIVE,
+                    TrafficSession.updated_at < cutoff
+                ],
+                {
+                    "status": TrafficSessionStatus.FAILED,
+                    "ended_at": TrafficSession.updated_at,
+                    "updated_at": now
+                },
+                [
+                    TrafficSession.id, TrafficSession.user_id,
+                    TrafficSession.total_bytes, TrafficSession.ended_at
+                ],
+                batch_size
+            )
+            if not rows:
+                self.db.commit()
+                break
+            
+            earnings = self._settle_sessions(rows)
+            self.db.commit()
+            
+            count += len(rows)
+            logger.info(
+                f"Closed {len(rows)} stale sessions (batch {batch}), "
+                f"earnings: ${earnings:.2f}"
+            )
+            
+            if len(rows) < batch_size:
+                break
+        
+        if count >= settings.ADMIN_ALERT_STALE_SESSIONS:
+            admin_alerts.emit(
+                "stale_sessions",
+                f"{count} sessions went stale in one sweep (no updates for "
+                f"{settings.STALE_SESSION_TIMEOUT}s) - clients may be failing to report"
+            )
         
-        return [TrafficSessionResponse.from_orm(s) for s in sessions]
+        return count
     
-    def get_traffic_summary(self, user_id: int) -> TrafficSummaryResponse:
-        """Get aggregated traffic statistics"""
-        now = datetime.utcnow()
+    def _settle_sessions(self, rows) -> float:
+        """
+        Store earnings of closed (id, user_id, total_bytes, ended_at) rows
+        and credit them to users. Does not commit.
+        """
+        session_earnings = [
+            (row, calculate_earnings(row.total_bytes or 0, settings.PRICE_PER_GB))
+            for row in rows
+        ]
         
-        # Daily
-        daily_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-        daily_stats = self.db.query(
-            func.sum(TrafficSession.bytes_total).label("bytes"),
-            func.sum(TrafficSession.earnings).label("earnings")
-        ).filter(
-            TrafficSession.user_id == user_id,
-            TrafficSession.start_time >= daily_start
-        ).first()
+        sessions = TrafficSession.__table__
+        self.db.execute(
+            sessions.update()
+            .where(sessions.c.id == bindparam("s_id"))
+            .values(earnings=bindparam("s_earnings")),
+            [
+                {"s_id": row.id, "s_earnings": earnings}
+                for row, earnings in session_earnings
+            ]
+        )
         
-        # Weekly
-        weekly_start = now - timedelta(days=7)
-        weekly_stats = self.db.query(
-            func.sum(TrafficSession.bytes_total).label("bytes"),
-            func.sum(TrafficSession.earnings).label("earnings")
-        ).filter(
-            TrafficSession.user_id == user_id,
-            TrafficSession.start_time >= weekly_start
-        ).first()
+        per_user: Dict[int, float] = {}
+        for row, earnings in session_earnings:
+            if earnings:
+                per_user[row.user_id] = per_user.get(row.user_id, 0.0) + earnings
         
-        # Monthly
-        monthly_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        monthly_stats = self.db.query(
-            func.sum(TrafficSession.bytes_total).label("bytes"),
-            func.sum(TrafficSession.earnings).label("earnings")
-        ).filter(
-            TrafficSession.user_id == user_id,
-            TrafficSession.start_time >= monthly_start
-        ).first()
+        if per_user:
+            users = User.__table__
+            # Sorted ids keep lock order stable between concurrent sweeps
+            self.db.execute(
+                users.update()
+                .where(users.c.id == bindparam("u_id"))
+                .values(
+                    balance=users.c.balance + bindparam("u_earnings"),
+                    total_earned=users.c.total_earned + bindparam("u_earnings")
+                ),
+                [
+                    {"u_id": user_id, "u_earnings": per_user[user_id]}
+                    for user_id in sorted(per_user)
+                ]
+            )
+            
+            # Bytes reached the rollups with the heartbeats, only earnings are new
+            apply_rollups(self.db, [
+                (row.user_id, row.ended_at, 0, earnings)
+                for row, earnings in session_earnings
+                if earnings
+            ])
         
-        # Total
-        total_stats = self.db.query(
-            func.sum(TrafficSession.bytes_total).label("bytes"),
-            func.sum(TrafficSession.earnings).label("earnings")
-        ).filter(
+        return sum(per_user.values())
+    
+    def get_session_history(
+        self, 
+        user_id: int, 
+        page: int = 1, 
+        page_size: int = 50,
+        cursor: str = None
+    ) -> tuple[List[TrafficSessionResponse], Optional[str]]:
+        """
+        Get user's traffic session history, newest first
+        Returns (sessions, next_cursor). page is only honoured without a
+        cursor, for clients that still page by number.
+        """
+        query = self.db.query(TrafficSession).filter(
             TrafficSession.user_id == user_id
-        ).first()
+        )
+        
+        if page > 1 and not cursor:
+            sessions = query.order_by(
+                TrafficSession.started_at.desc(),
+                TrafficSession.id.desc()
+            ).offset((page - 1) * page_size).limit(page_size).all()
+            return [TrafficSessionResponse.from_orm(s) for s in sessions], None
+        
+        sessions, next_cursor = keyset_paginate(
+            query, [TrafficSession.started_at, TrafficSession.id], cursor, page_size
+        )
+        
+        return [TrafficSessionResponse.from_orm(s) for s in sessions], next_cursor
+    
+    def get_traffic_summary(self, user_id: int) -> TrafficSummaryResponse:
+        """Get aggregated traffic statistics (from rollups)"""
+        stats = read_summary(self.db, user_id)
         
         return TrafficSummaryResponse(
-            daily_gb=bytes_to_gb(daily_stats.bytes or 0),
-            weekly_gb=bytes_to_gb(weekly_stats.bytes or 0),
-            monthly_gb=bytes_to_gb(monthly_stats.bytes or 0),
-            total_gb=bytes_to_gb(total_stats.bytes or 0),
-            daily_earnings=daily_stats.earnings or 0.0,
-            weekly_earnings=weekly_stats.earnings or 0.0,
-            monthly_earnings=monthly_stats.earnings or 0.0,
-            total_earnings=total_stats.earnings or 0.0
+            daily_gb=bytes_to_gb(stats["daily_bytes"]),
+            weekly_gb=bytes_to_gb(stats["weekly_bytes"]),
+            monthly_gb=bytes_to_gb(stats["monthly_bytes"]),
+            total_gb=bytes_to_gb(stats["total_bytes"]),
+            daily_earnings=stats["daily_earnings"],
+            weekly_earnings=stats["weekly_earnings"],
+            monthly_earnings=stats["monthly_earnings"],
+            total_earnings=stats["total_earnings"]
+        )
+
+
+class AsyncTrafficService:
+    """
+    Async variant of TrafficService
+    Runs the same logic on an AsyncSession, so DB waits yield to the event loop
+    """
+    
+    def __init__(self, db: AsyncSession):
+        self.db = db
+    
+    async def start_session(
+        self, 
+        user_id: int, 
+        request: TrafficStartRequest
+    ) -> TrafficStartResponse:
+        """Start new traffic session"""
+        return await self.db.run_sync(
+            lambda session: TrafficService(session).start_session(user_id, request)
+        )
+    
+    async def update_session(
+        self, 
+        user_id: int, 
+        request: TrafficUpdateRequest
+    ) -> TrafficUpdateResponse:
+        """Update traffic session with new data"""
+        return await self.db.run_sync(
+            lambda session: TrafficService(session).update_session(user_id, request)
+        )
+    
+    async def update_sessions_batch(
+        self,
+        user_id: int,
+        updates: List[TrafficUpdateRequest]
+    ) -> TrafficUpdateBatchResponse:
+        """Apply many traffic updates in one transaction"""
+        return await self.db.run_sync(
+            lambda session: TrafficService(session).update_sessions_batch(user_id, updates)
+        )
+    
+    async def stop_session(
+        self, 
+        user_id: int, 
+        request: TrafficStopRequest
+    ) -> TrafficStopResponse:
+        """Stop traffic session"""
+        return await self.db.run_sync(
+            lambda session: TrafficService(session).stop_session(user_id, request)
+        )
+    
+    async def get_session_history(
+        self, 
+        user_id: int, 
+        page: int = 1, 
+        page_size: int = 50,
+        cursor: str = None
+    ) -> tuple[List[TrafficSessionResponse], Optional[str]]:
+        """Get user's traffic session history"""
+        return await self.db.run_sync(
+            lambda session: TrafficService(session).get_session_history(
+                user_id, page, page_size, cursor
+            )
+        )
+    
+    async def get_traffic_summary(self, user_id: int) -> TrafficSummaryResponse:
+        """Get aggregated traffic statistics"""
+        return await self.db.run_sync(
+            lambda session: TrafficService(session).get_traffic_summary(user_id)
         )
@@ -5,6 +5,7 @@ User service - manages user profile and devices
 from datetime import datetime
 from typing import List, Optional
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from traffic_share.server.models import User, Device
 from traffic_share.server.schemas import (
@@ -149,3 +150,57 @@ class UserService:
             "total_earned": user.total_earned,
             "currency": "USD"
         }
+
+
+class AsyncUserService:
+    """
+    Async variant of UserService
+    Runs the same logic on an AsyncSession, so DB waits yield to the event loop
+    """
+    
+    def __init__(self, db: AsyncSession):
+        self.db = db
+    
+    async def get_user_profile(self, user_id: int) -> UserProfile:
+        """Get user profile"""
+        return await self.db.run_sync(
+            lambda session: UserService(session).get_user_profile(user_id)
+        )
+    
+    async def update_user_profile(
+        self, 
+        user_id: int, 
+        request: UpdateUserRequest
+    ) -> UserProfile:
+        """Update user profile"""
+        return await self.db.run_sync(
+            lambda session: UserService(session).update_user_profile(user_id, request)
+        )
+    
+    async def register_device(
+        self, 
+        user_id: int, 
+        request: DeviceRegisterRequest
+    ) -> DeviceResponse:
+        """Register or update user device"""
+        return await self.db.run_sync(
+            lambda session: UserService(session).register_device(user_id, request)
+        )
+    
+    async def get_user_devices(self, user_id: int) -> List[DeviceResponse]:
+        """Get all devices for a user"""
+        return await self.db.run_sync(
+            lambda session: UserService(session).get_user_devices(user_id)
+        )
+    
+    async def deactivate_device(self, user_id: int, device_id: str) -> bool:
+        """Deactivate a user device"""
+        return await self.db.run_sync(
+            lambda session: UserService(session).deactivate_device(user_id, device_id)
+        )
+    
+    async def get_user_balance(self, user_id: int) -> dict:
+        """Get user balance details"""
+        return await self.db.run_sync(
+            lambda session: UserService(session).get_user_balance(user_id)
+        )
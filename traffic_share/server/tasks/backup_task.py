@@ -63,17 +63,5 @@ def cleanup_old_backups(backup_dir: Path, days: int = 7):
         logger.error(f"Backup cleanup failed: {e}")
 
 
-async def backup_task_loop():
-    """Periodic backup task loop"""
-    while True:
-        try:
-            await backup_database()
-        except Exception as e:
-            logger.error(f"Backup task error: {e}")
-        
-        # Sleep for configured interval (default 24 hours)
-        await asyncio.sleep(settings.BACKUP_TASK_INTERVAL)
-
-
 if __name__ == "__main__":
     asyncio.run(backup_database())
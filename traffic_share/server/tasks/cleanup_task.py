@@ -6,8 +6,8 @@ import asyncio
 from datetime import datetime, timedelta
 
 from traffic_share.server.database import get_db_context
-from traffic_share.server.models import LoginCode, TrafficSession, Package
-from traffic_share.server.config import settings
+from traffic_share.server.models import LoginCode
+from traffic_share.server.services.traffic_service import TrafficService
 from traffic_share.server.logger import logger
 
 
@@ -30,24 +30,14 @@ def cleanup_expired_login_codes():
 
 
 def cleanup_stale_sessions():
-    """Mark stale active sessions as failed"""
+    """Close stale active sessions and settle their earnings"""
     with get_db_context() as db:
         try:
-            # Sessions active for more than 24 hours without update
-            cutoff = datetime.utcnow() - timedelta(hours=24)
+            service = TrafficService(db)
+            count = service.settle_stale_sessions()
             
-            stale_sessions = db.query(TrafficSession).filter(
-                TrafficSession.status == "active",
-                TrafficSession.updated_at < cutoff
-            ).all()
-            
-            for session in stale_sessions:
-                session.status = "failed"
-                session.end_time = datetime.utcnow()
-            
-            if stale_sessions:
-                db.commit()
-                logger.info(f"Marked {len(stale_sessions)} stale sessions as failed")
+            if count > 0:
+                logger.info(f"Closed {count} stale sessions")
                 
         except Exception as e:
             logger.error(f"Error cleaning stale sessions: {e}")
@@ -73,24 +63,13 @@ async def run_cleanup_tasks():
     """Run all cleanup tasks"""
     logger.info("Running cleanup tasks...")
     
-    cleanup_expired_login_codes()
-    cleanup_stale_sessions()
-    cleanup_stale_packages()
+    # Blocking DB work runs in a thread so the event loop stays responsive
+    await asyncio.to_thread(cleanup_expired_login_codes)
+    await asyncio.to_thread(cleanup_stale_sessions)
+    await asyncio.to_thread(cleanup_stale_packages)
     
     logger.info("Cleanup tasks completed")
 
 
-async def cleanup_task_loop():
-    """Periodic cleanup task loop"""
-    while True:
-        try:
-            await run_cleanup_tasks()
-        except Exception as e:
-            logger.error(f"Cleanup task error: {e}")
-        
-        # Sleep for configured interval (default 5 minutes)
-        await asyncio.sleep(settings.CLEANUP_TASK_INTERVAL)
-
-
 if __name__ == "__main__":
     asyncio.run(run_cleanup_tasks())
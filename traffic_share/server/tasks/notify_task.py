@@ -1,52 +1,69 @@
 """
-Notification task - process notification queue
+Notification task - deliver the notification queue through Telegram
+
+Pending notifications are claimed in batches of NOTIFY_BATCH_SIZE
+(FOR UPDATE SKIP LOCKED), sent concurrently by the throttled
+TelegramSender and their outcomes stored with one bulk UPDATE per batch.
+A run drains at most NOTIFY_MAX_BATCHES batches; the next run continues
+a larger backlog.
 """
 
 import asyncio
 from datetime import datetime
 
-from traffic_share.server.database import get_db_context
-from traffic_share.server.models import Notification
+from traffic_share.bot.delivery import TelegramSender, telegram_sender
+from traffic_share.server.config import settings
+from traffic_share.server.database import SessionLocal
 from traffic_share.server.logger import logger
+from traffic_share.server.metrics import NOTIFICATION_DELIVERIES, NOTIFICATION_LAG
+from traffic_share.server.models import NotificationDeliveryStatus
+from traffic_share.server.services.notification_service import NotificationService
 
 
-def process_pending_notifications():
-    """Process notifications that need to be sent"""
-    with get_db_context() as db:
+async def deliver_pending_notifications(
+    session_factory=SessionLocal,
+    sender: TelegramSender = None,
+    max_batches: int = None
+) -> int:
+    """Send due notifications; returns the number delivered"""
+    sender = sender or telegram_sender
+    max_batches = max_batches or settings.NOTIFY_MAX_BATCHES
+    
+    def call(method, *args):
+        db = session_factory()
         try:
-            # Get unsent notifications
-            notifications = db.query(Notification).filter(
-                Notification.sent_via_bot == False
-            ).limit(100).all()
+            return method(NotificationService(db), *args)
+        finally:
+            db.close()
             
-            if not notifications:
-                return
+    await asyncio.to_thread(call, NotificationService.release_stale_deliveries)
             
-            # TODO: Send via Telegram bot
-            # For now, just mark as sent
-            for notification in notifications:
-                # In production: send to bot service
-                notification.sent_via_bot = True
+    delivered = failed = 0
+    for _ in range(max_batches):
+        deliveries = await asyncio.to_thread(call, NotificationService.claim_deliveries)
+        if not deliveries:
+            break
             
-            db.commit()
+        results = await sender.send_many(deliveries)
+        await asyncio.to_thread(call, NotificationService.record_deliveries, results)
             
-            logger.info(f"Processed {len(notifications)} notifications")
+        now = datetime.utcnow()
+        created = {delivery.id: delivery.created_at for delivery in deliveries}
+        for result in results:
+            NOTIFICATION_DELIVERIES.labels(result=result.status.value).inc()
+            if result.status == NotificationDeliveryStatus.SENT:
+                delivered += 1
+                NOTIFICATION_LAG.observe(max((now - created[result.id]).total_seconds(), 0.0))
+            elif result.status == NotificationDeliveryStatus.FAILED:
+                failed += 1
             
-        except Exception as e:
-            logger.error(f"Error processing notifications: {e}")
-
-
-async def notify_task_loop():
-    """Periodic notification processing loop"""
-    while True:
-        try:
-            process_pending_notifications()
-        except Exception as e:
-            logger.error(f"Notify task error: {e}")
-        
-        # Sleep for 1 minute
-        await asyncio.sleep(60)
+        if len(deliveries) < settings.NOTIFY_BATCH_SIZE:
+            break
+    
+    if delivered or failed:
+        logger.info(f"Notifications delivered: {delivered}, failed: {failed}")
+    return delivered
 
 
 if __name__ == "__main__":
-    asyncio.run(process_pending_notifications())
+    asyncio.run(deliver_pending_notifications())
@@ -0,0 +1,180 @@
+"""
+Partition maintenance task - range partitions for time-series tables
+
+traffic_logs is partitioned by RANGE (timestamp) (see migration
+002_partition_traffic_logs). This task keeps partitions created ahead of
+time and enforces retention by dropping whole partitions, so old log rows
+are never deleted row by row.
+"""
+
+import asyncio
+import re
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from sqlalchemy import text
+
+from traffic_share.server.database import get_db_context
+from traffic_share.server.config import settings
+from traffic_share.server.logger import logger
+
+
+# Partitioned table -> partition key column
+PARTITIONED_TABLES = {
+    "traffic_logs": "timestamp",
+}
+
+# Only one API worker runs maintenance at a time
+PARTITION_LOCK_KEY = 7302
+
+_UPPER_BOUND = re.compile(r"TO \('([^']+)'\)")
+
+
+def interval_start(moment: datetime, interval: str) -> datetime:
+    """Start of the day / ISO week containing moment"""
+    day = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if interval == "week":
+        return day - timedelta(days=day.weekday())
+    return day
+
+
+def next_boundary(moment: datetime, interval: str) -> datetime:
+    """First interval start strictly after moment"""
+    step = timedelta(days=7 if interval == "week" else 1)
+    return interval_start(moment, interval) + step
+
+
+def partition_name(table: str, start: datetime) -> str:
+    """Partition table name, e.g. traffic_logs_p20250101"""
+    return f"{table}_p{start:%Y%m%d}"
+
+
+def is_partitioned(db, table: str) -> bool:
+    """Whether table is a partitioned parent"""
+    return bool(db.execute(text("""
+        SELECT EXISTS (
+            SELECT 1 FROM pg_partitioned_table pt
+            JOIN pg_class c ON c.oid = pt.partrelid
+            WHERE c.relname = :table
+        )
+    """), {"table": table}).scalar())
+
+
+def list_partitions(db, table: str) -> List[Tuple[str, Optional[datetime]]]:
+    """(name, upper bound) of table partitions; None bound for DEFAULT"""
+    rows = db.execute(text("""
+        SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+        FROM pg_inherits i
+        JOIN pg_class parent ON parent.oid = i.inhparent
+        JOIN pg_class child ON child.oid = i.inhrelid
+        WHERE parent.relname = :table
+    """), {"table": table}).all()
+    
+    partitions = []
+    for name, bound in rows:
+        match = _UPPER_BOUND.search(bound or "")
+        partitions.append((
+            name,
+            datetime.fromisoformat(match.group(1)) if match else None
+        ))
+    return partitions
+
+
+def create_future_partitions(
+    db,
+    table: str,
+    interval: str = None,
+    ahead: int = None,
+    now: datetime = None
+) -> List[str]:
+    """Create partitions from the current one up to `ahead` intervals ahead"""
+    interval = interval or settings.PARTITION_INTERVAL
+    ahead = ahead if ahead is not None else settings.PARTITIONS_AHEAD
+    now = now or datetime.utcnow()
+    
+    horizon = interval_start(now, interval)
+    for _ in range(ahead + 1):
+        horizon = next_boundary(horizon, interval)
+    
+    # Continue after the newest existing partition so ranges never overlap
+    bounds = [upper for _, upper in list_partitions(db, table) if upper]
+    start = max(bounds + [interval_start(now, interval)])
+    
+    created = []
+    while start < horizon:
+        end = next_boundary(start, interval)
+        name = partition_name(table, start)
+        db.execute(text(
+            f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "{table}" '
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        ))
+        created.append(name)
+        start = end
+    
+    return created
+
+
+def drop_expired_partitions(
+    db,
+    table: str,
+    retention_days: int = None,
+    now: datetime = None
+) -> List[str]:
+    """Drop partitions whose whole range is older than the retention period"""
+    retention_days = retention_days or settings.TRAFFIC_LOG_RETENTION_DAYS
+    cutoff = (now or datetime.utcnow()) - timedelta(days=retention_days)
+    
+    dropped = []
+    for name, upper in list_partitions(db, table):
+        if upper is not None and upper <= cutoff:
+            db.execute(text(f'DROP TABLE IF EXISTS "{name}"'))
+            dropped.append(name)
+    
+    return dropped
+
+
+def maintain_partitions():
+    """Create upcoming and drop expired partitions of all partitioned tables"""
+    with get_db_context() as db:
+        if db.get_bind().dialect.name != "postgresql":
+            return
+        
+        locked = db.execute(
+            text("SELECT pg_try_advisory_xact_lock(:key)"),
+            {"key": PARTITION_LOCK_KEY}
+        ).scalar()
+        if not locked:
+            return
+        
+        # DDL must not queue behind long transactions and block writers
+        db.execute(text("SET LOCAL lock_timeout = '5s'"))
+        
+        for table in PARTITIONED_TABLES:
+            try:
+                if not is_partitioned(db, table):
+                    logger.warning(f"{table} is not partitioned, run migrations")
+                    continue
+                
+                created = create_future_partitions(db, table)
+                dropped = drop_expired_partitions(db, table)
+                
+                if created or dropped:
+                    logger.info(
+                        f"{table} partitions: created {created}, dropped {dropped}"
+                    )
+            except Exception as e:
+                logger.error(f"Error maintaining {table} partitions: {e}")
+                raise
+
+
+async def run_partition_maintenance():
+    """Run partition maintenance"""
+    logger.info("Running partition maintenance...")
+    
+    await asyncio.to_thread(maintain_partitions)
+    
+    logger.info("Partition maintenance completed")
+
+
+if __name__ == "__main__":
+    asyncio.run(run_partition_maintenance())
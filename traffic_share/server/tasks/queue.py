@@ -0,0 +1,221 @@
+"""
+Durable job queue - task_jobs rows claimed with FOR UPDATE SKIP LOCKED
+
+A job is queued with a run time, claimed by one worker in a single
+UPDATE ... WHERE id IN (SELECT ... FOR UPDATE SKIP LOCKED) RETURNING
+statement, and finished as succeeded, queued again with exponential
+backoff, or dead once it is out of attempts. Concurrent workers never
+block on, or both claim, the same row. Jobs whose worker died while
+running are queued again after TASK_VISIBILITY_TIMEOUT.
+
+Scheduled runs carry a dedupe key ("<task>@<run time>"), so every
+scheduler replica may enqueue a tick and it is still queued once.
+"""
+
+import json
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from traffic_share.server.models import TaskJob, TaskJobStatus
+from traffic_share.server.config import settings
+from traffic_share.server.utils import update_batch_skip_locked
+
+
+class ClaimedJob(NamedTuple):
+    """A job a worker holds until it completes or fails it"""
+    id: int
+    name: str
+    payload: Dict[str, Any]
+    attempts: int
+    max_attempts: int
+    run_at: datetime
+
+
+def _insert(db: Session):
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(TaskJob.__table__)
+
+
+def enqueue(
+    db: Session,
+    name: str,
+    payload: Optional[Dict[str, Any]] = None,
+    run_at: datetime = None,
+    dedupe_key: str = None,
+    max_attempts: int = None
+) -> bool:
+    """Queue a job (commits); False when dedupe_key was already queued"""
+    now = datetime.utcnow()
+    stmt = _insert(db).values(
+        name=name,
+        payload=json.dumps(payload) if payload else None,
+        status=TaskJobStatus.QUEUED,
+        attempts=0,
+        max_attempts=max_attempts or settings.TASK_MAX_ATTEMPTS,
+        run_at=run_at or now,
+        dedupe_key=dedupe_key,
+        created_at=now
+    ).on_conflict_do_nothing(index_elements=["dedupe_key"])
+
+    inserted = db.execute(stmt).rowcount
+    db.commit()
+    return inserted > 0
+
+
+def claim(db: Session, worker_id: str, limit: int = 1, now: datetime = None) -> List[ClaimedJob]:
+    """Claim up to limit due jobs for worker_id (commits)"""
+    now = now or datetime.utcnow()
+    rows = update_batch_skip_locked(
+        db,
+        TaskJob,
+        [TaskJob.status == TaskJobStatus.QUEUED, TaskJob.run_at <= now],
+        {
+            "status": TaskJobStatus.RUNNING,
+            "attempts": TaskJob.attempts + 1,
+            "locked_by": worker_id,
+            "locked_at": now
+        },
+        [
+            TaskJob.id, TaskJob.name, TaskJob.payload,
+            TaskJob.attempts, TaskJob.max_attempts, TaskJob.run_at
+        ],
+        limit,
+        order_by=TaskJob.run_at
+    )
+    db.commit()
+
+    return sorted(
+        (
+            ClaimedJob(
+                id=row.id,
+                name=row.name,
+                payload=json.loads(row.payload) if row.payload else {},
+                attempts=row.attempts,
+                max_attempts=row.max_attempts,
+                run_at=row.run_at
+            )
+            for row in rows
+        ),
+        key=lambda job: job.run_at
+    )
+
+
+def complete(db: Session, job: ClaimedJob):
+    """Mark a claimed job succeeded (commits)"""
+    db.execute(
+        update(TaskJob)
+        .where(TaskJob.id == job.id)
+        .values(
+            status=TaskJobStatus.SUCCEEDED,
+            locked_by=None,
+            locked_at=None,
+            last_error=None,
+            finished_at=datetime.utcnow()
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+
+def retry_delay(attempts: int) -> float:
+    """Seconds before retry number `attempts`: doubling, capped"""
+    delay = settings.TASK_RETRY_BACKOFF * 2 ** max(attempts - 1, 0)
+    return min(delay, settings.TASK_RETRY_BACKOFF_MAX)
+
+
+def fail(db: Session, job: ClaimedJob, error: str, now: datetime = None) -> bool:
+    """
+    Record a failed attempt (commits)
+    Returns True when the job was queued again, False when it is dead
+    """
+    now = now or datetime.utcnow()
+    retry = job.attempts < job.max_attempts
+
+    values = {
+        "locked_by": None,
+        "locked_at": None,
+        "last_error": error[:2000]
+    }
+    if retry:
+        values["status"] = TaskJobStatus.QUEUED
+        values["run_at"] = now + timedelta(seconds=retry_delay(job.attempts))
+    else:
+        values["status"] = TaskJobStatus.DEAD
+        values["finished_at"] = now
+
+    db.execute(
+        update(TaskJob)
+        .where(TaskJob.id == job.id)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return retry
+
+
+def defer(db: Session, job: ClaimedJob, reason: str, now: datetime = None):
+    """Queue a claimed job again without using up its attempt (commits)"""
+    now = now or datetime.utcnow()
+    db.execute(
+        update(TaskJob)
+        .where(TaskJob.id == job.id)
+        .values(
+            status=TaskJobStatus.QUEUED,
+            attempts=TaskJob.attempts - 1,
+            run_at=now + timedelta(seconds=settings.TASK_RETRY_BACKOFF),
+            locked_by=None,
+            locked_at=None,
+            last_error=reason
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+
+def recover_stale(db: Session, now: datetime = None) -> int:
+    """
+    Jobs whose worker stopped without finishing them (commits)
+    They are queued again, or dead when that was their last attempt.
+    """
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(seconds=settings.TASK_VISIBILITY_TIMEOUT)
+    stale = (TaskJob.status == TaskJobStatus.RUNNING, TaskJob.locked_at < cutoff)
+    released = {
+        "locked_by": None,
+        "locked_at": None,
+        "last_error": "Worker stopped before finishing"
+    }
+
+    db.execute(
+        update(TaskJob)
+        .where(*stale, TaskJob.attempts >= TaskJob.max_attempts)
+        .values(status=TaskJobStatus.DEAD, finished_at=now, **released)
+        .execution_options(synchronize_session=False)
+    )
+    recovered = db.execute(
+        update(TaskJob)
+        .where(*stale)
+        .values(status=TaskJobStatus.QUEUED, run_at=now, **released)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+    return recovered
+
+
+def prune_finished(db: Session, now: datetime = None) -> int:
+    """Delete finished jobs older than TASK_JOB_RETENTION_DAYS (commits)"""
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(days=settings.TASK_JOB_RETENTION_DAYS)
+
+    deleted = db.query(TaskJob).filter(
+        TaskJob.status.in_([TaskJobStatus.SUCCEEDED, TaskJobStatus.DEAD]),
+        TaskJob.finished_at < cutoff
+    ).delete(synchronize_session=False)
+    db.commit()
+    return deleted
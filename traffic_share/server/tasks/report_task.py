@@ -0,0 +1,51 @@
+"""
+Daily report task - snapshot closed days into daily_reports
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+from typing import List
+
+from traffic_share.server.database import get_db_context
+from traffic_share.server.daily_reports import day_start, snapshot_day
+from traffic_share.server.models import DailyReport
+from traffic_share.server.config import settings
+from traffic_share.server.logger import logger
+
+
+def snapshot_closed_days(now: datetime = None) -> List[datetime]:
+    """
+    Store snapshots of the last REPORT_BACKFILL_DAYS closed days that are
+    missing (yesterday on a normal run, more after downtime)
+    """
+    today = day_start(now)
+    first_day = today - timedelta(days=settings.REPORT_BACKFILL_DAYS)
+    stored = []
+
+    with get_db_context() as db:
+        existing = {
+            report_date for (report_date,) in db.query(DailyReport.report_date).filter(
+                DailyReport.report_date >= first_day,
+                DailyReport.report_date < today
+            )
+        }
+
+        day = first_day
+        while day < today:
+            if day not in existing:
+                snapshot_day(db, day, now)
+                stored.append(day)
+            day += timedelta(days=1)
+
+    return stored
+
+
+async def run_report_snapshots():
+    """Snapshot missing closed days"""
+    stored = await asyncio.to_thread(snapshot_closed_days)
+    if stored:
+        logger.info(f"Daily report snapshots stored: {len(stored)} days")
+
+
+if __name__ == "__main__":
+    asyncio.run(run_report_snapshots())
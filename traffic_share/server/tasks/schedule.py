@@ -0,0 +1,142 @@
+"""
+Task schedules - cron expressions and fixed intervals
+
+Both kinds compute the next run time from wall-clock time alone (interval
+runs are aligned to multiples of the interval since the epoch), so every
+scheduler replica arrives at the same run times and a run can be queued
+once under the key "<task>@<run time>".
+
+Cron expressions have five fields (minute hour day-of-month month
+day-of-week) with *, lists, ranges and steps, e.g. "*/15 * * * *" or
+"0 3 * * 1-5". Day-of-week 0 and 7 are Sunday. As in cron, when both
+day-of-month and day-of-week are restricted a day matching either runs.
+"""
+
+from datetime import datetime, timedelta
+from typing import List, Set, Union
+
+
+_FIELDS = (
+    ("minute", 0, 59),
+    ("hour", 0, 23),
+    ("day", 1, 31),
+    ("month", 1, 12),
+    ("weekday", 0, 7),
+)
+
+
+def _parse_field(expression: str, low: int, high: int) -> Set[int]:
+    values: Set[int] = set()
+    for part in expression.split(","):
+        step = 1
+        if "/" in part:
+            part, step_text = part.split("/", 1)
+            step = int(step_text)
+            if step <= 0:
+                raise ValueError(f"Invalid step in {expression!r}")
+
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start_text, end_text = part.split("-", 1)
+            start, end = int(start_text), int(end_text)
+        else:
+            start = int(part)
+            end = high if step > 1 else start
+
+        if start < low or end > high or start > end:
+            raise ValueError(f"Value out of range in {expression!r}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronSchedule:
+    """Five-field cron expression"""
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: {expression!r}")
+
+        self.expression = expression
+        parsed = [
+            _parse_field(field, low, high)
+            for field, (_, low, high) in zip(fields, _FIELDS)
+        ]
+        self.minutes, self.hours, self.days, self.months, weekdays = parsed
+        # cron weekday 0/7 = Sunday, Python weekday() 6 = Sunday
+        self.weekdays = {(day - 1) % 7 for day in weekdays}
+        self._any_day = fields[2] == "*"
+        self._any_weekday = fields[4] == "*"
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day_ok = moment.day in self.days
+        weekday_ok = moment.weekday() in self.weekdays
+        if self._any_day or self._any_weekday:
+            return day_ok and weekday_ok
+        return day_ok or weekday_ok
+
+    def next_after(self, moment: datetime) -> datetime:
+        """First run time strictly after moment"""
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        # Bounded search: every valid expression matches within ~4 years
+        limit = candidate + timedelta(days=366 * 4 + 1)
+
+        while candidate < limit:
+            if candidate.month not in self.months or not self._day_matches(candidate):
+                candidate = (candidate + timedelta(days=1)).replace(hour=0, minute=0)
+                continue
+            if candidate.hour not in self.hours:
+                candidate = (candidate + timedelta(hours=1)).replace(minute=0)
+                continue
+            if candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+                continue
+            return candidate
+
+        raise ValueError(f"Cron expression never matches: {self.expression!r}")
+
+    def __repr__(self) -> str:
+        return f"CronSchedule({self.expression!r})"
+
+
+class IntervalSchedule:
+    """Every N seconds, aligned to the epoch"""
+
+    EPOCH = datetime(1970, 1, 1)
+
+    def __init__(self, seconds: float):
+        if seconds <= 0:
+            raise ValueError("Interval must be positive")
+        self.seconds = seconds
+
+    def next_after(self, moment: datetime) -> datetime:
+        elapsed = (moment - self.EPOCH).total_seconds()
+        periods = int(elapsed // self.seconds) + 1
+        return self.EPOCH + timedelta(seconds=periods * self.seconds)
+
+    def __repr__(self) -> str:
+        return f"IntervalSchedule({self.seconds})"
+
+
+Schedule = Union[CronSchedule, IntervalSchedule]
+
+
+def parse_schedule(value: Union[str, int, float]) -> Schedule:
+    """Cron expression, or a number of seconds"""
+    if isinstance(value, (int, float)):
+        return IntervalSchedule(value)
+    value = value.strip()
+    if value.replace(".", "", 1).isdigit():
+        return IntervalSchedule(float(value))
+    return CronSchedule(value)
+
+
+def run_times(schedule: Schedule, after: datetime, until: datetime) -> List[datetime]:
+    """Run times in (after, until]"""
+    times = []
+    moment = schedule.next_after(after)
+    while moment <= until:
+        times.append(moment)
+        moment = schedule.next_after(moment)
+    return times
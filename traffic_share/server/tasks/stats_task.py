@@ -3,167 +3,167 @@ Statistics task - collect and aggregate system statistics
 """
 
 import asyncio
+import time
 from datetime import datetime, timedelta
-from sqlalchemy import func
+from typing import List, Tuple
+from sqlalchemy import func, and_
 
 from traffic_share.server.database import get_db_context
 from traffic_share.server.models import (
-    User, TrafficSession, Payment, Package, SystemMetric
+    User, TrafficSession, TrafficSessionStatus, Payment, PaymentStatus, Package
 )
-from traffic_share.server.utils import record_metric, bytes_to_gb
-from traffic_share.server.config import settings
+from traffic_share.core.constants import (
+    PACKAGE_STATUS_AVAILABLE, PACKAGE_STATUS_ALLOCATED, PACKAGE_STATUS_IN_PROGRESS
+)
+from traffic_share.server.utils import record_metrics, bytes_to_gb
 from traffic_share.server.logger import logger
 
 
-def collect_user_stats():
-    """Collect user statistics"""
+# (metric_name, metric_value, metric_unit)
+Metric = Tuple[str, float, str]
+
+
+def collect_user_stats() -> List[Metric]:
+    """Collect user statistics (one query)"""
+    day_ago = datetime.utcnow() - timedelta(days=1)
+    
     with get_db_context() as db:
-        try:
-            # Total users
-            total_users = db.query(func.count(User.id)).scalar()
-            record_metric(db, "users_total", total_users, "count")
-            
-            # Active users (logged in last 24h)
-            day_ago = datetime.utcnow() - timedelta(days=1)
-            active_users = db.query(func.count(User.id)).filter(
-                User.last_login_at >= day_ago
-            ).scalar()
-            record_metric(db, "users_active_24h", active_users or 0, "count")
-            
-            # Verified users
-            verified_users = db.query(func.count(User.id)).filter(
-                User.is_verified == True
-            ).scalar()
-            record_metric(db, "users_verified", verified_users or 0, "count")
-            
-            logger.info(f"User stats collected: {total_users} total, {active_users} active")
-            
-        except Exception as e:
-            logger.error(f"Error collecting user stats: {e}")
-
-
-def collect_traffic_stats():
-    """Collect traffic statistics"""
+        stats = db.query(
+            func.count(User.id).label("total"),
+            func.count(User.id).filter(User.last_login_at >= day_ago).label("active"),
+            func.count(User.id).filter(User.is_verified == True).label("verified")
+        ).one()
+    
+    logger.info(f"User stats collected: {stats.total} total, {stats.active} active")
+    
+    return [
+        ("users_total", stats.total, "count"),
+        ("users_active_24h", stats.active, "count"),
+        ("users_verified", stats.verified, "count")
+    ]
+
+
+def collect_traffic_stats() -> List[Metric]:
+    """Collect traffic statistics (one query)"""
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    started_today = TrafficSession.started_at >= today
+    
     with get_db_context() as db:
-        try:
-            # Active sessions
-            active_sessions = db.query(func.count(TrafficSession.id)).filter(
-                TrafficSession.status == "active"
-            ).scalar()
-            record_metric(db, "traffic_sessions_active", active_sessions or 0, "count")
-            
-            # Today's traffic
-            today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-            today_stats = db.query(
-                func.sum(TrafficSession.bytes_total).label("bytes"),
-                func.sum(TrafficSession.earnings).label("earnings")
-            ).filter(
-                TrafficSession.start_time >= today
-            ).first()
-            
-            today_gb = bytes_to_gb(today_stats.bytes or 0)
-            today_earnings = today_stats.earnings or 0.0
-            
-            record_metric(db, "traffic_daily_gb", today_gb, "GB")
-            record_metric(db, "earnings_daily_usd", today_earnings, "USD")
-            
-            # Total traffic
-            total_stats = db.query(
-                func.sum(TrafficSession.bytes_total).label("bytes"),
-                func.sum(TrafficSession.earnings).label("earnings")
-            ).first()
-            
-            total_gb = bytes_to_gb(total_stats.bytes or 0)
-            total_earnings = total_stats.earnings or 0.0
-            
-            record_metric(db, "traffic_total_gb", total_gb, "GB")
-            record_metric(db, "earnings_total_usd", total_earnings, "USD")
-            
-            logger.info(f"Traffic stats: {active_sessions} active, {today_gb:.2f} GB today")
-            
-        except Exception as e:
-            logger.error(f"Error collecting traffic stats: {e}")
-
-
-def collect_payment_stats():
-    """Collect payment statistics"""
+        stats = db.query(
+            func.count(TrafficSession.id).filter(
+                TrafficSession.status == TrafficSessionStatus.ACTIVE
+            ).label("active"),
+            func.sum(TrafficSession.total_bytes).filter(started_today).label("today_bytes"),
+            func.sum(TrafficSession.earnings).filter(started_today).label("today_earnings"),
+            func.sum(TrafficSession.total_bytes).label("total_bytes"),
+            func.sum(TrafficSession.earnings).label("total_earnings")
+        ).one()
+    
+    today_gb = bytes_to_gb(stats.today_bytes or 0)
+    
+    logger.info(f"Traffic stats: {stats.active} active, {today_gb:.2f} GB today")
+    
+    return [
+        ("traffic_sessions_active", stats.active, "count"),
+        ("traffic_daily_gb", today_gb, "GB"),
+        ("earnings_daily_usd", stats.today_earnings or 0.0, "USD"),
+        ("traffic_total_gb", bytes_to_gb(stats.total_bytes or 0), "GB"),
+        ("earnings_total_usd", stats.total_earnings or 0.0, "USD")
+    ]
+
+
+def collect_payment_stats() -> List[Metric]:
+    """Collect payment statistics (one query)"""
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    completed_today = and_(
+        Payment.status == PaymentStatus.COMPLETED,
+        Payment.completed_at >= today
+    )
+    
     with get_db_context() as db:
-        try:
-            # Pending payments
-            pending_payments = db.query(func.count(Payment.id)).filter(
-                Payment.status.in_(["pending", "processing"])
-            ).scalar()
-            record_metric(db, "payments_pending", pending_payments or 0, "count")
-            
-            # Completed today
-            today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-            today_payments = db.query(
-                func.count(Payment.id),
-                func.sum(Payment.amount)
-            ).filter(
-                Payment.status == "completed",
-                Payment.completed_at >= today
-            ).first()
-            
-            record_metric(db, "payments_daily_count", today_payments[0] or 0, "count")
-            record_metric(db, "payments_daily_amount", today_payments[1] or 0, "USD")
-            
-            logger.info(f"Payment stats: {pending_payments} pending")
-            
-        except Exception as e:
-            logger.error(f"Error collecting payment stats: {e}")
-
-
-def collect_package_stats():
-    """Collect package statistics"""
+        stats = db.query(
+            func.count(Payment.id).filter(
+                Payment.status.in_([PaymentStatus.PENDING, PaymentStatus.PROCESSING])
+            ).label("pending"),
+            func.count(Payment.id).filter(completed_today).label("daily_count"),
+            func.sum(Payment.amount).filter(completed_today).label("daily_amount")
+        ).one()
+    
+    logger.info(f"Payment stats: {stats.pending} pending")
+    
+    return [
+        ("payments_pending", stats.pending, "count"),
+        ("payments_daily_count", stats.daily_count, "count"),
+        ("payments_daily_amount", stats.daily_amount or 0, "USD")
+    ]
+
+
+def collect_package_stats() -> List[Metric]:
+    """Collect package statistics (one query)"""
     with get_db_context() as db:
-        try:
-            # Available packages
-            available = db.query(func.count(Package.id)).filter(
-                Package.status == "available"
-            ).scalar()
-            record_metric(db, "packages_available", available or 0, "count")
-            
-            # Allocated packages
-            allocated = db.query(func.count(Package.id)).filter(
-                Package.status == "allocated"
-            ).scalar()
-            record_metric(db, "packages_allocated", allocated or 0, "count")
-            
-            # In progress
-            in_progress = db.query(func.count(Package.id)).filter(
-                Package.status == "in_progress"
-            ).scalar()
-            record_metric(db, "packages_in_progress", in_progress or 0, "count")
-            
-            logger.info(f"Package stats: {available} available, {allocated} allocated")
-            
-        except Exception as e:
-            logger.error(f"Error collecting package stats: {e}")
+        stats = db.query(
+            func.count(Package.id).filter(
+                Package.status == PACKAGE_STATUS_AVAILABLE
+            ).label("available"),
+            func.count(Package.id).filter(
+                Package.status == PACKAGE_STATUS_ALLOCATED
+            ).label("allocated"),
+            func.count(Package.id).filter(
+                Package.status == PACKAGE_STATUS_IN_PROGRESS
+            ).label("in_progress")
+        ).one()
+    
+    logger.info(f"Package stats: {stats.available} available, {stats.allocated} allocated")
+    
+    return [
+        ("packages_available", stats.available, "count"),
+        ("packages_allocated", stats.allocated, "count"),
+        ("packages_in_progress", stats.in_progress, "count")
+    ]
+
+
+COLLECTORS = [
+    collect_user_stats,
+    collect_traffic_stats,
+    collect_payment_stats,
+    collect_package_stats
+]
 
 
 async def run_stats_collection():
-    """Run all statistics collection"""
+    """
+    Run all statistics collection
+    Collectors run concurrently (one DB session each); all metrics of the
+    run, including its duration, are written in one bulk insert.
+    """
     logger.info("Collecting system statistics...")
+    started = time.monotonic()
     
-    collect_user_stats()
-    collect_traffic_stats()
-    collect_payment_stats()
-    collect_package_stats()
+    results = await asyncio.gather(
+        *[asyncio.to_thread(collector) for collector in COLLECTORS],
+        return_exceptions=True
+    )
     
-    logger.info("Statistics collection completed")
-
-
-async def stats_task_loop():
-    """Periodic stats collection loop"""
-    while True:
-        try:
-            await run_stats_collection()
-        except Exception as e:
-            logger.error(f"Stats task error: {e}")
-        
-        # Sleep for configured interval (default 1 hour)
-        await asyncio.sleep(settings.STATS_TASK_INTERVAL)
+    metrics: List[Metric] = []
+    for collector, result in zip(COLLECTORS, results):
+        if isinstance(result, Exception):
+            logger.error(f"Error in {collector.__name__}: {result}")
+            continue
+        metrics.extend(result)
+    
+    metrics.append((
+        "stats_collection_duration_ms",
+        (time.monotonic() - started) * 1000,
+        "ms"
+    ))
+    
+    def write():
+        with get_db_context() as db:
+            record_metrics(db, metrics)
+    
+    await asyncio.to_thread(write)
+    
+    logger.info(f"Statistics collection completed ({len(metrics)} metrics)")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,395 @@
+"""
+Background task worker - scheduler and worker pool over the job queue
+
+The scheduler turns each task's schedule (cron expression or interval)
+into task_jobs rows. Only the leader schedules: on PostgreSQL leadership
+is a session advisory lock held on a dedicated connection, so when the
+leader dies its lock is released with the connection and another replica
+takes over. Every scheduled run also carries a dedupe key, so a brief
+overlap of two leaders still queues each run once.
+
+Every process runs TASK_WORKER_CONCURRENCY workers that claim due jobs
+(FOR UPDATE SKIP LOCKED), run them with a per-task timeout - synchronous
+task functions in a thread so the event loop is never blocked - and
+retry failures with exponential backoff. A thread cannot be stopped, so
+after a sync task times out its jobs are deferred until that thread has
+finished (per process). Run time and queue lag are exported as
+Prometheus histograms.
+
+Run standalone with:
+
+    python -m traffic_share.server.tasks.worker
+
+or inside the API processes with TASK_WORKER_IN_API=True.
+"""
+
+import asyncio
+import inspect
+import os
+import signal
+import socket
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from sqlalchemy import text
+
+from traffic_share.server.admin_alerts import admin_alerts
+from traffic_share.server.config import settings
+from traffic_share.server.database import Base, SessionLocal, engine
+from traffic_share.server.logger import logger
+from traffic_share.server.metrics import TASK_DURATION, TASK_LAG
+from traffic_share.server.tasks import queue
+from traffic_share.server.tasks.schedule import Schedule, parse_schedule
+
+
+# Session advisory lock held by the scheduling leader
+SCHEDULER_LOCK_KEY = 7303
+
+
+class TaskSpec(NamedTuple):
+    """A registered task"""
+    name: str
+    func: Callable[..., Any]  # sync or async, called with the job payload as kwargs
+    schedule: Optional[Schedule] = None  # None: only run when enqueued
+    timeout: float = 600.0
+    run_on_start: bool = False  # also queue a run when a scheduler takes over
+
+
+def schedule_overrides() -> Dict[str, str]:
+    """TASK_SCHEDULES ("backup=0 3 * * *; stats=*/30 * * * *") as a dict"""
+    overrides = {}
+    for entry in settings.TASK_SCHEDULES.split(";"):
+        if "=" in entry:
+            name, expression = entry.split("=", 1)
+            overrides[name.strip()] = expression.strip()
+    return overrides
+
+
+def default_tasks() -> Dict[str, TaskSpec]:
+    """Built-in periodic tasks"""
+    from traffic_share.server.tasks.backup_task import backup_database
+    from traffic_share.server.tasks.cleanup_task import run_cleanup_tasks
+    from traffic_share.server.tasks.notify_task import deliver_pending_notifications
+    from traffic_share.server.tasks.partition_task import maintain_partitions
+    from traffic_share.server.tasks.report_task import run_report_snapshots
+    from traffic_share.server.tasks.stats_task import run_stats_collection
+
+    # Snapshots run daily REPORT_SNAPSHOT_DELAY after UTC midnight
+    delay_minutes = settings.REPORT_SNAPSHOT_DELAY // 60
+    report_cron = f"{delay_minutes % 60} {delay_minutes // 60 % 24} * * *"
+
+    specs = [
+        TaskSpec("cleanup", run_cleanup_tasks, settings.CLEANUP_TASK_INTERVAL),
+        TaskSpec("stats", run_stats_collection, settings.STATS_TASK_INTERVAL),
+        TaskSpec("backup", backup_database, settings.BACKUP_TASK_INTERVAL, timeout=3600.0),
+        TaskSpec("notify", deliver_pending_notifications, settings.NOTIFY_TASK_INTERVAL),
+    ]
+    if settings.PARTITION_MAINTENANCE_ENABLED:
+        specs.append(TaskSpec(
+            "partitions", maintain_partitions, settings.PARTITION_TASK_INTERVAL,
+            run_on_start=True
+        ))
+    if settings.REPORT_SNAPSHOT_ENABLED:
+        specs.append(TaskSpec(
+            "reports", run_report_snapshots, report_cron, run_on_start=True
+        ))
+
+    overrides = schedule_overrides()
+    return {
+        spec.name: spec._replace(
+            schedule=parse_schedule(overrides.get(spec.name, spec.schedule))
+        )
+        for spec in specs
+    }
+
+
+class Scheduler:
+    """Queues scheduled runs while this process holds leadership"""
+
+    def __init__(self, tasks: Dict[str, TaskSpec], session_factory=None):
+        self.tasks = tasks
+        self._session_factory = session_factory or SessionLocal
+        self._lock_connection = None
+        self._leader_since: Optional[datetime] = None
+        self._next_runs: Dict[str, datetime] = {}
+
+    @property
+    def is_leader(self) -> bool:
+        return self._leader_since is not None
+
+    def _acquire_leadership(self) -> bool:
+        """Take or confirm leadership"""
+        bind = self._session_factory.kw.get("bind") or engine
+        if bind.dialect.name != "postgresql":
+            # Single-node setups (SQLite) have one scheduler by construction
+            return True
+
+        if self._lock_connection is not None:
+            try:
+                self._lock_connection.execute(text("SELECT 1"))
+                return True
+            except Exception:
+                # Connection lost - and the lock with it
+                self._release_leadership()
+                return False
+
+        connection = bind.connect()
+        locked = connection.execute(
+            text("SELECT pg_try_advisory_lock(:key)"), {"key": SCHEDULER_LOCK_KEY}
+        ).scalar()
+        connection.commit()
+        if not locked:
+            connection.close()
+            return False
+        self._lock_connection = connection
+        return True
+
+    def _release_leadership(self):
+        connection, self._lock_connection = self._lock_connection, None
+        self._leader_since = None
+        if connection is not None:
+            try:
+                # Drop the connection rather than pooling it with the lock held
+                connection.invalidate()
+                connection.close()
+            except Exception:
+                pass
+
+    def _enqueue(self, db, spec: TaskSpec, run_at: datetime) -> bool:
+        return queue.enqueue(
+            db, spec.name, run_at=run_at,
+            dedupe_key=f"{spec.name}@{run_at.isoformat()}"
+        )
+
+    def tick(self, now: datetime = None) -> List[str]:
+        """
+        Queue runs that are due (one per task even after a long pause)
+        and do queue housekeeping; returns the task names queued
+        """
+        now = now or datetime.utcnow()
+        if not self._acquire_leadership():
+            self._leader_since = None
+            return []
+
+        queued = []
+        db = self._session_factory()
+        try:
+            if self._leader_since is None:
+                self._leader_since = now
+                self._next_runs = {}
+                logger.info("Task scheduler acquired leadership")
+                for spec in self.tasks.values():
+                    if spec.run_on_start and self._enqueue(db, spec, now):
+                        queued.append(spec.name)
+
+            for spec in self.tasks.values():
+                if spec.schedule is None:
+                    continue
+                next_run = self._next_runs.get(spec.name)
+                if next_run is None:
+                    self._next_runs[spec.name] = spec.schedule.next_after(now)
+                    continue
+                if next_run <= now:
+                    if self._enqueue(db, spec, next_run):
+                        queued.append(spec.name)
+                    self._next_runs[spec.name] = spec.schedule.next_after(now)
+
+            recovered = queue.recover_stale(db, now)
+            if recovered:
+                logger.warning(f"Requeued {recovered} jobs from stopped workers")
+            queue.prune_finished(db, now)
+        finally:
+            db.close()
+
+        return queued
+
+    async def run(self):
+        """Scheduler loop"""
+        try:
+            while True:
+                try:
+                    await asyncio.to_thread(self.tick)
+                except Exception as e:
+                    logger.error(f"Task scheduler error: {e}")
+                    await asyncio.to_thread(self._release_leadership)
+
+                interval = (
+                    settings.TASK_SCHEDULER_INTERVAL if self.is_leader
+                    else settings.TASK_LEADER_RETRY_INTERVAL
+                )
+                await asyncio.sleep(interval)
+        finally:
+            self._release_leadership()
+
+
+class TaskWorker:
+    """Scheduler plus a pool of workers claiming jobs from the queue"""
+
+    def __init__(
+        self,
+        tasks: Dict[str, TaskSpec] = None,
+        concurrency: int = None,
+        session_factory=None,
+        worker_id: str = None
+    ):
+        self.tasks = tasks
+        self.concurrency = concurrency
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self._session_factory = session_factory or SessionLocal
+        self._runners: List[asyncio.Task] = []
+        self.scheduler: Optional[Scheduler] = None
+        self._overruns: Dict[str, asyncio.Future] = {}  # timed-out threads by task
+
+    def _call(self, func, *args):
+        db = self._session_factory()
+        try:
+            return func(db, *args)
+        finally:
+            db.close()
+
+    def _start(self, spec: TaskSpec, payload: Dict[str, Any]) -> asyncio.Future:
+        if inspect.iscoroutinefunction(spec.func):
+            return asyncio.ensure_future(spec.func(**payload))
+        return asyncio.ensure_future(asyncio.to_thread(spec.func, **payload))
+
+    def _overrun(self, name: str, run: asyncio.Future):
+        """Track a timed-out thread until it ends"""
+        def finished(future: asyncio.Future):
+            if self._overruns.get(name) is future:
+                del self._overruns[name]
+            if not future.cancelled() and future.exception() is not None:
+                logger.error(f"Timed-out run of task {name} failed: {future.exception()}")
+
+        self._overruns[name] = run
+        run.add_done_callback(finished)
+
+    async def run_job(self, job: queue.ClaimedJob) -> str:
+        """Run one claimed job and record the outcome"""
+        TASK_LAG.labels(task=job.name).observe(
+            max((datetime.utcnow() - job.run_at).total_seconds(), 0.0)
+        )
+        started = time.monotonic()
+        spec = self.tasks.get(job.name)
+
+        if job.name in self._overruns:
+            await asyncio.to_thread(
+                self._call, queue.defer, job, "Previous run still in progress"
+            )
+            logger.warning(
+                f"Task {job.name} (job {job.id}) deferred, previous run still in progress"
+            )
+            return "deferred"
+
+        run = None
+        try:
+            if spec is None:
+                raise LookupError(f"Unknown task {job.name!r}")
+            run = self._start(spec, job.payload)
+            await asyncio.wait_for(asyncio.shield(run), spec.timeout)
+        except asyncio.CancelledError:
+            # Shutdown - recovered after TASK_VISIBILITY_TIMEOUT
+            if run is not None and inspect.iscoroutinefunction(spec.func):
+                run.cancel()
+            raise
+        except Exception as e:
+            timed_out = isinstance(e, asyncio.TimeoutError)
+            if timed_out and inspect.iscoroutinefunction(spec.func):
+                run.cancel()
+            elif timed_out:
+                # The thread runs on; its task is not started again until it ends
+                self._overrun(job.name, run)
+            error = "Timed out" if timed_out else f"{type(e).__name__}: {e}"
+            retried = await asyncio.to_thread(self._call, queue.fail, job, error)
+            outcome = "retry" if retried else "dead"
+            logger.error(
+                f"Task {job.name} (job {job.id}, attempt {job.attempts}) failed: {error}"
+                + ("" if retried else " - giving up")
+            )
+        else:
+            await asyncio.to_thread(self._call, queue.complete, job)
+            outcome = "succeeded"
+
+        TASK_DURATION.labels(task=job.name, outcome=outcome).observe(
+            time.monotonic() - started
+        )
+        return outcome
+
+    async def _work(self, index: int):
+        worker_id = f"{self.worker_id}:{index}"
+        while True:
+            try:
+                jobs = await asyncio.to_thread(self._call, queue.claim, worker_id)
+            except Exception as e:
+                logger.error(f"Task worker could not claim jobs: {e}")
+                jobs = []
+
+            if not jobs:
+                await asyncio.sleep(settings.TASK_POLL_INTERVAL)
+                continue
+            for job in jobs:
+                await self.run_job(job)
+
+    async def start(self):
+        """Start the scheduler and the worker pool"""
+        if self._runners:
+            return
+        if self.tasks is None:
+            self.tasks = default_tasks()
+        concurrency = self.concurrency or settings.TASK_WORKER_CONCURRENCY
+
+        self.scheduler = Scheduler(self.tasks, self._session_factory)
+        self._runners = [asyncio.create_task(self.scheduler.run())]
+        self._runners += [
+            asyncio.create_task(self._work(index)) for index in range(concurrency)
+        ]
+        logger.info(
+            f"Task worker {self.worker_id} started: {concurrency} workers, "
+            f"tasks {', '.join(sorted(self.tasks))}"
+        )
+
+    async def stop(self):
+        """Cancel the scheduler and workers (running jobs are retried later)"""
+        runners, self._runners = self._runners, []
+        for runner in runners:
+            runner.cancel()
+        for runner in runners:
+            try:
+                await runner
+            except asyncio.CancelledError:
+                pass
+
+
+# Global task worker (started by the API when TASK_WORKER_IN_API)
+task_worker = TaskWorker()
+
+
+async def run_worker():
+    """Run the task worker until SIGINT / SIGTERM"""
+    stopped = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stopped.set)
+
+    await admin_alerts.start()
+    await task_worker.start()
+    await stopped.wait()
+
+    logger.info("Stopping task worker...")
+    await task_worker.stop()
+    await admin_alerts.stop()
+
+
+def main():
+    """Dedicated worker process entrypoint"""
+    Base.metadata.create_all(bind=engine)
+
+    if settings.METRICS_ENABLED and settings.TASK_METRICS_PORT:
+        from prometheus_client import start_http_server
+        start_http_server(settings.TASK_METRICS_PORT)
+
+    asyncio.run(run_worker())
+
+
+if __name__ == "__main__":
+    main()
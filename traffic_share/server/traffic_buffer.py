@@ -0,0 +1,362 @@
+"""
+Write-behind buffer for traffic heartbeats
+
+Device heartbeats (/api/traffic/update) are coalesced in memory per session
+and written to PostgreSQL in batches: one executemany UPDATE for all touched
+sessions plus one multi-row INSERT for the traffic logs, inside a single
+transaction. A flush happens every TRAFFIC_BUFFER_FLUSH_INTERVAL seconds or as
+soon as TRAFFIC_BUFFER_MAX_ENTRIES heartbeats are pending, whichever is first.
+
+Crash safety:
+- a batch is applied atomically, so a session never gets its byte counters
+  without the matching logs (or vice versa)
+- a failed flush puts the batch back into the buffer and is retried on the
+  next tick, so a DB outage does not lose heartbeats
+- the buffer is drained on application shutdown (lifespan), bounding loss on
+  a hard crash to at most one flush interval
+"""
+
+import asyncio
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import bindparam, insert, select, update
+from sqlalchemy.orm import Session
+
+from traffic_share.server.config import settings
+from traffic_share.server.database import SessionLocal
+from traffic_share.server.logger import logger
+from traffic_share.server.models import TrafficSession, TrafficSessionStatus, TrafficLog
+from traffic_share.server.rollups import apply_rollups
+
+
+class SessionDelta:
+    """Pending byte counters for one traffic session"""
+
+    __slots__ = ("session_id", "user_id", "bytes_tx", "bytes_rx", "last_seen_at")
+
+    def __init__(self, session_id: int, user_id: int = None):
+        self.session_id = session_id
+        self.user_id = user_id
+        self.bytes_tx = 0
+        self.bytes_rx = 0
+        self.last_seen_at: Optional[datetime] = None
+
+    def merge(self, other: "SessionDelta"):
+        """Fold another delta for the same session into this one"""
+        self.user_id = self.user_id or other.user_id
+        self.bytes_tx += other.bytes_tx
+        self.bytes_rx += other.bytes_rx
+        if other.last_seen_at and (
+            self.last_seen_at is None or other.last_seen_at > self.last_seen_at
+        ):
+            self.last_seen_at = other.last_seen_at
+
+
+class TrafficWriteBuffer:
+    """Coalesces traffic updates and flushes them in batches"""
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        flush_interval: float = None,
+        max_entries: int = None,
+        max_pending_logs: int = None
+    ):
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval or settings.TRAFFIC_BUFFER_FLUSH_INTERVAL
+        self.max_entries = max_entries or settings.TRAFFIC_BUFFER_MAX_ENTRIES
+        self.max_pending_logs = max_pending_logs or settings.TRAFFIC_BUFFER_MAX_PENDING_LOGS
+
+        self._lock = threading.Lock()
+        self._deltas: Dict[int, SessionDelta] = {}
+        self._logs: List[dict] = []
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def pending(self) -> int:
+        """Number of heartbeats waiting to be written"""
+        return len(self._logs)
+
+    def pending_bytes(self, session_id: int) -> int:
+        """Bytes of a session waiting to be written"""
+        with self._lock:
+            delta = self._deltas.get(session_id)
+            return delta.bytes_tx + delta.bytes_rx if delta else 0
+
+    def add(
+        self,
+        session_id: int,
+        bytes_tx: int,
+        bytes_rx: int,
+        connection_count: int = 0,
+        timestamp: datetime = None,
+        user_id: int = None
+    ):
+        """Queue one heartbeat for a session (by primary key)"""
+        timestamp = timestamp or datetime.utcnow()
+
+        with self._lock:
+            delta = self._deltas.get(session_id)
+            if delta is None:
+                delta = self._deltas[session_id] = SessionDelta(session_id, user_id)
+
+            delta.bytes_tx += bytes_tx
+            delta.bytes_rx += bytes_rx
+            delta.last_seen_at = timestamp
+
+            self._logs.append({
+                "session_id": session_id,
+                "timestamp": timestamp,
+                "bytes_transferred": bytes_tx + bytes_rx,
+                "connection_count": connection_count
+            })
+
+            should_flush = len(self._logs) >= self.max_entries
+
+        if should_flush:
+            self._wake()
+
+    def add_batch(self, deltas: List[SessionDelta], logs: List[dict]):
+        """Queue already coalesced deltas and their logs (batch heartbeats)"""
+        with self._lock:
+            for delta in deltas:
+                current = self._deltas.get(delta.session_id)
+                if current is None:
+                    self._deltas[delta.session_id] = delta
+                else:
+                    current.merge(delta)
+
+            self._logs.extend(logs)
+            should_flush = len(self._logs) >= self.max_entries
+
+        if should_flush:
+            self._wake()
+
+    def discard_session(self, session_id: int) -> Optional[SessionDelta]:
+        """
+        Drop pending byte counters for a session
+        Used when a session is stopped with absolute final counters;
+        its logs are kept and written with the next flush.
+        """
+        with self._lock:
+            return self._deltas.pop(session_id, None)
+
+    def drain(self) -> Tuple[List[SessionDelta], List[dict]]:
+        """Take everything that is pending, leaving the buffer empty"""
+        with self._lock:
+            deltas = list(self._deltas.values())
+            logs = self._logs
+            self._deltas = {}
+            self._logs = []
+        return deltas, logs
+
+    def requeue(self, deltas: List[SessionDelta], logs: List[dict]):
+        """Put a batch that failed to flush back in front of newer data"""
+        with self._lock:
+            for delta in deltas:
+                current = self._deltas.get(delta.session_id)
+                if current is None:
+                    self._deltas[delta.session_id] = delta
+                else:
+                    current.merge(delta)
+
+            self._logs = logs + self._logs
+
+            overflow = len(self._logs) - self.max_pending_logs
+            if overflow > 0:
+                # Byte counters are kept in full; only the oldest log rows go
+                del self._logs[:overflow]
+                logger.warning(
+                    f"Traffic buffer over capacity, dropped {overflow} oldest log entries"
+                )
+
+    @staticmethod
+    def apply_batch(db: Session, deltas: List[SessionDelta], logs: List[dict]):
+        """
+        Write a batch of deltas and logs using the given session
+        Only sessions that are still active are updated, so a session
+        stopped or swept since its heartbeats keeps the totals it was paid
+        for. Also adds the applied byte deltas to the per-user rollups.
+        Does not commit - callers own the transaction.
+        """
+        if deltas:
+            table = TrafficSession.__table__
+            # Locked so a concurrent stop waits for this batch (or wins first)
+            owners = dict(db.execute(
+                select(table.c.id, table.c.user_id)
+                .where(
+                    table.c.id.in_([delta.session_id for delta in deltas]),
+                    table.c.status == TrafficSessionStatus.ACTIVE
+                )
+                .order_by(table.c.id)
+                .with_for_update()
+            ).all())
+            deltas = [delta for delta in deltas if delta.session_id in owners]
+
+        if deltas:
+            stmt = (
+                update(table)
+                .where(
+                    table.c.id == bindparam("b_id"),
+                    table.c.status == TrafficSessionStatus.ACTIVE
+                )
+                .values(
+                    bytes_uploaded=table.c.bytes_uploaded + bindparam("b_tx"),
+                    bytes_downloaded=table.c.bytes_downloaded + bindparam("b_rx"),
+                    total_bytes=table.c.total_bytes + bindparam("b_total"),
+                    updated_at=bindparam("b_seen")
+                )
+            )
+            db.execute(stmt, [
+                {
+                    "b_id": delta.session_id,
+                    "b_tx": delta.bytes_tx,
+                    "b_rx": delta.bytes_rx,
+                    "b_total": delta.bytes_tx + delta.bytes_rx,
+                    "b_seen": delta.last_seen_at or datetime.utcnow()
+                }
+                for delta in deltas
+            ])
+
+            apply_rollups(db, [
+                (
+                    owners[delta.session_id],
+                    delta.last_seen_at or datetime.utcnow(),
+                    delta.bytes_tx + delta.bytes_rx,
+                    0.0
+                )
+                for delta in deltas
+            ])
+
+        if logs:
+            db.execute(insert(TrafficLog.__table__), logs)
+
+    def write_through(
+        self,
+        db: Session,
+        session_id: int,
+        bytes_tx: int,
+        bytes_rx: int,
+        connection_count: int = 0,
+        user_id: int = None
+    ):
+        """Write a single heartbeat immediately (buffer disabled)"""
+        now = datetime.utcnow()
+        delta = SessionDelta(session_id, user_id)
+        delta.bytes_tx = bytes_tx
+        delta.bytes_rx = bytes_rx
+        delta.last_seen_at = now
+
+        self.apply_batch(db, [delta], [{
+            "session_id": session_id,
+            "timestamp": now,
+            "bytes_transferred": bytes_tx + bytes_rx,
+            "connection_count": connection_count
+        }])
+        db.commit()
+
+    def flush_sync(self, db: Session = None) -> int:
+        """
+        Flush pending data in one transaction
+        Returns number of heartbeats written
+        """
+        deltas, logs = self.drain()
+        if not deltas and not logs:
+            return 0
+
+        own_session = db is None
+        if own_session:
+            db = self.session_factory()
+
+        try:
+            self.apply_batch(db, deltas, logs)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            self.requeue(deltas, logs)
+            logger.error(f"Traffic buffer flush failed, batch requeued: {e}")
+            return 0
+        finally:
+            if own_session:
+                db.close()
+
+        logger.debug(
+            f"Traffic buffer flushed {len(logs)} heartbeats for {len(deltas)} sessions"
+        )
+        return len(logs)
+
+    async def flush(self) -> int:
+        """Flush pending data without blocking the event loop"""
+        if self._flush_lock is None:
+            return await asyncio.to_thread(self.flush_sync)
+
+        async with self._flush_lock:
+            return await asyncio.to_thread(self.flush_sync)
+
+    def _wake(self):
+        """Ask the flusher to run now (safe from any thread)"""
+        if self._loop is None or self._wakeup is None:
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        except RuntimeError:
+            # Loop already closed during shutdown
+            pass
+
+    async def _run(self):
+        """Background flush loop"""
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+
+            self._wakeup.clear()
+
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Traffic buffer loop error: {e}")
+
+    async def start(self):
+        """Start background flushing"""
+        if self._task is not None:
+            return
+
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = asyncio.create_task(self._run())
+
+        logger.info(
+            f"Traffic write buffer started "
+            f"(interval={self.flush_interval}s, max_entries={self.max_entries})"
+        )
+
+    async def stop(self):
+        """Stop background flushing and drain what is left"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        written = await self.flush()
+        if written:
+            logger.info(f"Traffic buffer drained {written} heartbeats on shutdown")
+
+        self._loop = None
+        self._wakeup = None
+        self._flush_lock = None
+
+
+# Global write buffer instance
+traffic_buffer = TrafficWriteBuffer()
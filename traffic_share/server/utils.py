@@ -2,12 +2,15 @@
 Utility functions
 """
 
+import base64
 import json
 from datetime import datetime
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import insert, select, text, tuple_, update
 from sqlalchemy.orm import Session
 
 from traffic_share.server.models import AuditLog, SystemMetric
+from traffic_share.core.exceptions import ValidationError
 
 
 def bytes_to_gb(bytes_count: int) -> float:
@@ -56,17 +59,27 @@ def record_metric(
     db: Session,
     metric_name: str,
     metric_value: float,
-    metric_unit: str = None,
-    tags: Dict[str, Any] = None
+    metric_unit: str = None
 ):
     """Record a system metric"""
-    metric = SystemMetric(
-        metric_name=metric_name,
-        metric_value=metric_value,
-        metric_unit=metric_unit,
-        tags=json.dumps(tags) if tags else None
-    )
-    db.add(metric)
+    record_metrics(db, [(metric_name, metric_value, metric_unit)])
+
+
+def record_metrics(db: Session, metrics: List[Tuple[str, float, str]]):
+    """Record (name, value, unit) metrics in one insert and commit"""
+    if not metrics:
+        return
+    
+    timestamp = datetime.utcnow()
+    db.execute(insert(SystemMetric.__table__), [
+        {
+            "metric_name": name,
+            "metric_value": value or 0,
+            "metric_unit": unit,
+            "timestamp": timestamp
+        }
+        for name, value, unit in metrics
+    ])
     db.commit()
 
 
@@ -114,6 +127,116 @@ def paginate_query(query, page: int = 1, page_size: int = 50):
     return items, total_count, total_pages
 
 
+def encode_cursor(values) -> str:
+    """Encode keyset position (e.g. created_at, id) as an opaque token"""
+    payload = [
+        {"dt": value.isoformat()} if isinstance(value, datetime) else value
+        for value in values
+    ]
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """Decode token from encode_cursor, raises ValidationError if malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = tuple(
+            datetime.fromisoformat(value["dt"]) if isinstance(value, dict) else value
+            for value in json.loads(raw)
+        )
+    except Exception:
+        raise ValidationError("Invalid pagination cursor")
+    
+    if not all(isinstance(value, (int, datetime)) for value in values):
+        raise ValidationError("Invalid pagination cursor")
+    
+    return values
+
+
+def keyset_paginate(
+    query,
+    order_columns: List,
+    cursor: Optional[str] = None,
+    page_size: int = 50
+) -> Tuple[list, Optional[str]]:
+    """
+    Paginate newest first by (order_columns...), e.g. (created_at, id)
+    The last column must be unique. Returns (items, next_cursor);
+    next_cursor is None on the last page.
+    """
+    if cursor:
+        position = decode_cursor(cursor)
+        if len(position) != len(order_columns):
+            raise ValidationError("Invalid pagination cursor")
+        query = query.filter(tuple_(*order_columns) < tuple_(*position))
+    
+    items = query.order_by(
+        *[column.desc() for column in order_columns]
+    ).limit(page_size + 1).all()
+    
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        last = items[-1]
+        next_cursor = encode_cursor(
+            [getattr(last, column.key) for column in order_columns]
+        )
+    
+    return items, next_cursor
+
+
+def update_batch_skip_locked(
+    db: Session,
+    model,
+    filters: List,
+    values: Dict[str, Any],
+    returning: List,
+    batch_size: int,
+    order_by=None
+) -> list:
+    """
+    Update at most batch_size matching rows and return them
+    One UPDATE ... WHERE id IN (SELECT id ... LIMIT n FOR UPDATE SKIP LOCKED)
+    RETURNING statement: rows locked by a concurrent sweep are skipped
+    rather than waited for, so several replicas split the backlog.
+    Does not commit - callers own the transaction.
+    """
+    batch = (
+        select(model.id)
+        .where(*filters)
+        .order_by(order_by if order_by is not None else model.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    stmt = (
+        update(model)
+        .where(model.id.in_(batch.scalar_subquery()))
+        .values(**values)
+        .returning(*returning)
+        .execution_options(synchronize_session=False)
+    )
+    return db.execute(stmt).all()
+
+
+def approximate_count(db: Session, model) -> Optional[int]:
+    """
+    Estimated row count of a model's table from planner statistics
+    Returns None where no estimate is available (not PostgreSQL / never analyzed).
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return None
+    
+    estimate = db.execute(
+        text("SELECT reltuples::bigint FROM pg_class WHERE oid = CAST(:table AS regclass)"),
+        {"table": model.__tablename__}
+    ).scalar()
+    
+    if estimate is None or estimate < 0:
+        return None
+    return estimate
+
+
 def validate_pagination_params(page: int, page_size: int, max_page_size: int = 100):
     """Validate and normalize pagination parameters"""
     page = max(1, page)